@@ -197,3 +197,636 @@ void forwardData() {
 }
 
 
+
+ADDITIONAL_INFO_BINARY_FRAMING = {
+    "description": """
+Binary chunk framing is selected. Instead of the JSON-wrapped chunks ({"cn":..,"tc":..,"data":".."} plus a newline) produced by the library, the modules exchange compact binary frames over I2C:
+
+- Byte 0: magic 0xA5 (the master reads 0xFF when the slave has nothing to send)
+- Byte 1: message id, incremented for every reading
+- Byte 2: sequence number of the frame within the reading, starting from 0
+- Byte 3: total number of frames in the reading
+- Byte 4: payload length (at most MaxChunkSize - 7 = 121 bytes)
+- Bytes 5-6: CRC-16/CCITT-FALSE (big endian) over bytes 0-4 and the payload
+- Bytes 7..: raw payload (a slice of the JSON reading, no escaping)
+
+The readings are still JSON and are still stored with i2cSlave.addToRingBuffer() on Module A and read with i2cMaster.getFromRingBuffer() on Module B. Only the I2C transfer changes: use the functions below exactly as given.
+""",
+    "common": """
+```cpp
+// Binary chunk framing - shared definitions (copy to both modules)
+const uint8_t FRAME_MAGIC = 0xA5;
+const size_t FRAME_HEADER_SIZE = 7;
+const size_t FRAME_MAX_PAYLOAD = MaxChunkSize - FRAME_HEADER_SIZE;
+
+uint16_t crc16Ccitt(const uint8_t* data, size_t len, uint16_t crc = 0xFFFF) {
+    for (size_t i = 0; i < len; i++) {
+        crc ^= (uint16_t)data[i] << 8;
+        for (uint8_t b = 0; b < 8; b++) {
+            crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+        }
+    }
+    return crc;
+}
+```
+""",
+    "module_a": """
+```cpp
+// Module A - replaces the library's requestEvent(). Register it after i2cSlave.initSlave():
+//     Wire.onRequest(binaryRequestEvent);
+String pendingData;
+size_t pendingOffset = 0;
+uint8_t frameMsgId = 0;
+uint8_t frameSeq = 0;
+uint8_t frameTotal = 0;
+
+void binaryRequestEvent() {
+    if (pendingOffset >= pendingData.length()) {
+        pendingData = AnttiGateway::ringBuffer.pop();  // next reading (empty if none)
+        pendingOffset = 0;
+        frameSeq = 0;
+        if (pendingData.length() == 0) {
+            return;  // nothing to send, the master reads 0xFF
+        }
+        frameMsgId++;
+        frameTotal = (pendingData.length() + FRAME_MAX_PAYLOAD - 1) / FRAME_MAX_PAYLOAD;
+    }
+
+    uint8_t frame[MaxChunkSize];
+    size_t len = min(FRAME_MAX_PAYLOAD, (size_t)(pendingData.length() - pendingOffset));
+    frame[0] = FRAME_MAGIC;
+    frame[1] = frameMsgId;
+    frame[2] = frameSeq;
+    frame[3] = frameTotal;
+    frame[4] = (uint8_t)len;
+    memcpy(frame + FRAME_HEADER_SIZE, pendingData.c_str() + pendingOffset, len);
+    uint16_t crc = crc16Ccitt(frame, 5);
+    crc = crc16Ccitt(frame + FRAME_HEADER_SIZE, len, crc);
+    frame[5] = crc >> 8;
+    frame[6] = crc & 0xFF;
+    Wire.write(frame, FRAME_HEADER_SIZE + len);
+
+    pendingOffset += len;
+    frameSeq++;
+}
+```
+""",
+    "module_b": """
+```cpp
+// Module B - replaces i2cMaster.receiveData(). Call it repeatedly for the same slave until it
+// returns true (a complete reading was pushed to AnttiGateway::ringBuffer) or no frame arrives.
+char binaryData[MaxDataSize];
+size_t binaryLength = 0;
+int expectedSeq = -1;
+uint8_t currentMsgId = 0;
+
+bool receiveBinaryFrame(uint8_t address) {
+    uint8_t frame[MaxChunkSize];
+    size_t received = 0;
+    Wire.requestFrom((int)address, (int)MaxChunkSize);
+    while (Wire.available() && received < sizeof(frame)) {
+        frame[received++] = Wire.read();
+    }
+    if (received < FRAME_HEADER_SIZE || frame[0] != FRAME_MAGIC) {
+        return false;  // slave had nothing to send
+    }
+
+    uint8_t len = frame[4];
+    uint16_t crc = crc16Ccitt(frame, 5);
+    if (len > FRAME_MAX_PAYLOAD || FRAME_HEADER_SIZE + len > received) {
+        expectedSeq = -1;
+        return false;
+    }
+    crc = crc16Ccitt(frame + FRAME_HEADER_SIZE, len, crc);
+    if ((crc >> 8) != frame[5] || (crc & 0xFF) != frame[6]) {
+        Serial.println("Frame CRC error");
+        expectedSeq = -1;
+        return false;
+    }
+
+    if (frame[2] == 0) {  // first frame of a reading
+        binaryLength = 0;
+        expectedSeq = 0;
+        currentMsgId = frame[1];
+    }
+    if (frame[1] != currentMsgId || frame[2] != expectedSeq) {
+        Serial.println("Frame out of sequence");
+        expectedSeq = -1;
+        return false;
+    }
+    if (binaryLength + len >= sizeof(binaryData)) {
+        Serial.println("Frame buffer overflow");
+        expectedSeq = -1;
+        return false;
+    }
+
+    memcpy(binaryData + binaryLength, frame + FRAME_HEADER_SIZE, len);
+    binaryLength += len;
+    expectedSeq++;
+
+    if (expectedSeq == frame[3]) {
+        binaryData[binaryLength] = '\\0';
+        if (AnttiGateway::ringBuffer.isFull()) {
+            AnttiGateway::ringBuffer.pop();  // overwrite the oldest reading
+        }
+        AnttiGateway::ringBuffer.push(String(binaryData));
+        expectedSeq = -1;
+        return true;
+    }
+    return false;
+}
+```
+"""
+}
+
+ADDITIONAL_INFO_BATCHED_UPLINK = {
+    "description": """
+Batched keep-alive uplink is selected for Module B. Do not open a new connection with "Connection: close" for every reading. Instead:
+
+- forwardData() drains every reading currently in the ring buffer with i2cMaster.getFromRingBuffer().
+- Readings are appended to one NDJSON body (one JSON reading per line, Content-Type: application/x-ndjson).
+- The batch is sent when it holds BATCH_MAX_READINGS readings, when the next reading would exceed BATCH_MAX_BYTES, or when the oldest reading has waited BATCH_FLUSH_INTERVAL_MS.
+- The TCP connection is kept open between batches (Connection: keep-alive) and only reopened when it drops.
+- A batch that could not be delivered is kept and retried on the next flush; when it is already full, new readings are dropped with a Serial message.
+
+Use the functions below as given and adapt only the endpoint constants and the transport (WiFiClient, WiFiClientSecure, ...) to the selected technology.
+""",
+    "example": """
+```cpp
+// Batched keep-alive uplink for Module B
+const char* endpointHost = "192.168.1.10";
+const uint16_t endpointPort = 8080;
+const char* endpointPath = "/readings";
+const size_t BATCH_MAX_READINGS = 20;
+const size_t BATCH_MAX_BYTES = 4096;
+const unsigned long BATCH_FLUSH_INTERVAL_MS = 10000;
+
+WiFiClient uplinkClient;
+String uplinkBatch;
+size_t uplinkBatchCount = 0;
+unsigned long uplinkBatchStarted = 0;
+
+bool ensureUplinkConnected() {
+    if (uplinkClient.connected()) {
+        return true;
+    }
+    uplinkClient.stop();
+    return uplinkClient.connect(endpointHost, endpointPort);
+}
+
+// Sends the batch as one NDJSON POST. Returns true when the batch was accepted (2xx).
+bool flushUplinkBatch() {
+    if (uplinkBatchCount == 0) {
+        return true;
+    }
+    if (WiFi.status() != WL_CONNECTED || !ensureUplinkConnected()) {
+        Serial.println("Uplink not connected, batch kept for the next flush.");
+        return false;
+    }
+
+    uplinkClient.print(String("POST ") + endpointPath + " HTTP/1.1\\r\\n");
+    uplinkClient.print(String("Host: ") + endpointHost + "\\r\\n");
+    uplinkClient.print("Content-Type: application/x-ndjson\\r\\n");
+    uplinkClient.print("Connection: keep-alive\\r\\n");
+    uplinkClient.print("Content-Length: " + String(uplinkBatch.length()) + "\\r\\n\\r\\n");
+    uplinkClient.print(uplinkBatch);
+
+    // Read the whole response so the connection can be reused for the next batch
+    String statusLine = uplinkClient.readStringUntil('\\n');
+    int contentLength = 0;
+    while (uplinkClient.connected()) {
+        String line = uplinkClient.readStringUntil('\\n');
+        line.toLowerCase();
+        if (line.startsWith("content-length:")) {
+            contentLength = line.substring(15).toInt();
+        }
+        if (line == "\\r" || line.length() == 0) {
+            break;
+        }
+    }
+    unsigned long readStarted = millis();
+    while (contentLength > 0 && uplinkClient.connected() && millis() - readStarted < 5000) {
+        if (uplinkClient.available()) {
+            uplinkClient.read();
+            contentLength--;
+        }
+    }
+
+    if (statusLine.indexOf(" 2") < 0) {
+        Serial.println("Uplink error: " + statusLine);
+        uplinkClient.stop();
+        return false;
+    }
+    Serial.println("Uplink batch sent: " + String(uplinkBatchCount) + " readings");
+    uplinkBatch = "";
+    uplinkBatchCount = 0;
+    return true;
+}
+
+void queueReadingForUplink(const String& reading) {
+    if (uplinkBatchCount > 0 && uplinkBatch.length() + reading.length() + 1 > BATCH_MAX_BYTES) {
+        if (!flushUplinkBatch()) {
+            Serial.println("Uplink batch full, reading dropped.");
+            return;
+        }
+    }
+    if (uplinkBatchCount == 0) {
+        uplinkBatchStarted = millis();
+    }
+    uplinkBatch += reading;
+    uplinkBatch += "\\n";
+    uplinkBatchCount++;
+    if (uplinkBatchCount >= BATCH_MAX_READINGS) {
+        flushUplinkBatch();
+    }
+}
+
+void forwardData() {
+    String dataFromBuffer = i2cMaster.getFromRingBuffer();
+    while (!dataFromBuffer.isEmpty()) {
+        queueReadingForUplink(dataFromBuffer);
+        dataFromBuffer = i2cMaster.getFromRingBuffer();
+    }
+    if (uplinkBatchCount > 0 && millis() - uplinkBatchStarted >= BATCH_FLUSH_INTERVAL_MS) {
+        flushUplinkBatch();
+    }
+}
+```
+"""
+}
+
+ADDITIONAL_INFO_POLLING_POLICY = {
+    "description": """
+A slave polling policy is selected for Module B. Do not pick a random slave with random(0, i2cMaster.slaveAddresses.size()) and do not keep polling one slave until it has data: busy slaves overflow their 10-slot RingBuffer while idle slaves hold the bus. Instead:
+
+- loop() asks choosePollTarget() which slave to poll; -1 means no slave is expected to have data and the loop only waits.
+- A visit fetches up to readingsPerVisit() complete readings with pollSlaveForReading(), which gives up after MAX_POLLS_PER_VISIT requests without a complete reading. Set MAX_POLLS_PER_VISIT to 3 plus the chunks of the largest reading (length / 64), so a slave is never left in the middle of a reading.
+- forwardData() is called after every received reading, and recordVisit() reports the outcome of the visit to the policy.
+
+Use the loop and the policy functions below as given.
+""",
+    "common": """
+```cpp
+// Slave polling - master loop shared by all policies
+const unsigned long LOOP_DELAY_MS = 2000;
+const unsigned long POLL_DELAY_MS = 1000;
+const uint8_t MAX_POLLS_PER_VISIT = 6;  // refill request + chunks of the largest reading + spare
+const uint8_t MAX_SLAVES = 16;
+
+// Requests chunks from one slave until a new complete reading is in the ring buffer.
+bool pollSlaveForReading(uint8_t addr) {
+    i2cMaster.setDeviceAddress(addr);
+    for (uint8_t polls = 0; polls < MAX_POLLS_PER_VISIT; polls++) {
+        i2cMaster.receiveData();
+        if (!AnttiGateway::ringBuffer.isEmpty()) {
+            return true;
+        }
+        delay(POLL_DELAY_MS);
+    }
+    return false;  // idle slave, try again in a later loop
+}
+
+void loop() {
+    delay(LOOP_DELAY_MS);
+    int index = choosePollTarget();
+    if (index < 0) {
+        return;
+    }
+    uint8_t addr = i2cMaster.slaveAddresses[index];
+    uint8_t wanted = readingsPerVisit(index);
+    uint8_t delivered = 0;
+    startVisit();
+    while (delivered < wanted && pollSlaveForReading(addr)) {
+        delivered++;
+        forwardData();  // empties the ring buffer before the next reading
+    }
+    recordVisit(index, delivered);
+}
+```
+""",
+    "round_robin": """
+```cpp
+// Round-robin policy: every slave in turn
+size_t nextSlave = 0;
+
+int choosePollTarget() {
+    if (i2cMaster.slaveAddresses.empty()) {
+        return -1;
+    }
+    int index = nextSlave % i2cMaster.slaveAddresses.size();
+    nextSlave = index + 1;
+    return index;
+}
+
+uint8_t readingsPerVisit(int index) {
+    return 1;
+}
+
+void startVisit() {
+}
+
+void recordVisit(int index, uint8_t delivered) {
+}
+```
+""",
+    "weighted": """
+Module A adds "Backlog" (the readings still waiting in its ring buffer) to every reading it sends. In forwardData(), after deserializeJson(), pass it to the policy and remove it before forwarding:
+    if (docG.containsKey("Backlog")) {
+        noteAnnouncedBacklog(docG["Backlog"].as<int>());
+        docG.remove("Backlog");
+    }
+
+```cpp
+// Backlog-weighted policy: poll the slave with the most readings expected in its ring buffer
+const uint8_t DRAIN_MAX = 4;  // most readings fetched from one slave per visit
+const float MAX_INTERVAL_S = 60.0;  // visit every slave at least this often
+const float MIN_EXPECTED = 0.5;  // skip the loop when no slave is expected to hold this many readings
+const float RATE_SMOOTHING = 0.3;
+
+float remainingBacklog[MAX_SLAVES];
+float arrivalRate[MAX_SLAVES];  // readings per second
+unsigned long lastVisit[MAX_SLAVES];
+bool visited[MAX_SLAVES];
+int announcedBacklog = -1;
+
+void noteAnnouncedBacklog(int backlog) {
+    announcedBacklog = backlog;
+}
+
+float expectedBacklog(int index, unsigned long now) {
+    if (!visited[index]) {
+        return 1e9;
+    }
+    float elapsed = (now - lastVisit[index]) / 1000.0;
+    float expected = remainingBacklog[index] + arrivalRate[index] * elapsed;
+    if (elapsed >= MAX_INTERVAL_S && expected < 1.0) {
+        expected = 1.0;
+    }
+    return expected;
+}
+
+int choosePollTarget() {
+    unsigned long now = millis();
+    int best = -1;
+    float bestExpected = -1.0;
+    unsigned long bestAge = 0;
+    for (size_t i = 0; i < i2cMaster.slaveAddresses.size() && i < MAX_SLAVES; i++) {
+        float expected = expectedBacklog(i, now);
+        unsigned long age = visited[i] ? now - lastVisit[i] : now;
+        if (expected > bestExpected || (expected == bestExpected && age > bestAge)) {
+            best = i;
+            bestExpected = expected;
+            bestAge = age;
+        }
+    }
+    return bestExpected >= MIN_EXPECTED ? best : -1;
+}
+
+uint8_t readingsPerVisit(int index) {
+    float expected = expectedBacklog(index, millis());
+    if (expected >= DRAIN_MAX) {
+        return DRAIN_MAX;
+    }
+    return max(1, (int)ceil(expected));
+}
+
+void startVisit() {
+    announcedBacklog = -1;
+}
+
+void recordVisit(int index, uint8_t delivered) {
+    unsigned long now = millis();
+    float remaining;
+    if (delivered == 0) {
+        remaining = 0;
+    } else if (announcedBacklog >= 0) {
+        remaining = announcedBacklog;
+    } else {
+        remaining = max(0.0f, roundf(expectedBacklog(index, now)) - delivered);
+    }
+    if (visited[index] && now > lastVisit[index]) {
+        float arrivals = max(0.0f, remaining - remainingBacklog[index] + delivered);
+        float observedRate = arrivals / ((now - lastVisit[index]) / 1000.0);
+        arrivalRate[index] += RATE_SMOOTHING * (observedRate - arrivalRate[index]);
+    }
+    remainingBacklog[index] = remaining;
+    lastVisit[index] = now;
+    visited[index] = true;
+}
+```
+""",
+    "adaptive_backoff": """
+```cpp
+// Adaptive backoff policy: round robin that skips slaves which came back empty
+const unsigned long BACKOFF_MIN_MS = 30000;  // pause after the first empty visit, doubled after each further one
+const unsigned long BACKOFF_MAX_MS = 300000;
+
+unsigned long backoffMs[MAX_SLAVES];
+unsigned long nextPollAt[MAX_SLAVES];
+size_t nextSlave = 0;
+
+int choosePollTarget() {
+    size_t count = min(i2cMaster.slaveAddresses.size(), (size_t)MAX_SLAVES);
+    unsigned long now = millis();
+    for (size_t offset = 0; offset < count; offset++) {
+        size_t index = (nextSlave + offset) % count;
+        if ((long)(now - nextPollAt[index]) >= 0) {
+            nextSlave = index + 1;
+            return index;
+        }
+    }
+    return -1;
+}
+
+uint8_t readingsPerVisit(int index) {
+    return 1;
+}
+
+void startVisit() {
+}
+
+void recordVisit(int index, uint8_t delivered) {
+    if (delivered > 0) {
+        backoffMs[index] = 0;
+    } else if (backoffMs[index] > 0) {
+        backoffMs[index] = min(backoffMs[index] * 2, BACKOFF_MAX_MS);
+    } else {
+        backoffMs[index] = BACKOFF_MIN_MS;
+    }
+    nextPollAt[index] = millis() + backoffMs[index];
+}
+```
+""",
+    "module_a": """
+The master uses a backlog-weighted polling policy: every reading sent to Module B must carry "Backlog", the number of readings still waiting in the ring buffer. Use the function below exactly as given (with binary chunk framing, add the key the same way in binaryRequestEvent() right after the reading is popped):
+
+```cpp
+// Module A - replaces the library's requestEvent(). Register it after i2cSlave.initSlave():
+//     Wire.onRequest(backlogRequestEvent);
+void backlogRequestEvent() {
+    if (AnttiGateway::simpleQueue.getSize() == 0) {
+        // Refill request: like the library, take the next reading and write nothing this time
+        String reading = AnttiGateway::ringBuffer.pop();
+        if (reading.length() == 0) {
+            return;
+        }
+        StaticJsonDocument<1024> doc;
+        if (!deserializeJson(doc, reading)) {
+            doc["Backlog"] = AnttiGateway::ringBuffer.getSize();
+            reading = "";
+            serializeJson(doc, reading);
+        }
+        AnttiGateway::breakDataIntoChunks(reading);
+        return;
+    }
+    String chunk;
+    AnttiGateway::simpleQueue.pop(chunk);
+    Wire.write((const uint8_t*)chunk.c_str(), chunk.length());
+}
+```
+"""
+}
+
+
+ADDITIONAL_INFO_WINDOWED_AGGREGATION = {
+    "description": """
+Windowed aggregation is selected for Module A: instead of sending every reading, Module A folds the readings into a window and sends one summary per window. This divides the readings Module B has to fetch and the ring buffer slots used by the number of readings per window. Build each reading as usual, but pass it to aggregateReading() instead of i2cSlave.addToRingBuffer(), and call checkWindow() at the start of every loop() so a window also closes when the sensor goes quiet.
+
+A summary keeps the latest value of every text field and, for every numeric field, sends the mean under the field's own name plus "<field>_min", "<field>_max" and "<field>_last"; "Count" is the number of readings in the window. Numeric fields missing from every reading of the window are left out. Use the code below as given and only change the constants at the top.
+""",
+    "module_a": """
+```cpp
+// Windowed aggregation - one summary per window instead of every reading
+const uint16_t WINDOW_READINGS = 10;  // close the window after this many readings (0: no limit)
+const unsigned long WINDOW_MS = 0;  // close the window this long after its first reading (0: no limit)
+const bool ROUND_MEANS = false;  // true when the data format sends scaled integers
+const bool AGG_DEBUG = false;  // print AGG_IN/AGG_OUT lines for window_aggregator.py check
+const uint8_t MAX_AGG_FIELDS = 10;
+
+struct FieldWindow {
+    char name[24];
+    uint16_t count;
+    float minValue;
+    float maxValue;
+    float sum;
+    float last;
+};
+
+FieldWindow aggFields[MAX_AGG_FIELDS];
+uint8_t aggFieldCount = 0;
+uint16_t windowCount = 0;
+unsigned long windowStart = 0;
+StaticJsonDocument<512> lastReading;  // text fields of the latest reading
+
+FieldWindow* aggField(const char* name) {
+    for (uint8_t i = 0; i < aggFieldCount; i++) {
+        if (strcmp(aggFields[i].name, name) == 0) {
+            return &aggFields[i];
+        }
+    }
+    if (aggFieldCount == MAX_AGG_FIELDS) {
+        return NULL;
+    }
+    FieldWindow* field = &aggFields[aggFieldCount++];
+    strncpy(field->name, name, sizeof(field->name) - 1);
+    field->name[sizeof(field->name) - 1] = '\\0';
+    field->count = 0;
+    field->sum = 0;
+    return field;
+}
+
+void flushWindow() {
+    if (windowCount == 0) {
+        return;
+    }
+    StaticJsonDocument<1024> summary;
+    summary.set(lastReading);
+    summary["Count"] = windowCount;
+    for (uint8_t i = 0; i < aggFieldCount; i++) {
+        FieldWindow& field = aggFields[i];
+        if (field.count == 0) {
+            continue;
+        }
+        String name = field.name;
+        float mean = field.sum / field.count;
+        if (ROUND_MEANS) {
+            summary[name] = lroundf(mean);
+        } else {
+            summary[name] = mean;
+        }
+        summary[name + "_min"] = field.minValue;
+        summary[name + "_max"] = field.maxValue;
+        summary[name + "_last"] = field.last;
+    }
+    String json;
+    serializeJson(summary, json);
+    if (AGG_DEBUG) {
+        Serial.print("AGG_OUT ");
+        Serial.println(json);
+    }
+    i2cSlave.addToRingBuffer(json);
+    windowCount = 0;
+    aggFieldCount = 0;
+    lastReading.clear();
+}
+
+// Use instead of i2cSlave.addToRingBuffer(reading) for sensor readings
+void aggregateReading(const String& reading) {
+    unsigned long now = millis();
+    if (windowCount > 0 && WINDOW_MS > 0 && now - windowStart >= WINDOW_MS) {
+        flushWindow();
+    }
+    StaticJsonDocument<512> doc;
+    if (deserializeJson(doc, reading)) {
+        return;
+    }
+    if (AGG_DEBUG) {
+        Serial.print("AGG_IN ");
+        Serial.print(now);
+        Serial.print(" ");
+        Serial.println(reading);
+    }
+    if (windowCount == 0) {
+        windowStart = now;
+    }
+    windowCount++;
+    lastReading.clear();
+    for (JsonPair pair : doc.as<JsonObject>()) {
+        const char* key = pair.key().c_str();
+        JsonVariant value = pair.value();
+        if (strcmp(key, "SlaveID") == 0 || strcmp(key, "Backlog") == 0) {
+            continue;
+        }
+        if (value.is<float>()) {  // int or float; false for bool and text
+            FieldWindow* field = aggField(key);
+            if (field == NULL) {
+                continue;
+            }
+            float v = value.as<float>();
+            if (field->count == 0 || v < field->minValue) {
+                field->minValue = v;
+            }
+            if (field->count == 0 || v > field->maxValue) {
+                field->maxValue = v;
+            }
+            field->sum += v;
+            field->last = v;
+            field->count++;
+        } else {
+            lastReading[String(key)] = value;
+        }
+    }
+    if (WINDOW_READINGS > 0 && windowCount >= WINDOW_READINGS) {
+        flushWindow();
+    }
+}
+
+// Call at the start of loop(): closes a time window when no reading arrives to close it
+void checkWindow() {
+    if (windowCount > 0 && WINDOW_MS > 0 && millis() - windowStart >= WINDOW_MS) {
+        flushWindow();
+    }
+}
+```
+"""
+}
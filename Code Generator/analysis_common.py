@@ -0,0 +1,73 @@
+# analysis_common.py
+
+# Helpers shared by the capture analyzers and simulators: streaming line reader for large
+# captures, nearest-rank percentiles and a bounded latency sample for long-running statistics.
+
+import mmap
+import os
+import random
+import sys
+
+LATENCY_SAMPLE_SIZE = 4096  # Latencies kept per LatencySample for the percentiles
+
+
+def iter_lines(path):
+    """
+    Yield the lines of a file without loading it (memory-mapped, trailing CR/LF removed).
+    :param path: Log file, or "-" to read standard input.
+    """
+    if path == "-":
+        for line in sys.stdin.buffer:
+            yield line.rstrip(b"\r\n")
+        return
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b""):
+                yield line.rstrip(b"\r\n")
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def round_or_none(value, digits=3):
+    return None if value is None else round(value, digits)
+
+
+class LatencySample:
+    def __init__(self, size=LATENCY_SAMPLE_SIZE, seed=0):
+        """
+        Uniform reservoir sample of a latency stream (algorithm R) with the exact count and maximum,
+        so memory stays fixed however long the capture is. Percentiles are exact until the stream
+        exceeds the sample size and estimates after that.
+        :param size: Number of latencies kept.
+        :param seed: Seed of the replacement choice, so repeated runs report the same percentiles.
+        """
+        self.size = size
+        self.values = []
+        self.count = 0
+        self.max = None
+        self._rng = random.Random(seed)
+
+    def add(self, value):
+        self.count += 1
+        if self.max is None or value > self.max:
+            self.max = value
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            index = self._rng.randrange(self.count)
+            if index < self.size:
+                self.values[index] = value
+
+    def percentile(self, fraction):
+        return percentile(self.values, fraction)
+
+    def __len__(self):
+        return self.count
@@ -27,31 +27,101 @@ class ChatGPTAPI:
         if not self.api_key or not self.model:
             return {"error": "API key or model not set.", "raw_response": ""}
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-
-        payload = {
-            "model": self.model,
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": 1500,
-            "temperature": 0.7
-        }
+        payload = self._build_payload(prompt)
 
+        response = None
         try:
-            response = requests.post(self.api_url, headers=headers, json=payload)
-            response.raise_for_status()
+            response = self._post(payload)
             data = response.json()
             content = data.get("choices", [])[0].get("message", {}).get("content", "")
 
             # Parse response to extract code and explanation
-            return self._parse_response(content)
+            result = self._parse_response(content)
+            result["usage"] = self._extract_usage(data)
+            return result
         except requests.exceptions.RequestException as e:
             return {"error": str(e), "raw_response": ""}
         except (KeyError, IndexError) as e:
             return {"error": "Error parsing response.", "raw_response": response.text}
 
+    def _post(self, payload):
+        """
+        Send a chat completion request.
+        :param payload: The request body.
+        :return: The successful HTTP response. Raises requests.exceptions.RequestException on failure.
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        response = requests.post(self.api_url, headers=headers, json=payload)
+        response.raise_for_status()
+        return response
+
+    def _build_payload(self, prompt, max_tokens=1500, temperature=0.7):
+        """
+        Build the chat completion request body for a prompt.
+        :param prompt: The input prompt to send to the ChatGPT API.
+        :return: The request body as a dictionary.
+        """
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+
+    def build_batch_line(self, custom_id, prompt):
+        """
+        Build one line of a batch input file for the given prompt.
+        The body is identical to the one sent by generate_code_with_explanation.
+        :param custom_id: Identifier used to match the result back to the request.
+        :param prompt: The input prompt to send to the ChatGPT API.
+        :return: A dictionary ready to be serialised as a JSONL line.
+        """
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": self._build_payload(prompt)
+        }
+
+    def parse_batch_result(self, result_line):
+        """
+        Parse one line of a batch output file.
+        :param result_line: Dictionary decoded from a batch output JSONL line.
+        :return: A dictionary with the generated code and explanation, or error details.
+        """
+        if result_line.get("error"):
+            return {"error": str(result_line["error"]), "raw_response": json.dumps(result_line)}
+
+        response = result_line.get("response") or {}
+        if response.get("status_code", 200) != 200:
+            return {"error": f"HTTP {response.get('status_code')}", "raw_response": json.dumps(response.get("body", {}))}
+
+        try:
+            content = response["body"]["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            return {"error": "Error parsing response.", "raw_response": json.dumps(response)}
+        result = self._parse_response(content)
+        result["usage"] = self._extract_usage(response["body"])
+        return result
+
+    def _extract_usage(self, data):
+        """
+        Extract token usage from a chat completion response body.
+        :param data: Decoded response body.
+        :return: Dictionary with model, prompt, completion and cached token counts.
+        """
+        usage = data.get("usage") or {}
+        details = usage.get("prompt_tokens_details") or {}
+        return {
+            "model": self.model,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "cached_tokens": details.get("cached_tokens", 0)
+        }
+
     def _parse_response(self, response_content):
         """
         Parse the response content to extract code and explanation.
@@ -90,10 +160,6 @@ class ChatGPTAPI:
 
     def analyse_text(self, text_input, max_tokens=300):
         """Send a text prompt to ChatGPT and return the response."""
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
         payload = {
             "model": self.model,
             "messages": [{"role": "user", "content": text_input}],
@@ -101,8 +167,7 @@ class ChatGPTAPI:
         }
 
         try:
-            response = requests.post(self.api_url, headers=headers, json=payload)
-            response.raise_for_status()
+            response = self._post(payload)
             data = response.json()
             return data["choices"][0]["message"]["content"]
         except requests.exceptions.RequestException as e:
@@ -0,0 +1,195 @@
+# api_pool.py
+
+import time
+import threading
+from collections import deque
+import requests
+from api import ChatGPTAPI
+
+# How long a key is taken out of rotation after an authentication or rate limit error (seconds)
+QUARANTINE_UNAUTHORIZED = 600
+QUARANTINE_RATE_LIMITED = 30
+ERROR_WINDOW = 20  # Number of recent requests used for the error rate
+
+
+def get_model_keys(model_info):
+    """
+    Return the list of API keys configured for a model.
+    A model entry in config.json may have a single "key" or a list of "keys".
+    """
+    keys = model_info.get("keys") or []
+    if not keys and model_info.get("key"):
+        keys = [model_info["key"]]
+    return [key for key in keys if key]
+
+
+class KeyState:
+    def __init__(self, key, index):
+        """
+        Health and throughput bookkeeping for one API key.
+        :param key: The API key.
+        :param index: Position of the key in config.json (used as its display name).
+        """
+        self.key = key
+        self.name = f"key{index + 1} (...{key[-4:]})"
+        self.recent = deque(maxlen=ERROR_WINDOW)  # True for success, False for error
+        self.quarantined_until = 0.0
+        self.remaining_requests = None
+        self.limit_requests = None
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.last_used = 0
+
+    def error_rate(self):
+        if not self.recent:
+            return 0.0
+        return self.recent.count(False) / len(self.recent)
+
+    def quota_fraction(self):
+        """Fraction of the request quota left in the current window (1.0 if unknown)."""
+        if self.remaining_requests is None or not self.limit_requests:
+            return 1.0
+        return max(0.0, self.remaining_requests / self.limit_requests)
+
+    def score(self):
+        return self.quota_fraction() * (1.0 - self.error_rate()) / (1 + self.in_flight)
+
+
+class APIKeyPool:
+    def __init__(self, keys):
+        """
+        Spread requests across several API keys.
+        Keys are chosen by remaining quota, recent error rate and in-flight requests;
+        equally healthy keys are used round-robin.
+        :param keys: List of API keys.
+        """
+        self.keys = [KeyState(key, i) for i, key in enumerate(keys)]
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self._sequence = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def acquire(self):
+        """Pick the healthiest available key. Returns None if every key is quarantined."""
+        now = time.time()
+        with self.lock:
+            available = [k for k in self.keys if k.quarantined_until <= now]
+            if not available:
+                return None
+            best = max(available, key=lambda k: (k.score(), -k.last_used))
+            self._sequence += 1
+            best.last_used = self._sequence
+            best.in_flight += 1
+            return best
+
+    def release(self, key_state, status_code, headers=None, latency=0.0):
+        """
+        Record the outcome of a request made with key_state.
+        :param status_code: HTTP status code, or None if the request failed without a response.
+        :param headers: Response headers (used for the x-ratelimit-* quota headers).
+        :param latency: Request duration in seconds.
+        """
+        headers = headers or {}
+        with self.lock:
+            key_state.in_flight -= 1
+            key_state.requests += 1
+            key_state.total_latency += latency
+            ok = status_code is not None and status_code < 400
+            key_state.recent.append(ok)
+            if not ok:
+                key_state.errors += 1
+
+            remaining = headers.get("x-ratelimit-remaining-requests")
+            limit = headers.get("x-ratelimit-limit-requests")
+            if remaining is not None and limit is not None:
+                try:
+                    key_state.remaining_requests = int(remaining)
+                    key_state.limit_requests = int(limit)
+                except ValueError:
+                    pass
+
+            if status_code == 401:
+                key_state.quarantined_until = time.time() + QUARANTINE_UNAUTHORIZED
+            elif status_code == 429:
+                try:
+                    delay = float(headers.get("retry-after", QUARANTINE_RATE_LIMITED))
+                except ValueError:
+                    delay = QUARANTINE_RATE_LIMITED
+                key_state.quarantined_until = time.time() + delay
+
+    def report(self):
+        """Per-key throughput and health statistics as a list of dictionaries."""
+        now = time.time()
+        elapsed_minutes = max((now - self.started) / 60.0, 1e-9)
+        with self.lock:
+            return [{
+                "key": k.name,
+                "requests": k.requests,
+                "errors": k.errors,
+                "error_rate": round(k.error_rate(), 3),
+                "requests_per_minute": round(k.requests / elapsed_minutes, 2),
+                "avg_latency_s": round(k.total_latency / k.requests, 2) if k.requests else None,
+                "remaining_requests": k.remaining_requests,
+                "quarantined_for_s": max(0, round(k.quarantined_until - now))
+            } for k in self.keys]
+
+    def format_report(self):
+        """Human readable version of report()."""
+        lines = []
+        for row in self.report():
+            line = (f"{row['key']}: {row['requests']} requests, {row['errors']} errors, "
+                    f"{row['requests_per_minute']} req/min")
+            if row["avg_latency_s"] is not None:
+                line += f", avg {row['avg_latency_s']} s"
+            if row["remaining_requests"] is not None:
+                line += f", quota left {row['remaining_requests']}"
+            if row["quarantined_for_s"]:
+                line += f", quarantined {row['quarantined_for_s']} s"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+class PooledChatGPTAPI(ChatGPTAPI):
+    def __init__(self, api_keys, model):
+        """
+        ChatGPTAPI that sends each request with a key picked from an APIKeyPool.
+        :param api_keys: List of OpenAI API keys for the model.
+        :param model: Model to be used (e.g., "gpt-4").
+        """
+        super().__init__(api_key=api_keys[0] if api_keys else None, model=model)
+        self.api_keys = list(api_keys)
+        self.pool = APIKeyPool(self.api_keys)
+
+    def _post(self, payload):
+        """Send the request with the healthiest key, moving on to the next key after a 401 or 429."""
+        last_error = None
+        for _ in range(len(self.pool)):
+            key_state = self.pool.acquire()
+            if key_state is None:
+                break
+
+            headers = {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {key_state.key}"
+            }
+            start = time.monotonic()
+            try:
+                response = requests.post(self.api_url, headers=headers, json=payload)
+            except requests.exceptions.RequestException as e:
+                self.pool.release(key_state, None, latency=time.monotonic() - start)
+                last_error = e
+                continue
+
+            self.pool.release(key_state, response.status_code, response.headers, time.monotonic() - start)
+            if response.status_code in (401, 429):
+                last_error = requests.exceptions.HTTPError(
+                    f"{response.status_code} error for {key_state.name}", response=response)
+                continue
+            response.raise_for_status()
+            return response
+
+        raise last_error or requests.exceptions.RequestException("All API keys are quarantined.")
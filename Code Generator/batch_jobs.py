@@ -0,0 +1,347 @@
+# batch_jobs.py
+
+import hashlib
+import json
+import os
+import time
+import uuid
+import datetime
+import requests
+
+BATCH_OUTPUT_DIR = "batch_output"
+TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+ESTIMATED_COMPLETION_TOKENS = 1500  # max_tokens of a request, so the estimate is an upper bound
+BATCH_TIMEOUT = 26 * 3600  # Seconds after submission before a batch is cancelled (24 h completion window + margin)
+
+
+def write_batch_file(chatgpt_api, items, path):
+    """
+    Serialise prompts into a JSONL batch input file.
+    :param chatgpt_api: ChatGPTAPI instance used to build the request bodies.
+    :param items: Iterable of (custom_id, prompt) tuples.
+    :param path: Path of the JSONL file to write.
+    :return: Number of lines written.
+    """
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, prompt in items:
+            f.write(json.dumps(chatgpt_api.build_batch_line(custom_id, prompt)) + "\n")
+            count += 1
+    return count
+
+
+def read_jsonl(path):
+    """Read a JSONL file and return a list of dictionaries."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class OpenAIBatchClient:
+    def __init__(self, api_key, base_url="https://api.openai.com/v1"):
+        """
+        Client for the OpenAI batch endpoint.
+        Batch requests are billed at a discount and use a separate rate limit pool,
+        so they never compete with interactive generations.
+        :param api_key: OpenAI API key.
+        :param base_url: Base URL of the API.
+        """
+        self.api_key = api_key
+        self.base_url = base_url
+        # Identifies the key in checkpoints without storing it
+        self.key_id = "openai:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+    def _headers(self):
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def submit(self, batch_file_path):
+        """Upload the batch file and create a batch job. Returns the batch id."""
+        with open(batch_file_path, "rb") as f:
+            response = requests.post(f"{self.base_url}/files", headers=self._headers(),
+                                     files={"file": f}, data={"purpose": "batch"})
+        response.raise_for_status()
+        file_id = response.json()["id"]
+
+        response = requests.post(f"{self.base_url}/batches", headers=self._headers(), json={
+            "input_file_id": file_id,
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h"
+        })
+        response.raise_for_status()
+        return response.json()["id"]
+
+    def status(self, batch_id):
+        """Return the batch object, including its 'status' field."""
+        response = requests.get(f"{self.base_url}/batches/{batch_id}", headers=self._headers())
+        response.raise_for_status()
+        return response.json()
+
+    def cancel(self, batch_id):
+        """Ask the API to cancel a batch (requests it already finished are still billed)."""
+        response = requests.post(f"{self.base_url}/batches/{batch_id}/cancel", headers=self._headers())
+        response.raise_for_status()
+
+    def fetch_results(self, batch_info):
+        """Download the output file of a completed batch and return its lines."""
+        results = []
+        for key in ("output_file_id", "error_file_id"):
+            file_id = batch_info.get(key)
+            if not file_id:
+                continue
+            response = requests.get(f"{self.base_url}/files/{file_id}/content", headers=self._headers())
+            response.raise_for_status()
+            results.extend(json.loads(line) for line in response.text.splitlines() if line.strip())
+        return results
+
+
+class LocalBatchClient:
+    def __init__(self, responder=None, work_dir=BATCH_OUTPUT_DIR, completion_delay=0.0):
+        """
+        Local stand-in for the batch endpoint, used for testing without an API key.
+        :param responder: Callable taking a request body and returning the message content.
+                          Defaults to a canned JSON code/explanation answer.
+        :param work_dir: Directory where output files are written.
+        :param completion_delay: Seconds before a submitted batch reports 'completed'.
+        """
+        self.responder = responder or self._default_responder
+        self.work_dir = work_dir
+        self.completion_delay = completion_delay
+        self.batches = {}
+        self.key_id = "local"
+
+    @staticmethod
+    def _default_responder(body):
+        prompt = body["messages"][0]["content"]
+        return json.dumps({
+            "code": f"// Local batch endpoint stub for model {body.get('model')}\n",
+            "explanation": f"Stub response for a prompt of {len(prompt)} characters."
+        })
+
+    def submit(self, batch_file_path):
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        os.makedirs(self.work_dir, exist_ok=True)
+        output_path = os.path.join(self.work_dir, f"{batch_id}_output.jsonl")
+
+        with open(output_path, "w", encoding="utf-8") as out:
+            for line in read_jsonl(batch_file_path):
+                try:
+                    content = self.responder(line["body"])
+                    result = {
+                        "id": f"req_{uuid.uuid4().hex[:12]}",
+                        "custom_id": line["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": {
+                                "model": line["body"].get("model"),
+                                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]
+                            }
+                        },
+                        "error": None
+                    }
+                except Exception as e:
+                    result = {"custom_id": line.get("custom_id"), "response": None,
+                              "error": {"message": str(e)}}
+                out.write(json.dumps(result) + "\n")
+
+        self.batches[batch_id] = {
+            "id": batch_id,
+            "submitted_at": time.time(),
+            "output_file": output_path
+        }
+        return batch_id
+
+    def status(self, batch_id):
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            # Submitted before a restart: the output file is all there is to a local batch
+            output_path = os.path.join(self.work_dir, f"{batch_id}_output.jsonl")
+            if os.path.exists(output_path):
+                return {"id": batch_id, "status": "completed", "output_file": output_path}
+            return {"id": batch_id, "status": "failed"}
+        done = time.time() - batch["submitted_at"] >= self.completion_delay
+        return {"id": batch_id, "status": "completed" if done else "in_progress",
+                "output_file": batch["output_file"]}
+
+    def cancel(self, batch_id):
+        self.batches.pop(batch_id, None)
+
+    def fetch_results(self, batch_info):
+        return read_jsonl(batch_info["output_file"])
+
+
+class BatchJob:
+    def __init__(self, chatgpt_api, client, output_dir=BATCH_OUTPUT_DIR, poll_interval=30, log=None, ledger=None,
+                 checkpoint=None, timeout=BATCH_TIMEOUT):
+        """
+        Collect prompts, submit them as one batch and write the parsed results to disk.
+        :param chatgpt_api: ChatGPTAPI instance (model and payload settings).
+        :param client: OpenAIBatchClient or LocalBatchClient, or a list of clients (one per API key).
+                       Requests are split evenly so each key's batch quota is used in parallel.
+        :param output_dir: Directory for batch input files and generated artifacts.
+        :param poll_interval: Seconds between status polls.
+        :param log: Callable(message, level) used for progress messages.
+        :param ledger: Optional UsageLedger. Usage is recorded at the batch discount. Before each shard is
+                       submitted its cost is estimated (prompt length / 4 input tokens, max_tokens output) and
+                       added to the shards already submitted by this run; a shard that would exceed a budget
+                       is not submitted. A submitted batch cannot be stopped, so this is the only check.
+        :param checkpoint: Optional job_queue.JobCheckpoint. Submitted batch ids, the key_id of the client
+                           that submitted them and parsed results are stored in it, so a resumed run polls the
+                           batches it already paid for with the same API key and only submits the requests
+                           that have no result yet. A batch whose key is no longer configured is abandoned.
+        :param timeout: Seconds after its submission (kept across resumes) before a batch that has not
+                        finished is cancelled and its requests are left without a result (None: no limit).
+        """
+        self.chatgpt_api = chatgpt_api
+        self.clients = client if isinstance(client, list) else [client]
+        self.output_dir = output_dir
+        self.poll_interval = poll_interval
+        self.log = log or (lambda message, level="INFO": print(f"[{level}] {message}"))
+        self.ledger = ledger
+        self.checkpoint = checkpoint
+        self.timeout = timeout
+        self.requests = {}
+
+    def add(self, custom_id, prompt, module_name, sensor=""):
+        """Queue a prompt. module_name decides which artifact is written ('module_a', 'module_b', 'data_format')."""
+        self.requests[custom_id] = {"prompt": prompt, "module": module_name, "sensor": sensor}
+
+    def run(self):
+        """
+        Submit the queued prompts, poll until the batch finishes and write the artifacts.
+        :return: Dictionary mapping custom_id to the parsed result.
+        """
+        if not self.requests:
+            self.log("Batch job has no requests.", "WARNING")
+            return {}
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        results, pending = self._resume()
+        in_flight = {custom_id for batch in pending.values() for custom_id in batch["custom_ids"]}
+        custom_ids = [cid for cid in self.requests if cid not in results and cid not in in_flight]
+        shards = [custom_ids[i::len(self.clients)] for i in range(len(self.clients))]
+
+        submitted_usd = 0.0  # Estimated cost of the shards this run submitted, not billed until they finish
+        for index, (client, shard) in enumerate(zip(self.clients, shards)):
+            if not shard:
+                continue
+            if self.ledger:
+                estimate = self._estimate_cost(shard)
+                exceeded = self.ledger.budget_exceeded(pending_usd=submitted_usd + estimate)
+                if exceeded:
+                    self.log(f"Batch paused, {len(shard)} requests not submitted: {exceeded}", "ERROR")
+                    continue
+                submitted_usd += estimate
+            input_path = os.path.join(self.output_dir, f"batch_input_{stamp}_{index}.jsonl")
+            count = write_batch_file(self.chatgpt_api,
+                                     ((cid, self.requests[cid]["prompt"]) for cid in shard), input_path)
+            self.log(f"Wrote {count} requests to {input_path}.", "INFO")
+            batch_id = client.submit(input_path)
+            self.log(f"Submitted batch {batch_id}.", "INFO")
+            pending[batch_id] = {"client": index, "key": client.key_id, "submitted": time.time(),
+                                 "custom_ids": shard}
+            if self.checkpoint:
+                self.checkpoint.put(f"batch:{batch_id}", pending[batch_id])
+
+        while pending:
+            for batch_id, batch in list(pending.items()):
+                client = self._client_for(batch)
+                if client is None:
+                    self.log(f"Batch {batch_id} was submitted with an API key that is no longer configured; "
+                             f"abandoning it.", "ERROR")
+                    del pending[batch_id]
+                    self._close_batch(batch_id, batch)
+                    continue
+                batch_info = client.status(batch_id)
+                status = batch_info.get("status")
+                if status not in TERMINAL_STATES:
+                    if self.timeout is not None and time.time() - batch.get("submitted", time.time()) > self.timeout:
+                        self.log(f"Batch {batch_id} did not finish within {self.timeout:g} s (status {status}); "
+                                 f"cancelling it.", "ERROR")
+                        try:
+                            client.cancel(batch_id)
+                        except Exception as e:
+                            self.log(f"Cancelling batch {batch_id} failed, abandoning it: {e}", "WARNING")
+                        del pending[batch_id]
+                        self._close_batch(batch_id, batch)
+                        continue
+                    self.log(f"Batch {batch_id} status: {status}", "DEBUG")
+                    continue
+                del pending[batch_id]
+                if status != "completed":
+                    self.log(f"Batch {batch_id} ended with status {status}.", "ERROR")
+                    self._close_batch(batch_id, batch)
+                    continue
+
+                batch_results = {}
+                for line in client.fetch_results(batch_info):
+                    custom_id = line.get("custom_id")
+                    if custom_id not in self.requests:
+                        continue
+                    result = self.chatgpt_api.parse_batch_result(line)
+                    batch_results[custom_id] = result
+                    if self.ledger:
+                        request = self.requests[custom_id]
+                        self.ledger.record(result.get("usage"), request["module"], request["sensor"], batch=True)
+                    if self.checkpoint and "error" not in result:
+                        self.checkpoint.put(f"result:{custom_id}", result)
+                self._write_artifacts(batch_id, batch_results)
+                self._close_batch(batch_id, batch)  # Only after its results are checkpointed
+                results.update(batch_results)
+            if pending:
+                time.sleep(self.poll_interval)
+
+        failed = sum(1 for r in results.values() if "error" in r)
+        self.log(f"Batch job completed: {len(results) - failed} ok, {failed} failed, "
+                 f"{len(self.requests) - len(results)} missing.", "INFO")
+        return results
+
+    def _client_for(self, batch):
+        """Client of the API key that submitted a batch (None if that key is no longer configured)."""
+        for client in self.clients:
+            if client.key_id == batch.get("key"):
+                return client
+        return None
+
+    def _estimate_cost(self, custom_ids):
+        """Upper bound of the cost of a shard at the batch discount (0 for models without pricing)."""
+        prompt_tokens = sum(len(self.requests[cid]["prompt"]) // 4 for cid in custom_ids)
+        return self.ledger.cost(self.chatgpt_api.model, prompt_tokens,
+                                ESTIMATED_COMPLETION_TOKENS * len(custom_ids), 0, batch=True)
+
+    def _resume(self):
+        """
+        State of an interrupted run from the checkpoint.
+        :return: (results already parsed, batches still open as batch_id -> {"client", "key", "submitted",
+                 "custom_ids"}).
+        """
+        if not self.checkpoint:
+            return {}, {}
+        results = {key: value for key, value in self.checkpoint.items("result:").items() if key in self.requests}
+        pending = {batch_id: batch for batch_id, batch in self.checkpoint.items("batch:").items()
+                   if not batch.get("closed")}
+        if results or pending:
+            self.log(f"Resuming batch job: {len(results)} results checkpointed, {len(pending)} batches "
+                     f"still open.", "INFO")
+        return results, pending
+
+    def _close_batch(self, batch_id, batch):
+        if self.checkpoint:
+            self.checkpoint.put(f"batch:{batch_id}", dict(batch, closed=True))
+
+    def _write_artifacts(self, batch_id, results):
+        """Write code and explanation files for every parsed result."""
+        batch_dir = os.path.join(self.output_dir, batch_id)
+        os.makedirs(batch_dir, exist_ok=True)
+        extensions = {"module_a": ".ino", "module_b": ".ino", "data_format": ".json"}
+
+        with open(os.path.join(batch_dir, "results.jsonl"), "w", encoding="utf-8") as summary:
+            for custom_id, result in results.items():
+                module_name = self.requests[custom_id]["module"]
+                summary.write(json.dumps({"custom_id": custom_id, "module": module_name, **result}) + "\n")
+                if "error" in result:
+                    continue
+                extension = extensions.get(module_name, ".txt")
+                with open(os.path.join(batch_dir, custom_id + extension), "w", encoding="utf-8") as f:
+                    f.write(result.get("code", ""))
+                with open(os.path.join(batch_dir, custom_id + "_explanation.txt"), "w", encoding="utf-8") as f:
+                    f.write(result.get("explanation", ""))
@@ -0,0 +1,199 @@
+# binary_framing.py
+
+# Compact binary chunk framing, an alternative to the JSON-wrapped chunks of breakDataIntoChunks().
+#
+# Frame layout (all fields one byte unless noted):
+#   0      magic 0xA5 (the master reads 0xFF padding when the slave has nothing to send)
+#   1      message id, incremented per reading, detects frames of different readings being mixed
+#   2      sequence number of the frame within the reading, from 0
+#   3      total number of frames in the reading
+#   4      payload length
+#   5..6   CRC-16/CCITT-FALSE (big endian) over bytes 0..4 and the payload
+#   7..    raw payload bytes, no escaping and no newline terminator
+#
+# The C++ side of this format is in additional_info.ADDITIONAL_INFO_BINARY_FRAMING and is added
+# to the generation prompts when binary framing is selected.
+
+from chunk_codec import RingBuffer, add_slave_id, MAX_CHUNK_SIZE, RING_BUFFER_SIZE, MAX_DATA_SIZE, I2C_PAD_BYTE
+
+FRAME_MAGIC = 0xA5
+FRAME_HEADER_SIZE = 7
+FRAME_MAX_PAYLOAD = MAX_CHUNK_SIZE - FRAME_HEADER_SIZE
+
+
+def _make_crc_table():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+
+_CRC_TABLE = _make_crc_table()
+
+
+def crc16_ccitt(data, crc=0xFFFF):
+    """CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), the same as crc16Ccitt() in the C++ template."""
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+
+def frame_count(length, max_payload=FRAME_MAX_PAYLOAD):
+    """Number of frames needed for a reading of the given length."""
+    return max(1, -(-length // max_payload))
+
+
+def encode_frames(data, msg_id, max_payload=FRAME_MAX_PAYLOAD):
+    """
+    Split a reading into binary frames.
+    :param data: Complete reading as bytes (or str, encoded as UTF-8).
+    :param msg_id: Message id (0-255).
+    :param max_payload: Payload bytes per frame, at most FRAME_MAX_PAYLOAD.
+    :return: List of frames as bytes.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    total = frame_count(len(data), max_payload)
+    if total > 255:
+        raise ValueError(f"Reading of {len(data)} bytes needs {total} frames, the maximum is 255.")
+    frames = []
+    for seq in range(total):
+        payload = data[seq * max_payload:(seq + 1) * max_payload]
+        header = bytes((FRAME_MAGIC, msg_id & 0xFF, seq, total, len(payload)))
+        crc = crc16_ccitt(payload, crc16_ccitt(header))
+        frames.append(header + bytes((crc >> 8, crc & 0xFF)) + payload)
+    return frames
+
+
+def decode_frame(raw):
+    """
+    Decode one frame read from the bus.
+    :param raw: Bytes read by the master (may include trailing padding).
+    :return: Dictionary with msg_id, seq, total and payload; None if there is no frame;
+             {"error": "crc"} or {"error": "length"} for a damaged frame.
+    """
+    if len(raw) < FRAME_HEADER_SIZE or raw[0] != FRAME_MAGIC:
+        return None
+    length = raw[4]
+    if length > FRAME_MAX_PAYLOAD or FRAME_HEADER_SIZE + length > len(raw):
+        return {"error": "length"}
+    payload = bytes(raw[FRAME_HEADER_SIZE:FRAME_HEADER_SIZE + length])
+    crc = crc16_ccitt(payload, crc16_ccitt(raw[:5]))
+    if crc != (raw[5] << 8 | raw[6]):
+        return {"error": "crc"}
+    return {"msg_id": raw[1], "seq": raw[2], "total": raw[3], "payload": payload}
+
+
+class BinarySlaveEndpoint:
+    def __init__(self, address, ring_buffer_size=RING_BUFFER_SIZE, max_payload=FRAME_MAX_PAYLOAD):
+        """
+        Module A side of the binary framing. Unlike the JSON requestEvent(), the request that
+        takes a new reading from the ring buffer also sends its first frame.
+        :param address: I2C slave address (becomes "SlaveID").
+        """
+        self.address = address
+        self.max_payload = max_payload
+        self.ring_buffer = RingBuffer(ring_buffer_size)
+        self.frames = []
+        self.msg_id = 0
+        self.ring_overwrites = 0
+        self.requests = 0
+
+    def add_reading(self, data):
+        """Same as SlaveEndpoint.add_reading(): add SlaveID and push, overwriting the oldest when full."""
+        if data in ("", b"", None):
+            return False
+        modified = add_slave_id(data, self.address)
+        overwritten = False
+        if self.ring_buffer.is_full():
+            self.ring_buffer.pop()
+            self.ring_overwrites += 1
+            overwritten = True
+        self.ring_buffer.push(modified)
+        return overwritten
+
+    def on_request(self):
+        """The bytes written to the bus for one master request (b"" if there is nothing to send)."""
+        self.requests += 1
+        if not self.frames:
+            data = self.ring_buffer.pop()
+            if not data:
+                return b""
+            self.msg_id = (self.msg_id + 1) & 0xFF
+            self.frames = encode_frames(data, self.msg_id, self.max_payload)
+        return self.frames.pop(0)
+
+
+class BinaryReassembler:
+    def __init__(self, ring_buffer_size=RING_BUFFER_SIZE, max_data_size=MAX_DATA_SIZE):
+        """Module B side of the binary framing. Reassembly state is kept per slave address."""
+        self.ring_buffer = RingBuffer(ring_buffer_size)
+        self.max_data_size = max_data_size
+        self.partial = {}  # address -> (msg_id, next seq, bytearray)
+        self.stats = {
+            "frames": 0,
+            "datasets": 0,
+            "empty_reads": 0,
+            "crc_errors": 0,
+            "out_of_sequence": 0,
+            "overflows": 0,
+            "ring_overwrites": 0
+        }
+
+    def receive(self, raw, address=0):
+        """
+        Process the bytes of one I2C read from the given slave.
+        :return: The completed reading if this frame completed one, otherwise None.
+        """
+        frame = decode_frame(raw)
+        if frame is None:
+            self.stats["empty_reads"] += 1
+            return None
+        if "error" in frame:
+            self.stats["crc_errors"] += 1
+            self.partial.pop(address, None)
+            return None
+        self.stats["frames"] += 1
+
+        if frame["seq"] == 0:
+            self.partial[address] = (frame["msg_id"], 0, bytearray())
+        msg_id, expected, data = self.partial.get(address, (None, None, None))
+        if msg_id != frame["msg_id"] or expected != frame["seq"]:
+            self.stats["out_of_sequence"] += 1
+            self.partial.pop(address, None)
+            return None
+
+        if len(data) + len(frame["payload"]) >= self.max_data_size:
+            self.stats["overflows"] += 1
+            self.partial.pop(address, None)
+            return None
+        data += frame["payload"]
+        self.partial[address] = (msg_id, expected + 1, data)
+
+        if expected + 1 == frame["total"]:
+            del self.partial[address]
+            dataset = bytes(data)
+            if self.ring_buffer.is_full():
+                self.ring_buffer.pop()
+                self.stats["ring_overwrites"] += 1
+            self.ring_buffer.push(dataset)
+            self.stats["datasets"] += 1
+            return dataset
+        return None
+
+    def get_from_ring_buffer(self):
+        """The oldest complete reading, or b"" if none."""
+        return self.ring_buffer.pop()
+
+
+def binary_i2c_transaction(slave, master, request_size=MAX_CHUNK_SIZE):
+    """
+    One Wire.requestFrom(slave, request_size) exchange with binary framing.
+    :return: The bytes the slave actually wrote.
+    """
+    written = slave.on_request()[:request_size]
+    master.receive(written + I2C_PAD_BYTE * (request_size - len(written)), slave.address)
+    return written
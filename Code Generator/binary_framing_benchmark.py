@@ -0,0 +1,97 @@
+# binary_framing_benchmark.py
+
+# Compares the JSON-wrapped chunk framing with the compact binary framing:
+# bytes on the wire, I2C transactions and bus time per reading.
+# The JSON slave sends MAX_CHUNK_SIZE_SLAVE data bytes per chunk while a binary frame fills the whole
+# MAX_CHUNK_SIZE request, so the binary framing is also run with MAX_CHUNK_SIZE_SLAVE-byte requests
+# ("binary64" columns) to separate what the framing itself saves from what the larger frames save.
+# Run: python binary_framing_benchmark.py [--clock 100000] [--json]
+
+import argparse
+import json
+from functools import partial
+from chunk_codec import (SlaveEndpoint, MasterReassembler, i2c_transaction, add_slave_id, MAX_CHUNK_SIZE,
+                         MAX_CHUNK_SIZE_SLAVE)
+from binary_framing import BinarySlaveEndpoint, BinaryReassembler, binary_i2c_transaction, FRAME_HEADER_SIZE
+from chunk_codec_benchmark import SAMPLE_PAYLOADS, SLAVE_ADDRESS, print_table
+
+I2C_BITS_PER_BYTE = 9  # 8 data bits + ACK
+
+
+def bus_time_ms(transactions, request_size, clock):
+    """Time the master spends clocking requestFrom() reads, including the address byte."""
+    return transactions * (request_size + 1) * I2C_BITS_PER_BYTE / clock * 1000
+
+
+def deliver(slave, master, transaction, max_transactions=50):
+    """Run transactions until the master has the reading. Returns (transactions, bytes written, reading)."""
+    transactions = 0
+    written = 0
+    while master.ring_buffer.is_empty() and transactions < max_transactions:
+        written += len(transaction(slave, master))
+        transactions += 1
+    return transactions, written, master.get_from_ring_buffer()
+
+
+def deliver_binary(reading, request_size):
+    """deliver() with binary frames that fill requests of request_size bytes."""
+    slave = BinarySlaveEndpoint(SLAVE_ADDRESS, max_payload=request_size - FRAME_HEADER_SIZE)
+    slave.add_reading(reading)
+    return deliver(slave, BinaryReassembler(), partial(binary_i2c_transaction, request_size=request_size))
+
+
+def compare(name, reading, clock, request_size=MAX_CHUNK_SIZE, small_request_size=MAX_CHUNK_SIZE_SLAVE):
+    """
+    :param request_size: requestFrom() size of the JSON and the full-size binary runs.
+    :param small_request_size: requestFrom() size of the binary run reported in the "binary64" columns.
+    """
+    dataset = add_slave_id(reading, SLAVE_ADDRESS)
+
+    slave, master = SlaveEndpoint(SLAVE_ADDRESS), MasterReassembler()
+    slave.add_reading(reading)
+    json_transactions, json_bytes, json_result = deliver(slave, master, i2c_transaction)
+
+    binary_transactions, binary_bytes, binary_result = deliver_binary(reading, request_size)
+    small_transactions, small_bytes, small_result = deliver_binary(reading, small_request_size)
+
+    json_ms = bus_time_ms(json_transactions, request_size, clock)
+    binary_ms = bus_time_ms(binary_transactions, request_size, clock)
+    small_ms = bus_time_ms(small_transactions, small_request_size, clock)
+    return {
+        "payload": name,
+        "reading_bytes": len(dataset),
+        "json_wire_bytes": json_bytes,
+        "binary_wire_bytes": binary_bytes,
+        "binary64_wire_bytes": small_bytes,
+        "json_transactions": json_transactions,
+        "binary_transactions": binary_transactions,
+        "binary64_transactions": small_transactions,
+        "json_bus_ms": round(json_ms, 2),
+        "binary_bus_ms": round(binary_ms, 2),
+        "binary64_bus_ms": round(small_ms, 2),
+        "bus_time_saved_pct": round((json_ms - binary_ms) / json_ms * 100, 1),
+        "binary64_saved_pct": round((json_ms - small_ms) / json_ms * 100, 1),
+        "all_delivered": json_result == binary_result == small_result == dataset
+    }
+
+
+def run(clock=100000):
+    """Compare both framings for every sample payload and return the result rows."""
+    return [compare(name, reading, clock) for name, reading in SAMPLE_PAYLOADS.items()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON and binary chunk framing.")
+    parser.add_argument("--clock", type=int, default=100000, help="I2C clock in Hz (initMaster default 100 kHz).")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    rows = run(args.clock)
+    if args.json:
+        print(json.dumps(rows, indent=4))
+    else:
+        print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
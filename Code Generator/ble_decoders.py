@@ -0,0 +1,353 @@
+# ble_decoders.py
+
+# Host-side decoding of captured BLE advertisements into typed readings, driven by the "decoder"
+# specs of the sensors.json catalog entries. Frames are decoded in batch: payloads are packed into
+# one uint8 matrix and each spec variant is read through a NumPy structured dtype view of it.
+#
+# Decoder spec (in a sensors.json entry, next to data_format):
+#   "decoder": {
+#       "source": "manufacturer_data" or "service_data:<16-bit uuid>",
+#       "variants": [{
+#           "name": "rawv2",
+#           "min_length": 24,
+#           "match": [{"offset": 0, "bytes": "990405", "mask": "ffffff"}],   (mask is optional)
+#           "fields": {"temperature": {"offset": 3, "type": ">i2", "scale": 0.005, "invalid": -32768}}
+#       }]
+#   }
+# "type" is a NumPy dtype string; value = ((raw >> shift) + bias) * scale; shifted raw values equal to
+# "invalid" become NaN. Optional: "clip": [low, high] bounds the value, "integer": true rounds it and
+# writes it as an int (for data_format "int" fields).
+#
+# Captures are NDJSON lines like {"t": 1718000000.1, "mac": "c6:f3:cf:4e:f4:b1",
+# "manufacturer_data": "9904...", "service_data": {"fe95": "5020..."}}. They are decoded in batches of
+# CAPTURE_BATCH frames, so the capture size is not limited by memory.
+# Run: python ble_decoders.py decode capture.ndjson --out readings.ndjson
+#      python ble_decoders.py check slave_serial.log --sensor ruuvitag   (decoder vs firmware output)
+
+import argparse
+import csv
+import json
+import re
+import sys
+import time
+import numpy as np
+from analysis_common import iter_lines
+
+NO_MAC = ""
+CAPTURE_BATCH = 100000  # Frames decoded per batch
+
+
+def load_decoder_specs(sensors_file="sensors.json", sensor_keys=None):
+    """
+    Decoder specs of the catalog.
+    :param sensor_keys: Only these catalog keys (all sensors with a decoder if None).
+    :return: Dictionary of sensor key -> decoder spec.
+    """
+    with open(sensors_file, "r") as f:
+        sensors = json.load(f).get("sensors", {})
+    specs = {}
+    for key, sensor in sensors.items():
+        if sensor_keys and key not in sensor_keys:
+            continue
+        if "decoder" in sensor:
+            specs[key] = sensor["decoder"]
+    if sensor_keys:
+        missing = [key for key in sensor_keys if key not in specs]
+        if missing:
+            raise KeyError(f"No decoder spec in {sensors_file} for: {', '.join(missing)}")
+    return specs
+
+
+def _clean_hex(text):
+    return text.replace(" ", "").replace(":", "")
+
+
+def pack_payloads(hex_payloads, width=0):
+    """
+    Pack hex payloads into one zero-padded matrix.
+    :param hex_payloads: List of hex strings ("" for frames without this source).
+    :param width: Minimum row width in bytes.
+    :return: (uint8 matrix of shape (n, width), int32 array of payload lengths).
+    """
+    hex_payloads = [_clean_hex(h) for h in hex_payloads]
+    lengths = np.fromiter((len(h) // 2 for h in hex_payloads), dtype=np.int32, count=len(hex_payloads))
+    width = max(width, int(lengths.max()) if len(lengths) else 0, 1)
+    joined = "".join(h.ljust(2 * width, "0") for h in hex_payloads)
+    matrix = np.frombuffer(bytes.fromhex(joined), dtype=np.uint8).reshape(len(hex_payloads), width)
+    return matrix, lengths
+
+
+def _variant_width(variant):
+    width = variant.get("min_length", 0)
+    for field in variant["fields"].values():
+        width = max(width, field["offset"] + np.dtype(field["type"]).itemsize)
+    for match in variant.get("match", []):
+        width = max(width, match["offset"] + len(match["bytes"]) // 2)
+    return width
+
+
+def spec_width(spec):
+    """Row width needed to read every field of every variant of a spec."""
+    return max(_variant_width(variant) for variant in spec["variants"])
+
+
+def _match_mask(variant, matrix, lengths):
+    mask = lengths >= max(variant.get("min_length", 0), 1)
+    for match in variant.get("match", []):
+        expected = np.frombuffer(bytes.fromhex(match["bytes"]), dtype=np.uint8)
+        columns = matrix[:, match["offset"]:match["offset"] + len(expected)]
+        if "mask" in match:
+            bits = np.frombuffer(bytes.fromhex(match["mask"]), dtype=np.uint8)
+            columns = columns & bits
+            expected = expected & bits
+        mask &= np.all(columns == expected, axis=1)
+    return mask
+
+
+def _field_view(variant, matrix):
+    """Structured dtype view of the matrix: every field at its offset, one record per row, no copy."""
+    names = list(variant["fields"])
+    dtype = np.dtype({
+        "names": names,
+        "formats": [variant["fields"][name]["type"] for name in names],
+        "offsets": [variant["fields"][name]["offset"] for name in names],
+        "itemsize": matrix.shape[1]
+    })
+    return np.ascontiguousarray(matrix).view(dtype).reshape(len(matrix))
+
+
+def decode_payloads(spec, matrix, lengths):
+    """
+    Decode a batch of payloads with one decoder spec.
+    :param matrix: uint8 matrix from pack_payloads() (at least spec_width() wide).
+    :param lengths: Payload lengths.
+    :return: (boolean array of decoded rows, dictionary of field -> float64 array with NaN where unavailable).
+    """
+    if matrix.shape[1] < spec_width(spec):
+        matrix = np.pad(matrix, ((0, 0), (0, spec_width(spec) - matrix.shape[1])))
+    decoded = np.zeros(len(matrix), dtype=bool)
+    fields = {}
+    for variant in spec["variants"]:
+        rows = _match_mask(variant, matrix, lengths) & ~decoded
+        if not rows.any():
+            continue
+        decoded |= rows
+        records = _field_view(variant, matrix)[rows]
+        for name, field in variant["fields"].items():
+            raw = records[name]
+            if "shift" in field:
+                raw = raw >> field["shift"]
+            values = (raw.astype(np.float64) + field.get("bias", 0)) * field.get("scale", 1)
+            if "clip" in field:
+                values = np.clip(values, *field["clip"])
+            if field.get("integer"):
+                values = np.round(values)
+            if "invalid" in field:
+                values[raw == field["invalid"]] = np.nan
+            column = fields.setdefault(name, np.full(len(matrix), np.nan))
+            column[rows] = values
+    return decoded, fields
+
+
+def _source_payload(record, source):
+    if source == "manufacturer_data":
+        return record.get("manufacturer_data") or ""
+    uuid = source.split(":", 1)[1].lower()
+    return (record.get("service_data") or {}).get(uuid) or ""
+
+
+def load_capture(path, batch_size=CAPTURE_BATCH):
+    """
+    Read an NDJSON capture (streamed line by line).
+    :param batch_size: Records per batch.
+    :return: Generator of lists of capture records.
+    """
+    records = []
+    for line in iter_lines(path):
+        if line.strip():
+            records.append(json.loads(line))
+            if len(records) >= batch_size:
+                yield records
+                records = []
+    if records:
+        yield records
+
+
+def integer_fields(specs):
+    """Dictionary of sensor key -> names of the fields its decoder writes as ints."""
+    return {key: {name for variant in spec["variants"] for name, field in variant["fields"].items()
+                  if field.get("integer")} for key, spec in specs.items()}
+
+
+def reading_fields(specs):
+    """Every field name a reading decoded with these specs can have, sensor_id included."""
+    return sorted({name for spec in specs.values() for variant in spec["variants"] for name in variant["fields"]}
+                  | {"sensor_id"})
+
+
+def decode_records(records, specs):
+    """
+    Decode capture records with every spec; each frame goes to the first spec that decodes it.
+    :param records: Capture records (dictionaries).
+    :param specs: Dictionary of sensor key -> decoder spec.
+    :return: List of (sensor key, row indices, field dictionary restricted to those rows).
+    """
+    claimed = np.zeros(len(records), dtype=bool)
+    results = []
+    for key, spec in specs.items():
+        matrix, lengths = pack_payloads([_source_payload(r, spec["source"]) for r in records], spec_width(spec))
+        decoded, fields = decode_payloads(spec, matrix, lengths)
+        rows = np.flatnonzero(decoded & ~claimed)
+        claimed[rows] = True
+        results.append((key, rows, {name: values[rows] for name, values in fields.items()}))
+    return results
+
+
+def iter_readings(records, results, digits=4, integers=None):
+    """
+    Readings in data_format shape, in capture order. Unavailable (NaN) fields are omitted.
+    :param integers: integer_fields() of the specs; those fields are written as ints.
+    """
+    readings = []
+    for key, rows, fields in results:
+        names = list(fields)
+        whole = (integers or {}).get(key, set())
+        columns = [np.round(fields[name], digits).tolist() for name in names]
+        for position, row in enumerate(rows.tolist()):
+            reading = {"sensor_id": records[row].get("mac", NO_MAC)}
+            for name, column in zip(names, columns):
+                value = column[position]
+                if value == value:  # not NaN
+                    reading[name] = int(value) if name in whole else value
+            readings.append((row, key, reading))
+    readings.sort(key=lambda item: item[0])
+    for row, key, reading in readings:
+        yield records[row].get("t"), key, reading
+
+
+_SERIAL_FOUND = re.compile(rb"found: ([0-9A-Fa-f:]{17})")
+_SERIAL_PAYLOAD = re.compile(rb"Manufacturer Data: ([0-9A-Fa-f ]*)")
+_SERIAL_SENT = re.compile(rb"Sent data via I2C: (\{.*\})")
+
+
+def read_serial_pairs(path):
+    """
+    Pair the advertisement each slave sketch printed ("Manufacturer Data: 99 04 ...") with the
+    reading it then sent ("Sent data via I2C: {...}"), from a captured slave serial log.
+    :return: (capture records, firmware readings or None per record).
+    """
+    records, firmware = [], []
+    mac = NO_MAC
+    for line in iter_lines(path):
+        if b"found: " in line:
+            match = _SERIAL_FOUND.search(line)
+            if match:
+                mac = match.group(1).decode().lower()
+        elif b"Manufacturer Data: " in line:
+            match = _SERIAL_PAYLOAD.search(line)
+            records.append({"mac": mac, "manufacturer_data": match.group(1).decode().strip()})
+            firmware.append(None)
+        elif b"Sent data via I2C: " in line and firmware and firmware[-1] is None:
+            match = _SERIAL_SENT.search(line)
+            if match:
+                firmware[-1] = json.loads(match.group(1))
+    return records, firmware
+
+
+def cross_check(records, firmware, results, tolerance=0.01):
+    """
+    Compare decoded fields with the readings the firmware produced for the same frames.
+    :return: Report dictionary with per-field mismatch counts and the largest differences.
+    """
+    report = {"frames": len(records), "firmware_readings": sum(f is not None for f in firmware),
+              "decoded": 0, "compared": 0, "fields": {}, "examples": []}
+    for key, rows, fields in results:
+        report["decoded"] += len(rows)
+        has_firmware = np.array([firmware[row] is not None for row in rows.tolist()], dtype=bool)
+        rows, fields = rows[has_firmware], {name: values[has_firmware] for name, values in fields.items()}
+        report["compared"] += len(rows)
+        for name, decoded in fields.items():
+            reported = np.array([firmware[row].get(name, np.nan) for row in rows.tolist()], dtype=np.float64)
+            both = ~np.isnan(decoded) & ~np.isnan(reported)
+            diff = np.abs(decoded - reported)
+            bad = both & (diff > tolerance)
+            stats = report["fields"].setdefault(name, {"compared": 0, "mismatches": 0, "max_abs_diff": 0.0})
+            stats["compared"] += int(both.sum())
+            stats["mismatches"] += int(bad.sum())
+            if both.any():
+                stats["max_abs_diff"] = max(stats["max_abs_diff"], round(float(diff[both].max()), 6))
+            for index in np.flatnonzero(bad)[:3].tolist():
+                if len(report["examples"]) < 10:
+                    report["examples"].append({"sensor": key, "frame": int(rows[index]), "field": name,
+                                               "decoded": round(float(decoded[index]), 4),
+                                               "firmware": float(reported[index]),
+                                               "payload": records[rows[index]].get("manufacturer_data")})
+    return report
+
+
+def decode_capture(path, specs, stats=None, batch_size=CAPTURE_BATCH):
+    """
+    Stream a capture through the decoders batch by batch.
+    :param stats: Optional dictionary; "frames" and "decoded" are added to it.
+    :return: Generator of (t, sensor key, reading) in capture order.
+    """
+    integers = integer_fields(specs)
+    for records in load_capture(path, batch_size):
+        results = decode_records(records, specs)
+        if stats is not None:
+            stats["frames"] = stats.get("frames", 0) + len(records)
+            stats["decoded"] = stats.get("decoded", 0) + sum(len(rows) for _, rows, _ in results)
+        yield from iter_readings(records, results, integers=integers)
+
+
+def write_readings(readings, path, fields=None):
+    """
+    Write (t, sensor, reading) rows as NDJSON, or as CSV when the path ends with .csv.
+    :param fields: CSV reading columns (reading_fields()); collected from the rows if None.
+    """
+    out = sys.stdout if path in (None, "-") else open(path, "w", newline="")
+    try:
+        if path and path.endswith(".csv"):
+            if fields is None:
+                readings = list(readings)
+                fields = sorted({name for _, _, reading in readings for name in reading})
+            writer = csv.DictWriter(out, fieldnames=["t", "sensor"] + [name for name in fields
+                                                                         if name not in ("t", "sensor")])
+            writer.writeheader()
+            for t, key, reading in readings:
+                writer.writerow(dict(reading, t=t, sensor=key))
+        else:
+            for t, key, reading in readings:
+                out.write(json.dumps(dict(reading, t=t, sensor=key), separators=(",", ":")) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode captured BLE advertisements with the catalog decoders.")
+    parser.add_argument("command", choices=["decode", "check"],
+                        help="decode: NDJSON capture to readings. check: compare with firmware output in a slave serial log.")
+    parser.add_argument("path", help="Capture (decode) or slave serial log (check).")
+    parser.add_argument("--sensor", action="append", help="Only use the decoder of this sensors.json entry.")
+    parser.add_argument("--sensors-file", default="sensors.json", help="Sensor catalog.")
+    parser.add_argument("--out", help="Output file for decoded readings (.ndjson or .csv, default stdout).")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Allowed difference in check mode.")
+    args = parser.parse_args()
+
+    specs = load_decoder_specs(args.sensors_file, args.sensor)
+    start = time.perf_counter()
+    if args.command == "check":
+        records, firmware = read_serial_pairs(args.path)
+        report = cross_check(records, firmware, decode_records(records, specs), args.tolerance)
+        print(json.dumps(report, indent=4))
+        return
+
+    stats = {"frames": 0, "decoded": 0}
+    write_readings(decode_capture(args.path, specs, stats), args.out, reading_fields(specs))
+    print(f"{stats['frames']} frames, {stats['decoded']} decoded; "
+          f"{time.perf_counter() - start:.2f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,39 @@
 # button_functions.py
 
+# Tk side of the code generator: snapshots the widget state into GenerationEngine requests on the
+# Tk thread, queues them in a job queue (job_queue.py) and applies the engine's events back to the
+# widgets. Widgets are only touched from the Tk thread; the job runners' worker threads hand events
+# over through ui_queue. Catalog runs go to the durable queue (jobs.db) and resume once a model is
+# selected after a restart. Generate, suggest and refine requests use an in-memory queue: their
+# results belong to the current window, so they are never re-run in a later session.
+# Code, feedback and log boxes are written through text_updater.TextUpdater: only changed lines are
+# replaced, once per frame, so large sketches keep their scroll position and selection.
+
 import json
 import datetime
-import threading
 import queue
 import logging
 from logging.handlers import RotatingFileHandler
-import traceback
-from additional_info import ADDITIONAL_INFO
-from additional_info import ADDITIONAL_INFO_CODE_MODULE_A
-from additional_info import ADDITIONAL_INFO_CODE_MODULE_B
-from api import ChatGPTAPI
+from format_compiler import compile_format, parse_format_text, format_report, emit_module_a, emit_module_b, emit_python
+from generation_engine import (GenerationEngine, ModuleRequest, DataFormatRequest, RefineRequest,
+                               CatalogBatchRequest, CatalogSchemaRequest)
+from job_queue import JobStore, JobRunner, request_key
+from schema_synthesis import vocabulary, load_catalog
+from text_updater import TextUpdater
+
+JOB_WORKERS = 4  # Requests generated at the same time
+INTERACTIVE_KINDS = (ModuleRequest.kind, DataFormatRequest.kind, RefineRequest.kind)
 
 
 class ButtonFunctions:
-    def __init__(self, chatgpt_api, ui_components):
+    def __init__(self, chatgpt_api, ui_components, usage_ledger=None, engine=None, job_store=None):
         """
         Initialize with ChatGPT API instance and UI components.
         :param chatgpt_api: ChatGPTAPI instance.
         :param ui_components: Dictionary of UI components (text boxes, dropdowns, etc.).
+        :param usage_ledger: Optional UsageLedger for token accounting and budgets.
+        :param engine: GenerationEngine to use (one is created around chatgpt_api by default).
+        :param job_store: JobStore for the catalog runs (jobs.db by default).
         """
         # Initialize logging with rotating file handler
         self.logger = logging.getLogger("ButtonFunctions")
@@ -31,19 +46,59 @@ class ButtonFunctions:
         fh.setFormatter(formatter)
         self.logger.addHandler(fh)
 
-        self.chatgpt_api = chatgpt_api
+        self.engine = engine or GenerationEngine(chatgpt_api, usage_ledger=usage_ledger)
+        self.engine.bus.subscribe(self._on_engine_event)
         self.ui_components = ui_components
-        self.refinement_history = []
-        self.log_queue = queue.Queue()
+        self.profiler = None  # Profiler when profiling mode is available
+        self.log_queue = queue.Queue()  # (log entry, level) for the progress log box
+        self.ui_queue = queue.Queue()  # engine events to apply on the Tk thread
+        self.text_updaters = {}  # ui_components key -> TextUpdater
         self.poll_log_queue()
+        self.poll_usage_totals()
 
         # Configure log tags for color-coding
         self._configure_log_tags()
 
+        # Requests run from job queues; no job is claimed until a model is selected
+        job_store = job_store or JobStore()
+        discarded = job_store.cancel_kinds(INTERACTIVE_KINDS)
+        if discarded:
+            self.log_progress(f"Discarded {discarded} interactive requests of an earlier session.", level="INFO")
+        self.job_runner = JobRunner(job_store, self.engine, workers=JOB_WORKERS,
+                                    ready=self._model_selected, execute=self._execute_job, log=self.log_progress)
+        self.interactive_runner = JobRunner(JobStore(":memory:"), self.engine, workers=JOB_WORKERS,
+                                            ready=self._model_selected, execute=self._execute_job,
+                                            log=self.log_progress)
+        self.job_runner.start()
+        self.interactive_runner.start()
+
         # **Debugging: Log the keys present in ui_components**
         self.log_progress(f"UI Components Keys: {list(self.ui_components.keys())}", level="DEBUG")
         print(f"[DEBUG] UI Components Keys: {list(self.ui_components.keys())}")
 
+    # main.py swaps the API and the model racer when the selection changes; both live in the engine
+    @property
+    def chatgpt_api(self):
+        return self.engine.chatgpt_api
+
+    @chatgpt_api.setter
+    def chatgpt_api(self, chatgpt_api):
+        self.engine.chatgpt_api = chatgpt_api
+        self.job_runner.notify()  # Queued jobs may have been waiting for a model
+        self.interactive_runner.notify()
+
+    @property
+    def model_racer(self):
+        return self.engine.model_racer
+
+    @model_racer.setter
+    def model_racer(self, model_racer):
+        self.engine.model_racer = model_racer
+
+    @property
+    def usage_ledger(self):
+        return self.engine.usage_ledger
+
     def _configure_log_tags(self):
         """Configure tags for different log levels to display colored text."""
         progress_log_box = self.ui_components.get("progress_log_box")
@@ -55,25 +110,59 @@ class ButtonFunctions:
             progress_log_box.tag_config("REQUEST", foreground="purple")
 
     def poll_log_queue(self):
-        """Poll the log queue and update the log box."""
-        while not self.log_queue.empty():
+        """Apply queued engine events and log messages on the Tk thread."""
+        while True:
             try:
-                log_message = self.log_queue.get_nowait()
-                progress_log_box = self.ui_components.get("progress_log_box")
-                if progress_log_box:
-                    progress_log_box.config(state="normal")
-                    progress_log_box.insert("end", log_message)
-                    progress_log_box.see("end")
-                    progress_log_box.config(state="disabled")
+                event = self.ui_queue.get_nowait()
             except queue.Empty:
-                pass
+                break
+            self._apply_event(event)
+
+        progress_log = self._text_updater("progress_log_box")
+        while True:
+            try:
+                log_entry, level = self.log_queue.get_nowait()
+            except queue.Empty:
+                break
+            if progress_log:
+                progress_log.append(log_entry, level)
         self.ui_components["progress_log_box"].after(100, self.poll_log_queue)  # Poll every 100 ms
 
+    def poll_usage_totals(self):
+        """Refresh the live token usage totals label."""
+        usage_label = self.ui_components.get("usage_label")
+        if not usage_label:
+            return
+        if self.usage_ledger:
+            usage_label.config(text=self.usage_ledger.summary())
+        usage_label.after(1000, self.poll_usage_totals)  # Refresh every second
+
+    def _text_updater(self, key):
+        """TextUpdater of a text box in ui_components, or None if there is no such box."""
+        if key not in self.text_updaters:
+            widget = self.ui_components.get(key)
+            if widget is None:
+                return None
+            self.text_updaters[key] = TextUpdater(widget)
+        return self.text_updaters[key]
+
+    def _set_text(self, key, text, state="disabled"):
+        """
+        Show text in a text box, replacing only the lines that changed.
+        :param state: State to leave the box in; None keeps an editable box editable.
+        :return: False if the box does not exist.
+        """
+        updater = self._text_updater(key)
+        if updater is None:
+            return False
+        updater.set_text(text, state=state)
+        return True
+
     def log_progress(self, message, level="INFO"):
-        """Add a log message to the queue and to the log file."""
+        """Add a log message to the queue and to the log file. Safe to call from any thread."""
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         log_entry = f"[{timestamp}] [{level}] {message}\n"
-        self.log_queue.put(log_entry)
+        self.log_queue.put((log_entry, level))
 
         # Log to file
         if level == "INFO":
@@ -85,13 +174,49 @@ class ButtonFunctions:
         else:
             self.logger.debug(message)
 
-        # Insert into progress_log_box with appropriate tag
-        progress_log_box = self.ui_components.get("progress_log_box")
-        if progress_log_box:
-            progress_log_box.config(state="normal")
-            progress_log_box.insert("end", log_entry, level)
-            progress_log_box.see("end")
-            progress_log_box.config(state="disabled")
+    def _on_engine_event(self, event):
+        """EventBus subscriber, called on the worker thread: log right away, queue the rest for Tk."""
+        if event.kind == "log":
+            self.log_progress(event.data["message"], level=event.data["level"])
+        elif event.kind != "done":
+            self.ui_queue.put(event)
+
+    def _apply_event(self, event):
+        if event.kind == "result":
+            self._handle_response({"code": event.data["code"], "explanation": event.data["explanation"]},
+                                  event.data["target"])
+        elif event.kind in ("error", "feedback"):
+            self._update_feedback(event.data["message"])
+
+    def _model_selected(self):
+        return bool(self.chatgpt_api and self.chatgpt_api.model)
+
+    def _submit(self, request, idempotency_key=None, max_attempts=1, reuse_done=True, durable=False):
+        """
+        Queue a request. Interactive requests are a job of their own in the in-memory queue and are not
+        retried (the user sees the error and can ask again).
+        :param durable: Queue it in the durable job store, so it resumes after a restart (catalog runs).
+        """
+        if not self._model_selected():
+            self.log_progress(f"No model selected; the {request.kind} request waits in the job queue.",
+                              level="WARNING")
+        runner = self.job_runner if durable else self.interactive_runner
+        runner.submit(request, idempotency_key or request.request_id, max_attempts, reuse_done)
+
+    def _execute_job(self, request, checkpoint):
+        """Run a job on the engine (job runner thread), under the profiler when profiling is enabled."""
+        run = self.engine.run
+        if self.profiler:
+            run = self.profiler.wrap_worker(run, request.kind)
+        return run(request, checkpoint=checkpoint)
+
+    def _text(self, key):
+        """Content of a Text widget (Tk thread only)."""
+        return self.ui_components[key].get("1.0", "end").strip()
+
+    def _selected(self, key, default):
+        dropdown = self.ui_components.get(key)
+        return dropdown.get() if dropdown else default
 
     def _get_module_details(self, module_name: str) -> dict:
         """
@@ -121,245 +246,60 @@ class ButtonFunctions:
     def suggest_data_format(self):
         """Use ChatGPT to suggest a data format based on the sensor description."""
         self.log_progress("Initiating data format suggestion.", level="INFO")
-        threading.Thread(target=self._suggest_data_format_thread, daemon=True).start()
-
-    def _suggest_data_format_thread(self):
+        request = DataFormatRequest(self.ui_components["sensor_type_entry"].get().strip(),
+                                    self._text("sensor_desc_entry"),
+                                    technology=self.ui_components["sensor_tech_dropdown"].get(),
+                                    board=self.ui_components["sensor_module_dropdown"].get(),
+                                    data_format=self._text("data_format_box"),
+                                    example_code_1=self._text("example_tab_1_text"),
+                                    example_code_2=self._text("example_tab_2_text"))
+        self._submit(request)
+
+    def compile_data_format(self):
+        """
+        Compile the data format box into the compact wire format: short keys and fixed-point numbers.
+        The box gets the key dictionary; the size report and the encode/decode helpers go to the feedback box.
+        """
+        data_format_box = self.ui_components["data_format_box"]
         try:
-            # Check if a model is selected
-            if not self.chatgpt_api or not self.chatgpt_api.model:
-                self._update_feedback("Error: No ChatGPT model selected. Please select a model first.")
-                self.log_progress("Failed to suggest data format: No ChatGPT model selected.", level="ERROR")
-                return
-
-            sensor_type = self.ui_components["sensor_type_entry"].get().strip()
-            sensor_desc = self.ui_components["sensor_desc_entry"].get("1.0", "end").strip()
-            self.log_progress(f"Sensor Type: {sensor_type}, Sensor Description: {sensor_desc}", level="DEBUG")
-
-            # Retrieve example code from bottom tabs
-            example_code_1 = self.ui_components["example_tab_1_text"].get("1.0", "end").strip()
-            example_code_2 = self.ui_components["example_tab_2_text"].get("1.0", "end").strip()
-
-            # Check that necessary inputs are provided
-            if not sensor_type or not sensor_desc:
-                self._update_feedback("Error: Please fill out the sensor type and description fields.")
-                self.log_progress("Failed to suggest data format: Missing sensor type or description.", level="ERROR")
-                return
-
-            # Construct the prompt for data format suggestion
-            data_format = self.ui_components["data_format_box"].get("1.0", "end").strip()
-            prompt = f"""
-{ADDITIONAL_INFO['intro']}
-
-{ADDITIONAL_INFO['data_format']}
-
-Code example for Module A:
-{ADDITIONAL_INFO_CODE_MODULE_A['example']}
-
-- Example Code 1:  {example_code_1}
-- Example Code 2:  {example_code_2}
-
-You are designing an IoT Gateway system. Here is the setup:
-
-Module A:
-- Sensor Type: {sensor_type}
-- Description: {sensor_desc}
-- Wireless Communication Technology: {self.ui_components['sensor_tech_dropdown'].get()}
-- Development Board: {self.ui_components['sensor_module_dropdown'].get()}
-
-Module B:
-- Data Format for Communication between Module A and Module B: {data_format}
-
-Please suggest a JSON format for communication between Module A and Module B. Provide an explanation of the suggested format.
-Remember that for many wireless devices it is not possible to get a timestamp from them.
-
-Provide the response strictly in the following JSON structure:
-{{
-  "code": "The data format to be used between A and B modules as a string.
-            Keep it short as there is limited data size.  
-            Short variable names are good.
-            Only relevant variables should be transmitted. 
-            Multiline format is nice and clearer.",
-  "explanation": "A concise explanation of the data format and why it was suggested. Bullet points are preferred. Not JSON!"
-}}
-Make sure your response is in JSON format! Do not provide answer inside ```!
-"""
-
-            # Log the prompt being sent
-            self.log_progress(f"Sending prompt to ChatGPT API for data format suggestion:\n{prompt}", level="DEBUG")
-            print(f"[DEBUG] Sending prompt to ChatGPT API for data format suggestion:\n{prompt}")
-
-            # Call the ChatGPT API
-            self.log_progress("Sending prompt to ChatGPT API for data format suggestion.", level="INFO")
-            result = self.chatgpt_api.generate_code_with_explanation(prompt)
-
-            # Log the response received
-            self.log_progress(f"Received response from ChatGPT API for data format suggestion:\n{result}", level="DEBUG")
-            print(f"[DEBUG] Received response from ChatGPT API for data format suggestion:\n{result}")
-
-            # Handle response or errors
-            self._handle_response(result, "data_format")
-
-            # Log successful data format suggestion
-            self.log_progress("Data format suggested successfully.", level="INFO")
+            data_format = parse_format_text(data_format_box.get("1.0", "end"))
+            if not isinstance(data_format, dict) or not data_format:
+                raise ValueError("The data format must be a non-empty JSON object.")
+            compiled = compile_format(data_format)
+        except ValueError as e:
+            self._update_feedback(f"Error: Cannot compile the data format: {e}")
+            self.log_progress(f"Data format compilation failed: {e}", level="ERROR")
+            return
 
-        except Exception as e:
-            error_trace = traceback.format_exc()
-            self._update_feedback("Error: An unexpected error occurred while suggesting data format.")
-            self.log_progress(f"Exception during data format suggestion: {e}\n{error_trace}", level="ERROR")
+        self._set_text("data_format_box", json.dumps(compiled, indent=4), state=None)
+        report = format_report(compiled)
+        self._update_feedback(f"Compact data format:\n{report}\n\nModule A helper:\n{emit_module_a(compiled)}\n"
+                              f"Module B helper:\n{emit_module_b(compiled)}\nHost helper:\n{emit_python(compiled)}")
+        self.log_progress(f"Data format compiled:\n{report}", level="INFO")
 
     def generate_code_for_module(self, module_name):
         """Generate code for a single module (Module A or Module B)."""
         self.log_progress(f"Initiating code generation for {module_name}.", level="INFO")
-        threading.Thread(target=self._generate_code_thread, args=(module_name,), daemon=True).start()
-
-    def _generate_code_thread(self, module_name):
-        try:
-            # Retrieve module details and data format from the UI
-            module_details = self._get_module_details(module_name)
-            data_format = self.ui_components["data_format_box"].get("1.0", "end").strip()
-
-            # Retrieve example code from bottom tabs
-            example_code_1 = self.ui_components["example_tab_1_text"].get("1.0", "end").strip()
-            example_code_2 = self.ui_components["example_tab_2_text"].get("1.0", "end").strip()
-
-            # Validate inputs
-            if not module_details or not data_format:
-                self._update_feedback(f"Error: Fill all fields for {module_name} and define the data format.")
-                self.log_progress(f"Failed to generate code for {module_name}: Missing module details or data format.",
-                                  level="ERROR")
-                return
-
-            # Extract module-specific values from UI
-            sensor_type = module_details.get("type", "")
-            sensor_description = module_details.get("desc", "")
-            wireless_technology = module_details.get("technology", "")
-            development_board = module_details.get("board", "")
-
-            # Get the appropriate prompt
-            if module_name.lower() == "module_a":
-                prompt = self.get_prompt_a(sensor_type, sensor_description, wireless_technology, development_board,
-                                           data_format, example_code_1, example_code_2)
-            elif module_name.lower() == "module_b":
-                prompt = self.get_prompt_b(wireless_technology, development_board, data_format, example_code_1,
-                                           example_code_2)
-            else:
-                self._update_feedback("Error: Unknown module name.")
-                self.log_progress(f"Failed to generate code: Unknown module name '{module_name}'.", level="ERROR")
-                return
-
-            # Log the prompt being sent
-            self.log_progress(f"Sending prompt to ChatGPT API for {module_name}:\n{prompt}", level="DEBUG")
-            print(f"[DEBUG] Sending prompt to ChatGPT API for {module_name}:\n{prompt}")
-
-            # Send the prompt to ChatGPT
-            self.log_progress(f"Sending prompt to ChatGPT API for {module_name}.", level="INFO")
-            result = self.chatgpt_api.generate_code_with_explanation(prompt)
-
-            # Log the response received
-            self.log_progress(f"Received response from ChatGPT API for {module_name}:\n{result}", level="DEBUG")
-            print(f"[DEBUG] Received response from ChatGPT API for {module_name}:\n{result}")
-
-            # Handle response or errors
-            self._handle_response(result, module_name)
-
-            # Log successful code generation
-            self.log_progress(f"Code generation for {module_name} completed.", level="INFO")
-
-            # Save to refinement history
-            if "code" in result:
-                self.refinement_history.append({
-                    "module": module_name,
-                    "prompt": prompt,
-                    "code": result["code"],
-                    "explanation": result.get("explanation", "")
-                })
-                self.log_progress(f"Appended to refinement_history: Module {module_name}", level="DEBUG")
-                print(f"[DEBUG] refinement_history after append: {self.refinement_history}")
-
-        except Exception as e:
-            error_trace = traceback.format_exc()
-            self._update_feedback("Error: An unexpected error occurred while generating code.")
-            self.log_progress(f"Exception during code generation for {module_name}: {e}\n{error_trace}", level="ERROR")
+        module_details = self._get_module_details(module_name)
+        request = ModuleRequest(module_name,
+                                sensor_type=module_details.get("type", ""),
+                                sensor_description=module_details.get("desc", ""),
+                                technology=module_details.get("technology", ""),
+                                board=module_details.get("board", ""),
+                                data_format=self._text("data_format_box"),
+                                example_code_1=self._text("example_tab_1_text"),
+                                example_code_2=self._text("example_tab_2_text"),
+                                framing=self._selected("framing_dropdown", "json"),
+                                uplink=self._selected("uplink_dropdown", "per_reading"),
+                                polling=self._selected("polling_dropdown", "random"),
+                                aggregation=self._selected("aggregation_dropdown", "none"))
+        self._submit(request)
 
     def refine_last_generated_code(self):
         """Refine the last generated code based on Code Modification Requests."""
         self.log_progress("Initiating code refinement/modification.", level="INFO")
-        threading.Thread(target=self._refine_last_generated_code_thread, daemon=True).start()
-
-    def _refine_last_generated_code_thread(self):
-        try:
-            modification_request = self.ui_components["modification_requests_box"].get("1.0", "end").strip()
-
-            # Prepend [REQUEST] to the modification request
-            formatted_request = f"[REQUEST] {modification_request}"
-
-            # Log the modification request with REQUEST tag
-            self.log_progress(f"Modification Request:\n{formatted_request}", level="REQUEST")
-            print(f"[DEBUG] Modification Request:\n{formatted_request}")
-
-            if not self.refinement_history:
-                self._update_feedback("Error: No code history available for refinement.")
-                self.log_progress("Refinement failed: No code history available.", level="ERROR")
-                return
-
-            last_entry = self.refinement_history[-1]
-            original_code = last_entry.get("code")
-            if not original_code:
-                self._update_feedback("Error: Original code is missing from history.")
-                self.log_progress("Refinement failed: Original code is missing.", level="ERROR")
-                return
-
-            # Log the original code
-            self.log_progress(f"Original Code Retrieved:\n{original_code}", level="DEBUG")
-            print(f"[DEBUG] Original Code Retrieved:\n{original_code}")
-
-            # Construct the refine prompt
-            refine_prompt = f"""
-{formatted_request}
-
-Original Code:
-{original_code}
-
-Please apply the requested modification and provide the response strictly in this JSON format:
-{{
-  "code": "The modified code as a string",
-  "explanation": "Detailed explanation of the changes made"
-}}
-Make sure your response is in JSON format! Do not provide answer inside ```!
-"""
-
-            # Log the refine prompt being sent
-            self.log_progress(f"Sending refine prompt to ChatGPT API:\n{refine_prompt}", level="DEBUG")
-            print(f"[DEBUG] Sending refine prompt to ChatGPT API:\n{refine_prompt}")
-
-            # Send the prompt to ChatGPT
-            self.log_progress("Sending refine prompt to ChatGPT API.", level="INFO")
-            result = self.chatgpt_api.generate_code_with_explanation(refine_prompt)
-
-            # Log the response received
-            self.log_progress(f"Received response from ChatGPT API for refinement/modification:\n{result}",
-                              level="DEBUG")
-            print(f"[DEBUG] Received response from ChatGPT API for refinement/modification:\n{result}")
-
-            # Handle response or errors
-            self._handle_response(result, last_entry["module"])
-
-            # Save refinement/modification to history
-            if "code" in result:
-                self.refinement_history.append({
-                    "module": last_entry["module"],
-                    "prompt": refine_prompt,
-                    "code": result["code"],
-                    "explanation": result.get("explanation", ""),
-                    "modification_request": modification_request
-                })
-                self.log_progress(f"Code refinement/modification for {last_entry['module']} completed.", level="INFO")
-                print(f"[DEBUG] refinement_history after append: {self.refinement_history}")
-
-        except Exception as e:
-            error_trace = traceback.format_exc()
-            self._update_feedback("Error: An unexpected error occurred while refining/modifying code.")
-            self.log_progress(f"Exception during code refinement/modification: {e}\n{error_trace}", level="ERROR")
+        request = RefineRequest(self._text("modification_requests_box"))
+        self._submit(request)
 
     def _update_feedback(self, message, module_name=None):
         """Update the feedback and code boxes in the UI."""
@@ -388,11 +328,7 @@ Make sure your response is in JSON format! Do not provide answer inside ```!
             print("[DEBUG] Extracted Explanation:", explanation)
 
             # Update the explanation text box
-            feedback_box = self.ui_components["feedback_box"]
-            feedback_box.config(state="normal")
-            feedback_box.delete("1.0", "end")
-            feedback_box.insert("end", explanation)
-            feedback_box.config(state="disabled")
+            self._set_text("feedback_box", explanation)
 
             # Determine which code box to update based on module_name
             if module_name == "module_a":
@@ -405,12 +341,7 @@ Make sure your response is in JSON format! Do not provide answer inside ```!
                 code_box_key = None
 
             if code_box_key:
-                code_box = self.ui_components.get(code_box_key)
-                if code_box:
-                    code_box.config(state="normal")
-                    code_box.delete("1.0", "end")
-                    code_box.insert("end", code)
-                    code_box.config(state="disabled")
+                if self._set_text(code_box_key, code):
                     self.log_progress(f"Updated {code_box_key} with generated code.", level="INFO")
                     print(f"[DEBUG] Updated {code_box_key} with generated code.")
                 else:
@@ -424,11 +355,7 @@ Make sure your response is in JSON format! Do not provide answer inside ```!
             # If message is not JSON, treat it as plain text
             self.log_progress("Received plain text message.", level="DEBUG")
             print("[DEBUG] Received plain text message.")
-            feedback_box = self.ui_components["feedback_box"]
-            feedback_box.config(state="normal")
-            feedback_box.delete("1.0", "end")
-            feedback_box.insert("end", message)
-            feedback_box.config(state="disabled")
+            self._set_text("feedback_box", message)
         except Exception as e:
             # Handle other unexpected exceptions
             self.log_progress(f"Unexpected error: {e}", level="ERROR")
@@ -437,11 +364,7 @@ Make sure your response is in JSON format! Do not provide answer inside ```!
             code = "Error: Unable to retrieve code."
 
             # Show error messages in the feedback box
-            feedback_box = self.ui_components["feedback_box"]
-            feedback_box.config(state="normal")
-            feedback_box.delete("1.0", "end")
-            feedback_box.insert("end", explanation)
-            feedback_box.config(state="disabled")
+            self._set_text("feedback_box", explanation)
 
     def _handle_response(self, result, module_name):
         """Handle API response and update the UI accordingly."""
@@ -455,13 +378,9 @@ Make sure your response is in JSON format! Do not provide answer inside ```!
 
         # Update the code box
         if module_name in ["module_a", "module_b", "data_format"]:
-            code_box_key = f"{module_name.lower()}_code_box"
-            code_box = self.ui_components.get(code_box_key)
-            if code_box:
-                code_box.config(state="normal")
-                code_box.delete("1.0", "end")
-                code_box.insert("end", code)
-                code_box.config(state="disabled")
+            code_box_key = "data_format_box" if module_name == "data_format" else f"{module_name.lower()}_code_box"
+            # The data format box stays editable
+            if self._set_text(code_box_key, code, state=None if module_name == "data_format" else "disabled"):
                 self.log_progress(f"Updated {module_name} code box with generated code.", level="INFO")
             else:
                 self.log_progress(f"Code box for {module_name} not found.", level="WARNING")
@@ -472,6 +391,68 @@ Make sure your response is in JSON format! Do not provide answer inside ```!
         self._update_feedback(explanation, module_name)
         self.log_progress(f"Updated feedback box with explanation for {module_name}.", level="INFO")
 
+    def batch_generate_catalog(self, sensor_data, batch_settings=None):
+        """
+        Regenerate Module A code for every catalog sensor (and Module B code for every
+        distinct data format) through the offline batch endpoint.
+        :param sensor_data: Dictionary of sensors loaded from sensors.json.
+        :param batch_settings: The "batch" section of config.json.
+        An unfinished run of the same catalog and model is resumed instead of started again.
+        """
+        self.log_progress("Initiating catalog batch generation.", level="INFO")
+        batch_settings = batch_settings or {}
+        request = CatalogBatchRequest(sensor_data, batch_settings,
+                                      endpoint_technology=self.ui_components["endpoint_tech_dropdown"].get(),
+                                      endpoint_board=self.ui_components["endpoint_board_dropdown"].get(),
+                                      example_code_1=self._text("example_tab_1_text"),
+                                      example_code_2=self._text("example_tab_2_text"))
+        self._submit(request, request_key(request, self.chatgpt_api.model),
+                     max_attempts=batch_settings.get("max_attempts", 3), reuse_done=False, durable=True)
+
+    def synthesize_catalog_schema(self, sensor_data, sensors_file="sensors.json"):
+        """
+        Suggest data formats for every catalog sensor concurrently, merge them into one canonical schema
+        and write it with the per-sensor field maps into sensors.json (schema_synthesis.py).
+        :param sensor_data: Dictionary of sensors loaded from sensors.json.
+        """
+        self.log_progress("Initiating catalog schema synthesis.", level="INFO")
+        try:
+            canonical_schema = vocabulary(load_catalog(sensors_file))
+        except (OSError, ValueError) as e:
+            self.log_progress(f"Could not read {sensors_file}: {e}", level="WARNING")
+            canonical_schema = vocabulary()
+        request = CatalogSchemaRequest(sensor_data, canonical_schema=canonical_schema, sensors_file=sensors_file)
+        self._submit(request, request_key(request, self.chatgpt_api.model), max_attempts=3, reuse_done=False,
+                     durable=True)
+
+    def show_api_key_statistics(self):
+        """Show per-key throughput and health of the selected model's API key pool."""
+        pool = getattr(self.chatgpt_api, "pool", None)
+        if pool is None:
+            self._update_feedback("The selected model uses a single API key; no pool statistics available.")
+            return
+        report = pool.format_report()
+        self._update_feedback(f"API key statistics:\n{report}")
+        self.log_progress(f"API key statistics:\n{report}", level="INFO")
+
+    def show_usage_report(self):
+        """Show token usage and cost per module, sensor and model."""
+        if not self.usage_ledger:
+            self._update_feedback("Usage accounting is not enabled.")
+            return
+        report = self.usage_ledger.format_report()
+        self._update_feedback(f"Token usage:\n{report}")
+        self.log_progress(f"Token usage:\n{report}", level="INFO")
+
+    def show_race_statistics(self):
+        """Show per-model win rates and latencies collected in race mode."""
+        if not self.model_racer:
+            self._update_feedback("Race mode is off; enable it to collect model statistics.")
+            return
+        report = self.model_racer.format_report() or "No races run yet."
+        self._update_feedback(f"Race statistics:\n{report}")
+        self.log_progress(f"Race statistics:\n{report}", level="INFO")
+
     def copy_code_to_clipboard(self, text_box):
         """Copy code from a text box to the clipboard."""
         if text_box:
@@ -487,86 +468,3 @@ Make sure your response is in JSON format! Do not provide answer inside ```!
             else:
                 self._update_feedback("Error: No code to copy.")
                 self.log_progress("Attempted to copy code: No code available.", level="ERROR")
-
-    # Define prompts for module A and B within the class
-    def get_prompt_a(self, sensor_type, sensor_description, wireless_technology, development_board, data_format,
-                     example_code_1, example_code_2):
-        return f"""
-{ADDITIONAL_INFO['intro']}
-
-{ADDITIONAL_INFO['module_a']}
-
-{ADDITIONAL_INFO['data_format']}
-
-Code example for Module A:
-{ADDITIONAL_INFO_CODE_MODULE_A['example']}
-
-- Example Code 1:  {example_code_1}
-- Example Code 2:  {example_code_2}
-
-You are designing an IoT Gateway system. Here is the setup:
-
-Module A:
-- Sensor Type: {sensor_type}
-- Description: {sensor_description}
-- Wireless Communication Technology: {wireless_technology}
-- Development Board: {development_board}
-
-Module B:
-- Data Format for Communication between Module A and Module B: {data_format}
-
-Please generate the Arduino code for Module A, which:
-1. Connects to the specified sensor using {wireless_technology}.
-2. Formats the data according to the given format.
-3. Sends the data to Module B.
-
-Use #include "AnttiGateway.h"
-Most important thing is to be compatible with the AnttiGateway.h library!
-
-Provide the response strictly in the following JSON structure:
-{{
-  "code": "The Arduino code for Module A as a string.",
-  "explanation": "A concise explanation of how the code works and interfaces with Module B as a string. Bullet points are preferred. Not JSON!"
-}}
-Make sure your response is in JSON format! Do not provide answer inside ```!
-"""
-
-    def get_prompt_b(self, wireless_technology, development_board, data_format, example_code_1, example_code_2):
-        return f"""
-{ADDITIONAL_INFO['intro']}
-
-{ADDITIONAL_INFO['module_b']}
-
-{ADDITIONAL_INFO['data_format']}
-
-Code example for Module B:
-{ADDITIONAL_INFO_CODE_MODULE_B['example']}
-
-- Example Code 1:  {example_code_1}
-- Example Code 2:  {example_code_2}
-
-
-You are designing an IoT Gateway system. Here is the setup:
-
-Module A:
-- Data Format for Communication: {data_format}
-
-Module B:
-- Technology: {wireless_technology}
-- Development Board: {development_board}
-
-Please generate the Arduino code for Module B, which:
-1. Receives data from Module A using the specified format.
-2. Processes and validates the received data.
-3. Transmits the data to the configured endpoint using {wireless_technology}.
-
-Use #include "AnttiGateway.h"
-Most important thing is to be compatible with the AnttiGateway.h library!
-
-Provide the response strictly in the following JSON structure:
-{{
-  "code": "The Arduino code for Module B as a string.",
-  "explanation": "A concise explanation of how the code works and interfaces with Module A as a string. Bullet points are preferred. Not JSON!"
-}}
-Make sure your response is in JSON format! Do not provide answer inside ```!
-"""
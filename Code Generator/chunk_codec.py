@@ -0,0 +1,300 @@
+# chunk_codec.py
+
+# Host-side reference implementation of the AnttiGateway I2C chunk protocol.
+# It reproduces the on-wire behaviour of AnttiGateway.cpp byte for byte, including its quirks:
+# - tc (total chunks) is len(data) // MaxChunkSizeSlave, so a dataset whose length is an exact
+#   multiple of 64 never reaches cn == tc and is merged with the next dataset,
+# - the requestEvent that refills the chunk queue writes nothing to the bus,
+# - RingBuffer holds bufferSize - 1 items and overwrites the oldest one when full,
+# - master-side reassembly state (completeData, lastChunkNumber) is shared by all slaves.
+
+import json
+
+# Constants from AnttiGateway.h
+MAX_CHUNK_SIZE_SLAVE = 64
+MAX_CHUNK_SIZE = 128
+RING_BUFFER_SIZE = 10
+SIMPLE_QUEUE_SIZE = 500
+MAX_DATA_SIZE = 5000
+I2C_PAD_BYTE = b"\xff"  # What the master reads when the slave writes fewer bytes than requested
+
+_ESCAPES = {
+    ord('"'): b'\\"',
+    ord("\\"): b"\\\\",
+    ord("\b"): b"\\b",
+    ord("\f"): b"\\f",
+    ord("\n"): b"\\n",
+    ord("\r"): b"\\r",
+    ord("\t"): b"\\t"
+}
+
+
+def serialize_json(obj):
+    """Serialise like ArduinoJson's serializeJson(): compact, key order kept, UTF-8 not escaped."""
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def escape_json_string(raw):
+    """
+    Escape raw bytes the way ArduinoJson writes a string value.
+    Works on bytes because a 64 byte slice may cut a UTF-8 character in half.
+    """
+    out = bytearray()
+    for byte in raw:
+        if byte in _ESCAPES:
+            out += _ESCAPES[byte]
+        elif byte < 0x20:
+            out += b"\\u%04x" % byte
+        else:
+            out.append(byte)
+    return bytes(out)
+
+
+def add_slave_id(data, slave_id):
+    """
+    Mirror of AnttiGateway::addToRingBuffer() before the push: parse the reading,
+    set "SlaveID" and serialise it again. Unparseable input becomes an empty object,
+    as deserializeJson() leaves the document empty on error.
+    :param data: Reading as a JSON string, bytes or dictionary.
+    :param slave_id: I2C address of the slave.
+    :return: The serialised reading as bytes.
+    """
+    if isinstance(data, dict):
+        doc = dict(data)
+    else:
+        try:
+            doc = json.loads(data)
+        except (ValueError, TypeError):
+            doc = {}
+        if not isinstance(doc, dict):
+            doc = {}
+    doc["SlaveID"] = slave_id
+    return serialize_json(doc)
+
+
+def total_chunks(length, chunk_size=MAX_CHUNK_SIZE_SLAVE):
+    """The 'tc' value written by breakDataIntoChunks() (truncating division)."""
+    return length // chunk_size
+
+
+def encode_chunks(data, chunk_size=MAX_CHUNK_SIZE_SLAVE):
+    """
+    Mirror of AnttiGateway::breakDataIntoChunks().
+    :param data: Complete dataset as bytes (or str, encoded as UTF-8).
+    :return: List of chunk frames, each {"cn":..,"tc":..,"data":".."} followed by a newline.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    tc = total_chunks(len(data), chunk_size)
+    chunks = []
+    for cn, start in enumerate(range(0, len(data), chunk_size)):
+        piece = escape_json_string(data[start:start + chunk_size])
+        chunks.append(b'{"cn":%d,"tc":%d,"data":"%s"}\n' % (cn, tc, piece))
+    return chunks
+
+
+def parse_chunk(chunk):
+    """
+    Mirror of getChunkNumber(), getTotalChunks() and getChunkData().
+    The firmware parses the chunk three times; the result is the same as parsing it once.
+    :param chunk: Chunk frame without the trailing newline.
+    :return: (cn, tc, data) with -1, -1, b"" if the chunk is not valid JSON.
+    """
+    try:
+        doc = json.loads(chunk.decode("utf-8", errors="surrogateescape"))
+        data = doc.get("data")
+        data = b"null" if data is None else str(data).encode("utf-8", errors="surrogateescape")
+        return int(doc.get("cn") or 0), int(doc.get("tc") or 0), data
+    except (ValueError, TypeError, AttributeError):
+        return -1, -1, b""
+
+
+class RingBuffer:
+    def __init__(self, size=RING_BUFFER_SIZE):
+        """Mirror of RingBuffer.h: a circular buffer that holds size - 1 items."""
+        self.size = size
+        self.buffer = [None] * size
+        self.head = 0
+        self.tail = 0
+
+    def push(self, item):
+        if self.is_full():
+            return
+        self.buffer[self.tail] = item
+        self.tail = (self.tail + 1) % self.size
+
+    def pop(self):
+        if self.is_empty():
+            return b""
+        item = self.buffer[self.head]
+        self.head = (self.head + 1) % self.size
+        return item
+
+    def is_empty(self):
+        return self.head == self.tail
+
+    def is_full(self):
+        return (self.tail + 1) % self.size == self.head
+
+    def __len__(self):
+        if self.tail >= self.head:
+            return self.tail - self.head
+        return self.size - (self.head - self.tail)
+
+
+class SimpleQueue:
+    def __init__(self, capacity=SIMPLE_QUEUE_SIZE):
+        """Mirror of SimpleQueue.h: push fails silently when the queue is full."""
+        self.capacity = capacity
+        self.items = []
+        self.dropped = 0
+
+    def push(self, item):
+        if len(self.items) >= self.capacity:
+            self.dropped += 1
+            return False
+        self.items.append(item)
+        return True
+
+    def pop(self):
+        return self.items.pop(0) if self.items else None
+
+    def __len__(self):
+        return len(self.items)
+
+
+class SlaveEndpoint:
+    def __init__(self, address, ring_buffer_size=RING_BUFFER_SIZE, queue_size=SIMPLE_QUEUE_SIZE,
+                 chunk_size=MAX_CHUNK_SIZE_SLAVE, announce_backlog=False):
+        """
+        Module A side of the protocol.
+        :param address: I2C slave address (becomes "SlaveID").
+        :param announce_backlog: Add "Backlog" (readings left in the ring buffer) to every reading
+                                 when it is taken for sending, as backlogRequestEvent() does.
+        """
+        self.address = address
+        self.chunk_size = chunk_size
+        self.announce_backlog = announce_backlog
+        self.ring_buffer = RingBuffer(ring_buffer_size)
+        self.queue = SimpleQueue(queue_size)
+        self.ring_overwrites = 0
+        self.requests = 0
+
+    def add_reading(self, data):
+        """
+        Mirror of addToRingBuffer(). Empty readings are ignored.
+        :return: True if the oldest reading was overwritten.
+        """
+        if data in ("", b"", None):
+            return False
+        modified = add_slave_id(data, self.address)
+        overwritten = False
+        if self.ring_buffer.is_full():
+            self.ring_buffer.pop()
+            self.ring_overwrites += 1
+            overwritten = True
+        self.ring_buffer.push(modified)
+        return overwritten
+
+    def on_request(self):
+        """
+        Mirror of requestEvent(): the bytes written to the bus for one master request.
+        When the chunk queue is empty it is refilled from the ring buffer and nothing is written.
+        """
+        self.requests += 1
+        queue_size = len(self.queue)
+        if queue_size == 0:
+            data = self.ring_buffer.pop()
+            if self.announce_backlog and data:
+                doc = json.loads(data)
+                doc["Backlog"] = len(self.ring_buffer)
+                data = serialize_json(doc)
+            for chunk in encode_chunks(data, self.chunk_size):
+                self.queue.push(chunk)
+            return b""
+        return self.queue.pop() or b""
+
+
+class MasterReassembler:
+    def __init__(self, ring_buffer_size=RING_BUFFER_SIZE, max_data_size=MAX_DATA_SIZE):
+        """
+        Module B side of the protocol: receiveData(), processReceivedChunk() and
+        addCompleteDataToRingBuffer(). One instance is shared by all slaves, like the firmware.
+        """
+        self.ring_buffer = RingBuffer(ring_buffer_size)
+        self.max_data_size = max_data_size
+        self.complete_data = bytearray()
+        self.last_chunk_number = -1
+        self.stats = {
+            "chunks": 0,
+            "datasets": 0,
+            "non_consecutive": 0,
+            "overflows": 0,
+            "invalid_json": 0,
+            "ring_overwrites": 0
+        }
+
+    def receive(self, raw):
+        """
+        Mirror of receiveData(): split the bytes of one I2C read on newlines and process each chunk.
+        :param raw: Bytes read from the bus.
+        :return: Bytes after the last newline (discarded by the firmware).
+        """
+        received = bytearray()
+        for byte in raw:
+            if byte == 0x0A:
+                self.process_chunk(bytes(received))
+                received.clear()
+            else:
+                received.append(byte)
+        return bytes(received)
+
+    def process_chunk(self, chunk):
+        """
+        Mirror of processReceivedChunk().
+        :return: The completed dataset if this chunk completed one, otherwise None.
+        """
+        self.stats["chunks"] += 1
+        chunk_number, current_total, data = parse_chunk(chunk)
+
+        if chunk_number != self.last_chunk_number + 1:
+            self.stats["non_consecutive"] += 1
+        self.last_chunk_number = chunk_number
+
+        if len(self.complete_data) + len(data) < self.max_data_size:
+            self.complete_data += data
+        else:
+            self.stats["overflows"] += 1
+
+        if chunk_number == current_total:
+            dataset = bytes(self.complete_data)
+            self._add_complete_data_to_ring_buffer(dataset)
+            self.complete_data.clear()
+            self.last_chunk_number = -1
+            return dataset
+        return None
+
+    def _add_complete_data_to_ring_buffer(self, dataset):
+        if not dataset or dataset[:1] != b"{" or dataset[-1:] != b"}":
+            self.stats["invalid_json"] += 1
+            return
+        if self.ring_buffer.is_full():
+            self.ring_buffer.pop()
+            self.stats["ring_overwrites"] += 1
+        self.ring_buffer.push(dataset)
+        self.stats["datasets"] += 1
+
+    def get_from_ring_buffer(self):
+        """Mirror of getFromRingBuffer(): the oldest complete dataset, or b"" if none."""
+        return self.ring_buffer.pop()
+
+
+def i2c_transaction(slave, master, request_size=MAX_CHUNK_SIZE):
+    """
+    One Wire.requestFrom(slave, request_size) exchange.
+    The slave's write is cut to request_size and padded with I2C_PAD_BYTE.
+    :return: The bytes the slave actually wrote.
+    """
+    written = slave.on_request()[:request_size]
+    master.receive(written + I2C_PAD_BYTE * (request_size - len(written)))
+    return written
@@ -0,0 +1,100 @@
+# chunk_codec_benchmark.py
+
+# Measures the efficiency of the AnttiGateway chunk protocol on realistic sensor payloads:
+# bytes on the wire, chunks and I2C transactions per reading, and encode / parse cost.
+# Run: python chunk_codec_benchmark.py [--repeat N] [--json]
+
+import argparse
+import json
+import timeit
+from chunk_codec import (SlaveEndpoint, MasterReassembler, add_slave_id, encode_chunks, parse_chunk,
+                         i2c_transaction, MAX_CHUNK_SIZE)
+
+SLAVE_ADDRESS = 0x07
+
+# Example readings shaped after the data formats in sensors.json
+SAMPLE_PAYLOADS = {
+    "xiaomi_mi_sensor": {"sensor_id": "A4:C1:38:2B:67:CD", "temperature": 21.37, "humidity": 45.2},
+    "ruuvitag": {"sensor_id": "C6:F3:CF:4E:F4:B1", "temperature": 22.415, "humidity": 41.5,
+                 "pressure": 1013.27, "battery_level": 87},
+    "ruuvitag_short_keys": {"id": "C6F3CF4EF4B1", "t": 22.42, "h": 41.5, "p": 1013.3, "b": 87},
+    "multi_sensor": {"sensor_id": "office-3", "temperature": 22.4, "humidity": 41.5, "pressure": 1013.27,
+                     "co2": 612, "voc": 112, "pm25": 4.2, "pm10": 7.9, "noise_db": 38.5,
+                     "light_lux": 320, "battery_level": 87, "rssi": -71},
+    "string_heavy": {"sensor_id": "door-1", "state": "open", "note": "quoted \"values\" need escaping",
+                     "location": "Building A / Floor 2 / Room 204"}
+}
+
+
+def measure_payload(name, reading, repeat):
+    """Encode one reading, push it through a simulated slave and master and time the steps."""
+    dataset = add_slave_id(reading, SLAVE_ADDRESS)
+    chunks = encode_chunks(dataset)
+    wire_bytes = sum(len(chunk) for chunk in chunks)
+
+    # Transactions until the master has the reading, including the queue refill request
+    slave = SlaveEndpoint(SLAVE_ADDRESS)
+    master = MasterReassembler()
+    slave.add_reading(reading)
+    transactions = 0
+    while master.ring_buffer.is_empty() and transactions < len(chunks) + 5:
+        i2c_transaction(slave, master)
+        transactions += 1
+    delivered = master.get_from_ring_buffer() == dataset
+
+    encode_us = timeit.timeit(lambda: encode_chunks(dataset), number=repeat) / repeat * 1e6
+    frames = [chunk[:-1] for chunk in chunks]
+    parse_once_us = timeit.timeit(lambda: [parse_chunk(f) for f in frames], number=repeat) / repeat * 1e6
+
+    def parse_three_times():
+        # processReceivedChunk() deserialises each chunk once per getter
+        for frame in frames:
+            parse_chunk(frame)
+            parse_chunk(frame)
+            parse_chunk(frame)
+
+    parse_firmware_us = timeit.timeit(parse_three_times, number=repeat) / repeat * 1e6
+
+    return {
+        "payload": name,
+        "reading_bytes": len(dataset),
+        "wire_bytes": wire_bytes,
+        "overhead_pct": round((wire_bytes - len(dataset)) / len(dataset) * 100, 1),
+        "chunks": len(chunks),
+        "i2c_transactions": transactions,
+        "bus_bytes_clocked": transactions * MAX_CHUNK_SIZE,
+        "delivered": delivered,
+        "encode_us": round(encode_us, 2),
+        "parse_once_us": round(parse_once_us, 2),
+        "parse_firmware_us": round(parse_firmware_us, 2)
+    }
+
+
+def run(repeat=2000):
+    """Run the benchmark for every sample payload and return the result rows."""
+    return [measure_payload(name, reading, repeat) for name, reading in SAMPLE_PAYLOADS.items()]
+
+
+def print_table(rows):
+    columns = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(row[c])) for row in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the AnttiGateway chunk protocol.")
+    parser.add_argument("--repeat", type=int, default=2000, help="Iterations for the timing measurements.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    rows = run(args.repeat)
+    if args.json:
+        print(json.dumps(rows, indent=4))
+    else:
+        print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,450 @@
+# format_compiler.py
+
+# Compiles a data_format ({"temperature": "float", "battery_level": "int", ...}) into a compact
+# wire format for the Module A -> Module B link:
+# - one or two letter keys (SlaveID, added by addToRingBuffer(), is left alone),
+# - floats as fixed-point integers (ArduinoJson writes a float widened to double with up to
+#   9 significant digits, e.g. 23.45000076, so fixed-point is shorter and exact),
+# - booleans as 0/1.
+# The result is a key dictionary plus encode/decode helpers for Module A (C++), Module B (C++) and
+# the host (Python), and a size report computed with chunk_codec: serialized bytes, chunks and
+# wire bytes per reading for the original and the compact format.
+# Run: python format_compiler.py --sensor ruuvitag [--out-dir compact_format]
+#      python format_compiler.py data_format.json --precision temperature=1
+
+import argparse
+import json
+import os
+import re
+import struct
+from chunk_codec import add_slave_id, encode_chunks, MAX_CHUNK_SIZE, MAX_CHUNK_SIZE_SLAVE
+
+SLAVE_ID_KEY = "SlaveID"
+REPORT_SLAVE_ID = 0x7F  # Largest 7-bit address, the longest SlaveID value
+
+# Precision (decimal places), range and typical value by field name fragment
+FIELD_HINTS = [
+    ("temp", {"precision": 2, "min": -40.0, "max": 85.0, "example": 23.45}),
+    ("humid", {"precision": 1, "min": 0.0, "max": 100.0, "example": 45.5}),
+    ("press", {"precision": 1, "min": 300.0, "max": 1100.0, "example": 1013.2}),
+    ("batt", {"precision": 0, "min": 0, "max": 100, "example": 87}),
+    ("volt", {"precision": 3, "min": 0.0, "max": 5.0, "example": 3.012}),
+    ("rssi", {"precision": 0, "min": -120, "max": 0, "example": -67}),
+    ("co2", {"precision": 0, "min": 0, "max": 10000, "example": 612}),
+    ("lux", {"precision": 0, "min": 0, "max": 100000, "example": 320})
+]
+DEFAULT_HINTS = {
+    "float": {"precision": 2, "min": -1000.0, "max": 1000.0, "example": 12.34},
+    "int": {"precision": 0, "min": -32768, "max": 32767, "example": 42},
+    "string": {"example": "c6:f3:cf:4e:f4:b1"},
+    "bool": {"example": True}
+}
+TYPE_ALIASES = {"float": "float", "double": "float", "number": "float", "int": "int", "integer": "int",
+                "long": "int", "string": "string", "str": "string", "bool": "bool", "boolean": "bool"}
+
+
+def parse_format_text(text):
+    """
+    Parse the data_format_box content (JSON, optionally wrapped in ``` fences).
+    :return: Dictionary.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("\n") + 1:] if "\n" in text else text
+    return json.loads(text)
+
+
+def is_compiled(data_format):
+    """True if the dictionary is a key dictionary produced by compile_format()."""
+    return (isinstance(data_format, dict) and bool(data_format)
+            and all(isinstance(entry, dict) and "field" in entry for entry in data_format.values()))
+
+
+def normalise_schema(data_format):
+    """
+    Turn a proposed format into {field: type}. Accepts type names ("float"), example values
+    (23.5, "abc", true), {"type": ...} objects and compiled key dictionaries.
+    """
+    if is_compiled(data_format):
+        return {entry["field"]: entry["source_type"] for entry in data_format.values()}
+    schema = {}
+    for field, value in data_format.items():
+        if field == SLAVE_ID_KEY:
+            continue
+        if isinstance(value, dict):
+            value = value.get("type", "string")
+        if isinstance(value, bool):
+            kind = "bool"
+        elif isinstance(value, int):
+            kind = "int"
+        elif isinstance(value, float):
+            kind = "float"
+        else:
+            text = str(value).strip()
+            kind = TYPE_ALIASES.get(text.split()[0].strip("()").lower(), "string") if text else "string"
+        schema[field] = kind
+    return schema
+
+
+def field_hints(field, kind):
+    hints = dict(DEFAULT_HINTS[kind])
+    if kind in ("float", "int"):
+        lowered = field.lower()
+        for fragment, values in FIELD_HINTS:
+            if fragment in lowered:
+                hints.update(values)
+                break
+        if kind == "int":
+            hints["precision"] = 0
+            hints["example"] = int(hints["example"])
+    return hints
+
+
+def short_keys(fields, reserved=(SLAVE_ID_KEY,)):
+    """
+    Assign short keys: the first letter, then the initials of the underscore parts,
+    then the first two letters, then the first letter and a number.
+    :return: Dictionary of field -> key.
+    """
+    used = set(reserved)
+    keys = {}
+    for field in fields:
+        letters = re.sub(r"[^a-z0-9_]", "", field.lower()) or "f"
+        parts = [part for part in letters.split("_") if part]
+        candidates = [letters[0], "".join(part[0] for part in parts), letters.replace("_", "")[:2]]
+        candidates += [letters[0] + str(number) for number in range(2, 100)]
+        key = next(candidate for candidate in candidates if candidate and candidate not in used)
+        used.add(key)
+        keys[field] = key
+    return keys
+
+
+def compile_format(data_format, precision=None):
+    """
+    Compile a data format into a key dictionary.
+    :param data_format: Proposed format (see normalise_schema()).
+    :param precision: Optional {field: decimal places} overriding FIELD_HINTS.
+    :return: Key dictionary {key: {"field", "source_type", "wire", "scale"}} in field order.
+    """
+    schema = normalise_schema(data_format)
+    keys = short_keys(schema)
+    compiled = {}
+    for field, kind in schema.items():
+        hints = field_hints(field, kind)
+        entry = {"field": field, "source_type": kind}
+        if kind == "float":
+            places = (precision or {}).get(field, hints["precision"])
+            entry.update(wire="int", scale=10 ** places)
+        elif kind == "bool":
+            entry.update(wire="int", scale=1)
+        else:
+            entry.update(wire=kind, scale=1)
+        compiled[keys[field]] = entry
+    return compiled
+
+
+def encode_reading(compiled, reading):
+    """Full reading -> compact reading (host reference of the Module A helper). Missing fields stay missing."""
+    out = {}
+    for key, entry in compiled.items():
+        value = reading.get(entry["field"])
+        if value is None or value != value:  # missing or NaN
+            continue
+        if entry["source_type"] == "float":
+            out[key] = int(round(value * entry["scale"]))
+        elif entry["source_type"] == "bool":
+            out[key] = 1 if value else 0
+        else:
+            out[key] = value
+    if SLAVE_ID_KEY in reading:
+        out[SLAVE_ID_KEY] = reading[SLAVE_ID_KEY]
+    return out
+
+
+def decode_reading(compiled, compact):
+    """Compact reading -> full reading (host reference of the Module B helper)."""
+    out = {}
+    for key, entry in compiled.items():
+        if key not in compact:
+            continue
+        value = compact[key]
+        if entry["source_type"] == "float":
+            out[entry["field"]] = value / entry["scale"]
+        elif entry["source_type"] == "bool":
+            out[entry["field"]] = bool(value)
+        else:
+            out[entry["field"]] = value
+    if SLAVE_ID_KEY in compact:
+        out[SLAVE_ID_KEY] = compact[SLAVE_ID_KEY]
+    return out
+
+
+def _arduinojson_float(value):
+    """Approximate ArduinoJson text of a float variable: widened to double, 9 significant digits."""
+    widened = struct.unpack("<f", struct.pack("<f", value))[0]
+    text = "%.9g" % widened
+    if "." in text and "e" not in text:
+        text = text.rstrip("0").rstrip(".")
+    return text
+
+
+def _serialize_original(reading, schema):
+    parts = []
+    for field, value in reading.items():
+        if schema.get(field) == "float":
+            text = _arduinojson_float(value)
+        else:
+            text = json.dumps(value, ensure_ascii=False)
+        parts.append(json.dumps(field, ensure_ascii=False) + ":" + text)
+    return "{" + ",".join(parts) + "}"
+
+
+def sample_readings(schema):
+    """
+    A typical reading and candidate values for a worst-case reading of the full format.
+    :return: (typical reading, {field: list of candidate values}).
+    """
+    typical, candidates = {}, {}
+    for field, kind in schema.items():
+        hints = field_hints(field, kind)
+        typical[field] = hints["example"]
+        if kind == "float":
+            # Range ends with a fractional part at full precision
+            step = 10 ** -max(hints["precision"], 1)
+            candidates[field] = [hints["min"] + step * 7, hints["max"] - step * 3, hints["example"]]
+        elif kind == "int":
+            candidates[field] = [hints["min"], hints["max"]]
+        else:
+            candidates[field] = [hints["example"]]
+    return typical, candidates
+
+
+def _wire_stats(text):
+    dataset = add_slave_id(text, REPORT_SLAVE_ID)
+    chunks = encode_chunks(dataset)
+    return {
+        "reading_bytes": len(dataset),
+        "chunks": len(chunks),
+        "wire_bytes": sum(len(chunk) for chunk in chunks),
+        "i2c_requests": len(chunks) + 1,  # The request that refills the chunk queue writes nothing
+        "largest_chunk": max(len(chunk) for chunk in chunks),
+        "multiple_of_chunk_size": len(dataset) % MAX_CHUNK_SIZE_SLAVE == 0
+    }
+
+
+def size_report(compiled):
+    """
+    Serialized size, chunk count and wire bytes per reading (with SlaveID) for the original
+    and the compact format, for a typical and a worst-case reading.
+    """
+    schema = normalise_schema(compiled)
+    typical, candidates = sample_readings(schema)
+    # The longest value differs per format: e.g. 1099.7 is long as a float, -39.93 as fixed-point
+    longest_original = {field: max(values, key=lambda v: len(_serialize_original({field: v}, schema)))
+                        for field, values in candidates.items()}
+    longest_compact = {field: max(values, key=lambda v: len(json.dumps(encode_reading(compiled, {field: v}))))
+                       for field, values in candidates.items()}
+    report = {}
+    for name, original_reading, compact_reading in (("typical", typical, typical),
+                                                    ("worst_case", longest_original, longest_compact)):
+        original = _wire_stats(_serialize_original(original_reading, schema))
+        compact = _wire_stats(json.dumps(encode_reading(compiled, compact_reading), separators=(",", ":"),
+                                         ensure_ascii=False))
+        report[name] = {"original": original, "compact": compact}
+    warnings = []
+    for name, sizes in report.items():
+        for variant, stats in sizes.items():
+            if stats["largest_chunk"] > MAX_CHUNK_SIZE:
+                warnings.append(f"{variant} {name} chunk is {stats['largest_chunk']} bytes; "
+                                f"the master reads only {MAX_CHUNK_SIZE} per request.")
+            if stats["multiple_of_chunk_size"]:
+                warnings.append(f"{variant} {name} reading is a multiple of {MAX_CHUNK_SIZE_SLAVE} bytes and "
+                                f"never completes (tc = len / {MAX_CHUNK_SIZE_SLAVE}).")
+    report["warnings"] = warnings
+    return report
+
+
+def format_report(compiled, report=None):
+    """Human-readable summary of the key dictionary and the size report."""
+    report = report or size_report(compiled)
+    lines = ["Key dictionary:"]
+    for key, entry in compiled.items():
+        scale = f" x{entry['scale']}" if entry["scale"] != 1 else ""
+        lines.append(f"  {key:<3} {entry['field']} ({entry['source_type']} -> {entry['wire']}{scale})")
+    lines.append("")
+    lines.append(f"{'Reading':<11}{'Format':<10}{'Bytes':>7}{'Chunks':>8}{'Wire B':>8}{'I2C req':>9}")
+    for name in ("typical", "worst_case"):
+        for variant in ("original", "compact"):
+            stats = report[name][variant]
+            lines.append(f"{name:<11}{variant:<10}{stats['reading_bytes']:>7}{stats['chunks']:>8}"
+                         f"{stats['wire_bytes']:>8}{stats['i2c_requests']:>9}")
+    lines.extend(f"Warning: {warning}" for warning in report["warnings"])
+    return "\n".join(lines)
+
+
+def _cpp_identifier(field):
+    identifier = re.sub(r"\W", "_", field)
+    return identifier if not identifier[0].isdigit() else "_" + identifier
+
+
+def _key_comment(compiled, prefix):
+    return "\n".join(f"{prefix} \"{key}\" = {entry['field']}" + (f" x{entry['scale']}" if entry["scale"] != 1 else "")
+                     for key, entry in compiled.items())
+
+
+def emit_module_a(compiled):
+    """C++ helper for Module A: build the compact reading string for addToRingBuffer()."""
+    parameters, body = [], []
+    for key, entry in compiled.items():
+        name = _cpp_identifier(entry["field"])
+        kind = entry["source_type"]
+        if kind == "float":
+            parameters.append(f"float {name}")
+            body.append(f"    if (!isnan({name})) doc[\"{key}\"] = (long)lroundf({name} * {entry['scale']}.0f);")
+        elif kind == "int":
+            parameters.append(f"long {name}")
+            body.append(f"    if ({name} != COMPACT_MISSING_INT) doc[\"{key}\"] = {name};")
+        elif kind == "bool":
+            parameters.append(f"int8_t {name}")
+            body.append(f"    if ({name} >= 0) doc[\"{key}\"] = {name} ? 1 : 0;")
+        else:
+            parameters.append(f"const char* {name}")
+            body.append(f"    if ({name} != nullptr && {name}[0] != '\\0') doc[\"{key}\"] = {name};")
+    return f"""// Compact data format, Module A side (generated by format_compiler.py)
+{_key_comment(compiled, "//")}
+// Pass NAN, COMPACT_MISSING_INT, -1 (bool) or nullptr for unavailable values; they are omitted.
+#include <ArduinoJson.h>
+#include <math.h>
+#include <limits.h>
+
+const long COMPACT_MISSING_INT = LONG_MIN;
+
+String encodeCompactReading({", ".join(parameters)}) {{
+    StaticJsonDocument<256> doc;
+{chr(10).join(body)}
+    String output;
+    serializeJson(doc, output);
+    return output;  // Pass to addToRingBuffer(), which adds SlaveID
+}}
+"""
+
+
+def emit_module_b(compiled):
+    """C++ helper for Module B: expand a compact reading to the full field names before forwarding."""
+    body = []
+    for key, entry in compiled.items():
+        field, kind = entry["field"], entry["source_type"]
+        if kind == "float":
+            body.append(f"    if (in.containsKey(\"{key}\")) out[\"{field}\"] = in[\"{key}\"].as<long>() / {entry['scale']}.0;")
+        elif kind == "bool":
+            body.append(f"    if (in.containsKey(\"{key}\")) out[\"{field}\"] = in[\"{key}\"].as<int>() != 0;")
+        elif kind == "int":
+            body.append(f"    if (in.containsKey(\"{key}\")) out[\"{field}\"] = in[\"{key}\"].as<long>();")
+        else:
+            body.append(f"    if (in.containsKey(\"{key}\")) out[\"{field}\"] = in[\"{key}\"].as<const char*>();")
+    return f"""// Compact data format, Module B side (generated by format_compiler.py)
+{_key_comment(compiled, "//")}
+// Forward the compact reading as is (the host decodes it), or expand it first with expandCompactReading().
+#include <ArduinoJson.h>
+
+bool expandCompactReading(const String& compact, String& output) {{
+    StaticJsonDocument<256> in;
+    if (deserializeJson(in, compact)) {{
+        return false;
+    }}
+    StaticJsonDocument<512> out;
+{chr(10).join(body)}
+    if (in.containsKey("{SLAVE_ID_KEY}")) out["{SLAVE_ID_KEY}"] = in["{SLAVE_ID_KEY}"];
+    output = "";
+    serializeJson(out, output);
+    return true;
+}}
+"""
+
+
+def emit_python(compiled):
+    """Python helpers for the host: straight-line decode_reading()/encode_reading() for this format."""
+    decode, encode = [], []
+    for key, entry in compiled.items():
+        field, kind, scale = entry["field"], entry["source_type"], entry["scale"]
+        if kind == "float":
+            decode.append(f"    if {key!r} in compact:\n        out[{field!r}] = compact[{key!r}] / {scale}")
+            encode.append(f"    value = reading.get({field!r})\n    if value is not None and value == value:\n"
+                          f"        out[{key!r}] = int(round(value * {scale}))")
+        elif kind == "bool":
+            decode.append(f"    if {key!r} in compact:\n        out[{field!r}] = bool(compact[{key!r}])")
+            encode.append(f"    if reading.get({field!r}) is not None:\n        out[{key!r}] = 1 if reading[{field!r}] else 0")
+        else:
+            decode.append(f"    if {key!r} in compact:\n        out[{field!r}] = compact[{key!r}]")
+            encode.append(f"    if reading.get({field!r}) is not None:\n        out[{key!r}] = reading[{field!r}]")
+    slave = f"    if {SLAVE_ID_KEY!r} in {{src}}:\n        out[{SLAVE_ID_KEY!r}] = {{src}}[{SLAVE_ID_KEY!r}]"
+    return f"""# Compact data format, host side (generated by format_compiler.py)
+
+KEY_DICTIONARY = {json.dumps(compiled, indent=4)}
+
+
+def decode_reading(compact):
+    out = {{}}
+{chr(10).join(decode)}
+{slave.format(src="compact")}
+    return out
+
+
+def encode_reading(reading):
+    out = {{}}
+{chr(10).join(encode)}
+{slave.format(src="reading")}
+    return out
+"""
+
+
+def write_outputs(compiled, out_dir):
+    """Write the key dictionary and the three helpers to a directory. Returns the written paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = {
+        "key_dictionary.json": json.dumps(compiled, indent=4) + "\n",
+        "compact_format_module_a.h": emit_module_a(compiled),
+        "compact_format_module_b.h": emit_module_b(compiled),
+        "compact_format.py": emit_python(compiled)
+    }
+    paths = []
+    for name, content in outputs.items():
+        path = os.path.join(out_dir, name)
+        with open(path, "w") as f:
+            f.write(content)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a data format into a compact wire format.")
+    parser.add_argument("data_format", nargs="?", help="JSON file with the proposed data format.")
+    parser.add_argument("--sensor", help="Use the data_format of this sensors.json entry instead.")
+    parser.add_argument("--precision", action="append", default=[],
+                        help="Decimal places for a float field, e.g. temperature=1 (repeatable).")
+    parser.add_argument("--out-dir", help="Write the key dictionary and helpers to this directory.")
+    args = parser.parse_args()
+
+    if args.sensor:
+        with open("sensors.json", "r") as f:
+            data_format = json.load(f)["sensors"][args.sensor]["data_format"]
+    elif args.data_format:
+        with open(args.data_format, "r") as f:
+            data_format = parse_format_text(f.read())
+    else:
+        parser.error("Give a data format file or --sensor.")
+    precision = {}
+    for item in args.precision:
+        field, _, places = item.partition("=")
+        precision[field] = int(places)
+
+    compiled = compile_format(data_format, precision)
+    print(format_report(compiled))
+    if args.out_dir:
+        for path in write_outputs(compiled, args.out_dir):
+            print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
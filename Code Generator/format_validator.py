@@ -0,0 +1,201 @@
+# format_validator.py
+
+# Compiles data_format definitions ({"temperature": "float", "battery_level": "int", ...}) into
+# Python validator functions. The source of each validator is generated once with one inlined
+# check per field, so validating a reading does no per-record lookups of the format itself.
+#
+# Rules (ADDITIONAL_INFO['data_format']): fields may be missing, because unavailable values are
+# omitted; null or NaN values are therefore errors, as are unknown fields and wrong types.
+# SlaveID, added by addToRingBuffer(), is required unless require_slave_id=False.
+# Compiled key dictionaries from format_compiler.py are validated by their short keys and wire types.
+#
+# Run: python format_validator.py readings.ndjson --sensor ruuvitag
+#      python format_validator.py slave_serial.log --serial --no-slave-id --data-format box.json
+#      (exits with status 1 if any reading is invalid, for use as a regression check)
+
+import argparse
+import json
+import sys
+from format_compiler import is_compiled, parse_format_text, TYPE_ALIASES
+from analysis_common import iter_lines
+
+SLAVE_ID_KEY = "SlaveID"
+
+# Inlined type test per data_format type; "v" is the field value
+_TYPE_TESTS = {
+    "float": "(type(v) is float and v == v) or type(v) is int",
+    "int": "type(v) is int",
+    "string": "type(v) is str",
+    "bool": "type(v) is bool"
+}
+
+
+def _normalise_format(data_format):
+    """{field: canonical type or None (any non-null value)} for a data_format or a compiled key dictionary."""
+    if is_compiled(data_format):
+        return {key: entry["wire"] for key, entry in data_format.items()}
+    fields = {}
+    for field, kind in data_format.items():
+        if isinstance(kind, dict):
+            kind = kind.get("type")
+        words = str(kind).split() if kind is not None else []
+        fields[field] = TYPE_ALIASES.get(words[0].strip("()").lower()) if words else None
+    return fields
+
+
+def _format_source(name, fields, require_slave_id, allowed_name=None):
+    """Source of one validator function; allowed_name is the frozenset of permitted keys (None: any keys)."""
+    lines = [f"def {name}(reading):",
+             "    if type(reading) is not dict:",
+             "        return 'Reading is not a JSON object.'"]
+    if require_slave_id:
+        lines += [f"    if {SLAVE_ID_KEY!r} not in reading:",
+                  "        return 'Missing SlaveID.'"]
+    if allowed_name:
+        lines += [f"    if not reading.keys() <= {allowed_name}:",
+                  f"        return _unknown_field(reading, {allowed_name})"]
+    fields = dict(fields)
+    fields.setdefault(SLAVE_ID_KEY, "int")
+    for field, kind in fields.items():
+        test = _TYPE_TESTS.get(kind, "v is not None")
+        lines += [f"    v = reading.get({field!r}, _MISSING)",
+                  f"    if v is not _MISSING and not ({test}):",
+                  f"        return {f'Field {field!r} is null; omit unavailable values.'!r} if v is None "
+                  f"else {f'Field {field!r} should be {kind}.'!r}"]
+    lines.append("    return None")
+    return "\n".join(lines)
+
+
+def _unknown_field(reading, allowed):
+    for key in reading:
+        if key not in allowed:
+            return f"Unknown field '{key}'."
+    return None
+
+
+def _build(data_formats, require_slave_id):
+    if isinstance(data_formats, dict):
+        data_formats = [data_formats]
+    if not data_formats:
+        return _format_source("validate", {}, require_slave_id), {}
+    parts, constants = [], {}
+    for index, fmt in enumerate(data_formats):
+        fields = _normalise_format(fmt)
+        constants[f"_ALLOWED_{index}"] = frozenset(fields) | {SLAVE_ID_KEY}
+        parts.append(_format_source(f"_validate_{index}", fields, require_slave_id, f"_ALLOWED_{index}"))
+    if len(parts) == 1:
+        return parts[0].replace("def _validate_0(", "def validate(", 1), constants
+    calls = ["def validate(reading):", "    error = None"]
+    for index in range(len(parts)):
+        calls += [f"    error = _validate_{index}(reading)", "    if error is None:", "        return None"]
+    calls.append("    return error")
+    return "\n\n\n".join(parts + ["\n".join(calls)]), constants
+
+
+def validator_source(data_formats, require_slave_id=True):
+    """
+    Python source of the validator for one or more data formats (a reading is valid if it matches any).
+    :param data_formats: A data_format dictionary or a list of them; an empty list accepts any object.
+    :param require_slave_id: Require the SlaveID added by addToRingBuffer().
+    """
+    return _build(data_formats, require_slave_id)[0]
+
+
+def compile_validator(data_formats, require_slave_id=True):
+    """
+    Compile data format(s) into a validator function.
+    :return: Function reading -> None if valid, otherwise an error message.
+    """
+    source, constants = _build(data_formats, require_slave_id)
+    namespace = dict(constants, _MISSING=object(), _unknown_field=_unknown_field)
+    exec(compile(source, "<data_format validator>", "exec"), namespace)
+    validate = namespace["validate"]
+    validate.source = source
+    return validate
+
+
+def validate_many(validate, readings):
+    """
+    Validate a list of readings.
+    :return: (list of valid readings, list of (index, error)).
+    """
+    valid, errors = [], []
+    append, report = valid.append, errors.append
+    for index, reading in enumerate(readings):
+        error = validate(reading)
+        if error is None:
+            append(reading)
+        else:
+            report((index, error))
+    return valid, errors
+
+
+def iter_json_lines(lines, serial=False):
+    """
+    Parse NDJSON lines (bytes or str). With serial=True, every line containing a JSON object
+    (e.g. "Sent data via I2C: {...}") contributes that object and other lines are skipped.
+    :return: Generator of (line number, parsed value or None, parse error or None).
+    """
+    for number, line in enumerate(lines, 1):
+        if serial:
+            brace, close = (b"{", b"}") if isinstance(line, bytes) else ("{", "}")
+            start, end = line.find(brace), line.rfind(close)
+            if start < 0 or end < start:
+                continue
+            line = line[start:end + 1]
+        elif not line.strip():
+            continue
+        try:
+            yield number, json.loads(line), None
+        except ValueError as e:
+            yield number, None, f"Invalid JSON: {e}"
+
+
+def validate_stream(validate, lines, serial=False, max_errors=20):
+    """
+    Validate an NDJSON stream (or a serial log with serial=True).
+    :return: Summary dictionary with counts and the first errors.
+    """
+    summary = {"readings": 0, "valid": 0, "invalid": 0, "errors": []}
+    for number, reading, error in iter_json_lines(lines, serial):
+        summary["readings"] += 1
+        if error is None:
+            error = validate(reading)
+        if error is None:
+            summary["valid"] += 1
+            continue
+        summary["invalid"] += 1
+        if len(summary["errors"]) < max_errors:
+            summary["errors"].append({"line": number, "error": error})
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate readings against a data format.")
+    parser.add_argument("path", help="NDJSON readings, a serial log with --serial, or - for standard input.")
+    parser.add_argument("--sensor", action="append", help="Validate against this sensors.json entry (repeatable).")
+    parser.add_argument("--data-format", help="JSON file with a data_format (e.g. the data_format_box content).")
+    parser.add_argument("--serial", action="store_true", help="Take the JSON object of every log line that has one.")
+    parser.add_argument("--no-slave-id", action="store_true", help="Readings before addToRingBuffer(), without SlaveID.")
+    parser.add_argument("--show-source", action="store_true", help="Print the generated validator.")
+    args = parser.parse_args()
+
+    data_formats = []
+    if args.sensor:
+        with open("sensors.json", "r") as f:
+            sensors = json.load(f)["sensors"]
+        data_formats += [sensors[key]["data_format"] for key in args.sensor]
+    if args.data_format:
+        with open(args.data_format, "r") as f:
+            data_formats.append(parse_format_text(f.read()))
+    validate = compile_validator(data_formats, require_slave_id=not args.no_slave_id)
+    if args.show_source:
+        print(validate.source)
+
+    summary = validate_stream(validate, iter_lines(args.path), serial=args.serial)
+    print(json.dumps(summary, indent=4))
+    sys.exit(1 if summary["invalid"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1052 @@
+# generation_engine.py
+
+# Tk-independent code generation pipeline. Callers pass plain request objects that hold a snapshot
+# of all inputs; the engine builds the prompts, calls the model (or races several models) and
+# reports progress and results as events on an EventBus. Nothing here touches Tk, so the same code
+# runs in worker threads, worker processes, a service or a headless script:
+#
+#     engine = GenerationEngine(ChatGPTAPI(api_key, "gpt-4o"))
+#     engine.bus.subscribe(lambda event: print(event.kind, event.data))
+#     result = engine.generate_code(ModuleRequest("module_a", sensor_type="RuuviTag", ...))
+# Run: python generation_engine.py --model gpt-4o --sensor ruuvitag --module module_a --out module_a.ino
+#
+# Events (EngineEvent.kind):
+#   log       {"message", "level"}                 progress for the log view
+#   result    {"target", "code", "explanation"}    target is "module_a", "module_b" or "data_format"
+#   feedback  {"message"}                          plain message for the feedback view
+#   error     {"message"}                          the request failed; message is ready to show
+#   done      {"status"}                           last event of every request ("ok" or "error")
+#
+# Requests run by job_queue.JobRunner get a checkpoint: every successful model response is stored
+# under the job, so a job resumed after a crash answers its finished prompts without calling the API.
+#
+# CatalogSchemaRequest suggests data formats for the whole catalog concurrently and merges them into one
+# canonical schema with per-sensor field maps (schema_synthesis.py).
+#
+# Generated and refined code is checked with resource_estimator.py for the module's board; errors and
+# warnings are appended to the explanation and put into the next refine prompt of that code.
+
+import datetime
+import hashlib
+import json
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from additional_info import ADDITIONAL_INFO
+from additional_info import ADDITIONAL_INFO_CODE_MODULE_A
+from additional_info import ADDITIONAL_INFO_CODE_MODULE_B
+from additional_info import ADDITIONAL_INFO_BINARY_FRAMING
+from additional_info import ADDITIONAL_INFO_BATCHED_UPLINK
+from additional_info import ADDITIONAL_INFO_POLLING_POLICY
+from additional_info import ADDITIONAL_INFO_WINDOWED_AGGREGATION
+from batch_jobs import BatchJob, OpenAIBatchClient, LocalBatchClient, BATCH_OUTPUT_DIR, BATCH_TIMEOUT
+from schema_synthesis import (parse_suggestion, merge_proposals, current_fields, vocabulary, format_summary,
+                              write_catalog, SCHEMA_WORKERS)
+from resource_estimator import estimate_resources, format_estimate, findings_for_prompt
+from format_compiler import compile_format, parse_format_text, is_compiled, format_report, emit_module_a, emit_module_b
+from window_aggregator import parse_window_spec, describe_window, aggregated_format
+
+REFINEMENT_HISTORY_SIZE = 50  # Generated versions kept for refinement (only the last one is refined)
+
+
+class EngineEvent:
+    def __init__(self, kind, request_id=None, **data):
+        """
+        :param kind: 'log', 'result', 'feedback', 'error' or 'done'.
+        :param request_id: Id of the request the event belongs to (None for engine-wide events).
+        """
+        self.kind = kind
+        self.request_id = request_id
+        self.data = data
+        self.time = datetime.datetime.now().isoformat(timespec="milliseconds")
+
+    def to_dict(self):
+        return {"kind": self.kind, "request_id": self.request_id, "time": self.time, **self.data}
+
+    def __repr__(self):
+        return f"EngineEvent({self.kind!r}, {self.request_id!r}, {self.data!r})"
+
+
+class EventBus:
+    def __init__(self):
+        """Synchronous publish/subscribe. Subscribers run on the publishing thread and must be thread-safe."""
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """:param callback: Function taking an EngineEvent. :return: The callback (for unsubscribe)."""
+        with self._lock:
+            self._subscribers = self._subscribers + [callback]
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [subscriber for subscriber in self._subscribers if subscriber is not callback]
+
+    def publish(self, event):
+        for subscriber in self._subscribers:
+            try:
+                subscriber(event)
+            except Exception as e:
+                print(f"[ERROR] Event subscriber failed on {event.kind}: {e}")
+
+
+class EngineRequest:
+    kind = ""
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+
+    def to_dict(self):
+        return {"kind": self.kind, **vars(self)}
+
+
+class ModuleRequest(EngineRequest):
+    kind = "generate"
+
+    def __init__(self, module_name, sensor_type="", sensor_description="", technology="", board="", data_format="",
+                 example_code_1="", example_code_2="", framing="json", uplink="per_reading", polling="random",
+                 aggregation="none", request_id=None):
+        """
+        Generate the code of one module.
+        :param module_name: 'module_a' or 'module_b'.
+        :param sensor_type: Sensor type (Module A) or endpoint type (Module B).
+        :param technology: Wireless technology of the module.
+        :param board: Development board of the module.
+        :param data_format: Data format between the modules (text, as in the data format box).
+        :param framing: I2C chunk framing ('json' or 'binary').
+        :param uplink: Module B uplink ('per_reading' or 'batched').
+        :param polling: Module B slave polling policy ('random', 'round_robin', 'weighted', 'adaptive_backoff').
+        :param aggregation: Module A window before sending ('none', '10' readings, '60s', '10,60s').
+        """
+        super().__init__(request_id)
+        self.module_name = module_name
+        self.sensor_type = sensor_type
+        self.sensor_description = sensor_description
+        self.technology = technology
+        self.board = board
+        self.data_format = data_format
+        self.example_code_1 = example_code_1
+        self.example_code_2 = example_code_2
+        self.framing = framing
+        self.uplink = uplink
+        self.polling = polling
+        self.aggregation = aggregation
+
+
+class DataFormatRequest(EngineRequest):
+    kind = "suggest_data_format"
+
+    def __init__(self, sensor_type, sensor_description, technology="", board="", data_format="", example_code_1="",
+                 example_code_2="", request_id=None):
+        """Suggest a data format between Module A and Module B for a sensor."""
+        super().__init__(request_id)
+        self.sensor_type = sensor_type
+        self.sensor_description = sensor_description
+        self.technology = technology
+        self.board = board
+        self.data_format = data_format
+        self.example_code_1 = example_code_1
+        self.example_code_2 = example_code_2
+
+
+class RefineRequest(EngineRequest):
+    kind = "refine"
+
+    def __init__(self, modification_request, code=None, module_name=None, sensor="", board="", data_format="",
+                 request_id=None):
+        """
+        Apply a modification request to generated code.
+        :param code: Code to modify; None takes the last entry of the engine's refinement history.
+        :param module_name: Module of the code (needed when code is given).
+        :param board: Development board of the code (when code is given); used for the resource check.
+        :param data_format: Data format of the readings (when code is given); used for the resource check.
+        """
+        super().__init__(request_id)
+        self.modification_request = modification_request
+        self.code = code
+        self.module_name = module_name
+        self.sensor = sensor
+        self.board = board
+        self.data_format = data_format
+
+
+class CatalogBatchRequest(EngineRequest):
+    kind = "batch_catalog"
+
+    def __init__(self, sensor_data, batch_settings=None, endpoint_technology="", endpoint_board="",
+                 example_code_1="", example_code_2="", request_id=None):
+        """
+        Regenerate Module A code for every catalog sensor (and Module B code for every distinct data format).
+        :param sensor_data: Dictionary of sensors loaded from sensors.json.
+        :param batch_settings: The "batch" section of config.json.
+        """
+        super().__init__(request_id)
+        self.sensor_data = sensor_data
+        self.batch_settings = batch_settings or {}
+        self.endpoint_technology = endpoint_technology
+        self.endpoint_board = endpoint_board
+        self.example_code_1 = example_code_1
+        self.example_code_2 = example_code_2
+
+
+class CatalogSchemaRequest(EngineRequest):
+    kind = "catalog_schema"
+
+    def __init__(self, sensor_data, canonical_schema=None, workers=SCHEMA_WORKERS, sensors_file=None, adopt=False,
+                 request_id=None):
+        """
+        Suggest a data format for every catalog sensor at once and merge them into one canonical schema.
+        :param sensor_data: Dictionary of sensors loaded from sensors.json.
+        :param canonical_schema: Field names and types the model should reuse (schema_synthesis.vocabulary()).
+        :param workers: Suggestions running at the same time.
+        :param sensors_file: Catalog to write the schema and the per-sensor maps into (None: do not write).
+        :param adopt: Also replace each sensor's data_format with its canonical format.
+        """
+        super().__init__(request_id)
+        self.sensor_data = sensor_data
+        self.canonical_schema = canonical_schema
+        self.workers = workers
+        self.sensors_file = sensors_file
+        self.adopt = adopt
+
+
+REQUEST_TYPES = {request_class.kind: request_class
+                 for request_class in (ModuleRequest, DataFormatRequest, RefineRequest, CatalogBatchRequest,
+                                       CatalogSchemaRequest)}
+
+
+def request_from_dict(data, request_id=None):
+    """
+    Rebuild a request from EngineRequest.to_dict() output (e.g. a stored job).
+    :param request_id: Request id to use instead of the stored one.
+    :raise ValueError: If the kind is unknown.
+    """
+    data = dict(data)
+    request_class = REQUEST_TYPES.get(data.pop("kind", None))
+    if request_class is None:
+        raise ValueError("Unknown request kind.")
+    if request_id is not None:
+        data["request_id"] = request_id
+    return request_class(**data)
+
+
+class ResponseCache:
+    def __init__(self, max_entries=512, ttl=None):
+        """
+        Model responses by (model, prompt), shared by every request of an engine. Identical prompts
+        that arrive while the first one is still running wait for its answer instead of paying twice.
+        Only successful responses are kept.
+        :param max_entries: Least recently used entries beyond this are dropped.
+        :param ttl: Seconds an entry stays valid (None: until evicted).
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (stored at, result)
+        self._pending = {}  # key -> threading.Event of the request computing it
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model, prompt):
+        return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def get_or_compute(self, key, compute):
+        """
+        :param compute: Function returning the result dictionary on a miss.
+        :return: (result dictionary, True if it came from the cache).
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and (self.ttl is None or time.time() - entry[0] < self.ttl):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(entry[1]), True
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    self.misses += 1
+                    break
+            pending.wait()  # Same prompt in flight; take its answer (or compute it if it failed)
+
+        try:
+            result = compute()
+            if isinstance(result, dict) and "error" not in result:
+                with self._lock:
+                    self._entries[key] = (time.time(), dict(result))
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            return result, False
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            pending.set()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "in_flight": len(self._pending)}
+
+
+class RequestFailed(Exception):
+    """Raised inside the engine to end a request with an error message for the user."""
+
+
+class GenerationEngine:
+    def __init__(self, chatgpt_api=None, usage_ledger=None, model_racer=None, bus=None, cache=None):
+        """
+        :param chatgpt_api: ChatGPTAPI (or PooledChatGPTAPI) used for the requests.
+        :param usage_ledger: Optional UsageLedger for token accounting and budgets.
+        :param model_racer: Optional ModelRacer; generate requests race the models when set.
+        :param bus: EventBus for progress and results (a new one by default).
+        :param cache: Optional ResponseCache for answers to identical prompts (not used when racing).
+        """
+        self.chatgpt_api = chatgpt_api
+        self.usage_ledger = usage_ledger
+        self.model_racer = model_racer
+        self.bus = bus or EventBus()
+        self.cache = cache
+        self.refinement_history = deque(maxlen=REFINEMENT_HISTORY_SIZE)
+        self._history_lock = threading.Lock()
+        self._checkpoints = {}  # request_id -> JobCheckpoint of the requests running under a job
+        self._handlers = {
+            ModuleRequest: self._generate_code,
+            DataFormatRequest: self._suggest_data_format,
+            RefineRequest: self._refine,
+            CatalogBatchRequest: self._batch_generate_catalog,
+            CatalogSchemaRequest: self._synthesize_catalog_schema
+        }
+
+    # ------------------------------------------------ events ------------------------------------------------
+
+    def emit(self, kind, request_id=None, **data):
+        self.bus.publish(EngineEvent(kind, request_id, **data))
+
+    def log(self, message, level="INFO", request_id=None):
+        self.emit("log", request_id, message=message, level=level)
+
+    # ------------------------------------------------ requests ------------------------------------------------
+
+    def run(self, request, checkpoint=None):
+        """
+        Run a request to completion on the calling thread.
+        :param checkpoint: Optional job_queue.JobCheckpoint; finished model responses are stored in it
+                           and reused instead of calling the API again.
+        :return: Result dictionary ({"code", "explanation"}, a batch summary, or {"error", ...}).
+        """
+        handler = self._handlers.get(type(request))
+        if handler is None:
+            raise TypeError(f"Unsupported request type {type(request).__name__}.")
+        rid = request.request_id
+        if checkpoint is not None:
+            self._checkpoints[rid] = checkpoint
+        try:
+            result = handler(request)
+        except RequestFailed as e:
+            self.emit("error", rid, message=str(e))
+            self.emit("done", rid, status="error")
+            return {"error": str(e)}
+        except Exception as e:
+            error_trace = traceback.format_exc()
+            message = f"Error: An unexpected error occurred while running {request.kind}."
+            self.log(f"Exception during {request.kind}: {e}\n{error_trace}", level="ERROR", request_id=rid)
+            self.emit("error", rid, message=message)
+            self.emit("done", rid, status="error")
+            return {"error": message}
+        finally:
+            self._checkpoints.pop(rid, None)
+        self.emit("done", rid, status="error" if "error" in result else "ok")
+        return result
+
+    def generate_code(self, request):
+        return self.run(request)
+
+    def suggest_data_format(self, request):
+        return self.run(request)
+
+    def refine(self, request):
+        return self.run(request)
+
+    def batch_generate_catalog(self, request):
+        return self.run(request)
+
+    def synthesize_catalog_schema(self, request):
+        return self.run(request)
+
+    def _require_model(self, action):
+        if not self.chatgpt_api or not self.chatgpt_api.model:
+            self.log(f"Failed to {action}: No ChatGPT model selected.", level="ERROR")
+            raise RequestFailed("Error: No ChatGPT model selected. Please select a model first.")
+
+    def _request_generation(self, prompt, module_name, sensor="", race=False, request_id=None):
+        """
+        Send a prompt through the usage ledger (budget check and accounting) and the model racer.
+        :param prompt: The prompt to send.
+        :param module_name: 'module_a', 'module_b' or 'data_format' (used for accounting and race checks).
+        :param sensor: Sensor the request is for (used for accounting).
+        :param race: Allow race mode for this request.
+        :return: Result dictionary from generate_code_with_explanation.
+        """
+        checkpoint = self._checkpoints.get(request_id)
+        if checkpoint is None:
+            return self._send_prompt(prompt, module_name, sensor, race, request_id)
+
+        step = f"llm:{module_name}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}"
+        saved = checkpoint.get(step)
+        if saved is not None:
+            self.log(f"Answered {module_name} from the job checkpoint, no API call made.", request_id=request_id)
+            return saved
+        result = self._send_prompt(prompt, module_name, sensor, race, request_id)
+        if isinstance(result, dict) and "error" not in result:
+            checkpoint.put(step, result)
+        return result
+
+    def _send_prompt(self, prompt, module_name, sensor, race, request_id):
+        def budget_exceeded():
+            exceeded = self.usage_ledger.budget_exceeded() if self.usage_ledger else None
+            if exceeded:
+                self.log(f"Request blocked: {exceeded}", level="ERROR", request_id=request_id)
+            return exceeded
+
+        def record_usage(result):
+            if self.usage_ledger and isinstance(result, dict):
+                self.usage_ledger.record(result.get("usage"), module_name, sensor)
+
+        model_racer = self.model_racer
+        if race and model_racer:
+            exceeded = budget_exceeded()
+            if exceeded:
+                return {"error": f"Budget exceeded. {exceeded}", "raw_response": ""}
+            self.log(f"Racing models {model_racer.model} for {module_name}.", request_id=request_id)
+            result, winning_model = model_racer.race(prompt, module_name, on_result=record_usage)
+            self.log(f"Model {winning_model} answered first for {module_name}.", request_id=request_id)
+            return result
+
+        chatgpt_api = self.chatgpt_api
+
+        def call_model():
+            exceeded = budget_exceeded()
+            if exceeded:
+                return {"error": f"Budget exceeded. {exceeded}", "raw_response": ""}
+            result = chatgpt_api.generate_code_with_explanation(prompt)
+            record_usage(result)
+            return result
+
+        if self.cache is None:
+            return call_model()
+        result, cached = self.cache.get_or_compute(self.cache.key(chatgpt_api.model, prompt), call_model)
+        if cached:
+            self.log(f"Answered {module_name} from the response cache.", request_id=request_id)
+        return result
+
+    def _publish_result(self, result, target, request_id):
+        """Result or API error event for a model response."""
+        if "error" in result:
+            self.log(f"API Error: {result['error']}", level="ERROR", request_id=request_id)
+            self.emit("error", request_id, message=f"Error: {result['error']}\n{result.get('raw_response', '')}")
+            return
+        self.emit("result", request_id, target=target, code=result.get("code", "No code provided."),
+                  explanation=result.get("explanation", "No explanation provided."))
+
+    def _check_resources(self, result, board, data_format, request_id):
+        """
+        Estimate the RAM and timing of generated code on its board. Errors and warnings are appended to
+        the explanation so they are seen before flashing; the compact report is stored in result["resources"].
+        :return: Copy of the result with the findings (the model response may be cached or checkpointed).
+        """
+        if "code" not in result or not board:
+            return result
+        try:
+            report = estimate_resources(result["code"], board, data_format=data_format or None)
+        except Exception as e:
+            self.log(f"Resource check failed: {e}", level="WARNING", request_id=request_id)
+            return result
+        result = dict(result)
+        problems = [finding for finding in report["findings"] if finding["severity"] in ("error", "warning")]
+        self.log(format_estimate(report), level="WARNING" if problems else "INFO", request_id=request_id)
+        if problems:
+            result["explanation"] = (result.get("explanation", "") + f"\n\nResource check ({report['board']}):\n"
+                                     + "\n".join(f"- [{finding['severity'].upper()}] {finding['message']}"
+                                                  for finding in problems))
+        result["resources"] = {"board": report["board"], "ram": report["ram"], "static": report["static"]["total"],
+                               "stack": report["stack"]["main"], "free_ram": report["free_ram"],
+                               "ms_per_reading": report["timing"]["ms_per_reading"],
+                               "over_budget": report["over_budget"], "findings": report["findings"]}
+        return result
+
+    def _suggest_data_format(self, request):
+        rid = request.request_id
+        self._require_model("suggest data format")
+        self.log(f"Sensor Type: {request.sensor_type}, Sensor Description: {request.sensor_description}",
+                 level="DEBUG", request_id=rid)
+        if not request.sensor_type.strip() or not request.sensor_description.strip():
+            self.log("Failed to suggest data format: Missing sensor type or description.", level="ERROR",
+                     request_id=rid)
+            raise RequestFailed("Error: Please fill out the sensor type and description fields.")
+
+        prompt = self.get_data_format_prompt(request.sensor_type, request.sensor_description, request.technology,
+                                             request.board, request.data_format, request.example_code_1,
+                                             request.example_code_2)
+        self.log(f"Sending prompt to ChatGPT API for data format suggestion:\n{prompt}", level="DEBUG", request_id=rid)
+        print(f"[DEBUG] Sending prompt to ChatGPT API for data format suggestion:\n{prompt}")
+
+        self.log("Sending prompt to ChatGPT API for data format suggestion.", request_id=rid)
+        result = self._request_generation(prompt, "data_format", request.sensor_type, request_id=rid)
+
+        self.log(f"Received response from ChatGPT API for data format suggestion:\n{result}", level="DEBUG",
+                 request_id=rid)
+        print(f"[DEBUG] Received response from ChatGPT API for data format suggestion:\n{result}")
+        self._publish_result(result, "data_format", rid)
+        if "error" in result:
+            return result
+        self.log("Data format suggested successfully.", request_id=rid)
+
+        # Report what the suggestion costs on the I2C bus and what compiling it would save
+        if "code" in result:
+            try:
+                report = format_report(compile_format(parse_format_text(result["code"])))
+                self.log(f"Wire size of the suggested format (Compile Data Format gives the compact one):\n{report}",
+                         request_id=rid)
+            except (ValueError, AttributeError):
+                self.log("Suggested data format is not a JSON object; wire size not estimated.", level="DEBUG",
+                         request_id=rid)
+        return result
+
+    def _generate_code(self, request):
+        rid = request.request_id
+        module_name = request.module_name.lower()
+        if module_name not in ("module_a", "module_b"):
+            self.log(f"Failed to generate code: Unknown module name '{request.module_name}'.", level="ERROR",
+                     request_id=rid)
+            raise RequestFailed("Error: Unknown module name.")
+        if not request.data_format.strip():
+            self.log(f"Failed to generate code for {module_name}: Missing module details or data format.",
+                     level="ERROR", request_id=rid)
+            raise RequestFailed(f"Error: Fill all fields for {module_name} and define the data format.")
+        try:
+            parse_window_spec(request.aggregation)
+        except ValueError as e:
+            self.log(f"Failed to generate code for {module_name}: {e}", level="ERROR", request_id=rid)
+            raise RequestFailed(f"Error: {e}")
+
+        if module_name == "module_a":
+            prompt = self.get_prompt_a(request.sensor_type, request.sensor_description, request.technology,
+                                       request.board, request.data_format, request.example_code_1,
+                                       request.example_code_2, request.framing, request.polling,
+                                       request.aggregation)
+        else:
+            prompt = self.get_prompt_b(request.technology, request.board, request.data_format,
+                                       request.example_code_1, request.example_code_2, request.framing,
+                                       request.uplink, request.polling, request.aggregation)
+
+        self.log(f"Sending prompt to ChatGPT API for {module_name}:\n{prompt}", level="DEBUG", request_id=rid)
+        print(f"[DEBUG] Sending prompt to ChatGPT API for {module_name}:\n{prompt}")
+
+        # Send the prompt to ChatGPT, or to several models at once in race mode
+        self.log(f"Sending prompt to ChatGPT API for {module_name}.", request_id=rid)
+        result = self._request_generation(prompt, module_name, request.sensor_type, race=True, request_id=rid)
+
+        self.log(f"Received response from ChatGPT API for {module_name}:\n{result}", level="DEBUG", request_id=rid)
+        print(f"[DEBUG] Received response from ChatGPT API for {module_name}:\n{result}")
+        result = self._check_resources(result, request.board, request.data_format, rid)
+        self._publish_result(result, module_name, rid)
+        self.log(f"Code generation for {module_name} completed.", request_id=rid)
+
+        if "code" in result:
+            with self._history_lock:
+                self.refinement_history.append({
+                    "module": module_name,
+                    "sensor": request.sensor_type,
+                    "board": request.board,
+                    "data_format": request.data_format,
+                    "prompt": prompt,
+                    "code": result["code"],
+                    "explanation": result.get("explanation", "")
+                })
+            self.log(f"Appended to refinement_history: Module {module_name}", level="DEBUG", request_id=rid)
+        return result
+
+    def _refine(self, request):
+        rid = request.request_id
+        formatted_request = f"[REQUEST] {request.modification_request}"
+        self.log(f"Modification Request:\n{formatted_request}", level="REQUEST", request_id=rid)
+        print(f"[DEBUG] Modification Request:\n{formatted_request}")
+
+        if request.code is not None:
+            last_entry = {"module": request.module_name or "", "sensor": request.sensor, "board": request.board,
+                          "data_format": request.data_format, "code": request.code}
+        else:
+            with self._history_lock:
+                last_entry = self.refinement_history[-1] if self.refinement_history else None
+            if last_entry is None:
+                self.log("Refinement failed: No code history available.", level="ERROR", request_id=rid)
+                raise RequestFailed("Error: No code history available for refinement.")
+        original_code = last_entry.get("code")
+        if not original_code:
+            self.log("Refinement failed: Original code is missing.", level="ERROR", request_id=rid)
+            raise RequestFailed("Error: Original code is missing from history.")
+        self.log(f"Original Code Retrieved:\n{original_code}", level="DEBUG", request_id=rid)
+
+        # Ask the model to fix what the resource check found in the code being refined as well
+        board, data_format = last_entry.get("board", ""), last_entry.get("data_format", "")
+        resource_findings = ""
+        if board:
+            try:
+                resource_findings = findings_for_prompt(estimate_resources(original_code, board,
+                                                                           data_format=data_format or None))
+            except Exception as e:
+                self.log(f"Resource check of the original code failed: {e}", level="WARNING", request_id=rid)
+        refine_prompt = self.get_refine_prompt(formatted_request, original_code, resource_findings)
+        self.log(f"Sending refine prompt to ChatGPT API:\n{refine_prompt}", level="DEBUG", request_id=rid)
+        print(f"[DEBUG] Sending refine prompt to ChatGPT API:\n{refine_prompt}")
+
+        self.log("Sending refine prompt to ChatGPT API.", request_id=rid)
+        result = self._request_generation(refine_prompt, last_entry["module"], last_entry.get("sensor", ""),
+                                          request_id=rid)
+        self.log(f"Received response from ChatGPT API for refinement/modification:\n{result}", level="DEBUG",
+                 request_id=rid)
+        print(f"[DEBUG] Received response from ChatGPT API for refinement/modification:\n{result}")
+        result = self._check_resources(result, board, data_format, rid)
+        self._publish_result(result, last_entry["module"], rid)
+
+        if "code" in result:
+            with self._history_lock:
+                self.refinement_history.append({
+                    "module": last_entry["module"],
+                    "sensor": last_entry.get("sensor", ""),
+                    "board": board,
+                    "data_format": data_format,
+                    "prompt": refine_prompt,
+                    "code": result["code"],
+                    "explanation": result.get("explanation", ""),
+                    "modification_request": request.modification_request
+                })
+            self.log(f"Code refinement/modification for {last_entry['module']} completed.", request_id=rid)
+        return result
+
+    def _batch_generate_catalog(self, request):
+        rid = request.request_id
+        self._require_model("run batch generation")
+        if not request.sensor_data:
+            self.log("Batch generation failed: Sensor catalog is empty.", level="ERROR", request_id=rid)
+            raise RequestFailed("Error: No sensors found in sensors.json.")
+
+        batch_settings = request.batch_settings
+        output_dir = batch_settings.get("output_dir", BATCH_OUTPUT_DIR)
+        if batch_settings.get("backend", "openai") == "local":
+            client = LocalBatchClient(work_dir=output_dir)
+        else:
+            api_keys = getattr(self.chatgpt_api, "api_keys", [self.chatgpt_api.api_key])
+            client = [OpenAIBatchClient(api_key) for api_key in api_keys]
+        job = BatchJob(self.chatgpt_api, client, output_dir=output_dir,
+                       poll_interval=batch_settings.get("poll_interval", 30),
+                       timeout=batch_settings.get("timeout", BATCH_TIMEOUT),
+                       log=lambda message, level="INFO": self.log(message, level=level, request_id=rid),
+                       ledger=self.usage_ledger, checkpoint=self._checkpoints.get(rid))
+
+        data_formats = {}
+        for sensor_key, sensor in request.sensor_data.items():
+            data_format = json.dumps(sensor.get("data_format", {}), indent=4)
+            prompt = self.get_prompt_a(sensor.get("type", ""), sensor.get("description", ""),
+                                       sensor.get("technology", ""), sensor.get("board", ""),
+                                       data_format, request.example_code_1, request.example_code_2)
+            job.add(f"{sensor_key}_module_a", prompt, "module_a", sensor_key)
+            data_formats.setdefault(data_format, sensor_key)
+
+        if request.endpoint_technology and request.endpoint_board:
+            for data_format, sensor_key in data_formats.items():
+                prompt = self.get_prompt_b(request.endpoint_technology, request.endpoint_board, data_format,
+                                           request.example_code_1, request.example_code_2)
+                job.add(f"{sensor_key}_module_b", prompt, "module_b", sensor_key)
+        else:
+            self.log("Module B technology or board not selected; batch covers Module A only.", level="WARNING",
+                     request_id=rid)
+
+        results = job.run()
+        failed = sum(1 for r in results.values() if "error" in r)
+        unfinished = len(job.requests) - len(results) + failed
+        if unfinished and self._checkpoints.get(rid) is not None:
+            # Finished artifacts are checkpointed; failing hands the rest to the job queue's retry
+            raise RequestFailed(f"Error: {unfinished} of {len(job.requests)} catalog requests did not finish; "
+                                f"a retry of the job submits only those.")
+        self.emit("feedback", rid, message=f"Batch generation finished: {len(results) - failed} artifacts written to "
+                                           f"{output_dir}, {failed} failed.")
+        return {"artifacts": len(results) - failed, "failed": failed, "output_dir": output_dir}
+
+    def _synthesize_catalog_schema(self, request):
+        rid = request.request_id
+        self._require_model("synthesize the catalog schema")
+        if not request.sensor_data:
+            self.log("Schema synthesis failed: Sensor catalog is empty.", level="ERROR", request_id=rid)
+            raise RequestFailed("Error: No sensors found in sensors.json.")
+        canonical_schema = json.dumps(request.canonical_schema or vocabulary(), indent=4)
+
+        def suggest(sensor_key, sensor):
+            prompt = self.get_catalog_schema_prompt(sensor.get("type", ""), sensor.get("description", ""),
+                                                    sensor.get("technology", ""), sensor.get("board", ""),
+                                                    json.dumps(sensor.get("data_format", {}), indent=4),
+                                                    canonical_schema)
+            return self._request_generation(prompt, "data_format", sensor_key, request_id=rid)
+
+        workers = max(1, request.workers)
+        self.log(f"Suggesting data formats for {len(request.sensor_data)} sensors, {workers} at a time.",
+                 request_id=rid)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {sensor_key: pool.submit(suggest, sensor_key, sensor)
+                       for sensor_key, sensor in request.sensor_data.items()}
+
+        proposals, failed = {}, []
+        for sensor_key, future in futures.items():
+            proposal = {"current": current_fields(request.sensor_data[sensor_key]), "data_format": {},
+                        "field_map": {}}
+            try:
+                result = future.result()
+                if "error" in result:
+                    raise ValueError(result["error"])
+                proposal["data_format"], proposal["field_map"] = parse_suggestion(result.get("code", ""))
+            except Exception as e:
+                self.log(f"No usable data format suggestion for {sensor_key}: {e}", level="WARNING", request_id=rid)
+                failed.append(sensor_key)
+            proposals[sensor_key] = proposal
+        if failed and self._checkpoints.get(rid) is not None:
+            # Finished suggestions are checkpointed; failing hands the rest to the job queue's retry
+            raise RequestFailed(f"Error: {len(failed)} of {len(proposals)} data format suggestions failed; "
+                                f"a retry of the job asks again only for those.")
+
+        merged = merge_proposals(proposals)
+        merged["failed"] = failed
+        summary = format_summary(merged, failed)
+        self.log(summary, request_id=rid)
+        if request.sensors_file:
+            write_catalog(merged, request.sensors_file, adopt=request.adopt)
+            summary += f"\n\nCanonical schema and field maps written to {request.sensors_file}."
+            self.log(f"Canonical schema written to {request.sensors_file}.", request_id=rid)
+        self.emit("feedback", rid, message=summary)
+        return merged
+
+    # ------------------------------------------------ prompts ------------------------------------------------
+
+    def _get_framing_section(self, module_name, framing):
+        """Prompt section describing the selected I2C chunk framing ('json' needs none)."""
+        if framing != "binary":
+            return ""
+        return f"""
+{ADDITIONAL_INFO_BINARY_FRAMING['description']}
+{ADDITIONAL_INFO_BINARY_FRAMING['common']}
+{ADDITIONAL_INFO_BINARY_FRAMING[module_name]}
+"""
+
+    def _get_uplink_section(self, uplink):
+        """Prompt section describing the Module B uplink mode ('per_reading' needs none)."""
+        if uplink != "batched":
+            return ""
+        return f"""
+{ADDITIONAL_INFO_BATCHED_UPLINK['description']}
+{ADDITIONAL_INFO_BATCHED_UPLINK['example']}
+"""
+
+    def _get_polling_section(self, module_name, polling):
+        """Prompt section for the Module B slave polling policy ('random' keeps the example loop)."""
+        if polling not in ("round_robin", "weighted", "adaptive_backoff"):
+            return ""
+        if module_name == "module_a":
+            # Only the weighted policy needs Module A to announce its backlog
+            return f"\n{ADDITIONAL_INFO_POLLING_POLICY['module_a']}" if polling == "weighted" else ""
+        return f"""
+{ADDITIONAL_INFO_POLLING_POLICY['description']}
+{ADDITIONAL_INFO_POLLING_POLICY['common']}
+{ADDITIONAL_INFO_POLLING_POLICY[polling]}
+"""
+
+    def _get_aggregation_section(self, module_name, aggregation, data_format):
+        """Prompt section for Module A windowed aggregation ('none' sends every reading)."""
+        try:
+            window_readings, window_ms = parse_window_spec(aggregation)
+        except ValueError:
+            return ""
+        if not window_readings and not window_ms:
+            return ""
+        try:
+            compiled = parse_format_text(data_format)
+            round_means = is_compiled(compiled)
+            summary_format = json.dumps(aggregated_format(compiled, round_means=round_means))
+        except (ValueError, AttributeError):
+            round_means, summary_format = False, ""
+        if module_name == "module_b":
+            return f"""
+Module A sends one summary per window of {describe_window(window_readings, window_ms)} instead of every reading.
+Forward the summaries like readings; their format is: {summary_format or "the numeric fields as mean, <field>_min, <field>_max and <field>_last, plus Count"}
+"""
+        return f"""
+{ADDITIONAL_INFO_WINDOWED_AGGREGATION['description']}
+Set the constants to: WINDOW_READINGS = {window_readings}; WINDOW_MS = {window_ms}; ROUND_MEANS = {str(round_means).lower()}.
+{ADDITIONAL_INFO_WINDOWED_AGGREGATION['module_a']}
+"""
+
+    def _get_compact_format_section(self, module_name, data_format):
+        """Prompt section with the encode/decode helper when the data format is a compiled key dictionary."""
+        try:
+            compiled = parse_format_text(data_format)
+        except ValueError:
+            return ""
+        if not is_compiled(compiled):
+            return ""
+        if module_name == "module_a":
+            helper = emit_module_a(compiled)
+            usage = "Build every reading with encodeCompactReading() and pass the result to addToRingBuffer()."
+        else:
+            helper = emit_module_b(compiled)
+            usage = ("The readings use the compact keys above. Forward them unchanged unless the endpoint needs the "
+                     "full field names, in which case expand them with expandCompactReading().")
+        return f"""
+The data format is a compact key dictionary: each key is sent instead of the field name, and numbers with a
+"scale" are sent as integers (value multiplied by the scale). {usage}
+Use this helper as is:
+{helper}
+"""
+
+    def get_prompt_a(self, sensor_type, sensor_description, wireless_technology, development_board, data_format,
+                     example_code_1, example_code_2, framing="json", polling="random", aggregation="none"):
+        return f"""
+{ADDITIONAL_INFO['intro']}
+
+{ADDITIONAL_INFO['module_a']}
+
+{ADDITIONAL_INFO['data_format']}
+
+Code example for Module A:
+{ADDITIONAL_INFO_CODE_MODULE_A['example']}
+
+- Example Code 1:  {example_code_1}
+- Example Code 2:  {example_code_2}
+
+You are designing an IoT Gateway system. Here is the setup:
+
+Module A:
+- Sensor Type: {sensor_type}
+- Description: {sensor_description}
+- Wireless Communication Technology: {wireless_technology}
+- Development Board: {development_board}
+
+Module B:
+- Data Format for Communication between Module A and Module B: {data_format}
+{self._get_compact_format_section("module_a", data_format)}{self._get_framing_section("module_a", framing)}{self._get_polling_section("module_a", polling)}{self._get_aggregation_section("module_a", aggregation, data_format)}
+Please generate the Arduino code for Module A, which:
+1. Connects to the specified sensor using {wireless_technology}.
+2. Formats the data according to the given format.
+3. Sends the data to Module B.
+
+Use #include "AnttiGateway.h"
+Most important thing is to be compatible with the AnttiGateway.h library!
+
+Provide the response strictly in the following JSON structure:
+{{
+  "code": "The Arduino code for Module A as a string.",
+  "explanation": "A concise explanation of how the code works and interfaces with Module B as a string. Bullet points are preferred. Not JSON!"
+}}
+Make sure your response is in JSON format! Do not provide answer inside ```!
+"""
+
+    def get_prompt_b(self, wireless_technology, development_board, data_format, example_code_1, example_code_2,
+                     framing="json", uplink="per_reading", polling="random", aggregation="none"):
+        return f"""
+{ADDITIONAL_INFO['intro']}
+
+{ADDITIONAL_INFO['module_b']}
+
+{ADDITIONAL_INFO['data_format']}
+
+Code example for Module B:
+{ADDITIONAL_INFO_CODE_MODULE_B['example']}
+
+- Example Code 1:  {example_code_1}
+- Example Code 2:  {example_code_2}
+
+
+You are designing an IoT Gateway system. Here is the setup:
+
+Module A:
+- Data Format for Communication: {data_format}
+
+Module B:
+- Technology: {wireless_technology}
+- Development Board: {development_board}
+{self._get_compact_format_section("module_b", data_format)}{self._get_framing_section("module_b", framing)}{self._get_uplink_section(uplink)}{self._get_polling_section("module_b", polling)}{self._get_aggregation_section("module_b", aggregation, data_format)}
+Please generate the Arduino code for Module B, which:
+1. Receives data from Module A using the specified format.
+2. Processes and validates the received data.
+3. Transmits the data to the configured endpoint using {wireless_technology}.
+
+Use #include "AnttiGateway.h"
+Most important thing is to be compatible with the AnttiGateway.h library!
+
+Provide the response strictly in the following JSON structure:
+{{
+  "code": "The Arduino code for Module B as a string.",
+  "explanation": "A concise explanation of how the code works and interfaces with Module A as a string. Bullet points are preferred. Not JSON!"
+}}
+Make sure your response is in JSON format! Do not provide answer inside ```!
+"""
+
+    def get_data_format_prompt(self, sensor_type, sensor_description, wireless_technology, development_board,
+                               data_format, example_code_1, example_code_2):
+        return f"""
+{ADDITIONAL_INFO['intro']}
+
+{ADDITIONAL_INFO['data_format']}
+
+Code example for Module A:
+{ADDITIONAL_INFO_CODE_MODULE_A['example']}
+
+- Example Code 1:  {example_code_1}
+- Example Code 2:  {example_code_2}
+
+You are designing an IoT Gateway system. Here is the setup:
+
+Module A:
+- Sensor Type: {sensor_type}
+- Description: {sensor_description}
+- Wireless Communication Technology: {wireless_technology}
+- Development Board: {development_board}
+
+Module B:
+- Data Format for Communication between Module A and Module B: {data_format}
+
+Please suggest a JSON format for communication between Module A and Module B. Provide an explanation of the suggested format.
+Remember that for many wireless devices it is not possible to get a timestamp from them.
+
+Provide the response strictly in the following JSON structure:
+{{
+  "code": "The data format to be used between A and B modules as a string.
+            Keep it short as there is limited data size.  
+            Short variable names are good.
+            Only relevant variables should be transmitted. 
+            Multiline format is nice and clearer.",
+  "explanation": "A concise explanation of the data format and why it was suggested. Bullet points are preferred. Not JSON!"
+}}
+Make sure your response is in JSON format! Do not provide answer inside ```!
+"""
+
+    def get_catalog_schema_prompt(self, sensor_type, sensor_description, wireless_technology, development_board,
+                                  data_format, canonical_schema):
+        return f"""
+{ADDITIONAL_INFO['intro']}
+
+{ADDITIONAL_INFO['data_format']}
+
+All sensors of the catalog are being moved to one shared data format vocabulary, so the backend can parse
+every sensor with a single parser. The vocabulary so far (field name: type):
+{canonical_schema}
+
+Sensor:
+- Sensor Type: {sensor_type}
+- Description: {sensor_description}
+- Wireless Communication Technology: {wireless_technology}
+- Development Board: {development_board}
+- Current data format sent by Module A: {data_format}
+
+Restate the data format of this sensor in the shared vocabulary:
+- Use a vocabulary field whenever the sensor measures the same quantity, even if the current format names it differently.
+- Only add a new field for a quantity the vocabulary does not have; name it in snake_case with the unit implied by the name if needed.
+- Types are "float", "int", "string" or "bool". Only include quantities this sensor can actually provide.
+- Map every field of the current data format to its field in the new format (null if it has none).
+
+Provide the response strictly in the following JSON structure:
+{{
+  "code": {{"data_format": {{"field": "type"}}, "field_map": {{"current field": "new field"}}}},
+  "explanation": "A concise explanation of the mapping. Bullet points are preferred. Not JSON!"
+}}
+Make sure your response is in JSON format! Do not provide answer inside ```!
+"""
+
+    def get_refine_prompt(self, formatted_request, original_code, resource_findings=""):
+        if resource_findings:
+            resource_findings = f"""
+{resource_findings}
+Fix these problems as part of the modification unless the request says otherwise.
+"""
+        return f"""
+{formatted_request}
+
+Original Code:
+{original_code}
+{resource_findings}
+Please apply the requested modification and provide the response strictly in this JSON format:
+{{
+  "code": "The modified code as a string",
+  "explanation": "Detailed explanation of the changes made"
+}}
+Make sure your response is in JSON format! Do not provide answer inside ```!
+"""
+
+
+def engine_from_config(config, model, usage_ledger=None):
+    """
+    GenerationEngine for a model of config.json (a key pool when the model has several keys).
+    :raise ValueError: If the model is unknown or has no API key.
+    """
+    from api import ChatGPTAPI
+    from api_pool import PooledChatGPTAPI, get_model_keys
+
+    if model not in config.get("models", {}):
+        raise ValueError(f"Unknown model '{model}'.")
+    api_keys = get_model_keys(config["models"][model])
+    if not api_keys:
+        raise ValueError(f"No API key configured for '{model}'.")
+    if len(api_keys) > 1:
+        chatgpt_api = PooledChatGPTAPI(api_keys=api_keys, model=model)
+    else:
+        chatgpt_api = ChatGPTAPI(api_key=api_keys[0], model=model)
+    return GenerationEngine(chatgpt_api, usage_ledger=usage_ledger)
+
+
+def main():
+    import argparse
+    from config_manager import load_config
+
+    parser = argparse.ArgumentParser(description="Generate module code for a catalog sensor without the UI.")
+    parser.add_argument("--model", required=True, help="Model from config.json.")
+    parser.add_argument("--sensor", required=True, help="Sensor key in sensors.json.")
+    parser.add_argument("--module", choices=["module_a", "module_b"], default="module_a", help="Module to generate.")
+    parser.add_argument("--technology", help="Module B technology (Module A uses the sensor's).")
+    parser.add_argument("--board", help="Module B board (Module A uses the sensor's).")
+    parser.add_argument("--framing", choices=["json", "binary"], default="json", help="I2C chunk framing.")
+    parser.add_argument("--uplink", choices=["per_reading", "batched"], default="per_reading", help="Module B uplink.")
+    parser.add_argument("--polling", choices=["random", "round_robin", "weighted", "adaptive_backoff"],
+                        default="random", help="Module B slave polling policy.")
+    parser.add_argument("--aggregation", default="none", help="Module A window before sending (10, 60s, 10,60s).")
+    parser.add_argument("--out", help="Write the generated code to this file.")
+    args = parser.parse_args()
+
+    with open("sensors.json", "r") as f:
+        sensor = json.load(f)["sensors"][args.sensor]
+    engine = engine_from_config(load_config(), args.model)
+    engine.bus.subscribe(lambda event: print(f"[{event.data['level']}] {event.data['message']}")
+                         if event.kind == "log" and event.data["level"] != "DEBUG" else None)
+    request = ModuleRequest(args.module, sensor_type=sensor.get("type", ""),
+                            sensor_description=sensor.get("description", ""),
+                            technology=args.technology or sensor.get("technology", ""),
+                            board=args.board or sensor.get("board", ""),
+                            data_format=json.dumps(sensor.get("data_format", {}), indent=4),
+                            framing=args.framing, uplink=args.uplink, polling=args.polling,
+                            aggregation=args.aggregation)
+    result = engine.generate_code(request)
+    if "error" in result:
+        print(result["error"])
+        raise SystemExit(1)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(result["code"])
+    else:
+        print(result["code"])
+    print(result.get("explanation", ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+# generator_service.py
+
+# Multi-user HTTP/JSON service around GenerationEngine, so a team shares one set of API keys, one
+# worker pool, one response cache and one usage ledger instead of running a desktop copy each.
+# Requests become jobs: POST returns a job id at once, the job runs on the shared pool and its
+# engine events can be followed as server-sent events.
+#
+#   POST /jobs/generate              {"module_name": "module_a", "sensor": "ruuvitag", ...ModuleRequest fields}
+#   POST /jobs/refine                {"modification_request": "...", "code": optional, "module_name": optional}
+#   POST /jobs/suggest-data-format   {"sensor_type": "...", "sensor_description": "...", ...}
+#   GET  /jobs, /jobs/<id>           job state and result
+#   GET  /jobs/<id>/events           text/event-stream of the job's events (Last-Event-ID resumes)
+#   DELETE /jobs/<id>                cancel a queued job
+#   GET  /catalog, /catalog/<key>    sensors.json
+#   GET  /metrics                    pool, cache, rate limiter and token usage
+# Users are told apart by the X-User header (the client address otherwise); every user has a token
+# bucket for job submissions, refine uses that user's last generated code, and a user can only list,
+# read, follow and cancel their own jobs (others' jobs answer 404). X-User is trusted as sent, so
+# expose the service through a proxy that sets it from the authenticated user.
+# Run: python generator_service.py --model gpt-4o --port 8090 --workers 4
+
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from generation_engine import (EngineEvent, ModuleRequest, DataFormatRequest, RefineRequest, ResponseCache,
+                               engine_from_config)
+
+MAX_BODY = 1024 * 1024
+MAX_FINISHED_JOBS = 1000  # Finished jobs kept for GET /jobs/<id>
+SSE_HEARTBEAT = 15.0  # Seconds between keep-alive comments on an idle event stream
+
+
+class Job:
+    def __init__(self, request, user):
+        self.request = request
+        self.user = user
+        self.id = request.request_id
+        self.state = "queued"  # queued, running, done, error, cancelled
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.events = []  # EngineEvent.to_dict() in order; the SSE id is the index
+        self.future = None
+        self.changed = threading.Condition()
+
+    def add_event(self, event):
+        with self.changed:
+            self.events.append(event.to_dict())
+            self.changed.notify_all()
+
+    def finish(self, state, result=None):
+        with self.changed:
+            self.state = state
+            self.result = result
+            self.finished = time.time()
+            self.changed.notify_all()
+
+    def to_dict(self, with_result=True):
+        info = {"id": self.id, "kind": self.request.kind, "user": self.user, "state": self.state,
+                "submitted": self.submitted, "started": self.started, "finished": self.finished,
+                "events": len(self.events)}
+        if with_result and self.result is not None:
+            info["result"] = {key: value for key, value in self.result.items() if key != "usage"}
+        return info
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        """
+        Per-user submission limit.
+        :param rate: Jobs per second refilled.
+        :param burst: Jobs that can be submitted at once.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}  # user -> (tokens, last refill)
+        self.lock = threading.Lock()
+        self.limited = 0
+
+    def take(self, user):
+        """:return: 0 if allowed, otherwise seconds until the next job is allowed."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(user, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self.buckets[user] = (tokens - 1, now)
+                return 0.0
+            self.buckets[user] = (tokens, now)
+            self.limited += 1
+            return (1 - tokens) / self.rate
+
+
+class GeneratorService:
+    def __init__(self, engine, sensors, workers=4, rate_per_minute=30, burst=10):
+        """
+        :param engine: GenerationEngine shared by all users (give it a ResponseCache to share answers).
+        :param sensors: The "sensors" dictionary of sensors.json.
+        :param workers: Jobs running at the same time.
+        :param rate_per_minute: Job submissions per user and minute.
+        :param burst: Job submissions a user can make at once.
+        """
+        self.engine = engine
+        self.sensors = sensors
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="generator")
+        self.limiter = TokenBucket(rate_per_minute / 60.0, burst)
+        self.jobs = OrderedDict()
+        self.last_code = {}  # user -> (module_name, sensor, code) of the last generated code
+        self.lock = threading.Lock()
+        engine.bus.subscribe(self._on_event)
+
+    def _on_event(self, event):
+        with self.lock:
+            job = self.jobs.get(event.request_id)
+        if job is not None:
+            job.add_event(event)
+
+    # ------------------------------------------------ jobs ------------------------------------------------
+
+    def build_request(self, kind, body, user):
+        """
+        Request object for a POST body.
+        :raise ValueError: If the body does not describe a valid request.
+        """
+        body = dict(body)
+        if kind == "generate":
+            body.setdefault("module_name", "module_a")
+            if body["module_name"] not in ("module_a", "module_b"):
+                raise ValueError("module_name must be 'module_a' or 'module_b'.")
+            sensor_key = body.pop("sensor", None)
+            if sensor_key is not None:
+                sensor = self.sensors.get(sensor_key)
+                if sensor is None:
+                    raise ValueError(f"Unknown sensor '{sensor_key}'.")
+                defaults = {"sensor_type": sensor.get("type", ""),
+                            "sensor_description": sensor.get("description", ""),
+                            "data_format": json.dumps(sensor.get("data_format", {}), indent=4)}
+                if body["module_name"] == "module_a":
+                    defaults.update(technology=sensor.get("technology", ""), board=sensor.get("board", ""))
+                body = {**defaults, **body}
+            if isinstance(body.get("data_format"), dict):
+                body["data_format"] = json.dumps(body["data_format"], indent=4)
+            return self._construct(ModuleRequest, body)
+        if kind == "suggest-data-format":
+            return self._construct(DataFormatRequest, body)
+        if kind == "refine":
+            if body.get("code") is None:
+                with self.lock:
+                    last = self.last_code.get(user)
+                if last is None:
+                    raise ValueError("No generated code to refine; generate first or send \"code\".")
+                body.setdefault("module_name", last[0])
+                body.setdefault("sensor", last[1])
+                body["code"] = last[2]
+                body.setdefault("board", last[3])
+                body.setdefault("data_format", last[4])
+            return self._construct(RefineRequest, body)
+        raise LookupError(kind)
+
+    @staticmethod
+    def _construct(request_class, body):
+        body.pop("request_id", None)
+        try:
+            return request_class(**body)
+        except TypeError as e:
+            raise ValueError(f"Invalid request: {e}")
+
+    def job(self, job_id, user):
+        """The job with this id if it belongs to user, else None."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        return job if job is not None and job.user == user else None
+
+    def user_jobs(self, user):
+        """Jobs of one user, oldest first."""
+        with self.lock:
+            return [job for job in self.jobs.values() if job.user == user]
+
+    def submit(self, request, user):
+        job = Job(request, user)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._forget_finished()
+        job.future = self.pool.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        with job.changed:
+            if job.state == "cancelled":
+                return
+            job.state = "running"
+            job.started = time.time()
+        result = self.engine.run(job.request)
+        if "code" in result and isinstance(job.request, (ModuleRequest, RefineRequest)):
+            module_name = job.request.module_name
+            sensor = getattr(job.request, "sensor_type", None) or getattr(job.request, "sensor", "")
+            with self.lock:
+                self.last_code[job.user] = (module_name, sensor, result["code"], getattr(job.request, "board", ""),
+                                            getattr(job.request, "data_format", ""))
+        job.finish("error" if "error" in result else "done", result)
+
+    def cancel(self, job):
+        """Cancel a job that has not started. :return: True if it was cancelled."""
+        if job.future is not None and job.future.cancel():
+            job.finish("cancelled")
+            job.add_event(EngineEvent("done", job.id, status="cancelled"))
+            return True
+        return False
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def metrics(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        states = {}
+        for job in jobs:
+            states[job.state] = states.get(job.state, 0) + 1
+        usage = self.engine.usage_ledger
+        return {
+            "workers": self.workers,
+            "jobs": states,
+            "users": len({job.user for job in jobs}),
+            "rate_limited": self.limiter.limited,
+            "cache": self.engine.cache.stats() if self.engine.cache else None,
+            "usage": usage.summary() if usage else None,
+            "model": getattr(self.engine.chatgpt_api, "model", None)
+        }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service = None  # GeneratorService, set by make_server()
+
+    def log_message(self, format, *args):
+        pass  # the engine events are the log
+
+    @property
+    def user(self):
+        return self.headers.get("X-User") or self.client_address[0]
+
+    def _send_json(self, status, response, extra_headers=None):
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _job(self, job_id):
+        job = self.service.job(job_id, self.user)
+        if job is None:
+            self._send_json(404, {"error": f"Unknown job '{job_id}'."})
+        return job
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        parts = path.strip("/").split("/")
+        if path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif path == "/metrics":
+            self._send_json(200, self.service.metrics())
+        elif path == "/catalog":
+            self._send_json(200, {key: {"type": sensor.get("type"), "technology": sensor.get("technology"),
+                                        "board": sensor.get("board")}
+                                  for key, sensor in self.service.sensors.items()})
+        elif len(parts) == 2 and parts[0] == "catalog":
+            sensor = self.service.sensors.get(parts[1])
+            if sensor is None:
+                self._send_json(404, {"error": f"Unknown sensor '{parts[1]}'."})
+            else:
+                self._send_json(200, sensor)
+        elif path == "/jobs":
+            self._send_json(200, [job.to_dict(with_result=False) for job in self.service.user_jobs(self.user)])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self._job(parts[1])
+            if job:
+                self._send_json(200, job.to_dict())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            job = self._job(parts[1])
+            if job:
+                self._stream_events(job)
+        else:
+            self._send_json(404, {"error": "Not found."})
+
+    def do_POST(self):
+        parts = self.path.split("?", 1)[0].strip("/").split("/")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {"error": "Invalid Content-Length."})
+            return
+        if length > MAX_BODY:
+            self._send_json(413, {"error": "Body too large."})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("The body must be a JSON object.")
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            return
+        if len(parts) != 2 or parts[0] != "jobs":
+            self._send_json(404, {"error": "Not found."})
+            return
+
+        user = self.user
+        try:
+            request = self.service.build_request(parts[1], body, user)
+        except LookupError:
+            self._send_json(404, {"error": f"Unknown job kind '{parts[1]}'."})
+            return
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        wait = self.service.limiter.take(user)
+        if wait:
+            self._send_json(429, {"error": "Too many jobs, slow down."}, {"Retry-After": str(int(wait) + 1)})
+            return
+        job = self.service.submit(request, user)
+        self._send_json(202, {"id": job.id, "state": job.state, "events": f"/jobs/{job.id}/events"},
+                        {"Location": f"/jobs/{job.id}"})
+
+    def do_DELETE(self):
+        parts = self.path.split("?", 1)[0].strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "jobs":
+            self._send_json(404, {"error": "Not found."})
+            return
+        job = self._job(parts[1])
+        if job:
+            if self.service.cancel(job):
+                self._send_json(200, job.to_dict())
+            else:
+                self._send_json(409, {"error": f"Job is {job.state} and can no longer be cancelled."})
+
+    def _stream_events(self, job):
+        """Replay the job's events from Last-Event-ID and follow it until its done event."""
+        try:
+            position = int(self.headers.get("Last-Event-ID", -1)) + 1
+        except ValueError:
+            position = 0
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while True:
+                with job.changed:
+                    if position >= len(job.events) and job.finished is None:
+                        job.changed.wait(SSE_HEARTBEAT)
+                    pending = job.events[position:]
+                    finished = job.finished is not None
+                if not pending:
+                    if finished:
+                        return
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                    continue
+                for event in pending:
+                    data = json.dumps(event).replace("\n", "\\n")
+                    self.wfile.write(f"id: {position}\nevent: {event['kind']}\ndata: {data}\n\n".encode("utf-8"))
+                    position += 1
+                self.wfile.flush()
+                if pending[-1]["kind"] == "done":
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def make_server(service, host="127.0.0.1", port=8090):
+    handler = type("BoundServiceHandler", (ServiceHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    from config_manager import load_config
+    from usage_ledger import UsageLedger
+
+    parser = argparse.ArgumentParser(description="Serve the code generator as a multi-user HTTP/JSON API.")
+    parser.add_argument("--model", required=True, help="Model from config.json.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--workers", type=int, default=4, help="Jobs running at the same time.")
+    parser.add_argument("--cache-size", type=int, default=512, help="Cached model responses (0 disables).")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="Seconds a cached response stays valid.")
+    parser.add_argument("--rate", type=float, default=30, help="Job submissions per user and minute.")
+    parser.add_argument("--burst", type=int, default=10, help="Job submissions a user can make at once.")
+    args = parser.parse_args()
+
+    config = load_config()
+    engine = engine_from_config(config, args.model,
+                                usage_ledger=UsageLedger(pricing=config.get("pricing"), budgets=config.get("budgets")))
+    if args.cache_size:
+        engine.cache = ResponseCache(args.cache_size, args.cache_ttl)
+    with open("sensors.json", "r") as f:
+        sensors = json.load(f).get("sensors", {})
+
+    service = GeneratorService(engine, sensors, workers=args.workers, rate_per_minute=args.rate, burst=args.burst)
+    server = make_server(service, args.host, args.port)
+    print(f"Generator service for {args.model} listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+# i2c_simulator.py
+
+# Discrete-event simulator of the Module B master polling N Module A slaves over I2C.
+# The slave and master protocol state machines come from chunk_codec.py; this module adds time:
+# sensor readings arriving at each slave, the master loop delays of the example sketches and
+# the bus time of every Wire.requestFrom() at the configured clock.
+# Slave selection can be replaced by a polling policy from polling_policies.py.
+# Run: python i2c_simulator.py --slaves 12 --rate 0.5 --duration 3600
+
+import argparse
+import heapq
+import json
+import random
+import re
+from collections import deque
+from chunk_codec import (SlaveEndpoint, MasterReassembler, i2c_transaction, RING_BUFFER_SIZE,
+                         SIMPLE_QUEUE_SIZE, MAX_CHUNK_SIZE, MAX_CHUNK_SIZE_SLAVE)
+from chunk_codec_benchmark import SAMPLE_PAYLOADS
+from analysis_common import percentile, round_or_none
+
+I2C_BITS_PER_BYTE = 9  # 8 data bits + ACK
+_SLAVE_ID = re.compile(rb'"SlaveID":(\d+)')
+_BACKLOG = re.compile(rb'"Backlog":(\d+)')
+
+
+class SimulatedSlave(SlaveEndpoint):
+    def __init__(self, address, rate, payload, rng, periodic=False, arrivals=None, **kwargs):
+        """
+        SlaveEndpoint that remembers when each buffered reading was produced.
+        :param rate: Sensor readings per second.
+        :param payload: Example reading (dictionary); numeric values are jittered per reading.
+        :param rng: random.Random used for arrivals and jitter.
+        :param periodic: Fixed interval between readings instead of Poisson arrivals.
+        :param arrivals: Sorted production times replayed from a capture (overrides rate).
+        """
+        super().__init__(address, **kwargs)
+        self.rate = rate
+        self.payload = payload
+        self.rng = rng
+        self.periodic = periodic
+        self.arrivals = deque(arrivals) if arrivals is not None else None
+        self.produced = 0
+        self.buffered_times = deque()  # production times of the readings in the ring buffer
+        self.in_flight_time = None  # production time of the reading being sent as chunks
+
+    def next_interval(self):
+        if self.periodic:
+            return 1.0 / self.rate
+        return self.rng.expovariate(self.rate)
+
+    def next_arrival(self, now):
+        """Time of the next sensor reading after now (None when a replayed capture is exhausted)."""
+        if self.arrivals is not None:
+            return self.arrivals.popleft() if self.arrivals else None
+        return now + self.next_interval() if self.rate > 0 else None
+
+    def produce(self, now):
+        reading = {key: round(value * self.rng.uniform(0.98, 1.02), 2) if isinstance(value, float) else value
+                   for key, value in self.payload.items()}
+        self.produced += 1
+        if self.add_reading(reading):
+            self.buffered_times.popleft()
+        self.buffered_times.append(now)
+
+    def on_request(self):
+        refill = len(self.queue) == 0
+        had_reading = not self.ring_buffer.is_empty()
+        written = super().on_request()
+        if refill and had_reading:
+            self.in_flight_time = self.buffered_times.popleft()
+        return written
+
+
+class GatewaySimulation:
+    def __init__(self, slave_rates, clock=100000, request_size=MAX_CHUNK_SIZE, chunk_size=MAX_CHUNK_SIZE_SLAVE,
+                 ring_buffer_size=RING_BUFFER_SIZE, queue_size=SIMPLE_QUEUE_SIZE, loop_delay=2.0, poll_delay=1.0,
+                 forward_time=0.0, max_polls=None, payloads=None, periodic=False, seed=1, policy=None,
+                 arrivals=None, announce_backlog=False):
+        """
+        :param slave_rates: Sensor readings per second for each slave.
+        :param clock: I2C clock in Hz (initMaster default 100 kHz).
+        :param request_size: Bytes per Wire.requestFrom() (MaxChunkSize).
+        :param chunk_size: Payload bytes per chunk on the slave (MaxChunkSizeSlave).
+        :param ring_buffer_size: RingBufferSize (holds one item less).
+        :param queue_size: SimpleQueueSize.
+        :param loop_delay: delay() at the start of the master loop, seconds.
+        :param poll_delay: delay() between requests to the same slave, seconds.
+        :param forward_time: Time spent in forwardData() per loop, seconds.
+        :param max_polls: Give up on a slave after this many requests without a reading
+                          (None keeps polling like the example sketches).
+        :param payloads: Example reading per slave; defaults cycle through SAMPLE_PAYLOADS.
+        :param periodic: Fixed sensor intervals instead of Poisson arrivals.
+        :param seed: Random seed for reproducible runs.
+        :param policy: Polling policy (polling_policies.py); None picks a random slave like the sketches.
+        :param arrivals: Production times per slave replayed from a capture instead of slave_rates arrivals.
+        :param announce_backlog: Slaves add "Backlog" to every reading they send (weighted policy).
+        """
+        self.rng = random.Random(seed)
+        samples = list(SAMPLE_PAYLOADS.values())
+        payloads = payloads or [samples[i % len(samples)] for i in range(len(slave_rates))]
+        self.slaves = [SimulatedSlave(0x08 + i, rate, payloads[i], self.rng, periodic,
+                                      arrivals[i] if arrivals is not None else None,
+                                      ring_buffer_size=ring_buffer_size, queue_size=queue_size,
+                                      chunk_size=chunk_size, announce_backlog=announce_backlog)
+                       for i, rate in enumerate(slave_rates)]
+        self.by_address = {slave.address: slave for slave in self.slaves}
+        self.master = MasterReassembler(ring_buffer_size=ring_buffer_size)
+        self.clock = clock
+        self.request_size = request_size
+        self.loop_delay = loop_delay
+        self.poll_delay = poll_delay
+        self.forward_time = forward_time
+        self.max_polls = max_polls
+        self.policy = policy
+        self.transaction_time = (request_size + 1) * I2C_BITS_PER_BYTE / clock
+
+        self.latencies = []
+        self.delivered = 0
+        self.transactions = 0
+        self.bytes_written = 0
+        self.empty_polls = 0
+        self.gave_up = 0
+        self.idle_loops = 0
+
+    def choose_slave(self, now):
+        """
+        Slave to poll in this master loop. Without a policy: a random slave every loop, like the sketches.
+        :return: SimulatedSlave, or None to skip polling in this loop.
+        """
+        if self.policy is None:
+            return self.rng.choice(self.slaves)
+        address = self.policy.choose(now)
+        return self.by_address[address] if address is not None else None
+
+    def _complete(self, now):
+        """
+        Hand the completed reading to forwardData() and record its latency.
+        :return: Backlog announced with the reading, or None.
+        """
+        dataset = self.master.get_from_ring_buffer()
+        if not dataset:
+            return None
+        match = _SLAVE_ID.search(dataset)
+        slave = self.by_address.get(int(match.group(1))) if match else None
+        if slave is not None and slave.in_flight_time is not None:
+            self.latencies.append(now - slave.in_flight_time)
+            slave.in_flight_time = None
+        self.delivered += 1
+        backlog = _BACKLOG.search(dataset)
+        return int(backlog.group(1)) if backlog else None
+
+    def _poll_until_complete(self, slave, now, duration, events):
+        """
+        Request chunks from one slave until a reading is complete, the slave is given up or time is over.
+        :return: (time after the last request, True if a reading is in the master ring buffer).
+        """
+        polls = 0
+        while True:
+            self._advance_sensors(events, now)
+            written = i2c_transaction(slave, self.master, self.request_size)
+            now += self.transaction_time
+            self.transactions += 1
+            self.bytes_written += len(written)
+            polls += 1
+            if not written:
+                self.empty_polls += 1
+            if not self.master.ring_buffer.is_empty():
+                return now, True
+            if self.max_polls is not None and polls >= self.max_polls:
+                self.gave_up += 1
+                return now, False
+            if now >= duration:
+                return now, False
+            now += self.poll_delay
+
+    def run(self, duration):
+        """
+        Simulate the given number of seconds.
+        :return: Result dictionary (see report()).
+        """
+        events = []
+        for index, slave in enumerate(self.slaves):
+            first = slave.next_arrival(0.0)
+            if first is not None:
+                heapq.heappush(events, (first, index))
+
+        now = 0.0
+        while now < duration:
+            # Master loop: delay, pick a slave, poll it until a reading is complete, forward it
+            now += self.loop_delay
+            slave = self.choose_slave(now)
+            if slave is None:
+                self.idle_loops += 1
+                continue
+            wanted = self.policy.readings_per_visit(slave.address, now) if self.policy else 1
+            delivered, backlog = 0, None
+            for _ in range(wanted):
+                now, complete = self._poll_until_complete(slave, now, duration, events)
+                now += self.forward_time
+                announced = self._complete(now)
+                if not complete:
+                    break
+                delivered += 1
+                backlog = announced
+                if now >= duration:
+                    break
+            if self.policy:
+                self.policy.record(slave.address, now, delivered, backlog)
+
+        self._advance_sensors(events, duration)
+        return self.report(duration)
+
+    def _advance_sensors(self, events, until):
+        while events and events[0][0] <= until:
+            time, index = heapq.heappop(events)
+            slave = self.slaves[index]
+            slave.produce(time)
+            following = slave.next_arrival(time)
+            if following is not None:
+                heapq.heappush(events, (following, index))
+
+    def report(self, duration):
+        produced = sum(slave.produced for slave in self.slaves)
+        ring_drops = sum(slave.ring_overwrites for slave in self.slaves) + self.master.stats["ring_overwrites"]
+        bus_busy = self.transactions * self.transaction_time
+        return {
+            "policy": self.policy.name if self.policy else "random",
+            "slaves": len(self.slaves),
+            "duration_s": duration,
+            "produced": produced,
+            "delivered": self.delivered,
+            "throughput_per_s": round(self.delivered / duration, 4),
+            "ring_buffer_drops": ring_drops,
+            "drop_rate": round(ring_drops / produced, 4) if produced else 0.0,
+            "still_buffered": produced - self.delivered - ring_drops,
+            "transactions": self.transactions,
+            "empty_polls": self.empty_polls,
+            "gave_up_polls": self.gave_up,
+            "idle_loops": self.idle_loops,
+            "bus_utilisation": round(bus_busy / duration, 5),
+            "useful_bus_fraction": round(self.bytes_written / (self.transactions * self.request_size), 4)
+            if self.transactions else 0.0,
+            "latency_p50_s": round_or_none(percentile(self.latencies, 0.5)),
+            "latency_p95_s": round_or_none(percentile(self.latencies, 0.95)),
+            "latency_p99_s": round_or_none(percentile(self.latencies, 0.99)),
+            "latency_max_s": round_or_none(max(self.latencies) if self.latencies else None),
+            "protocol_errors": {key: self.master.stats[key] for key in ("non_consecutive", "overflows", "invalid_json")}
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate Module B polling Module A slaves over I2C.")
+    parser.add_argument("--slaves", type=int, default=10, help="Number of slaves.")
+    parser.add_argument("--rate", type=float, nargs="+", default=[0.2],
+                        help="Readings per second per slave; one value for all or one per slave.")
+    parser.add_argument("--clock", type=int, default=100000, help="I2C clock in Hz.")
+    parser.add_argument("--duration", type=float, default=3600, help="Simulated seconds.")
+    parser.add_argument("--ring-size", type=int, default=RING_BUFFER_SIZE, help="RingBufferSize.")
+    parser.add_argument("--chunk-size", type=int, default=MAX_CHUNK_SIZE_SLAVE, help="MaxChunkSizeSlave.")
+    parser.add_argument("--request-size", type=int, default=MAX_CHUNK_SIZE, help="MaxChunkSize.")
+    parser.add_argument("--loop-delay", type=float, default=2.0, help="Master loop delay in seconds.")
+    parser.add_argument("--poll-delay", type=float, default=1.0, help="Delay between polls in seconds.")
+    parser.add_argument("--forward-time", type=float, default=0.0, help="Seconds spent in forwardData().")
+    parser.add_argument("--max-polls", type=int, default=None, help="Give up on an idle slave after N polls.")
+    parser.add_argument("--periodic", action="store_true", help="Fixed sensor intervals instead of Poisson.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed.")
+    args = parser.parse_args()
+
+    rates = args.rate * args.slaves if len(args.rate) == 1 else args.rate
+    if len(rates) != args.slaves:
+        parser.error("--rate needs one value or one value per slave.")
+
+    simulation = GatewaySimulation(rates, clock=args.clock, request_size=args.request_size,
+                                   chunk_size=args.chunk_size, ring_buffer_size=args.ring_size,
+                                   loop_delay=args.loop_delay, poll_delay=args.poll_delay,
+                                   forward_time=args.forward_time, max_polls=args.max_polls,
+                                   periodic=args.periodic, seed=args.seed)
+    print(json.dumps(simulation.run(args.duration), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+# ingest_server.py
+
+# Local asyncio ingestion service standing in for the REST endpoint of B_Master_AnttiGateway_REST.ino.
+# Module B POSTs readings (one JSON object, a JSON array or NDJSON); they are validated against the
+# configured data format, queued and written to SQLite (WAL mode) in grouped commits.
+# The queue is bounded: when the writer falls behind, POSTs get 503 with Retry-After (backpressure).
+# A failed commit is retried with backoff; a batch that keeps failing is appended to the dead-letter
+# file, since its readings were already acknowledged.
+# With --timeseries the readings go into the columnar store of timeseries_store.py instead of SQLite.
+# One process uses one core; sharded_ingest.py runs several workers on one port with a shard each.
+# Run: python ingest_server.py --sensor ruuvitag --port 8080
+#      python ingest_server.py --sensor ruuvitag --timeseries timeseries
+#      GET /metrics returns ingest rate, queue depth and backpressure counters.
+
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+import logging
+from collections import deque
+from format_validator import compile_validator, validate_many
+
+DEFAULT_DB = "readings.db"
+QUEUE_CAPACITY = 100000  # Readings waiting for the writer before POSTs are refused
+BATCH_SIZE = 5000  # Readings per grouped commit
+BATCH_WAIT = 0.05  # Seconds the writer waits to fill a batch
+MAX_BODY = 4 * 1024 * 1024
+WRITE_RETRIES = 5  # Attempts to commit a batch before it goes to the dead-letter file
+RETRY_BACKOFF = 0.5  # Seconds before the first retry, doubled after every failure
+DEAD_LETTER_FILE = "ingest_dead_letter.ndjson"
+
+STATUS_TEXT = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               411: "Length Required", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+def load_data_formats(sensor_keys=None, data_format_path=None, sensors_file="sensors.json"):
+    """
+    Data formats readings are validated against.
+    :param sensor_keys: Catalog keys in sensors.json whose data_format is accepted.
+    :param data_format_path: JSON file with a data_format object (e.g. the data_format_box content).
+    :return: List of data_format dictionaries (empty list accepts any JSON object).
+    """
+    formats = []
+    if sensor_keys:
+        with open(sensors_file, "r") as f:
+            sensors = json.load(f).get("sensors", {})
+        for key in sensor_keys:
+            if key not in sensors:
+                raise KeyError(f"Sensor '{key}' not found in {sensors_file}.")
+            formats.append(sensors[key]["data_format"])
+    if data_format_path:
+        with open(data_format_path, "r") as f:
+            formats.append(json.load(f))
+    return formats
+
+
+class ReadingValidator:
+    def __init__(self, data_formats):
+        """
+        Check readings against data_format definitions such as {"temperature": "float"}.
+        Fields may be missing (unavailable values are omitted), unknown fields are rejected.
+        SlaveID, added by addToRingBuffer(), is always required.
+        The checks are compiled once by format_validator.compile_validator().
+        """
+        self.formats = list(data_formats)
+        self.validate = compile_validator(self.formats)
+
+    def validate_many(self, readings):
+        """:return: (list of valid readings, list of (index, error))."""
+        return validate_many(self.validate, readings)
+
+
+class SQLiteStore:
+    def __init__(self, path=DEFAULT_DB):
+        """SQLite store in WAL mode; write_batch() commits a whole batch in one transaction."""
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS readings (
+                id INTEGER PRIMARY KEY,
+                received_at REAL NOT NULL,
+                gateway TEXT,
+                slave_id INTEGER,
+                payload TEXT NOT NULL
+            )""")
+        self.connection.commit()
+
+    def write_batch(self, rows):
+        """:param rows: List of (received_at, gateway, slave_id, payload) tuples."""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO readings (received_at, gateway, slave_id, payload) VALUES (?, ?, ?, ?)", rows)
+
+    def close(self):
+        self.connection.close()
+
+
+class IngestMetrics:
+    def __init__(self):
+        self.started = time.time()
+        self.received = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.refused_backpressure = 0
+        self.written = 0
+        self.batches = 0
+        self.requests = 0
+        self.write_failures = 0  # Failed commit attempts
+        self.dead_lettered = 0  # Accepted readings written to the dead-letter file instead of the store
+        self.lost = 0  # Accepted readings neither stored nor dead-lettered
+        self.write_seconds = 0.0
+        self.recent = deque()  # (time, readings written) for the rolling ingest rate
+
+    def record_write(self, count, seconds):
+        now = time.time()
+        self.written += count
+        self.batches += 1
+        self.write_seconds += seconds
+        self.recent.append((now, count))
+        while self.recent and self.recent[0][0] < now - 10:
+            self.recent.popleft()
+
+    def snapshot(self, queue_depth, queue_capacity):
+        now = time.time()
+        window = sum(count for t, count in self.recent if t >= now - 10)
+        uptime = max(now - self.started, 1e-9)
+        return {
+            "uptime_s": round(uptime, 1),
+            "requests": self.requests,
+            "received": self.received,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "refused_backpressure": self.refused_backpressure,
+            "written": self.written,
+            "ingest_rate_10s": round(window / min(10.0, uptime), 1),
+            "ingest_rate_avg": round(self.written / uptime, 1),
+            "readings_per_request": round(self.received / self.requests, 2) if self.requests else 0,
+            "batches": self.batches,
+            "avg_batch_size": round(self.written / self.batches, 1) if self.batches else 0,
+            "avg_commit_ms": round(self.write_seconds / self.batches * 1000, 2) if self.batches else 0,
+            "write_failures": self.write_failures,
+            "dead_lettered": self.dead_lettered,
+            "lost": self.lost,
+            "queue_depth": queue_depth,
+            "queue_capacity": queue_capacity,
+            "backpressure": queue_depth >= queue_capacity * 0.8
+        }
+
+
+class IngestServer:
+    def __init__(self, store, validator, queue_capacity=QUEUE_CAPACITY, batch_size=BATCH_SIZE,
+                 batch_wait=BATCH_WAIT, log=None, dead_letter_path=DEAD_LETTER_FILE):
+        """
+        :param store: SQLiteStore, timeseries_store.TimeSeriesStore or any object with write_batch(rows).
+        :param validator: ReadingValidator.
+        :param queue_capacity: Readings that may wait for the writer before POSTs are refused.
+        :param batch_size: Maximum readings per grouped commit.
+        :param batch_wait: Seconds the writer waits for more readings before committing.
+        :param dead_letter_path: NDJSON file for batches that still fail after WRITE_RETRIES attempts
+                                 (they were already acknowledged with 202).
+        """
+        self.store = store
+        self.validator = validator
+        self.queue_capacity = queue_capacity
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.dead_letter_path = dead_letter_path
+        self.log = log or logging.getLogger("IngestServer")
+        self.metrics = IngestMetrics()
+        self.queue = None
+        self.server = None
+        self.writer_task = None
+
+    # ------------------------------------------------ ingestion ------------------------------------------------
+
+    def parse_body(self, body, content_type=""):
+        """Decode a JSON object, a JSON array or NDJSON into a list of readings."""
+        text = body.decode("utf-8").strip()
+        if not text:
+            return []
+        if "ndjson" in content_type or (text.startswith("{") and "\n" in text):
+            try:
+                return [json.loads(line) for line in text.splitlines() if line.strip()]
+            except ValueError:
+                pass
+        data = json.loads(text)
+        return data if isinstance(data, list) else [data]
+
+    def ingest(self, readings, gateway=None):
+        """
+        Validate readings and queue the valid ones for the writer.
+        :return: (status code, response dictionary)
+        """
+        self.metrics.received += len(readings)
+        if self.queue.qsize() + len(readings) > self.queue_capacity:
+            self.metrics.refused_backpressure += len(readings)
+            return 503, {"error": "Ingest queue full, retry later.", "queue_depth": self.queue.qsize()}
+
+        now = time.time()
+        valid, errors = self.validator.validate_many(readings)
+        put = self.queue.put_nowait
+        for reading in valid:
+            put((now, gateway, reading.get("SlaveID"), json.dumps(reading, separators=(",", ":"))))
+        accepted = len(valid)
+        self.metrics.accepted += accepted
+        self.metrics.rejected += len(errors)
+        status = 202 if accepted or not errors else 400
+        return status, {"accepted": accepted, "rejected": len(errors), "errors": [error for _, error in errors[:5]]}
+
+    async def writer(self):
+        """Collect queued readings into batches and commit each batch in a worker thread; None ends it."""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            row = await self.queue.get()
+            if row is None:
+                return
+            rows = [row]
+            deadline = loop.time() + self.batch_wait
+            while len(rows) < self.batch_size:
+                if self.queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        row = await asyncio.wait_for(self.queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    row = self.queue.get_nowait()
+                if row is None:
+                    stopping = True
+                    break
+                rows.append(row)
+            await self._commit(rows)
+
+    async def _commit(self, rows):
+        """Write a batch, retrying with backoff; a batch that keeps failing goes to the dead-letter file."""
+        loop = asyncio.get_running_loop()
+        delay = RETRY_BACKOFF
+        for attempt in range(1, WRITE_RETRIES + 1):
+            start = time.perf_counter()
+            try:
+                await loop.run_in_executor(None, self.store.write_batch, rows)
+            except Exception as e:
+                self.metrics.write_failures += 1
+                self.log.error(f"Writing {len(rows)} readings failed (attempt {attempt}/{WRITE_RETRIES}): {e}")
+                if attempt < WRITE_RETRIES:
+                    await asyncio.sleep(delay)
+                    delay *= 2
+                continue
+            self.metrics.record_write(len(rows), time.perf_counter() - start)
+            return
+        try:
+            await loop.run_in_executor(None, self._dead_letter, rows)
+            self.metrics.dead_lettered += len(rows)
+            self.log.error(f"{len(rows)} readings moved to {self.dead_letter_path}.")
+        except OSError as e:
+            self.metrics.lost += len(rows)
+            self.log.error(f"{len(rows)} readings lost, dead-letter file not writable: {e}")
+
+    def _dead_letter(self, rows):
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            for received_at, gateway, slave_id, payload in rows:
+                f.write(json.dumps({"received_at": received_at, "gateway": gateway, "slave_id": slave_id,
+                                    "payload": payload}) + "\n")
+
+    # ------------------------------------------------ HTTP ------------------------------------------------
+
+    async def handle_connection(self, reader, writer):
+        """Minimal HTTP/1.1 handler with keep-alive."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "Bad request line."}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              and version.upper() == "HTTP/1.1")
+
+                body = b""
+                if method == "POST":
+                    if "content-length" not in headers:
+                        await self._respond(writer, 411, {"error": "Content-Length required."}, False)
+                        break
+                    try:
+                        length = int(headers["content-length"])
+                    except ValueError:
+                        length = -1
+                    if length < 0:
+                        await self._respond(writer, 400, {"error": "Invalid Content-Length."}, False)
+                        break
+                    if length > MAX_BODY:
+                        await self._respond(writer, 413, {"error": "Body too large."}, False)
+                        break
+                    body = await reader.readexactly(length)
+
+                status, response, extra = self.route(method, target, headers, body)
+                await self._respond(writer, status, response, keep_alive, extra)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def route(self, method, target, headers, body):
+        """:return: (status, response dictionary, extra headers)"""
+        path, _, query = target.partition("?")
+        if method == "GET" and path == "/metrics":
+            return 200, self.metrics.snapshot(self.queue.qsize(), self.queue_capacity), {}
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}, {}
+        if method != "POST":
+            return 405, {"error": "Use POST to send readings."}, {}
+
+        self.metrics.requests += 1
+        gateway = headers.get("x-gateway-id")
+        for part in query.split("&"):
+            if part.startswith("gateway="):
+                gateway = part[len("gateway="):]
+        try:
+            readings = self.parse_body(body, headers.get("content-type", ""))
+        except (ValueError, UnicodeDecodeError) as e:
+            self.metrics.rejected += 1
+            return 400, {"error": f"Invalid JSON: {e}"}, {}
+        status, response = self.ingest(readings, gateway)
+        return status, response, ({"Retry-After": "1"} if status == 503 else {})
+
+    async def _respond(self, writer, status, response, keep_alive, extra_headers=None):
+        body = json.dumps(response).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+                "Content-Type: application/json",
+                f"Content-Length: {len(body)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head.extend(f"{name}: {value}" for name, value in (extra_headers or {}).items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    # ------------------------------------------------ lifecycle ------------------------------------------------
+
+    async def start(self, host="0.0.0.0", port=8080, sock=None):
+        """Start listening (on host/port, or on an already bound socket) and start the writer."""
+        self.queue = asyncio.Queue()
+        self.writer_task = asyncio.create_task(self.writer())
+        if sock is not None:
+            self.server = await asyncio.start_server(self.handle_connection, sock=sock)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def stop(self):
+        """Stop accepting connections and let the writer commit everything queued (including its current batch)."""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.writer_task:
+            self.queue.put_nowait(None)
+            await self.writer_task
+
+
+async def _serve(server, host, port, report_interval):
+    await server.start(host, port)
+    server.log.info(f"Ingest server listening on http://{host}:{port}")
+    try:
+        while True:
+            await asyncio.sleep(report_interval)
+            server.log.info(json.dumps(server.metrics.snapshot(server.queue.qsize(), server.queue_capacity)))
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local ingestion endpoint for Module B readings.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite database file.")
+    parser.add_argument("--timeseries", help="Store readings in this columnar time-series store instead.")
+    parser.add_argument("--sensor", action="append", help="Accept the data_format of this sensors.json entry.")
+    parser.add_argument("--data-format", help="JSON file with the data_format to accept.")
+    parser.add_argument("--queue-capacity", type=int, default=QUEUE_CAPACITY)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--dead-letter", default=DEAD_LETTER_FILE, help="NDJSON file for batches that cannot be stored.")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="Seconds between metric log lines.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] [%(levelname)s] %(message)s")
+    validator = ReadingValidator(load_data_formats(args.sensor, args.data_format))
+    if args.timeseries:
+        from timeseries_store import TimeSeriesStore
+        store = TimeSeriesStore(args.timeseries)
+    else:
+        store = SQLiteStore(args.db)
+    server = IngestServer(store, validator, queue_capacity=args.queue_capacity,
+                          batch_size=args.batch_size, dead_letter_path=args.dead_letter)
+    try:
+        asyncio.run(_serve(server, args.host, args.port, args.report_interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+# job_queue.py
+
+# Durable job queue for GenerationEngine requests. Jobs live in SQLite (WAL mode), so closing the
+# window or a crash loses nothing: on the next start jobs that were running go back to the queue and
+# run again. Every job has a checkpoint table: the engine stores each successful model response and
+# BatchJob its submitted batch ids and parsed results, so a resumed job skips the calls it already
+# paid for and polls the batches it already submitted.
+#   states       queued -> running -> done, or back to queued after a failure until max_attempts,
+#                then error; cancelled for queued jobs that were cancelled
+#   idempotency  submitting a request with the same idempotency key returns the existing job
+#                (by default the key is a hash of the request, so an identical catalog run resumes)
+# Run: python job_queue.py --model gpt-4o catalog        (queue a catalog regeneration and run it)
+#      python job_queue.py --model gpt-4o run            (resume everything left in the queue)
+#      python job_queue.py list
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from generation_engine import CatalogBatchRequest, engine_from_config, request_from_dict
+
+JOB_STORE_FILE = "jobs.db"
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_DELAY = 30.0  # Seconds before a failed job is retried; doubled after every further failure
+ACTIVE_STATES = ("queued", "running")
+
+
+def request_key(request, *extra):
+    """Idempotency key of a request: a hash of its content (without the request id) and extra values."""
+    content = {key: value for key, value in request.to_dict().items() if key != "request_id"}
+    text = json.dumps([content, *extra], sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class JobCheckpoint:
+    def __init__(self, store, job_id):
+        """Key/value checkpoint of one job, passed to GenerationEngine.run() and BatchJob."""
+        self.store = store
+        self.job_id = job_id
+
+    def get(self, key):
+        return self.store.get_checkpoint(self.job_id, key)
+
+    def put(self, key, value):
+        self.store.put_checkpoint(self.job_id, key, value)
+
+    def items(self, prefix):
+        """:return: Dictionary of the entries whose key starts with prefix, with the prefix removed."""
+        return self.store.checkpoint_items(self.job_id, prefix)
+
+
+class JobStore:
+    def __init__(self, path=JOB_STORE_FILE):
+        """
+        SQLite store of jobs and their checkpoints, safe to share between threads.
+        Every change is committed right away with synchronous=FULL, so it survives a crash.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    idempotency_key TEXT UNIQUE,
+                    kind TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    not_before REAL NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )""")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    job_id TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (job_id, key)
+                )""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, not_before, created)")
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["request"] = json.loads(job["request"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    # ------------------------------------------------ jobs ------------------------------------------------
+
+    def enqueue(self, request, idempotency_key=None, max_attempts=DEFAULT_MAX_ATTEMPTS, reuse_done=True):
+        """
+        Queue a request, or return the job that already has its idempotency key.
+        A failed or cancelled job with the key is queued again with fresh attempts.
+        :param idempotency_key: Defaults to request_key(request).
+        :param reuse_done: False starts a new job when the existing one is done (the old job keeps its results).
+        :return: (job dictionary, True if the request was queued).
+        """
+        key = idempotency_key or request_key(request)
+        now = time.time()
+        with self.lock, self.connection:
+            existing = self._job(self.connection.execute(
+                "SELECT * FROM jobs WHERE idempotency_key = ?", (key,)).fetchone())
+            if existing and existing["state"] in ACTIVE_STATES:
+                return existing, False
+            if existing and existing["state"] == "done" and reuse_done:
+                return existing, False
+            if existing and existing["state"] in ("error", "cancelled"):
+                self.connection.execute("UPDATE jobs SET state = 'queued', attempts = 0, not_before = 0, error = NULL, "
+                                        "updated = ? WHERE id = ?", (now, existing["id"]))
+                return self.get(existing["id"], locked=True), True
+            if existing:
+                self.connection.execute("UPDATE jobs SET idempotency_key = NULL WHERE id = ?", (existing["id"],))
+            self.connection.execute(
+                "INSERT INTO jobs (id, idempotency_key, kind, request, state, max_attempts, created, updated) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (request.request_id, key, request.kind, json.dumps(request.to_dict()), max_attempts, now, now))
+            return self.get(request.request_id, locked=True), True
+
+    def claim(self):
+        """Mark the oldest due queued job as running and return it (None when nothing is due)."""
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT id FROM jobs WHERE state = 'queued' AND not_before <= ? "
+                                          "ORDER BY created LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE jobs SET state = 'running', attempts = attempts + 1, updated = ? "
+                                    "WHERE id = ?", (now, row["id"]))
+            return self.get(row["id"], locked=True)
+
+    def next_due(self):
+        """Seconds until the next queued job is due (None when the queue is empty)."""
+        with self.lock:
+            row = self.connection.execute("SELECT MIN(not_before) FROM jobs WHERE state = 'queued'").fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def complete(self, job_id, result):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE jobs SET state = 'done', result = ?, error = NULL, updated = ? "
+                                    "WHERE id = ?", (json.dumps(result), time.time(), job_id))
+
+    def fail(self, job_id, error, retry_delay=RETRY_DELAY):
+        """
+        Record a failed attempt; the job is queued again after a backoff until it runs out of attempts.
+        :return: New state ('queued' or 'error').
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            job = self.connection.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?",
+                                          (job_id,)).fetchone()
+            if job["attempts"] < job["max_attempts"]:
+                delay = retry_delay * 2 ** (job["attempts"] - 1)
+                self.connection.execute("UPDATE jobs SET state = 'queued', error = ?, not_before = ?, updated = ? "
+                                        "WHERE id = ?", (error, now + delay, now, job_id))
+                return "queued"
+            self.connection.execute("UPDATE jobs SET state = 'error', error = ?, updated = ? WHERE id = ?",
+                                    (error, now, job_id))
+            return "error"
+
+    def cancel(self, job_id):
+        """Cancel a queued job. :return: True if it was cancelled."""
+        with self.lock, self.connection:
+            cursor = self.connection.execute("UPDATE jobs SET state = 'cancelled', updated = ? "
+                                             "WHERE id = ? AND state = 'queued'", (time.time(), job_id))
+            return cursor.rowcount == 1
+
+    def retry(self, job_id):
+        """Queue a failed or cancelled job again; its checkpoints are kept. :return: True if it was queued."""
+        with self.lock, self.connection:
+            cursor = self.connection.execute("UPDATE jobs SET state = 'queued', attempts = 0, not_before = 0, "
+                                             "updated = ? WHERE id = ? AND state IN ('error', 'cancelled')",
+                                             (time.time(), job_id))
+            return cursor.rowcount == 1
+
+    def recover(self):
+        """
+        Queue the jobs left running by a previous process. The interruption does not count as an attempt.
+        Call once at start-up, before any job of this process is claimed.
+        :return: Number of jobs recovered.
+        """
+        with self.lock, self.connection:
+            cursor = self.connection.execute("UPDATE jobs SET state = 'queued', attempts = MAX(attempts - 1, 0), "
+                                             "not_before = 0, updated = ? WHERE state = 'running'", (time.time(),))
+            return cursor.rowcount
+
+    def cancel_kinds(self, kinds):
+        """
+        Cancel the queued and running jobs of the given kinds, e.g. interactive requests an older
+        version left in the store, so they are not recovered. :return: Number of jobs cancelled.
+        """
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                f"UPDATE jobs SET state = 'cancelled', updated = ? WHERE kind IN ({', '.join('?' * len(kinds))}) "
+                "AND state IN ('queued', 'running')", (time.time(), *kinds))
+            return cursor.rowcount
+
+    def get(self, job_id, locked=False):
+        if locked:
+            return self._job(self.connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+        with self.lock:
+            return self.get(job_id, locked=True)
+
+    def list(self, states=None, limit=100):
+        """Newest jobs first, optionally only those in the given states."""
+        query, args = "SELECT * FROM jobs", []
+        if states:
+            query += f" WHERE state IN ({', '.join('?' * len(states))})"
+            args.extend(states)
+        query += " ORDER BY created DESC LIMIT ?"
+        args.append(limit)
+        with self.lock:
+            return [self._job(row) for row in self.connection.execute(query, args).fetchall()]
+
+    def counts(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    # ------------------------------------------------ checkpoints ------------------------------------------------
+
+    def checkpoint(self, job_id):
+        return JobCheckpoint(self, job_id)
+
+    def get_checkpoint(self, job_id, key):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM checkpoints WHERE job_id = ? AND key = ?",
+                                          (job_id, key)).fetchone()
+        return json.loads(row["value"]) if row else None
+
+    def put_checkpoint(self, job_id, key, value):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO checkpoints (job_id, key, value, created) "
+                                    "VALUES (?, ?, ?, ?)", (job_id, key, json.dumps(value), time.time()))
+
+    def checkpoint_items(self, job_id, prefix):
+        with self.lock:
+            rows = self.connection.execute("SELECT key, value FROM checkpoints WHERE job_id = ? "
+                                           "AND substr(key, 1, ?) = ?", (job_id, len(prefix), prefix)).fetchall()
+        return {row["key"][len(prefix):]: json.loads(row["value"]) for row in rows}
+
+    def close(self):
+        self.connection.close()
+
+
+class JobRunner:
+    def __init__(self, store, engine, workers=2, retry_delay=RETRY_DELAY, ready=None, execute=None, log=None):
+        """
+        Worker threads that claim jobs from a JobStore and run them on a GenerationEngine.
+        The threads are daemon threads: the store, not the thread, holds the work, so stopping the
+        process at any point is safe.
+        :param workers: Jobs run at the same time.
+        :param retry_delay: Backoff before the first retry of a failed job (seconds).
+        :param ready: Callable; no job is claimed while it returns False (e.g. no model selected yet).
+        :param execute: Callable(request, checkpoint) running a request; defaults to engine.run.
+        :param log: Callable(message, level) used for progress messages.
+        """
+        self.store = store
+        self.engine = engine
+        self.workers = workers
+        self.retry_delay = retry_delay
+        self.ready = ready or (lambda: True)
+        self.execute = execute or (lambda request, checkpoint: engine.run(request, checkpoint=checkpoint))
+        self.log = log or (lambda message, level="INFO": print(f"[{level}] {message}"))
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def start(self):
+        """Requeue the jobs of an interrupted session and start the worker threads."""
+        if self.threads:
+            return
+        recovered = self.store.recover()
+        queued = self.store.counts().get("queued", 0)
+        if recovered:
+            self.log(f"Recovered {recovered} interrupted jobs.", "WARNING")
+        if queued:
+            self.log(f"{queued} jobs waiting in {self.store.path}.", "INFO")
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work_loop, name=f"job-runner-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+
+    def notify(self):
+        """Wake the workers, e.g. after the model was selected."""
+        self.wakeup.set()
+
+    def submit(self, request, idempotency_key=None, max_attempts=DEFAULT_MAX_ATTEMPTS, reuse_done=True):
+        """Queue a request (see JobStore.enqueue) and wake the workers. :return: Job dictionary."""
+        job, queued = self.store.enqueue(request, idempotency_key, max_attempts, reuse_done)
+        if not queued:
+            self.log(f"Job {job['id']} ({job['kind']}) is already {job['state']}.", "INFO")
+        self.wakeup.set()
+        return job
+
+    def run_pending(self):
+        """Run queued jobs on the calling thread until none is left (waiting out retry backoffs)."""
+        self.store.recover()
+        while not self.stopping.is_set():
+            job = self.store.claim() if self.ready() else None
+            if job:
+                self._run_job(job)
+                continue
+            wait = self.store.next_due()
+            if wait is None:
+                return
+            time.sleep(min(wait, 5.0))
+
+    def _work_loop(self):
+        while not self.stopping.is_set():
+            job = self.store.claim() if self.ready() else None
+            if job is None:
+                wait = self.store.next_due() if self.ready() else None
+                self.wakeup.wait(5.0 if wait is None else max(min(wait, 5.0), 0.1))
+                self.wakeup.clear()
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job):
+        job_id = job["id"]
+        self.log(f"Running job {job_id} ({job['kind']}), attempt {job['attempts']} of {job['max_attempts']}.",
+                 "DEBUG")
+        try:
+            result = self.execute(request_from_dict(job["request"], job_id), self.store.checkpoint(job_id))
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+        if "error" not in result:
+            self.store.complete(job_id, {key: value for key, value in result.items() if key != "usage"})
+            return
+        state = self.store.fail(job_id, result["error"], self.retry_delay)
+        if state == "queued":
+            self.log(f"Job {job_id} failed, retrying later: {result['error']}", "WARNING")
+        else:
+            self.log(f"Job {job_id} failed after {job['attempts']} attempts: {result['error']}", "ERROR")
+
+
+def main():
+    from config_manager import load_config
+    from usage_ledger import UsageLedger
+
+    parser = argparse.ArgumentParser(description="Run and inspect the durable generation job queue.")
+    parser.add_argument("command", choices=["list", "run", "catalog", "retry", "cancel"])
+    parser.add_argument("job_id", nargs="?", help="Job for retry and cancel.")
+    parser.add_argument("--model", help="Model from config.json (run and catalog).")
+    parser.add_argument("--store", default=JOB_STORE_FILE, help="Job store file.")
+    parser.add_argument("--technology", default="", help="Module B technology for catalog runs.")
+    parser.add_argument("--board", default="", help="Module B board for catalog runs.")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    args = parser.parse_args()
+
+    store = JobStore(args.store)
+    if args.command == "list":
+        for job in store.list():
+            error = f"  {job['error'][:60]}" if job["error"] else ""
+            print(f"{job['id']}  {job['kind']:<20} {job['state']:<10} attempts {job['attempts']}/"
+                  f"{job['max_attempts']}{error}")
+        return
+    if args.command in ("retry", "cancel"):
+        if not args.job_id:
+            parser.error(f"{args.command} needs a job id.")
+        done = store.retry(args.job_id) if args.command == "retry" else store.cancel(args.job_id)
+        print(f"Job {args.job_id} {args.command} {'done' if done else 'not possible in its state'}.")
+        return
+    if not args.model:
+        parser.error(f"{args.command} needs --model.")
+
+    config = load_config()
+    engine = engine_from_config(config, args.model,
+                                usage_ledger=UsageLedger(pricing=config.get("pricing"), budgets=config.get("budgets")))
+    engine.bus.subscribe(lambda event: print(f"[{event.data['level']}] {event.data['message']}")
+                         if event.kind == "log" and event.data["level"] != "DEBUG" else None)
+    runner = JobRunner(store, engine)
+    if args.command == "catalog":
+        with open("sensors.json", "r") as f:
+            sensor_data = json.load(f).get("sensors", {})
+        request = CatalogBatchRequest(sensor_data, config.get("batch", {}), endpoint_technology=args.technology,
+                                      endpoint_board=args.board)
+        job = runner.submit(request, request_key(request, args.model), args.max_attempts)
+        print(f"Catalog job {job['id']} is {job['state']}.")
+    runner.run_pending()
+    print(json.dumps(store.counts()))
+
+
+if __name__ == "__main__":
+    main()
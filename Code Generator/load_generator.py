@@ -0,0 +1,345 @@
+# load_generator.py
+
+# Synthetic sensor traffic for load-testing the Module A -> Module B -> endpoint path without
+# physical sensors. Readings follow the data_format of sensors.json entries: numeric fields do a
+# random walk inside the ranges of format_compiler.FIELD_HINTS, fields drop out (are omitted),
+# devices go offline for a while and send bursts. Runs are reproducible from --seed.
+#
+# Outputs:
+#   raw    NDJSON {"t", "slave", "sensor", "body"} lines; uplink_replay.py reads the same format
+#   chunks One file per slave with the chunk frames Module A writes to the bus (chunk_codec)
+#   rest   POSTs to an endpoint from --gateways concurrent Module B connections, optionally batched
+# Run: python load_generator.py raw --sensor ruuvitag --devices 1000 --rate 0.2 --duration 600 --out load.ndjson
+#      python load_generator.py rest --devices 5000 --rate 1 --duration 60 --gateways 50 --batch 20 --speed 0
+
+import argparse
+import heapq
+import http.client
+import json
+import os
+import queue
+import random
+import threading
+import time
+from urllib.parse import urlparse
+from chunk_codec import add_slave_id, encode_chunks, MasterReassembler, i2c_transaction, SlaveEndpoint
+from format_compiler import encode_reading, field_hints, is_compiled, normalise_schema, parse_format_text
+from analysis_common import percentile
+from uplink_replay import UplinkBatcher
+
+FIRST_SLAVE_ADDRESS = 0x08
+
+
+class DeviceModel:
+    def __init__(self, index, sensor, data_format, rng, field_dropout=0.0, invalid_rate=0.0):
+        """
+        One simulated sensor behind a Module A.
+        :param index: Device number, also used for its identifiers.
+        :param sensor: Catalog key of the sensor.
+        :param data_format: data_format of the sensor (or a compiled key dictionary).
+        :param rng: random.Random of this device.
+        :param field_dropout: Probability that a field is unavailable (omitted) in a reading.
+        :param invalid_rate: Probability of a reading with a null field, to exercise validation.
+        """
+        self.index = index
+        self.sensor = sensor
+        self.address = FIRST_SLAVE_ADDRESS + index % 112  # 7-bit addresses 0x08..0x77
+        self.compiled = data_format if is_compiled(data_format) else None
+        self.schema = normalise_schema(data_format)
+        self.rng = rng
+        self.field_dropout = field_dropout
+        self.invalid_rate = invalid_rate
+        self.state = {}
+        for field, kind in self.schema.items():
+            hints = field_hints(field, kind)
+            if kind in ("float", "int"):
+                spread = (hints["max"] - hints["min"]) * 0.1
+                self.state[field] = min(hints["max"], max(hints["min"], hints["example"] + rng.uniform(-spread, spread)))
+            elif kind == "bool":
+                self.state[field] = rng.random() < 0.5
+
+    def _identifier(self, field):
+        if "id" in field.lower() or "mac" in field.lower():
+            return "02:00:%02x:%02x:%02x:%02x" % ((self.index >> 24) & 0xFF, (self.index >> 16) & 0xFF,
+                                                  (self.index >> 8) & 0xFF, self.index & 0xFF)
+        return f"{field}-{self.index}"
+
+    def reading(self):
+        """Next reading as Module A would produce it (no SlaveID), with unavailable fields omitted."""
+        rng = self.rng
+        out = {}
+        for field, kind in self.schema.items():
+            if kind in ("float", "int"):
+                hints = field_hints(field, kind)
+                value = self.state[field] + rng.gauss(0, (hints["max"] - hints["min"]) * 0.005)
+                value = min(hints["max"], max(hints["min"], value))
+                self.state[field] = value
+            elif kind == "bool" and rng.random() < 0.05:
+                self.state[field] = not self.state[field]
+            if self.field_dropout and rng.random() < self.field_dropout:
+                continue
+            if kind == "float":
+                out[field] = round(self.state[field], max(field_hints(field, kind)["precision"], 1))
+            elif kind == "int":
+                out[field] = int(round(self.state[field]))
+            elif kind == "bool":
+                out[field] = self.state[field]
+            else:
+                out[field] = self._identifier(field)
+        if self.invalid_rate and out and rng.random() < self.invalid_rate:
+            out[rng.choice(list(out))] = None
+        return encode_reading(self.compiled, out) if self.compiled else out
+
+
+class Fleet:
+    def __init__(self, data_formats, devices, rate, seed=1, field_dropout=0.0, dropout=0.0, dropout_mean=60.0,
+                 burst_prob=0.0, burst_size=10, burst_interval=0.05, invalid_rate=0.0):
+        """
+        :param data_formats: Dictionary of sensor key -> data_format; devices cycle through the sensors.
+        :param devices: Number of devices.
+        :param rate: Readings per second per device (Poisson arrivals).
+        :param dropout: Probability per reading that the device then goes offline.
+        :param dropout_mean: Mean offline time in seconds (exponential).
+        :param burst_prob: Probability per reading that a burst follows.
+        :param burst_size: Readings in a burst.
+        :param burst_interval: Seconds between readings of a burst.
+        """
+        self.rate = rate
+        self.dropout = dropout
+        self.dropout_mean = dropout_mean
+        self.burst_prob = burst_prob
+        self.burst_size = burst_size
+        self.burst_interval = burst_interval
+        self.rng = random.Random(seed)
+        sensors = list(data_formats.items())
+        self.devices = [DeviceModel(index, sensors[index % len(sensors)][0], sensors[index % len(sensors)][1],
+                                    random.Random(f"{seed}-{index}"), field_dropout, invalid_rate)
+                        for index in range(devices)]
+        self.stats = {"readings": 0, "dropouts": 0, "bursts": 0}
+
+    def events(self, duration):
+        """
+        Readings in time order.
+        :return: Generator of (time, device, reading).
+        """
+        rng = self.rng
+        heap = [(rng.expovariate(self.rate), index, 0) for index in range(len(self.devices))]
+        heapq.heapify(heap)
+        while heap:
+            t, index, burst_left = heapq.heappop(heap)
+            if t > duration:
+                break
+            device = self.devices[index]
+            self.stats["readings"] += 1
+            yield t, device, device.reading()
+
+            if burst_left:
+                next_time, burst_left = t + self.burst_interval, burst_left - 1
+            elif self.burst_prob and rng.random() < self.burst_prob:
+                self.stats["bursts"] += 1
+                next_time, burst_left = t + self.burst_interval, self.burst_size - 1
+            else:
+                next_time = t + rng.expovariate(self.rate)
+                if self.dropout and rng.random() < self.dropout:
+                    self.stats["dropouts"] += 1
+                    next_time += rng.expovariate(1.0 / self.dropout_mean)
+            heapq.heappush(heap, (next_time, index, burst_left))
+
+
+def write_raw(fleet, duration, path):
+    """NDJSON of every reading (uplink_replay.py capture format plus slave and sensor)."""
+    with open(path, "w") as f:
+        for t, device, reading in fleet.events(duration):
+            f.write(json.dumps({"t": round(t, 3), "slave": device.address, "sensor": device.sensor, "body": reading},
+                               separators=(",", ":")) + "\n")
+    return dict(fleet.stats)
+
+
+def write_chunks(fleet, duration, out_dir, verify=False):
+    """
+    Chunk frames per slave address, exactly as Module A writes them to the bus.
+    :param verify: Feed every reading through SlaveEndpoint/MasterReassembler and count deliveries.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    files = {}
+    stats = {"chunks": 0, "wire_bytes": 0, "delivered": 0}
+    try:
+        for t, device, reading in fleet.events(duration):
+            if device.address not in files:
+                files[device.address] = open(os.path.join(out_dir, f"slave_{device.address:02x}.chunks"), "wb")
+            payload = add_slave_id(reading, device.address)
+            chunks = encode_chunks(payload)
+            files[device.address].writelines(chunks)
+            stats["chunks"] += len(chunks)
+            stats["wire_bytes"] += sum(len(chunk) for chunk in chunks)
+            if verify:
+                slave, master = SlaveEndpoint(device.address), MasterReassembler()
+                slave.add_reading(reading)
+                for _ in range(len(chunks) + 1):
+                    i2c_transaction(slave, master)
+                stats["delivered"] += master.get_from_ring_buffer() == payload
+    finally:
+        for f in files.values():
+            f.close()
+    stats.update(fleet.stats, slaves=len(files))
+    return stats
+
+
+class GatewaySender(threading.Thread):
+    def __init__(self, name, url, batch, results):
+        """One Module B: sends its readings over one keep-alive connection, per reading or NDJSON batched."""
+        super().__init__(daemon=True)
+        self.gateway = name
+        self.target = urlparse(url)
+        self.batcher = UplinkBatcher(max_readings=batch) if batch > 1 else None
+        self.results = results
+        self.inbox = queue.Queue(maxsize=10000)
+        self.connection = None
+
+    def run(self):
+        while True:
+            item = self.inbox.get()
+            if item is None:
+                if self.batcher and self.batcher.lines:
+                    batch = self.batcher.flush()
+                    self._send(batch, "application/x-ndjson", batch.count("\n"))
+                return
+            t, body = item
+            if not self.batcher:
+                self._send(body, "application/json", 1)
+                continue
+            for batch in self.batcher.poll(t) + self.batcher.add(body, t):
+                self._send(batch, "application/x-ndjson", batch.count("\n"))
+
+    def _send(self, body, content_type, readings):
+        data = body.encode("utf-8")
+        headers = {"Content-Type": content_type, "Content-Length": str(len(data)), "X-Gateway-Id": self.gateway}
+        for attempt in range(2):
+            try:
+                if self.connection is None:
+                    self.connection = http.client.HTTPConnection(self.target.hostname, self.target.port or 80,
+                                                                 timeout=30)
+                start = time.perf_counter()
+                self.connection.request("POST", self.target.path or "/", body=data, headers=headers)
+                response = self.connection.getresponse()
+                response.read()
+                self.results.record(response.status, readings, time.perf_counter() - start)
+                return
+            except (http.client.HTTPException, OSError):
+                if self.connection is not None:
+                    self.connection.close()
+                self.connection = None
+        self.results.record(None, readings, 0.0)
+
+
+class SendResults:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.readings = 0
+        self.status = {}
+        self.latencies = []
+
+    def record(self, status, readings, latency):
+        with self.lock:
+            self.requests += 1
+            self.readings += readings
+            key = str(status) if status else "connection_error"
+            self.status[key] = self.status.get(key, 0) + 1
+            if status:
+                self.latencies.append(latency)
+
+
+def send_rest(fleet, duration, url, gateways=10, batch=1, speed=1.0):
+    """
+    POST the readings to an endpoint.
+    :param gateways: Concurrent Module B connections; devices are spread over them.
+    :param batch: Readings per POST (NDJSON) when > 1, with the UplinkBatcher flush policy.
+    :param speed: 1 = real time, N = N times faster, 0 = as fast as possible.
+    """
+    results = SendResults()
+    senders = [GatewaySender(f"gw-{index}", url, batch, results) for index in range(gateways)]
+    for sender in senders:
+        sender.start()
+    start = time.perf_counter()
+    for t, device, reading in fleet.events(duration):
+        if speed:
+            delay = t / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        body = add_slave_id(reading, device.address).decode("utf-8")
+        senders[device.index % gateways].inbox.put((t, body))
+    for sender in senders:
+        sender.inbox.put(None)
+    for sender in senders:
+        sender.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "generated": fleet.stats,
+        "requests": results.requests,
+        "readings_sent": results.readings,
+        "status": results.status,
+        "elapsed_s": round(elapsed, 3),
+        "readings_per_s": round(results.readings / elapsed, 1) if elapsed else 0.0,
+        "latency_p50_ms": _ms(percentile(results.latencies, 0.5)),
+        "latency_p99_ms": _ms(percentile(results.latencies, 0.99))
+    }
+
+
+def _ms(value):
+    return None if value is None else round(value * 1000, 2)
+
+
+def load_formats(sensor_keys, data_format_path=None, sensors_file="sensors.json"):
+    """Dictionary of sensor key -> data_format (all catalog sensors if no keys are given)."""
+    if data_format_path:
+        with open(data_format_path, "r") as f:
+            return {"custom": parse_format_text(f.read())}
+    with open(sensors_file, "r") as f:
+        sensors = json.load(f).get("sensors", {})
+    keys = sensor_keys or list(sensors)
+    return {key: sensors[key]["data_format"] for key in keys}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic sensor traffic for load tests.")
+    parser.add_argument("output", choices=["raw", "chunks", "rest"], help="Where the readings go.")
+    parser.add_argument("--sensor", action="append", help="Catalog sensor (repeatable; default all).")
+    parser.add_argument("--data-format", help="Use this data format (or compiled key dictionary) file instead.")
+    parser.add_argument("--devices", type=int, default=100, help="Number of devices.")
+    parser.add_argument("--rate", type=float, default=0.2, help="Readings per second per device.")
+    parser.add_argument("--duration", type=float, default=60.0, help="Simulated seconds.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed.")
+    parser.add_argument("--field-dropout", type=float, default=0.02, help="Probability a field is omitted.")
+    parser.add_argument("--dropout", type=float, default=0.001, help="Probability per reading of going offline.")
+    parser.add_argument("--dropout-mean", type=float, default=120.0, help="Mean offline time in seconds.")
+    parser.add_argument("--burst-prob", type=float, default=0.005, help="Probability per reading of a burst.")
+    parser.add_argument("--burst-size", type=int, default=10, help="Readings per burst.")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="Fraction of readings with a null field.")
+    parser.add_argument("--out", default="load.ndjson", help="Output file (raw) or directory (chunks).")
+    parser.add_argument("--verify", action="store_true", help="chunks: reassemble every reading with chunk_codec.")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/readings", help="rest: endpoint URL.")
+    parser.add_argument("--gateways", type=int, default=10, help="rest: concurrent Module B connections.")
+    parser.add_argument("--batch", type=int, default=1, help="rest: readings per POST (NDJSON when > 1).")
+    parser.add_argument("--speed", type=float, default=0.0, help="rest: 1 = real time, 0 = as fast as possible.")
+    args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error("--rate must be greater than 0.")
+    if args.dropout_mean <= 0:
+        parser.error("--dropout-mean must be greater than 0.")
+
+    fleet = Fleet(load_formats(args.sensor, args.data_format), args.devices, args.rate, seed=args.seed,
+                  field_dropout=args.field_dropout, dropout=args.dropout, dropout_mean=args.dropout_mean,
+                  burst_prob=args.burst_prob, burst_size=args.burst_size, invalid_rate=args.invalid_rate)
+    if args.output == "raw":
+        result = write_raw(fleet, args.duration, args.out)
+    elif args.output == "chunks":
+        result = write_chunks(fleet, args.duration, args.out if args.out != "load.ndjson" else "load_chunks",
+                              args.verify)
+    else:
+        result = send_rest(fleet, args.duration, args.url, args.gateways, args.batch, args.speed)
+    print(json.dumps(result, indent=4))
+
+
+if __name__ == "__main__":
+    main()
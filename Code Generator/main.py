@@ -4,6 +4,10 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import json
 from api import ChatGPTAPI
+from api_pool import PooledChatGPTAPI, get_model_keys
+from model_race import ModelRacer
+from usage_ledger import UsageLedger
+from profiling import Profiler, profiling_requested
 from config_manager import load_config, save_config
 from button_functions import ButtonFunctions
 from scrollable_frame import ScrollableFrame  # Import the ScrollableFrame class
@@ -11,6 +15,9 @@ from scrollable_frame import ScrollableFrame  # Import the ScrollableFrame class
 # Load configuration
 config = load_config()
 
+# Token usage accounting and budgets
+usage_ledger = UsageLedger(pricing=config.get("pricing"), budgets=config.get("budgets"))
+
 # Initialize ChatGPT API Wrapper
 chatgpt_api = ChatGPTAPI(api_key=None, model=None)  # Will be set when a model is selected
 
@@ -41,10 +48,13 @@ def update_selected_model(ui_components, config, model_selection_var, llm_feedba
     selected_model = model_selection_var.get()
     if selected_model:
         model_info = config["models"].get(selected_model, {})
-        api_key = model_info.get("key")
-        if api_key:
+        api_keys = get_model_keys(model_info)
+        if api_keys:
             global chatgpt_api
-            chatgpt_api = ChatGPTAPI(api_key=api_key, model=selected_model)
+            if len(api_keys) > 1:
+                chatgpt_api = PooledChatGPTAPI(api_keys=api_keys, model=selected_model)
+            else:
+                chatgpt_api = ChatGPTAPI(api_key=api_keys[0], model=selected_model)
 
             # Update the ButtonFunctions instance with the new API instance
             button_functions.chatgpt_api = chatgpt_api
@@ -52,9 +62,9 @@ def update_selected_model(ui_components, config, model_selection_var, llm_feedba
             # Update the feedback box
             llm_feedback_box.config(state="normal")
             llm_feedback_box.delete("1.0", "end")
-            llm_feedback_box.insert("1.0", f"Selected Model: {selected_model}\n\nDescription: {model_info.get('description', 'No description available.')}")
+            llm_feedback_box.insert("1.0", f"Selected Model: {selected_model}\n\nDescription: {model_info.get('description', 'No description available.')}\n\nAPI keys: {len(api_keys)}")
             llm_feedback_box.config(state="disabled")
-            button_functions.log_progress(f"Selected model: {selected_model}", level="INFO")
+            button_functions.log_progress(f"Selected model: {selected_model} ({len(api_keys)} API keys)", level="INFO")
         else:
             llm_feedback_box.config(state="normal")
             llm_feedback_box.delete("1.0", "end")
@@ -69,6 +79,51 @@ def update_selected_model(ui_components, config, model_selection_var, llm_feedba
         button_functions.log_progress("No model selected.", level="WARNING")
 
 
+def update_race_mode(config, race_mode_var, button_functions):
+    """Enable or disable racing several models for the generate buttons."""
+    if not race_mode_var.get():
+        button_functions.model_racer = None
+        button_functions.log_progress("Race mode disabled.", level="INFO")
+        return
+
+    apis = []
+    for model in config.get("race", {}).get("models", []):
+        api_keys = get_model_keys(config["models"].get(model, {}))
+        if not api_keys:
+            button_functions.log_progress(f"Race mode: no API key for {model}, skipping it.", level="WARNING")
+        elif len(api_keys) > 1:
+            apis.append(PooledChatGPTAPI(api_keys=api_keys, model=model))
+        else:
+            apis.append(ChatGPTAPI(api_key=api_keys[0], model=model))
+
+    if len(apis) < 2:
+        race_mode_var.set(False)
+        button_functions.model_racer = None
+        button_functions.log_progress("Race mode needs at least two models with API keys in config.json.", level="ERROR")
+        return
+    button_functions.model_racer = ModelRacer(apis)
+    button_functions.log_progress(f"Race mode enabled: {', '.join(api.model for api in apis)}", level="INFO")
+
+
+def toggle_profiling(profiling_var, profiler, button_functions):
+    """Enable or disable profiling from the Debug menu."""
+    if profiling_var.get():
+        profiler.enable(root)
+        button_functions.log_progress(f"Profiling enabled, output goes to '{profiler.output_dir}'.", level="INFO")
+    else:
+        paths = profiler.disable()
+        button_functions.log_progress(f"Profiling disabled. Written: {', '.join(paths)}", level="INFO")
+
+
+def dump_profile(profiler, button_functions):
+    """Write the profile collected so far without stopping profiling."""
+    if not profiler.enabled:
+        button_functions.log_progress("Profiling is not enabled.", level="WARNING")
+        return
+    paths = profiler.dump()
+    button_functions.log_progress(f"Profile written: {', '.join(paths)}", level="INFO")
+
+
 def add_new_board():
     new_board = new_board_entry.get().strip()
     if new_board:
@@ -261,6 +316,11 @@ sensor_module_var = tk.StringVar()
 sensor_module_dropdown = ttk.Combobox(module_a_frame, textvariable=sensor_module_var, values=config["boards"], state="readonly")
 sensor_module_dropdown.pack(anchor="w")
 
+tk.Label(module_a_frame, text="Aggregation window (none, readings per summary, seconds, or both as 10,60s):").pack(anchor="w")
+aggregation_dropdown = ttk.Combobox(module_a_frame, values=["none", "10", "60s", "300s", "10,60s"])
+aggregation_dropdown.set("none")
+aggregation_dropdown.pack(anchor="w")
+
 tk.Label(module_a_frame, text="Generated Code for Module A:").pack(anchor="w")
 module_a_code_frame, module_a_code_box = create_scrollable_text(module_a_frame, height=15, width=70)
 module_a_code_frame.pack(fill="x", pady=10)
@@ -295,6 +355,16 @@ transmission_module_var = tk.StringVar()
 transmission_module_dropdown = ttk.Combobox(module_b_frame, textvariable=transmission_module_var, values=config["boards"], state="readonly")
 transmission_module_dropdown.pack(anchor="w")
 
+tk.Label(module_b_frame, text="Uplink (per_reading: one POST per reading, batched: NDJSON over keep-alive):").pack(anchor="w")
+uplink_dropdown = ttk.Combobox(module_b_frame, values=["per_reading", "batched"], state="readonly")
+uplink_dropdown.set("per_reading")
+uplink_dropdown.pack(anchor="w")
+
+tk.Label(module_b_frame, text="Slave polling (random: example loop; round_robin, weighted by backlog, adaptive_backoff):").pack(anchor="w")
+polling_dropdown = ttk.Combobox(module_b_frame, values=["random", "round_robin", "weighted", "adaptive_backoff"], state="readonly")
+polling_dropdown.set("random")
+polling_dropdown.pack(anchor="w")
+
 tk.Label(module_b_frame, text="Generated Code for Module B:").pack(anchor="w")
 module_b_code_frame, module_b_code_box = create_scrollable_text(module_b_frame, height=15, width=70)
 module_b_code_frame.pack(fill="x", pady=10)
@@ -333,6 +403,21 @@ model_dropdown = ttk.Combobox(center_frame, textvariable=model_selection_var, st
 model_dropdown["values"] = list(config["models"].keys())  # Populate dropdown with model names from config
 model_dropdown.pack(fill="x", pady=5)
 
+# Race mode: send generate prompts to several models and keep the first valid answer
+race_mode_var = tk.BooleanVar(value=False)
+race_mode_checkbutton = tk.Checkbutton(center_frame, text="Race models (see config.json)", variable=race_mode_var)
+race_mode_checkbutton.pack(anchor="w")
+
+# Live token usage totals
+usage_label = tk.Label(center_frame, text="Session: 0 requests", wraplength=280, justify="left")
+usage_label.pack(anchor="w", pady=5)
+
+# I2C chunk framing used by the generated code
+tk.Label(center_frame, text="I2C Chunk Framing:").pack(anchor="w")
+framing_dropdown = ttk.Combobox(center_frame, values=["json", "binary"], state="readonly", width=28)
+framing_dropdown.set("json")
+framing_dropdown.pack(anchor="w", pady=5)
+
 # Data Format Section
 tk.Label(center_frame, text="Define Data Format for Communication:").pack(anchor="w", pady=10)
 data_format_frame, data_format_box = create_scrollable_text(center_frame, height=10, width=40, state="normal")  # Ensure state="normal"
@@ -387,15 +472,22 @@ ui_components = {
     "example_tab_2_text": example_tab_2_text,
     #"error_log_box": error_log_box,
     "modification_requests_box": modification_requests_box,
-    "progress_log_box": progress_log_box  # **Added Progress Log Box to UI Components**
+    "progress_log_box": progress_log_box,  # **Added Progress Log Box to UI Components**
+    "usage_label": usage_label,
+    "framing_dropdown": framing_dropdown,
+    "uplink_dropdown": uplink_dropdown,
+    "polling_dropdown": polling_dropdown,
+    "aggregation_dropdown": aggregation_dropdown
 }
 
 # Initialize ButtonFunctions instance
-button_functions = ButtonFunctions(chatgpt_api, ui_components)
+button_functions = ButtonFunctions(chatgpt_api, ui_components, usage_ledger=usage_ledger)
 
 # Now that button_functions is defined, bind the model dropdown selection event
 model_dropdown.bind("<<ComboboxSelected>>", lambda e: update_selected_model(ui_components, config, model_selection_var, llm_feedback_box, button_functions))
 
+race_mode_checkbutton.config(command=lambda: update_race_mode(config, race_mode_var, button_functions))
+
 # Test Log Message
 button_functions.log_progress("Application started successfully.", level="INFO")
 
@@ -403,12 +495,44 @@ button_functions.log_progress("Application started successfully.", level="INFO")
 tk.Button(module_a_frame, text="Generate Code For Module A", command=lambda: button_functions.generate_code_for_module("module_a")).pack(pady=5)
 tk.Button(module_b_frame, text="Generate Code For Module B", command=lambda: button_functions.generate_code_for_module("module_b")).pack(pady=5)
 tk.Button(center_frame, text="Suggest Data Format", command=button_functions.suggest_data_format).pack(pady=5)
+tk.Button(center_frame, text="Compile Data Format", command=button_functions.compile_data_format).pack(pady=5)
 
 # Refine button using button_functions instance
 tk.Button(center_frame, text="Refine Last Generated Code", command=button_functions.refine_last_generated_code).pack(pady=5)
 
+# Batch regeneration of the whole sensor catalog through the offline batch endpoint
+tk.Button(center_frame, text="Batch Generate Sensor Catalog",
+          command=lambda: button_functions.batch_generate_catalog(sensor_data, config.get("batch", {}))).pack(pady=5)
+
+# One canonical data schema for the whole catalog, with per-sensor field maps written to sensors.json
+tk.Button(center_frame, text="Synthesize Unified Data Schema",
+          command=lambda: button_functions.synthesize_catalog_schema(sensor_data)).pack(pady=5)
+
+tk.Button(center_frame, text="Show API Key Statistics", command=button_functions.show_api_key_statistics).pack(pady=5)
+tk.Button(center_frame, text="Show Race Statistics", command=button_functions.show_race_statistics).pack(pady=5)
+tk.Button(center_frame, text="Show Token Usage", command=button_functions.show_usage_report).pack(pady=5)
+
 # Add Board button configuration
 add_board_button.config(command=add_new_board)
 
+# Debug menu for the opt-in profiling mode (also enabled with GATEWAY_PROFILE=1)
+profiler = Profiler()
+button_functions.profiler = profiler
+profiling_var = tk.BooleanVar(value=False)
+menu_bar = tk.Menu(root)
+debug_menu = tk.Menu(menu_bar, tearoff=0)
+debug_menu.add_checkbutton(label="Profiling", variable=profiling_var,
+                           command=lambda: toggle_profiling(profiling_var, profiler, button_functions))
+debug_menu.add_command(label="Dump Profile Now", command=lambda: dump_profile(profiler, button_functions))
+menu_bar.add_cascade(label="Debug", menu=debug_menu)
+root.config(menu=menu_bar)
+
+if profiling_requested():
+    profiling_var.set(True)
+    toggle_profiling(profiling_var, profiler, button_functions)
+
 # Run the application
 root.mainloop()
+
+if profiler.enabled:
+    profiler.disable()
@@ -0,0 +1,164 @@
+# model_race.py
+
+import json
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+RACE_STATS_FILE = "race_stats.json"
+MAX_LATENCY_SAMPLES = 200  # Latencies kept per model for the percentile statistics
+
+
+def is_valid_result(result, module_name):
+    """
+    Basic structural checks for a generation result.
+    :param result: Dictionary returned by generate_code_with_explanation.
+    :param module_name: 'module_a', 'module_b' or 'data_format'.
+    :return: True if the result can be shown to the user.
+    """
+    if not isinstance(result, dict) or "error" in result:
+        return False
+    code = (result.get("code") or "").strip()
+    explanation = (result.get("explanation") or "").strip()
+    if not code or code == "No code provided." or not explanation:
+        return False
+    if module_name in ("module_a", "module_b"):
+        return "AnttiGateway.h" in code and "setup(" in code and "loop(" in code
+    return True
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class ModelRacer:
+    def __init__(self, apis, stats_file=RACE_STATS_FILE):
+        """
+        Send the same prompt to several models at once and keep the first valid answer.
+        :param apis: List of ChatGPTAPI instances, one per model taking part in the race.
+        :param stats_file: JSON file where per-model win rates and latencies are kept.
+        """
+        self.apis = apis
+        self.stats_file = stats_file
+        self.lock = threading.Lock()
+        self.stats = self._load_stats()
+
+    @property
+    def model(self):
+        """Models taking part, so callers can check a model is selected like with ChatGPTAPI."""
+        return ", ".join(api.model for api in self.apis)
+
+    def _load_stats(self):
+        if os.path.exists(self.stats_file):
+            try:
+                with open(self.stats_file, "r") as f:
+                    return json.load(f)
+            except (OSError, json.JSONDecodeError):
+                pass
+        return {}
+
+    def _save_stats(self):
+        with open(self.stats_file, "w") as f:
+            json.dump(self.stats, f, indent=4)
+
+    def _record(self, model, latency, valid, won):
+        entry = self.stats.setdefault(model, {"races": 0, "wins": 0, "invalid": 0, "latencies": []})
+        entry["races"] += 1
+        entry["wins"] += int(won)
+        entry["invalid"] += int(not valid)
+        if latency is not None:
+            entry["latencies"] = (entry["latencies"] + [round(latency, 3)])[-MAX_LATENCY_SAMPLES:]
+
+    def race(self, prompt, module_name, on_result=None):
+        """
+        Run the race.
+        :param on_result: Optional callable receiving every result, including the ones that arrive after
+                          the race ended (used for token accounting: abandoned requests are billed too).
+        :return: (result, winning model). If no model produces a valid answer the first
+                 answer received is returned so the error is still shown to the user.
+        """
+        executor = ThreadPoolExecutor(max_workers=len(self.apis))
+        start = time.monotonic()
+        futures = {executor.submit(api.generate_code_with_explanation, prompt): api.model for api in self.apis}
+
+        winner = None
+        first_result = None
+        finished = set()
+        try:
+            for future in as_completed(futures):
+                model = futures[future]
+                finished.add(model)
+                latency = time.monotonic() - start
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"error": str(e), "raw_response": ""}
+                if on_result:
+                    on_result(result)
+                valid = is_valid_result(result, module_name)
+                with self.lock:
+                    self._record(model, latency, valid, valid and winner is None)
+                if first_result is None:
+                    first_result = (result, model)
+                if valid:
+                    winner = (result, model)
+                    break
+        finally:
+            # Requests that have not started are cancelled. The ones in flight are abandoned, but their
+            # real latency is recorded when they finish, so the slow tail stays in the percentiles.
+            for future, model in futures.items():
+                if model not in finished:
+                    future.add_done_callback(
+                        lambda future, model=model: self._record_late(future, model, start, module_name,
+                                                                      on_result))
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        with self.lock:
+            self._save_stats()
+        return winner or first_result
+
+    def _record_late(self, future, model, start, module_name, on_result=None):
+        """Done-callback of a request the race no longer waits for."""
+        if future.cancelled():
+            latency, valid = None, True
+        else:
+            latency = time.monotonic() - start
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": str(e), "raw_response": ""}
+            valid = is_valid_result(result, module_name)
+            if on_result:
+                on_result(result)
+        with self.lock:
+            self._record(model, latency, valid, False)
+            self._save_stats()
+
+    def report(self):
+        """Per-model win rate and latency percentiles as a list of dictionaries."""
+        with self.lock:
+            rows = []
+            for model, entry in self.stats.items():
+                latencies = entry["latencies"]
+                rows.append({
+                    "model": model,
+                    "races": entry["races"],
+                    "win_rate": round(entry["wins"] / entry["races"], 3) if entry["races"] else 0.0,
+                    "invalid": entry["invalid"],
+                    "p50_latency_s": _percentile(latencies, 0.5),
+                    "p95_latency_s": _percentile(latencies, 0.95)
+                })
+            return sorted(rows, key=lambda row: row["win_rate"], reverse=True)
+
+    def format_report(self):
+        """Human readable version of report()."""
+        return "\n".join(
+            f"{row['model']}: won {row['win_rate'] * 100:.0f}% of {row['races']} races, "
+            f"p50 {row['p50_latency_s']} s, p95 {row['p95_latency_s']} s, {row['invalid']} invalid"
+            for row in self.report()
+        )
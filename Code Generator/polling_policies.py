@@ -0,0 +1,272 @@
+# polling_policies.py
+
+# Python reference of the Module B slave polling policies and a harness that scores them with
+# i2c_simulator.py. The shipped master loop picks random(0, slaveAddresses.size()) and keeps
+# polling that slave until it has a complete reading, so busy slaves overflow their RingBuffer
+# while idle slaves hold the bus. The policies mirror ADDITIONAL_INFO_POLLING_POLICY:
+#   round_robin       every slave in turn, give up on a slave after a bounded number of polls
+#   weighted          poll the slave with the largest estimated backlog; slaves announce the readings
+#                     left in their ring buffer ("Backlog") and busy slaves are drained several at a time
+#   adaptive_backoff  round robin that skips slaves which came back empty, with exponential backoff
+# Run: python polling_policies.py --rate 0.1 0.05 0.005 0.005 0.005 0.005 --duration 3600
+#      python polling_policies.py --capture load.ndjson     (per-slave traffic from load_generator.py)
+
+import argparse
+import json
+import math
+import random
+from chunk_codec import add_slave_id, total_chunks, MAX_CHUNK_SIZE_SLAVE, RING_BUFFER_SIZE
+from chunk_codec_benchmark import SAMPLE_PAYLOADS, print_table
+from i2c_simulator import GatewaySimulation
+
+FIRST_SLAVE_ADDRESS = 0x08
+
+
+class PollingPolicy:
+    name = ""
+
+    def __init__(self, addresses):
+        """
+        :param addresses: I2C addresses of the slaves (i2cMaster.slaveAddresses).
+        """
+        self.addresses = list(addresses)
+
+    def choose(self, now):
+        """Slave to poll in this master loop, or None to skip polling until the next loop."""
+        raise NotImplementedError
+
+    def readings_per_visit(self, address, now):
+        """Complete readings to fetch from the chosen slave before forwarding."""
+        return 1
+
+    def record(self, address, now, delivered, backlog=None):
+        """
+        Outcome of a visit.
+        :param delivered: Complete readings received.
+        :param backlog: "Backlog" announced with the last reading (None if not announced).
+        """
+
+
+class RandomPolicy(PollingPolicy):
+    name = "random"
+
+    def __init__(self, addresses, rng=None):
+        """Selection of the example sketches: a random slave every loop."""
+        super().__init__(addresses)
+        self.rng = rng or random.Random(1)
+
+    def choose(self, now):
+        return self.rng.choice(self.addresses)
+
+
+class RoundRobinPolicy(PollingPolicy):
+    name = "round_robin"
+
+    def __init__(self, addresses):
+        super().__init__(addresses)
+        self.next_index = 0
+
+    def choose(self, now):
+        address = self.addresses[self.next_index]
+        self.next_index = (self.next_index + 1) % len(self.addresses)
+        return address
+
+
+class BacklogWeightedPolicy(PollingPolicy):
+    name = "weighted"
+
+    def __init__(self, addresses, drain_max=4, max_interval=60.0, min_expected=0.5, smoothing=0.3):
+        """
+        :param drain_max: Most readings fetched from one slave per visit.
+        :param max_interval: Visit every slave at least this often (seconds), whatever its estimate.
+        :param min_expected: Skip the loop when no slave is expected to hold this many readings.
+        :param smoothing: Weight of the newest observation in the arrival rate estimate.
+        """
+        super().__init__(addresses)
+        self.drain_max = drain_max
+        self.max_interval = max_interval
+        self.min_expected = min_expected
+        self.smoothing = smoothing
+        self.remaining = {address: 0 for address in self.addresses}
+        self.rate = {address: 0.0 for address in self.addresses}
+        self.last_visit = {address: None for address in self.addresses}
+
+    def estimate(self, address, now):
+        """Readings expected in the slave's ring buffer: the last announced backlog plus arrivals since."""
+        last = self.last_visit[address]
+        if last is None:
+            return math.inf
+        expected = self.remaining[address] + self.rate[address] * (now - last)
+        if now - last >= self.max_interval:
+            expected = max(expected, 1.0)
+        return expected
+
+    def choose(self, now):
+        # Largest estimate first, the longest unvisited slave on ties
+        best = max(self.addresses, key=lambda address: (self.estimate(address, now),
+                                                        -(self.last_visit[address] or 0.0)))
+        return best if self.estimate(best, now) >= self.min_expected else None
+
+    def readings_per_visit(self, address, now):
+        expected = self.estimate(address, now)
+        return self.drain_max if expected == math.inf else max(1, min(self.drain_max, math.ceil(expected)))
+
+    def record(self, address, now, delivered, backlog=None):
+        previous = self.remaining[address]
+        if not delivered:
+            remaining = 0
+        elif backlog is not None:
+            remaining = backlog
+        else:
+            remaining = max(0, round(self.estimate(address, now)) - delivered)
+        last = self.last_visit[address]
+        if last is not None and now > last:
+            arrivals = max(0, remaining - previous + delivered)
+            self.rate[address] += self.smoothing * (arrivals / (now - last) - self.rate[address])
+        self.remaining[address] = remaining
+        self.last_visit[address] = now
+
+
+class AdaptiveBackoffPolicy(PollingPolicy):
+    name = "adaptive_backoff"
+
+    def __init__(self, addresses, backoff_min=30.0, backoff_max=300.0):
+        """
+        :param backoff_min: Pause after the first empty visit (seconds); doubled after every further one.
+        :param backoff_max: Longest pause (seconds); a slave with a full ring buffer (9 readings) must
+                            not fill up faster than this.
+        """
+        super().__init__(addresses)
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.backoff = {address: 0.0 for address in self.addresses}
+        self.next_poll = {address: 0.0 for address in self.addresses}
+        self.next_index = 0
+
+    def choose(self, now):
+        for offset in range(len(self.addresses)):
+            index = (self.next_index + offset) % len(self.addresses)
+            address = self.addresses[index]
+            if self.next_poll[address] <= now:
+                self.next_index = (index + 1) % len(self.addresses)
+                return address
+        return None
+
+    def record(self, address, now, delivered, backlog=None):
+        if delivered:
+            self.backoff[address] = 0.0
+        elif self.backoff[address]:
+            self.backoff[address] = min(self.backoff[address] * 2, self.backoff_max)
+        else:
+            self.backoff[address] = self.backoff_min
+        self.next_poll[address] = now + self.backoff[address]
+
+
+POLICIES = {
+    "random": RandomPolicy,
+    "round_robin": RoundRobinPolicy,
+    "weighted": BacklogWeightedPolicy,
+    "adaptive_backoff": AdaptiveBackoffPolicy
+}
+
+
+def make_policy(name, addresses, seed=1):
+    if name not in POLICIES:
+        raise ValueError(f"Unknown polling policy '{name}'.")
+    if name == "random":
+        return RandomPolicy(addresses, random.Random(seed))
+    return POLICIES[name](addresses)
+
+
+def polls_per_reading(payloads, chunk_size=MAX_CHUNK_SIZE_SLAVE):
+    """
+    Requests a visit may take before the slave is given up (MAX_POLLS_PER_VISIT): the refill request,
+    one per chunk of the largest reading and one spare. Giving up mid-reading would leave partial
+    data in the master's shared reassembly buffer.
+    """
+    largest = max(len(add_slave_id(dict(payload, Backlog=RING_BUFFER_SIZE), 0x77)) for payload in payloads)
+    return total_chunks(int(largest * 1.1), chunk_size) + 3
+
+
+def load_traffic(path):
+    """
+    Per-slave production times from an NDJSON capture: load_generator.py raw output ({"t", "slave",
+    "body"}) or uplink captures ({"t", "body"} with a SlaveID in the body).
+    :return: (list of arrival time lists, list of example payloads, duration).
+    """
+    arrivals, payloads = {}, {}
+    last = 0.0
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            body = record.get("body", {})
+            slave = record.get("slave", body.get("SlaveID") if isinstance(body, dict) else None)
+            if slave is None or "t" not in record:
+                continue
+            arrivals.setdefault(slave, []).append(float(record["t"]))
+            if isinstance(body, dict):
+                payloads.setdefault(slave, {key: value for key, value in body.items() if key != "SlaveID"})
+            last = max(last, float(record["t"]))
+    slaves = sorted(arrivals)
+    return [sorted(arrivals[slave]) for slave in slaves], [payloads.get(slave, {}) for slave in slaves], last
+
+
+def score_policies(policies, rates=None, arrivals=None, payloads=None, duration=3600.0, seed=1, max_polls=None,
+                   **simulation_options):
+    """
+    Run the same traffic under every policy.
+    :param rates: Readings per second per slave (synthetic Poisson traffic).
+    :param arrivals: Production times per slave (replayed traffic); overrides rates.
+    :param max_polls: Requests per visit before giving up; defaults to polls_per_reading(). The random
+                      policy keeps polling like the shipped sketch.
+    :return: List of report dictionaries from GatewaySimulation.report().
+    """
+    if arrivals is not None:
+        rates = [len(times) / duration if duration else 0.0 for times in arrivals]
+    samples = list(SAMPLE_PAYLOADS.values())
+    payloads = payloads or [samples[i % len(samples)] for i in range(len(rates))]
+    max_polls = max_polls or polls_per_reading(payloads)
+    addresses = [FIRST_SLAVE_ADDRESS + i for i in range(len(rates))]
+    reports = []
+    for name in policies:
+        simulation = GatewaySimulation(rates, payloads=payloads, seed=seed, arrivals=arrivals,
+                                       policy=make_policy(name, addresses, seed),
+                                       max_polls=None if name == "random" else max_polls,
+                                       announce_backlog=name == "weighted", **simulation_options)
+        reports.append(simulation.run(duration))
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score Module B slave polling policies on simulated traffic.")
+    parser.add_argument("--rate", type=float, nargs="+", default=[0.1, 0.05, 0.005, 0.005, 0.005, 0.005, 0.005, 0.005],
+                        help="Readings per second, one value per slave (a mixed-rate fleet by default).")
+    parser.add_argument("--capture", help="Replay per-slave traffic from an NDJSON capture instead.")
+    parser.add_argument("--policy", action="append", choices=list(POLICIES), help="Policy to score (repeatable).")
+    parser.add_argument("--duration", type=float, default=None, help="Simulated seconds (default 3600 or capture).")
+    parser.add_argument("--loop-delay", type=float, default=2.0, help="Master loop delay in seconds.")
+    parser.add_argument("--poll-delay", type=float, default=1.0, help="Delay between polls in seconds.")
+    parser.add_argument("--max-polls", type=int, default=None, help="Requests per visit before giving up.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed.")
+    parser.add_argument("--json", action="store_true", help="Print the full reports as JSON.")
+    args = parser.parse_args()
+
+    arrivals = payloads = None
+    duration = args.duration or 3600.0
+    if args.capture:
+        arrivals, payloads, last = load_traffic(args.capture)
+        duration = args.duration or last
+    reports = score_policies(args.policy or list(POLICIES), rates=args.rate, arrivals=arrivals, payloads=payloads,
+                             duration=duration, seed=args.seed, max_polls=args.max_polls,
+                             loop_delay=args.loop_delay, poll_delay=args.poll_delay)
+    if args.json:
+        print(json.dumps(reports, indent=4))
+        return
+    print_table([{key: report[key] for key in ("policy", "produced", "delivered", "drop_rate", "empty_polls",
+                                                "useful_bus_fraction", "latency_p95_s")} for report in reports])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+# profiling.py
+
+import os
+import sys
+import time
+import cProfile
+import datetime
+import logging
+import threading
+import tracemalloc
+import traceback
+import tkinter as tk
+from collections import Counter
+
+PROFILE_ENV_VAR = "GATEWAY_PROFILE"  # Set to 1 to start the application with profiling enabled
+PROFILE_DIR = "profiles"
+STALL_THRESHOLD_MS = 100  # UI callbacks or event loop gaps longer than this are logged
+SAMPLE_INTERVAL_MS = 5  # Stack sampling interval for the flame graph output
+HEARTBEAT_INTERVAL_MS = 20
+
+
+def profiling_requested():
+    """True if profiling was requested through the GATEWAY_PROFILE environment variable."""
+    return os.environ.get(PROFILE_ENV_VAR, "").lower() in ("1", "true", "yes", "on")
+
+
+def _start_profile(profile):
+    """
+    Enable a cProfile.Profile. From Python 3.12 on only one profiler can be active in the process
+    (they share sys.monitoring), so a second one raises ValueError; the stack sampler still covers it.
+    :return: True if the profile was enabled.
+    """
+    try:
+        profile.enable()
+        return True
+    except ValueError:
+        return False
+
+
+def _callback_name(func):
+    """Readable name for a Tk callback. after() wraps the real function in a closure called 'callit'."""
+    if getattr(func, "__name__", "") == "callit" and func.__closure__:
+        for cell in func.__closure__:
+            if callable(cell.cell_contents):
+                func = cell.cell_contents
+                break
+    name = getattr(func, "__qualname__", None) or repr(func)
+    module = getattr(func, "__module__", "")
+    return f"{module}.{name}" if module else name
+
+
+class Profiler:
+    def __init__(self, output_dir=PROFILE_DIR, stall_threshold_ms=STALL_THRESHOLD_MS,
+                 sample_interval_ms=SAMPLE_INTERVAL_MS):
+        """
+        Opt-in profiling for the Tk UI thread and ButtonFunctions worker threads.
+        - Every Tk callback is timed and profiled with cProfile; slow ones are logged.
+        - A watchdog thread detects event loop stalls and logs the UI thread's stack.
+        - A sampler thread collects stacks of all threads in folded format for flame graphs.
+        - tracemalloc records the top allocation sites.
+        :param output_dir: Directory where profile files are written.
+        :param stall_threshold_ms: Callbacks and event loop gaps longer than this are logged.
+        :param sample_interval_ms: Stack sampling interval.
+        """
+        self.output_dir = output_dir
+        self.stall_threshold = stall_threshold_ms / 1000.0
+        self.sample_interval = sample_interval_ms / 1000.0
+        self.enabled = False
+        self.logger = logging.getLogger("Profiler")
+
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.callback_times = {}  # callback name -> [calls, total seconds, max seconds]
+        self.stalls = []
+        self.worker_profiles = []
+        self.ui_profile = cProfile.Profile()
+        self._ui_depth = 0
+        self._ui_profiling = False
+        self._started_tracemalloc = False
+
+        self._root = None
+        self._original_call = None
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_heartbeat = time.monotonic()
+        self._main_thread_id = threading.main_thread().ident
+
+    # ------------------------------------------------ control ------------------------------------------------
+
+    def enable(self, root):
+        """Start profiling. Must be called from the Tk thread."""
+        if self.enabled:
+            return
+        self.enabled = True
+        self._root = root
+        self._stop.clear()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self._original_call = tk.CallWrapper.__call__
+        profiler = self
+        original_call = self._original_call
+
+        def profiled_call(wrapper, *args):
+            return profiler._run_ui_callback(original_call, wrapper, *args)
+
+        tk.CallWrapper.__call__ = profiled_call
+
+        # Tracing started by someone else is left alone, also when profiling stops
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start(10)
+
+        self._last_heartbeat = time.monotonic()
+        self._heartbeat()
+        self._threads = [
+            threading.Thread(target=self._watchdog, name="ProfilerWatchdog", daemon=True),
+            threading.Thread(target=self._sampler, name="ProfilerSampler", daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+        self.logger.info("Profiling enabled.")
+
+    def disable(self):
+        """Stop profiling and write the collected data to disk. Returns the written file paths."""
+        if not self.enabled:
+            return []
+        self.enabled = False
+        self._stop.set()
+        tk.CallWrapper.__call__ = self._original_call
+        for thread in self._threads:
+            thread.join(timeout=1)
+        paths = self.dump()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        self.logger.info("Profiling disabled.")
+        return paths
+
+    # ------------------------------------------------ UI thread ------------------------------------------------
+
+    def _run_ui_callback(self, original_call, wrapper, *args):
+        name = _callback_name(wrapper.func)
+        self._ui_depth += 1
+        if self._ui_depth == 1:
+            self._ui_profiling = _start_profile(self.ui_profile)
+        start = time.perf_counter()
+        try:
+            return original_call(wrapper, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if self._ui_depth == 1 and self._ui_profiling:
+                self.ui_profile.disable()
+                self._ui_profiling = False
+            self._ui_depth -= 1
+            with self.lock:
+                entry = self.callback_times.setdefault(name, [0, 0.0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] = max(entry[2], elapsed)
+            if elapsed >= self.stall_threshold:
+                self._log_stall(f"UI callback {name} took {elapsed * 1000:.0f} ms")
+
+    def _heartbeat(self):
+        if not self.enabled:
+            return
+        self._last_heartbeat = time.monotonic()
+        self._root.after(HEARTBEAT_INTERVAL_MS, self._heartbeat)
+
+    def _watchdog(self):
+        """Log the UI thread's stack when the event loop has not run for longer than the threshold."""
+        reported = False
+        while not self._stop.wait(self.stall_threshold / 2):
+            gap = time.monotonic() - self._last_heartbeat - HEARTBEAT_INTERVAL_MS / 1000.0
+            if gap >= self.stall_threshold and not reported:
+                frame = sys._current_frames().get(self._main_thread_id)
+                stack = "".join(traceback.format_stack(frame)) if frame else "(no stack)"
+                self._log_stall(f"Event loop stalled for {gap * 1000:.0f} ms so far. UI thread stack:\n{stack}")
+                reported = True
+            elif gap < self.stall_threshold:
+                reported = False
+
+    def _log_stall(self, message):
+        with self.lock:
+            self.stalls.append(f"[{datetime.datetime.now().strftime('%H:%M:%S.%f')[:-3]}] {message}")
+        self.logger.warning(message)
+        print(f"[PROFILE] {message}")
+
+    # ------------------------------------------------ sampling ------------------------------------------------
+
+    def _sampler(self):
+        """Sample the stacks of all threads and count them in folded (flame graph) format."""
+        own_threads = {thread.ident for thread in self._threads} | {threading.get_ident()}
+        names = {}
+        while not self._stop.wait(self.sample_interval):
+            frames = sys._current_frames()
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            with self.lock:
+                for thread_id, frame in frames.items():
+                    if thread_id in own_threads:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    # ------------------------------------------------ workers ------------------------------------------------
+
+    def wrap_worker(self, target, name):
+        """
+        Wrap a worker thread target so it runs under cProfile while profiling is enabled. When another
+        profiler is active (Python 3.12+ allows only one) the worker is only timed and sampled.
+        :param target: Function run by the worker thread.
+        :param name: Name used for the profile file.
+        """
+        def run(*args, **kwargs):
+            if not self.enabled:
+                return target(*args, **kwargs)
+            profile = cProfile.Profile()
+            start = time.perf_counter()
+            profiled = _start_profile(profile)
+            try:
+                return target(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                path = "(sampled only, another profiler was active)"
+                if profiled:
+                    profile.disable()
+                    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                    path = os.path.join(self.output_dir, f"worker_{name}_{stamp}.prof")
+                    profile.dump_stats(path)
+                with self.lock:
+                    self.worker_profiles.append((name, elapsed, path))
+                self.logger.info(f"Worker {name} ran {elapsed:.2f} s, profile: {path}")
+        return run
+
+    # ------------------------------------------------ output ------------------------------------------------
+
+    def dump(self):
+        """
+        Write the collected data:
+        - stacks_*.folded: sampled stacks, input for flamegraph.pl or speedscope
+        - ui_callbacks_*.prof: cProfile stats of all Tk callbacks (pstats / snakeviz)
+        - report_*.txt: slowest callbacks, stalls, worker timings and top allocations
+        :return: List of written file paths.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        folded_path = os.path.join(self.output_dir, f"stacks_{stamp}.folded")
+        prof_path = os.path.join(self.output_dir, f"ui_callbacks_{stamp}.prof")
+        report_path = os.path.join(self.output_dir, f"report_{stamp}.txt")
+
+        with self.lock:
+            with open(folded_path, "w", encoding="utf-8") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+            lines = ["Slowest UI callbacks (calls, total ms, max ms):"]
+            for name, (calls, total, longest) in sorted(self.callback_times.items(),
+                                                         key=lambda item: -item[1][2])[:30]:
+                lines.append(f"  {name}: {calls}, {total * 1000:.1f}, {longest * 1000:.1f}")
+            lines.append(f"\nStalls over {self.stall_threshold * 1000:.0f} ms: {len(self.stalls)}")
+            lines.extend(f"  {stall}" for stall in self.stalls)
+            lines.append("\nWorkers (name, seconds, profile):")
+            lines.extend(f"  {name}, {elapsed:.2f}, {path}" for name, elapsed, path in self.worker_profiles)
+
+        self.ui_profile.dump_stats(prof_path)
+
+        if tracemalloc.is_tracing():
+            lines.append("\nTop allocations:")
+            for stat in tracemalloc.take_snapshot().statistics("lineno")[:30]:
+                lines.append(f"  {stat}")
+
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return [folded_path, prof_path, report_path]
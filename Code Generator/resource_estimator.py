@@ -0,0 +1,688 @@
+# resource_estimator.py
+
+# Static memory and timing estimate of a generated sketch together with the AnttiGateway library,
+# checked against a per-board profile before the code is flashed. The sketch and the library sources
+# (AnttiGateway.h/.cpp, RingBuffer.h, SimpleQueue.h) are scanned for:
+#   static RAM   globals of the sketch, library statics reachable from it (completeData[MaxDataSize],
+#                RingBuffer<String, RingBufferSize>, SimpleQueue<String, SimpleQueueSize>), the core's
+#                buffers and, on AVR, string literals that are not wrapped in F()
+#   stack        worst call path from setup(), loop() and the I2C callbacks, with every StaticJsonDocument,
+#                local array and String counted in the frame of its function
+#   heap         String copies held by the ring buffer and the chunk queue, and the String allocations
+#                per reading (a char appended to a String in a loop reallocates it every byte)
+#   timing       I2C bus time, JSON parsing and Serial output per reading, and the delays of the loop
+# The figures are estimates from the source (no compiler involved); they are meant to catch output that
+# cannot fit, such as the library's 8 kB of buffers on a 2 kB Arduino Uno, before it is flashed.
+# Run: python resource_estimator.py module_b.ino --board "Arduino Uno" --sensor ruuvitag
+#      python resource_estimator.py module_a.ino --board "ESP32 Firebeetle" --json
+
+import argparse
+import ast
+import functools
+import json
+import operator
+import os
+import re
+from chunk_codec import encode_chunks, MAX_CHUNK_SIZE, MAX_CHUNK_SIZE_SLAVE, RING_BUFFER_SIZE, SIMPLE_QUEUE_SIZE, \
+    MAX_DATA_SIZE
+from format_compiler import compile_format, is_compiled, parse_format_text, size_report
+
+LIBRARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Arduino Libary", "AnttiGateway")
+LIBRARY_FILES = ("AnttiGateway.h", "AnttiGateway.cpp", "RingBuffer.h", "SimpleQueue.h")
+DEFAULT_READING_BYTES = 200  # Reading size when the data format is unknown
+JSON_CYCLES_PER_BYTE = 40  # ArduinoJson deserialisation, approximate
+STRING_APPEND_CYCLES = 200  # String += char: realloc and copy, approximate
+SERIAL_BYTES_PER_PRINT = 30  # Average Serial.print() of the sketch
+LOW_FREE_RAM = 0.15  # Warn below this share of free RAM
+MAX_SIZE_VALUE = 1 << 24  # Size expressions beyond 16 MB (more than any board's RAM) are not evaluated
+SIZE_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+                  ast.Div: lambda a, b: int(a / b), ast.LShift: operator.lshift, ast.RShift: operator.rshift}
+
+# Approximate per-board figures. core_static is RAM used by the core before the sketch (Serial and Wire
+# buffers, and the WiFi/BT stacks on the ESP boards); main_stack is the loop task stack where it is
+# fixed (None: stack and heap share the free RAM, as on AVR).
+BOARD_PROFILES = {
+    "Arduino Uno": {"mcu": "ATmega328P", "ram": 2048, "cpu_mhz": 16, "pointer": 2, "int": 2, "double": 4,
+                    "string_object": 6, "heap_overhead": 2, "core_static": 370, "main_stack": None,
+                    "callback_stack": None, "callbacks_on_main_stack": True, "wire_buffer": 32,
+                    "literals_in_ram": True, "std_vector": False},
+    "Arduino Mega 2560": {"mcu": "ATmega2560", "ram": 8192, "cpu_mhz": 16, "pointer": 2, "int": 2, "double": 4,
+                          "string_object": 6, "heap_overhead": 2, "core_static": 370, "main_stack": None,
+                          "callback_stack": None, "callbacks_on_main_stack": True, "wire_buffer": 32,
+                          "literals_in_ram": True, "std_vector": False},
+    "ESP8266": {"mcu": "ESP8266", "ram": 81920, "cpu_mhz": 80, "pointer": 4, "int": 4, "double": 8,
+                "string_object": 12, "heap_overhead": 8, "core_static": 36000, "main_stack": 4096,
+                "callback_stack": None, "callbacks_on_main_stack": True, "wire_buffer": 128,
+                "literals_in_ram": True, "std_vector": True},
+    "ESP32": {"mcu": "ESP32", "ram": 327680, "cpu_mhz": 240, "pointer": 4, "int": 4, "double": 8,
+              "string_object": 16, "heap_overhead": 8, "core_static": 110000, "main_stack": 8192,
+              "callback_stack": 4096, "callbacks_on_main_stack": False, "wire_buffer": 128,
+              "literals_in_ram": False, "std_vector": True}
+}
+BOARD_ALIASES = [("firebeetle", "ESP32"), ("heltec", "ESP32"), ("esp32", "ESP32"), ("esp8266", "ESP8266"),
+                 ("nodemcu", "ESP8266"), ("wemos", "ESP8266"), ("mega", "Arduino Mega 2560"),
+                 ("uno", "Arduino Uno"), ("nano", "Arduino Uno")]
+
+# Stack used inside functions that are not in the sketch or the library (bytes on a 32-bit board)
+EXTERNAL_STACK = {"deserializeJson": 96, "serializeJson": 64, "printf": 256, "connect": 1024, "POST": 2048,
+                  "GET": 2048, "begin": 256, "publish": 512, "send": 512, "endPacket": 256}
+EXTERNAL_STACK_DEFAULT = 64
+FRAME_BASE = 8  # Saved registers and return address, in pointers
+
+KEYWORDS = {"if", "while", "for", "switch", "catch", "return", "sizeof", "else", "do", "case", "defined", "F",
+            "String", "StaticJsonDocument", "DynamicJsonDocument", "static_cast", "reinterpret_cast", "const_cast"}
+TYPE_SIZES = {"char": 1, "byte": 1, "uint8_t": 1, "int8_t": 1, "bool": 1, "boolean": 1, "int16_t": 2,
+              "uint16_t": 2, "short": 2, "uint32_t": 4, "int32_t": 4, "long": 4, "float": 4, "uint64_t": 8,
+              "int64_t": 8}
+SCALAR_TYPES = r"(?:unsigned\s+|signed\s+)?(?:char|byte|uint8_t|int8_t|bool|boolean|int16_t|uint16_t|short|int|" \
+               r"unsigned|uint32_t|int32_t|long|float|double|size_t|uint64_t|int64_t)"
+STRING_SITES = [r"\bString\s*\(", r"\bString\s+\w+\s*=", r"\.substring\s*\(", r"\.as<String>\s*\(",
+                r"\"\s*\+|\+\s*\"", r"\bserializeJson\s*\(\s*\w+\s*,\s*\w+\s*\)"]
+
+FUNCTION_HEAD = re.compile(r"([A-Za-z_][\w:~]*)\s*\(([^;{}]*)\)\s*(?:const\s*|override\s*|noexcept\s*)*"
+                           r"(?::[^;{}]*)?$")
+CALLBACK = re.compile(r"\b(?:onRequest|onReceive)\s*\(\s*&?(\w+)\s*\)|\battachInterrupt\s*\([^,]+,\s*&?(\w+)")
+
+
+def board_profile(board):
+    """:return: (profile name, profile dictionary), or (None, None) for an unknown board."""
+    if board in BOARD_PROFILES:
+        return board, BOARD_PROFILES[board]
+    lowered = (board or "").lower()
+    for fragment, name in BOARD_ALIASES:
+        if fragment in lowered:
+            return name, BOARD_PROFILES[name]
+    return None, None
+
+
+def reading_bytes_for_format(data_format):
+    """Worst-case serialized reading (with SlaveID) for a data format text or dictionary."""
+    try:
+        parsed = parse_format_text(data_format) if isinstance(data_format, str) else data_format
+        if not isinstance(parsed, dict) or not parsed:
+            return DEFAULT_READING_BYTES
+        if is_compiled(parsed):
+            return size_report(parsed)["worst_case"]["compact"]["reading_bytes"]
+        return size_report(compile_format(parsed))["worst_case"]["original"]["reading_bytes"]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return DEFAULT_READING_BYTES
+
+
+# ------------------------------------------------ source scanning ------------------------------------------------
+
+def strip_comments(source):
+    """Remove // and /* */ comments, keeping string and character literals intact."""
+    out = []
+    i, n = 0, len(source)
+    while i < n:
+        if source.startswith("//", i):
+            end = source.find("\n", i)
+            i = n if end < 0 else end
+        elif source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            out.append(" ")
+        elif source[i] in "\"'":
+            quote, j = source[i], i + 1
+            while j < n and source[j] != quote and source[j] != "\n":
+                j += 2 if source[j] == "\\" else 1
+            out.append(source[i:j + 1])
+            i = j + 1
+        else:
+            out.append(source[i])
+            i += 1
+    return "".join(out)
+
+
+def string_literals(code, literals_in_ram):
+    """Unique string literals that end up in RAM (all of them unless wrapped in F() or PROGMEM)."""
+    if not literals_in_ram:
+        return set()
+    literals = set()
+    for match in re.finditer(r"(F\(\s*|PROGMEM[^;\"]*)?\"((?:[^\"\\\n]|\\.)*)\"", code):
+        if match.group(1) is None and not code[:match.start()].rstrip().endswith("#include"):
+            literals.add(match.group(2))
+    return literals
+
+
+def _blank_literals(code):
+    code = re.sub(r"\"(?:[^\"\\\n]|\\.)*\"", '""', code)
+    code = re.sub(r"'(?:[^'\\\n]|\\.)'", "' '", code)
+    return "\n".join("" if line.lstrip().startswith("#") else line for line in code.split("\n"))
+
+
+def _matching_brace(code, start):
+    depth = 0
+    for i in range(start, len(code)):
+        if code[i] == "{":
+            depth += 1
+        elif code[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(code) - 1
+
+
+def split_functions(code):
+    """
+    Function bodies at any nesting level outside other functions (methods of classes included).
+    :param code: Source without comments.
+    :return: ({name: [(parameters, body), ...]}, text outside all blocks, i.e. the global declarations).
+    """
+    code = _blank_literals(code)
+    functions, global_text = {}, []
+    depth, segment_start, i = 0, 0, 0
+    while i < len(code):
+        char = code[i]
+        if char == "{":
+            head = FUNCTION_HEAD.search(code[segment_start:i])
+            name = head.group(1).split("::")[-1] if head else None
+            if name and name not in KEYWORDS:
+                end = _matching_brace(code, i)
+                functions.setdefault(name, []).append((head.group(2), code[i + 1:end]))
+                if depth == 0:
+                    del global_text[len(global_text) - (i - segment_start):]  # The function head
+                    global_text.append(";")
+                i = segment_start = end + 1
+                continue
+            depth += 1
+            segment_start = i + 1
+        elif char == "}":
+            depth = max(depth - 1, 0)
+            segment_start = i + 1
+        elif char == ";":
+            segment_start = i + 1
+        if depth == 0 and char not in "{}":
+            global_text.append(char)
+        i += 1
+    return functions, "".join(global_text)
+
+
+def evaluate_size(expression, constants):
+    """
+    Value of a size expression such as 'JsonDocumentSize+100' (None if it cannot be evaluated).
+    Only integer literals, parentheses and + - * / << >> are accepted, and every intermediate value must
+    stay within MAX_SIZE_VALUE, so a sketch cannot make the estimate hang on a huge expression.
+    """
+    text = re.sub(r"[A-Za-z_]\w*", lambda m: str(constants.get(m.group(0), "?")), expression)
+    try:
+        return _evaluate_size_node(ast.parse(text.strip(), mode="eval").body)
+    except (SyntaxError, ValueError, ZeroDivisionError, RecursionError):
+        return None
+
+
+def _evaluate_size_node(node):
+    if isinstance(node, ast.Constant) and type(node.value) is int:
+        value = node.value
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        value = _evaluate_size_node(node.operand)
+        value = -value if isinstance(node.op, ast.USub) else value
+    elif isinstance(node, ast.BinOp) and type(node.op) in SIZE_OPERATORS:
+        left, right = _evaluate_size_node(node.left), _evaluate_size_node(node.right)
+        if isinstance(node.op, (ast.LShift, ast.RShift)) and not 0 <= right < 64:
+            raise ValueError("Shift count out of range")
+        value = SIZE_OPERATORS[type(node.op)](left, right)
+    else:
+        raise ValueError(f"Unsupported size expression: {ast.dump(node)}")
+    if abs(value) > MAX_SIZE_VALUE:
+        raise ValueError("Size expression too large")
+    return value
+
+
+def _type_size(type_name, profile):
+    type_name = type_name.replace("unsigned", "").replace("signed", "").strip() or "int"
+    if type_name in ("int", "size_t"):
+        return profile["int"] if type_name == "int" else profile["pointer"]
+    if type_name == "double":
+        return profile["double"]
+    if type_name == "String":
+        return profile["string_object"]
+    return TYPE_SIZES.get(type_name, profile["pointer"])
+
+
+class FunctionInfo:
+    def __init__(self, name, parameters, body, constants, profile, source):
+        """
+        Stack frame, calls, delays and String allocation sites of one function body.
+        :param source: 'sketch' or 'library'.
+        """
+        self.name = name
+        self.source = source
+        self.body = body
+        self.frame = FRAME_BASE * profile["pointer"]
+        self.frame_items = []
+        self.static_items = []
+        self.heap_transient = 0
+        self.unknown_sizes = []
+
+        for match in re.finditer(r"(static\s+)?StaticJsonDocument\s*<([^>]+)>\s*(\w+)", body):
+            self._add(match.group(3), evaluate_size(match.group(2), constants), bool(match.group(1)),
+                      f"StaticJsonDocument<{match.group(2).strip()}>")
+        for match in re.finditer(r"(static\s+)?(?:const\s+)?(" + SCALAR_TYPES + r")\s+(\w+)\s*\[\s*([^\]]+)\]", body):
+            count = evaluate_size(match.group(4), constants)
+            size = None if count is None else count * _type_size(match.group(2), profile)
+            self._add(match.group(3), size, bool(match.group(1)), f"{match.group(2)}[{match.group(4).strip()}]")
+        for match in re.finditer(r"(static\s+)?\bString\s+(\w+)\s*(?=[=;(),])", body):
+            self._add(match.group(2), profile["string_object"], bool(match.group(1)), "String")
+        for match in re.finditer(r"\bString\s+(\w+)\s*(?:,|$)", parameters):
+            self._add(match.group(1), profile["string_object"], False, "String parameter")
+        for match in re.finditer(r"DynamicJsonDocument\s+\w+\s*\(\s*([^)]+)\)", body):
+            self.heap_transient += evaluate_size(match.group(1), constants) or 0
+
+        self.calls = set()
+        for match in re.finditer(r"\b([A-Za-z_]\w*)\s*\(", body):
+            if match.group(1) not in KEYWORDS and match.group(1) not in TYPE_SIZES:
+                self.calls.add(match.group(1))
+        self.delays = [int(value) for value in re.findall(r"\bdelay\s*\(\s*(\d+)\s*\)", body)]
+        self.chunk_loop_delays = []  # Delays in a loop that also polls for chunks (run once per chunk)
+        for loop in re.finditer(r"\bwhile\s*\([^{;]*\)\s*\{", body):
+            block = body[loop.end():_matching_brace(body, loop.end() - 1)]
+            if "receiveData" in block:
+                self.chunk_loop_delays += [int(value) for value in re.findall(r"\bdelay\s*\(\s*(\d+)\s*\)", block)]
+        self.serial_prints = len(re.findall(r"\bSerial\.(?:print|println|printf|write)\s*\(", body))
+        self.string_sites = sum(len(re.findall(pattern, body)) for pattern in STRING_SITES)
+        self.byte_appends = bool(re.search(r"while\s*\(\s*Wire\.available\s*\(\s*\)\s*\)", body)
+                                 and re.search(r"\w+\s*\+=\s*\w+", body))
+
+    def _add(self, name, size, is_static, description):
+        if size is None:
+            self.unknown_sizes.append(f"{description} in {self.name}()")
+            return
+        target = self.static_items if is_static else self.frame_items
+        target.append((f"{self.name}(): {name} ({description})", size))
+        if not is_static:
+            self.frame += size
+
+
+def global_items(global_text, constants, profile, source):
+    """:return: List of (name, description, bytes) for the global variables in declaration text."""
+    items = []
+    for statement in global_text.split(";"):
+        statement = " ".join(statement.replace("extern", " ").split())
+        if not statement or statement.startswith(("class ", "struct ", "using ", "typedef ", "template", "enum ")):
+            continue
+        for pattern, size_of in (
+                (r"RingBuffer\s*<\s*([\w:]+)\s*,\s*([^>]+)>\s+([\w:]+)$",
+                 lambda m: _count(m.group(2), constants) * _type_size(m.group(1), profile)
+                 + 2 * profile["pointer"] + 1),
+                (r"SimpleQueue\s*<\s*([\w:]+)\s*,\s*([^>]+)>\s+([\w:]+)$",
+                 lambda m: _count(m.group(2), constants) * _type_size(m.group(1), profile) + 3 * profile["int"]),
+                (r"StaticJsonDocument\s*<\s*()([^>]+)>\s+([\w:]+)$", lambda m: _count(m.group(2), constants)),
+                (r"(" + SCALAR_TYPES + r")\s+()([\w:]+)\s*\[\s*([^\]]+)\]",
+                 lambda m: _count(m.group(4), constants) * _type_size(m.group(1), profile)),
+                (r"std::vector\s*<[^>]*>()()\s+([\w:]+)$", lambda m: 3 * profile["pointer"]),
+                (r"(AnttiGateway)()\s+([\w:]+)\s*(?:\(.*\))?$", lambda m: 3 * profile["pointer"] + 2),
+                (r"^(?:static\s+)?(?:volatile\s+)?()()String\s+([\w:]+)", lambda m: profile["string_object"]),
+                (r"^(?:static\s+)?(?:volatile\s+)?(" + SCALAR_TYPES + r")()\s+([\w:]+)\s*(?:=.*)?$",
+                 lambda m: _type_size(m.group(1), profile)),
+                (r"^(?:static\s+)?(?:const\s+)?[\w:]+\s*\*\s*(?:const\s+)?()()([\w:]+)\s*(?:=.*)?$",
+                 lambda m: profile["pointer"])):
+            match = re.search(pattern, statement)
+            if match:
+                size = size_of(match)
+                if size:
+                    items.append((match.group(3).split("::")[-1], statement[:80], size, source))
+                break
+    return items
+
+
+def _count(expression, constants):
+    return evaluate_size(expression, constants) or 0
+
+
+@functools.lru_cache(maxsize=4)
+def load_library(library_dir=LIBRARY_DIR):
+    """
+    Library constants, functions and statics.
+    :return: (constants, {name: [(parameters, body)]}, global declaration text, AnttiGateway.cpp source);
+             the source is empty when the library is missing.
+    """
+    sources = {}
+    for file_name in LIBRARY_FILES:
+        path = os.path.join(library_dir, file_name)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                sources[file_name] = strip_comments(f.read())
+    constants = {"RingBufferSize": RING_BUFFER_SIZE, "SimpleQueueSize": SIMPLE_QUEUE_SIZE,
+                 "MaxChunkSizeSlave": MAX_CHUNK_SIZE_SLAVE, "MaxChunkSize": MAX_CHUNK_SIZE,
+                 "MaxDataSize": MAX_DATA_SIZE, "JsonDocumentSize": 1500}
+    for match in re.finditer(r"constexpr\s+[\w:]+\s+(\w+)\s*=\s*(\d+)", sources.get("AnttiGateway.h", "")):
+        constants[match.group(1)] = int(match.group(2))
+    functions, global_text = {}, ""
+    for file_name in ("AnttiGateway.cpp", "RingBuffer.h", "SimpleQueue.h"):
+        if file_name in sources:
+            file_functions, file_globals = split_functions(sources[file_name])
+            for name, bodies in file_functions.items():
+                functions.setdefault(name, []).extend(bodies)
+            if file_name == "AnttiGateway.cpp":
+                global_text = file_globals
+    return constants, functions, global_text, sources.get("AnttiGateway.cpp", "")
+
+
+# ------------------------------------------------ estimate ------------------------------------------------
+
+def _worst_stack(name, functions, profile, visiting=()):
+    """:return: (bytes, call path) of the deepest call chain starting at name."""
+    infos = functions.get(name)
+    if not infos:
+        allowance = EXTERNAL_STACK.get(name, EXTERNAL_STACK_DEFAULT)
+        return allowance * profile["pointer"] // 4, [name]
+    best, best_path = 0, []
+    for info in infos:
+        for callee in info.calls:
+            if callee in visiting or callee == name:
+                continue
+            depth, path = _worst_stack(callee, functions, profile, visiting + (name,))
+            if depth > best:
+                best, best_path = depth, path
+    frame = max(info.frame for info in infos)
+    return frame + best, [name] + best_path
+
+
+def _reachable(roots, functions):
+    seen, pending = set(), list(roots)
+    while pending:
+        name = pending.pop()
+        if name in seen or name not in functions:
+            continue
+        seen.add(name)
+        for info in functions[name]:
+            pending.extend(info.calls)
+    return seen
+
+
+def _timing(role, reachable, functions, profile, constants, reading_bytes, clock, baud):
+    frames = encode_chunks(b"x" * reading_bytes, constants["MaxChunkSizeSlave"])
+    chunks = len(frames)
+    frame_bytes = sum(len(frame) for frame in frames)
+    requested = min(constants["MaxChunkSize"], profile["wire_buffer"])
+    bus_s = (chunks + 1) * (1 + requested) * 9 / clock
+    sketch = [info for name in reachable for info in functions[name] if info.source == "sketch"]
+    if role == "slave":
+        # requestEvent prints the queue state and the chunk on every request, in the I2C callback; the
+        # loop's delays do not limit the slave, its readings come from the sensor
+        serial_bytes = chunks * 120 + frame_bytes + reading_bytes * 2
+        cpu_cycles = reading_bytes * JSON_CYCLES_PER_BYTE * 2 + frame_bytes * JSON_CYCLES_PER_BYTE
+        sketch = [info for info in sketch if info.name != "loop"]
+    else:
+        serial_bytes = frame_bytes + chunks * 20 + reading_bytes * 2 + 60
+        cpu_cycles = frame_bytes * (3 * JSON_CYCLES_PER_BYTE + STRING_APPEND_CYCLES)
+        cpu_cycles += reading_bytes * JSON_CYCLES_PER_BYTE * sum(
+            len(re.findall(r"\bdeserializeJson\s*\(", info.body)) for info in sketch)
+    serial_bytes += SERIAL_BYTES_PER_PRINT * sum(info.serial_prints for info in sketch)
+    loop_delay_ms = sum(sum(info.delays) - sum(info.chunk_loop_delays) for info in sketch)
+    chunk_delay_ms = sum(sum(info.chunk_loop_delays) for info in sketch) * chunks
+    timing = {
+        "i2c_clock_hz": clock,
+        "chunks_per_reading": chunks,
+        "i2c_requests_per_reading": chunks + 1,
+        "bus_ms": round(bus_s * 1000, 2),
+        "json_cpu_ms": round(cpu_cycles / (profile["cpu_mhz"] * 1e6) * 1000, 2),
+        "serial_ms": round(serial_bytes / (baud / 10) * 1000, 2),
+        "delay_ms": loop_delay_ms + chunk_delay_ms
+    }
+    total_ms = timing["bus_ms"] + timing["json_cpu_ms"] + timing["serial_ms"] + timing["delay_ms"]
+    timing["ms_per_reading"] = round(total_ms, 1)
+    timing["readings_per_s"] = round(1000 / total_ms, 3) if total_ms else None
+    return timing
+
+
+def estimate_resources(code, board, reading_bytes=None, data_format=None, library_dir=LIBRARY_DIR):
+    """
+    Estimate static RAM, worst-case stack, heap and per-reading timing of a sketch on a board.
+    :param code: Sketch source.
+    :param board: Board name (config.json boards, or a BOARD_PROFILES name).
+    :param reading_bytes: Serialized reading size; derived from data_format when not given.
+    :param data_format: Data format text or dictionary of the readings.
+    :return: Report dictionary; "findings" lists {"severity", "message"} and "over_budget" is True when
+             the sketch cannot fit the board.
+    """
+    profile_name, profile = board_profile(board)
+    findings = []
+    if profile is None:
+        profile_name, profile = "ESP32", BOARD_PROFILES["ESP32"]
+        findings.append({"severity": "info", "message": f"Unknown board '{board}', estimated as an ESP32."})
+    if reading_bytes is None:
+        reading_bytes = reading_bytes_for_format(data_format) if data_format else DEFAULT_READING_BYTES
+
+    constants, library_functions, library_globals, library_source = load_library(library_dir)
+    library_found = bool(library_source)
+    constants = dict(constants)
+    sketch_code = strip_comments(code)
+    for match in re.finditer(r"^\s*#define\s+(\w+)\s+\(?\s*(\d+)\s*\)?\s*$", sketch_code, re.MULTILINE):
+        constants[match.group(1)] = int(match.group(2))
+    for match in re.finditer(r"\bconst(?:expr)?\s+(?:static\s+)?[\w:]+\s+(\w+)\s*=\s*(\d+)\s*;", sketch_code):
+        constants[match.group(1)] = int(match.group(2))
+
+    functions = {}
+    for name, bodies in library_functions.items():
+        functions[name] = [FunctionInfo(name, parameters, body, constants, profile, "library")
+                           for parameters, body in bodies]
+    sketch_functions, sketch_globals = split_functions(sketch_code)
+    for name, bodies in sketch_functions.items():
+        functions[name] = [FunctionInfo(name, parameters, body, constants, profile, "sketch")
+                           for parameters, body in bodies]
+    if not library_found:
+        findings.append({"severity": "info", "message": "AnttiGateway library not found; library code not counted."})
+
+    role = "slave" if "initSlave" in sketch_code else "master" if "initMaster" in sketch_code else "unknown"
+    callbacks = set()
+    main_roots = [name for name in ("setup", "loop") if name in functions]
+    for name in _reachable(main_roots, functions):
+        for info in functions[name]:
+            for match in CALLBACK.finditer(info.body):
+                callbacks.add(match.group(1) or match.group(2))
+    called = {callee for infos in functions.values() for info in infos for callee in info.calls}
+    # Functions nobody calls are run by a library (e.g. BLE scan callbacks): in their own task on the ESP32,
+    # on the main stack elsewhere
+    tasks = {name for name in sketch_functions if name not in called and name not in ("setup", "loop")
+             and name not in callbacks and functions[name][0].calls}
+    if not profile["callback_stack"]:
+        main_roots += sorted(tasks)
+        tasks = set()
+    reachable = _reachable(main_roots + sorted(callbacks) + sorted(tasks), functions)
+
+    # Static RAM: core, sketch globals, library statics used by reachable code, locals declared static
+    static_items = [("core (Serial, Wire and board support)", profile["core_static"])]
+    static_items += [(f"{name} ({statement})", size) for name, statement, size, _ in
+                     global_items(sketch_globals, constants, profile, "sketch")]
+    reachable_bodies = " ".join(info.body for name in reachable for info in functions[name])
+    for name, statement, size, _ in global_items(library_globals, constants, profile, "library"):
+        if name == "instance" or re.search(r"\b" + re.escape(name) + r"\b", reachable_bodies):
+            static_items.append((f"library {name} ({statement})", size))
+    for name in reachable:
+        for info in functions[name]:
+            static_items += info.static_items
+    literals = string_literals(sketch_code, profile["literals_in_ram"])
+    if any(functions[name][0].source == "library" for name in reachable):
+        literals |= string_literals(library_source, profile["literals_in_ram"])
+    if literals:
+        static_items.append((f"{len(literals)} string literals in RAM (not wrapped in F())",
+                             sum(len(literal) + 1 for literal in literals)))
+    static_total = sum(size for _, size in static_items)
+
+    # Stack: main context, I2C callbacks (on the main stack on AVR/ESP8266) and library tasks
+    main_stack, main_path = max((_worst_stack(root, functions, profile) for root in main_roots),
+                                default=(0, []))
+    callback_stacks = {name: _worst_stack(name, functions, profile) for name in sorted(callbacks)}
+    task_stacks = {name: _worst_stack(name, functions, profile) for name in sorted(tasks)}
+    worst_callback = max((depth for depth, _ in callback_stacks.values()), default=0)
+    if profile["callbacks_on_main_stack"] and callback_stacks:
+        main_stack += worst_callback
+        worst_name = max(callback_stacks, key=lambda name: callback_stacks[name][0])
+        main_path = main_path + [f"+ {worst_name} (I2C interrupt)"] + callback_stacks[worst_name][1][1:]
+
+    # Heap: Strings held by the ring buffer (bufferSize - 1 entries) and the chunk queue, plus transients
+    frames = encode_chunks(b"x" * reading_bytes, constants["MaxChunkSizeSlave"])
+    string_cost = lambda length: length + 1 + profile["heap_overhead"]
+    ring_entries = constants["RingBufferSize"] - 1
+    heap_items = [(f"ring buffer, {ring_entries} readings", ring_entries * string_cost(reading_bytes))]
+    if role != "master":
+        heap_items.append((f"chunk queue, {len(frames)} chunks", sum(string_cost(len(frame)) for frame in frames)))
+    heap_items.append(("working copies of one reading", 3 * string_cost(reading_bytes)))
+    transient = sum(info.heap_transient for name in reachable for info in functions[name])
+    if transient:
+        heap_items.append(("DynamicJsonDocument", transient))
+    heap_peak = sum(size for _, size in heap_items)
+
+    per_chunk = {"receiveData", "processReceivedChunk", "getChunkNumber", "getTotalChunks", "getChunkData",
+                 "requestEvent", "getNextChunk"} | callbacks
+    frame_bytes = max(len(frame) for frame in frames)
+    allocations = churn_bytes = 0
+    for name in reachable:
+        for info in functions[name]:
+            repeat = len(frames) if name in per_chunk else 1
+            allocations += info.string_sites * repeat
+            churn_bytes += info.string_sites * repeat * (frame_bytes if name in per_chunk else reading_bytes)
+            if info.byte_appends:
+                allocations += frame_bytes * repeat
+                churn_bytes += frame_bytes * (frame_bytes + 1) // 2 * repeat
+
+    clock_match = re.search(r"initMaster\s*\(\s*(\d+)", sketch_code)
+    baud_match = re.search(r"Serial\.begin\s*\(\s*(\d+)", sketch_code)
+    timing = _timing(role, _reachable(["loop"] + sorted(callbacks), functions), functions, profile, constants,
+                     reading_bytes,
+                     int(clock_match.group(1)) if clock_match else 100000,
+                     int(baud_match.group(1)) if baud_match else 115200)
+
+    ram = profile["ram"]
+    if profile["main_stack"] is None:
+        stack_limit = ram - static_total - heap_peak
+        heap_available = ram - static_total - main_stack
+    else:
+        stack_limit = profile["main_stack"]
+        heap_available = ram - static_total
+    free_ram = heap_available - heap_peak
+
+    def add(severity, message):
+        findings.append({"severity": severity, "message": message})
+
+    largest = ", ".join(f"{name} {size} B" for name, size in sorted(static_items, key=lambda item: -item[1])[:3])
+    if static_total > ram:
+        add("error", f"Static RAM {static_total} B exceeds the {ram} B of the {profile_name}. Largest: {largest}.")
+    if main_stack > stack_limit and static_total <= ram:
+        add("error", f"Worst-case stack {main_stack} B ({' -> '.join(main_path)}) exceeds the {max(stack_limit, 0)} B "
+                     f"left for the stack on the {profile_name}.")
+    for name, (depth, path) in list(callback_stacks.items()) + list(task_stacks.items()):
+        if profile["callback_stack"] and depth > profile["callback_stack"]:
+            add("error", f"Callback {name}() needs {depth} B of stack ({' -> '.join(path)}); the task running it "
+                         f"has about {profile['callback_stack']} B.")
+    if free_ram < 0 and static_total <= ram and main_stack <= stack_limit:
+        add("error", f"Heap peak {heap_peak} B (ring buffer and chunk Strings) does not fit in the {heap_available} B "
+                     f"left after static RAM and stack.")
+    elif static_total <= ram and free_ram < LOW_FREE_RAM * ram:
+        add("warning", f"Only {free_ram} B of RAM stays free at the heap peak; String fragmentation can still fail "
+                       f"allocations.")
+    for name in reachable:
+        for info in functions[name]:
+            for item, size in info.frame_items:
+                if size >= (512 if profile["pointer"] == 2 else 4096):
+                    add("warning", f"{item} puts {size} B on the stack.")
+    byte_appenders = sorted(name for name in reachable if any(info.byte_appends for info in functions[name]))
+    if byte_appenders:
+        add("warning" if profile["pointer"] == 2 else "info",
+            f"{', '.join(byte_appenders)}() append{'s' if len(byte_appenders) == 1 else ''} to a String one byte "
+            f"at a time: about {allocations} allocations and {churn_bytes} B copied per reading.")
+    if profile["wire_buffer"] < constants["MaxChunkSize"] and role in ("master", "unknown"):
+        add("error", f"Wire on the {profile_name} buffers {profile['wire_buffer']} B, but the master requests "
+                     f"MaxChunkSize = {constants['MaxChunkSize']} B; chunk frames up to {frame_bytes} B are cut off.")
+    if profile["wire_buffer"] < frame_bytes and role == "slave":
+        add("error", f"Wire on the {profile_name} sends at most {profile['wire_buffer']} B per request; chunk "
+                     f"frames are up to {frame_bytes} B.")
+    if not profile["std_vector"]:
+        add("error", f"AnttiGateway.h includes <vector>, which the {profile_name} core does not provide.")
+    if literals and profile["literals_in_ram"]:
+        literal_bytes = sum(len(literal) + 1 for literal in literals)
+        if literal_bytes > 0.1 * ram:
+            add("warning", f"{literal_bytes} B of string literals are copied to RAM; wrap Serial.print() texts "
+                           f"in F().")
+    for name in reachable:
+        for info in functions[name]:
+            for unknown in info.unknown_sizes:
+                add("info", f"Size of {unknown} could not be evaluated.")
+    if role == "master" and library_found:
+        add("info", "A non-consecutive chunk or a completeData overflow makes the library wait 10 s (delay(10000)).")
+
+    return {
+        "board": board,
+        "profile": profile_name,
+        "role": role,
+        "reading_bytes": reading_bytes,
+        "ram": ram,
+        "static": {"total": static_total, "items": static_items},
+        "stack": {"main": main_stack, "limit": stack_limit, "path": main_path,
+                  "callbacks": {name: depth for name, (depth, _) in callback_stacks.items()},
+                  "tasks": {name: depth for name, (depth, _) in task_stacks.items()}},
+        "heap": {"peak": heap_peak, "available": heap_available, "items": heap_items,
+                 "allocations_per_reading": allocations, "bytes_copied_per_reading": churn_bytes},
+        "free_ram": free_ram,
+        "timing": timing,
+        "findings": findings,
+        "over_budget": any(finding["severity"] == "error" for finding in findings)
+    }
+
+
+def format_estimate(report):
+    """Human-readable summary of an estimate_resources() report."""
+    lines = [f"Resource estimate for {report['board']} ({report['profile']}, {report['role']}, "
+             f"{report['reading_bytes']} B readings):",
+             f"  static RAM  {report['static']['total']} B of {report['ram']} B",
+             f"  stack       {report['stack']['main']} B worst case, {report['stack']['limit']} B available "
+             f"({' -> '.join(report['stack']['path'])})",
+             f"  heap        {report['heap']['peak']} B peak, {report['heap']['available']} B available, "
+             f"{report['heap']['allocations_per_reading']} String allocations per reading",
+             f"  free RAM    {report['free_ram']} B at the heap peak"]
+    for name, depth in report["stack"]["callbacks"].items():
+        lines.append(f"  callback    {name}() {depth} B stack")
+    for name, depth in report["stack"]["tasks"].items():
+        lines.append(f"  task        {name}() {depth} B stack")
+    timing = report["timing"]
+    lines.append(f"  timing      {timing['ms_per_reading']} ms per reading (bus {timing['bus_ms']}, JSON "
+                 f"{timing['json_cpu_ms']}, Serial {timing['serial_ms']}, delays {timing['delay_ms']}), "
+                 f"{timing['chunks_per_reading']} chunks")
+    for item, size in sorted(report["static"]["items"], key=lambda entry: -entry[1])[:5]:
+        lines.append(f"    {size:>7} B  {item}")
+    for finding in report["findings"]:
+        lines.append(f"  [{finding['severity'].upper()}] {finding['message']}")
+    return "\n".join(lines)
+
+
+def findings_for_prompt(report):
+    """Errors and warnings of a report as prompt text ('' when there are none)."""
+    problems = [finding["message"] for finding in report["findings"] if finding["severity"] in ("error", "warning")]
+    if not problems:
+        return ""
+    return (f"A static resource check of this code for the {report['board']} found:\n"
+            + "\n".join(f"- {problem}" for problem in problems)
+            + "\nThe AnttiGateway library constants (RingBufferSize, SimpleQueueSize, JsonDocumentSize, "
+              "MaxDataSize) cannot be changed from the sketch, so keep the sketch's own buffers, "
+              "StaticJsonDocument sizes and String use as small as possible.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate RAM, stack, heap and timing of a sketch on a board.")
+    parser.add_argument("sketch", help="Sketch (.ino) to analyse.")
+    parser.add_argument("--board", required=True, help="Board name, e.g. 'Arduino Uno' or 'ESP32 Firebeetle'.")
+    parser.add_argument("--sensor", help="Sensor key in sensors.json whose data format sizes the readings.")
+    parser.add_argument("--data-format", help="JSON file with the data format of the readings.")
+    parser.add_argument("--reading-bytes", type=int, help="Serialized reading size (overrides the data format).")
+    parser.add_argument("--library", default=LIBRARY_DIR, help="AnttiGateway library folder.")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON.")
+    args = parser.parse_args()
+
+    with open(args.sketch, "r", encoding="utf-8", errors="replace") as f:
+        code = f.read()
+    data_format = None
+    if args.sensor:
+        with open("sensors.json", "r") as f:
+            data_format = json.load(f)["sensors"][args.sensor].get("data_format")
+    elif args.data_format:
+        with open(args.data_format, "r") as f:
+            data_format = f.read()
+    report = estimate_resources(code, args.board, args.reading_bytes, data_format, os.path.abspath(args.library))
+    print(json.dumps(report, indent=4) if args.json else format_estimate(report))
+    raise SystemExit(1 if report["over_budget"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+# schema_synthesis.py
+
+# One canonical schema for the whole sensor catalog. The engine's catalog schema request
+# (generation_engine.CatalogSchemaRequest) asks the model for every sensors.json entry at the same time
+# to restate its data format in a shared vocabulary; merge_proposals() folds the answers into one
+# canonical schema ({field: type}) plus, per sensor, a map from the field names its firmware sends
+# to the canonical names. write_catalog() stores both in sensors.json:
+#
+#     {"canonical_schema": {"temperature": "float", ...},
+#      "sensors": {"ruuvitag": {..., "canonical_map": {"temp": "temperature", "temperature": "temperature"}}}}
+#
+# CanonicalParser turns readings of any catalog sensor into canonical readings with one rename table,
+# so the host needs a single parser instead of one per sensor. Compact formats (format_compiler.py)
+# are decoded first.
+# Run: python schema_synthesis.py synthesize --model gpt-4o --write        (model suggestions for every sensor)
+#      python schema_synthesis.py merge --write                            (no model: field names and synonyms only)
+#      python schema_synthesis.py parse readings.ndjson --sensor ruuvitag  (canonical NDJSON to stdout)
+
+import argparse
+import json
+import os
+import re
+import sys
+from format_compiler import parse_format_text, normalise_schema, is_compiled, decode_reading, SLAVE_ID_KEY
+
+DEFAULT_SENSORS_FILE = "sensors.json"
+SCHEMA_WORKERS = 8  # Sensors whose format suggestion runs at the same time
+
+# Canonical fields the model is asked to reuse, with their type and the names they are often sent as
+CANONICAL_FIELDS = {
+    "sensor_id": ("string", ["id", "sid", "mac", "device_id", "sensorid", "device"]),
+    "temperature": ("float", ["temp", "t", "tmp", "temp_c", "temperature_c"]),
+    "humidity": ("float", ["hum", "h", "rh", "humid", "relative_humidity"]),
+    "pressure": ("float", ["press", "pres", "p", "air_pressure", "baro", "barometric_pressure"]),
+    "battery_level": ("int", ["batt", "bat", "battery", "battery_percent", "battery_percentage"]),
+    "battery_voltage": ("float", ["vbat", "batt_v", "battery_v", "voltage"]),
+    "rssi": ("int", ["signal", "signal_strength"]),
+    "tx_power": ("int", ["txpower", "tx"]),
+    "co2": ("int", ["co2_ppm", "carbon_dioxide"]),
+    "illuminance": ("float", ["lux", "light", "illumination"]),
+    "acceleration_x": ("float", ["ax", "acc_x", "accel_x"]),
+    "acceleration_y": ("float", ["ay", "acc_y", "accel_y"]),
+    "acceleration_z": ("float", ["az", "acc_z", "accel_z"]),
+    "movement_counter": ("int", ["mc", "movement", "moves"]),
+    "measurement_sequence": ("int", ["seq", "sequence", "msn"])
+}
+ALIASES = {alias: canonical for canonical, (_, aliases) in CANONICAL_FIELDS.items() for alias in aliases}
+TYPE_WIDENING = {frozenset(("int", "float")): "float", frozenset(("bool", "int")): "int"}
+
+
+def canonical_name(field):
+    """Snake-case field name with known synonyms replaced by their canonical name ("Temp" -> "temperature")."""
+    name = re.sub(r"([a-z0-9])([A-Z])", r"\1_\2", str(field)).lower()
+    name = re.sub(r"[^a-z0-9]+", "_", name).strip("_") or "field"
+    return ALIASES.get(name, name)
+
+
+def vocabulary(catalog=None):
+    """
+    Canonical fields offered to the model: the catalog's current canonical schema, or CANONICAL_FIELDS.
+    :param catalog: Whole sensors.json content.
+    :return: Dictionary of field -> type.
+    """
+    schema = {field: kind for field, (kind, _) in CANONICAL_FIELDS.items()}
+    if catalog and catalog.get("canonical_schema"):
+        schema.update(catalog["canonical_schema"])
+    return schema
+
+
+def current_fields(sensor):
+    """{field: type} of the names a sensor's firmware sends (original names for compact formats)."""
+    data_format = sensor.get("data_format", {})
+    if not isinstance(data_format, dict):
+        return {}
+    return normalise_schema(data_format)
+
+
+def parse_suggestion(text):
+    """
+    Parse a model answer to the catalog schema prompt.
+    :return: (canonical data format {field: type}, field map {current field: canonical field or None}).
+    :raise ValueError: If the answer is not the expected JSON object.
+    """
+    answer = parse_format_text(text) if isinstance(text, str) else text
+    if not isinstance(answer, dict):
+        raise ValueError("The suggestion is not a JSON object.")
+    data_format = answer.get("data_format", answer)
+    field_map = answer.get("field_map", {}) if "data_format" in answer else {}
+    if not isinstance(data_format, dict) or not isinstance(field_map, dict):
+        raise ValueError("The suggestion has no data_format object.")
+    return normalise_schema(data_format), field_map
+
+
+def _merge_type(first, second):
+    if first == second:
+        return first
+    return TYPE_WIDENING.get(frozenset((first, second)))
+
+
+def merge_proposals(proposals):
+    """
+    Fold per-sensor proposals into one canonical schema.
+    :param proposals: Dictionary of sensor key -> {"current": {field: type} the firmware sends,
+                      "data_format": {field: type} in canonical names (may be empty), "field_map":
+                      {current field: canonical field}}.
+    :return: Dictionary with "canonical_schema" {field: type}, "formats" {sensor: {canonical field: type}},
+             "maps" {sensor: {sent field: canonical field}} and "conflicts" (list of messages).
+    """
+    schema, formats, maps, conflicts = {}, {}, {}, []
+
+    def claim(sensor_key, canonical, kind, used):
+        """Canonical field for a sensor field, renamed when its type or the sensor clashes with it."""
+        for candidate in [canonical, f"{canonical}_{kind}"] + [f"{canonical}_{n}" for n in range(2, 100)]:
+            existing = schema.get(candidate)
+            merged = kind if existing is None else _merge_type(existing, kind)
+            if merged is None or candidate in used:
+                continue
+            schema[candidate] = merged
+            used.add(candidate)
+            if candidate != canonical:
+                conflicts.append(f"{sensor_key}: '{canonical}' ({kind}) clashes with {schema[canonical]}; "
+                                 f"stored as '{candidate}'.")
+            return candidate
+        raise ValueError(f"{sensor_key}: no free canonical name for '{canonical}'.")
+
+    for sensor_key in sorted(proposals):
+        proposal = proposals[sensor_key]
+        used, sensor_format, sensor_map = set(), {}, {}
+        for field, kind in proposal.get("data_format", {}).items():
+            canonical = claim(sensor_key, canonical_name(field), kind, used)
+            sensor_format[canonical] = schema[canonical]
+            sensor_map[canonical] = canonical
+        for field, kind in proposal.get("current", {}).items():
+            target = proposal.get("field_map", {}).get(field) or field
+            canonical = canonical_name(target)
+            if canonical not in sensor_format:
+                canonical = claim(sensor_key, canonical, kind, used)
+                sensor_format[canonical] = schema[canonical]
+                sensor_map[canonical] = canonical
+            elif _merge_type(schema[canonical], kind) is None:
+                conflicts.append(f"{sensor_key}: '{field}' ({kind}) maps to '{canonical}' "
+                                 f"({schema[canonical]}); values are passed through unchanged.")
+            sensor_map[field] = canonical
+        formats[sensor_key] = sensor_format
+        maps[sensor_key] = sensor_map
+    return {"canonical_schema": schema, "formats": formats, "maps": maps, "conflicts": conflicts}
+
+
+def proposals_from_catalog(sensors):
+    """Proposals without a model: every sensor's current fields, renamed by canonical_name()."""
+    return {key: {"current": current_fields(sensor), "data_format": {}, "field_map": {}}
+            for key, sensor in sensors.items()}
+
+
+def load_catalog(sensors_file=DEFAULT_SENSORS_FILE):
+    with open(sensors_file, "r") as f:
+        return json.load(f)
+
+
+def write_catalog(merged, sensors_file=DEFAULT_SENSORS_FILE, adopt=False):
+    """
+    Store the canonical schema and the per-sensor maps in sensors.json (re-read, so concurrent edits of
+    other entries are kept; replaced atomically).
+    :param adopt: Also replace each sensor's data_format with its canonical format, so regenerated
+                  firmware sends canonical names (compact formats are left alone).
+    """
+    catalog = load_catalog(sensors_file)
+    catalog["canonical_schema"] = merged["canonical_schema"]
+    for key, sensor in catalog.get("sensors", {}).items():
+        if key not in merged["maps"]:
+            continue
+        sensor["canonical_map"] = merged["maps"][key]
+        if adopt and merged["formats"][key] and not is_compiled(sensor.get("data_format")):
+            sensor["data_format"] = dict(merged["formats"][key])
+    temporary = sensors_file + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(catalog, f, indent=2)
+    os.replace(temporary, sensors_file)
+
+
+def format_summary(merged, failed=()):
+    lines = [f"Canonical schema: {len(merged['canonical_schema'])} fields for {len(merged['maps'])} sensors."]
+    for field, kind in merged["canonical_schema"].items():
+        senders = sorted(key for key, fields in merged["formats"].items() if field in fields)
+        lines.append(f"  {field:<24} {kind:<7} {', '.join(senders)}")
+    for key, sensor_map in sorted(merged["maps"].items()):
+        renamed = [f"{field} -> {canonical}" for field, canonical in sensor_map.items() if field != canonical]
+        lines.append(f"{key}: {', '.join(renamed) if renamed else 'already canonical'}")
+    for conflict in merged["conflicts"]:
+        lines.append(f"Conflict: {conflict}")
+    if failed:
+        lines.append(f"No suggestion (current fields used): {', '.join(sorted(failed))}")
+    return "\n".join(lines)
+
+
+class CanonicalParser:
+    def __init__(self, catalog):
+        """
+        :param catalog: sensors.json content with canonical maps (see write_catalog()).
+        Sent field names that every sensor maps the same way go into one shared rename table; readings
+        only need their sensor key when they use a name that sensors map differently.
+        """
+        sensors = catalog.get("sensors", {})
+        self.schema = catalog.get("canonical_schema", {})
+        self.maps = {key: sensor.get("canonical_map") or {field: canonical_name(field)
+                                                          for field in current_fields(sensor)}
+                     for key, sensor in sensors.items()}
+        self.compiled = {key: sensor["data_format"] for key, sensor in sensors.items()
+                         if is_compiled(sensor.get("data_format"))}
+        self.shared = {SLAVE_ID_KEY: SLAVE_ID_KEY}
+        self.ambiguous = set()
+        for sensor_map in self.maps.values():
+            for field, canonical in sensor_map.items():
+                if self.shared.get(field, canonical) != canonical:
+                    self.ambiguous.add(field)
+                self.shared.setdefault(field, canonical)
+        for field in self.ambiguous:
+            del self.shared[field]
+        for sensor_map in self.maps.values():
+            sensor_map.setdefault(SLAVE_ID_KEY, SLAVE_ID_KEY)
+
+    def parse(self, reading, sensor_key=None):
+        """
+        Canonical reading (SlaveID kept, unknown fields dropped).
+        :param sensor_key: Catalog key of the sender; needed for compact formats and ambiguous names.
+        """
+        if sensor_key is None:
+            rename = self.shared
+        else:
+            rename = self.maps[sensor_key]
+            if sensor_key in self.compiled:
+                reading = decode_reading(self.compiled[sensor_key], reading)
+        return {rename[field]: value for field, value in reading.items() if field in rename}
+
+    def parse_many(self, readings, sensor_key=None):
+        return [self.parse(reading, sensor_key) for reading in readings]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build one canonical data schema for the sensor catalog.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    synthesize_parser = subparsers.add_parser("synthesize", help="Ask the model for every sensor at once.")
+    synthesize_parser.add_argument("--model", required=True, help="Model name from config.json.")
+    synthesize_parser.add_argument("--workers", type=int, default=SCHEMA_WORKERS, help="Concurrent suggestions.")
+    merge_parser = subparsers.add_parser("merge", help="Merge the current formats without a model.")
+    for sub in (synthesize_parser, merge_parser):
+        sub.add_argument("--write", action="store_true", help="Write the schema and maps into the catalog.")
+        sub.add_argument("--adopt", action="store_true", help="Also replace data_format with the canonical one.")
+    parse_parser = subparsers.add_parser("parse", help="Print NDJSON readings in the canonical schema.")
+    parse_parser.add_argument("readings", help="NDJSON file of readings ('-' for stdin).")
+    parse_parser.add_argument("--sensor", help="Catalog key of the sender (needed for compact formats).")
+    parser.add_argument("--sensors-file", default=DEFAULT_SENSORS_FILE, help="Sensor catalog.")
+    args = parser.parse_args()
+
+    catalog = load_catalog(args.sensors_file)
+    if args.command == "parse":
+        canonical = CanonicalParser(catalog)
+        source = sys.stdin if args.readings == "-" else open(args.readings, "r")
+        with source:
+            for line in source:
+                if line.strip():
+                    record = json.loads(line)
+                    body = record.get("body", record) if isinstance(record, dict) else record
+                    print(json.dumps(canonical.parse(body, args.sensor or record.get("sensor")),
+                                     separators=(",", ":")))
+        return
+
+    if args.command == "merge":
+        merged = merge_proposals(proposals_from_catalog(catalog.get("sensors", {})))
+        failed = ()
+    else:
+        from config_manager import load_config
+        from generation_engine import engine_from_config, CatalogSchemaRequest
+
+        engine = engine_from_config(load_config(), args.model)
+        engine.bus.subscribe(lambda event: event.kind == "log" and event.data["level"] != "DEBUG"
+                             and print(event.data["message"]))
+        result = engine.run(CatalogSchemaRequest(catalog.get("sensors", {}), canonical_schema=vocabulary(catalog),
+                                                 workers=args.workers))
+        if "error" in result:
+            print(result["error"])
+            sys.exit(1)
+        merged, failed = result, result["failed"]
+    print(format_summary(merged, failed))
+    if args.write:
+        write_catalog(merged, args.sensors_file, adopt=args.adopt)
+        print(f"Canonical schema and maps written to {args.sensors_file}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+# serial_log_analyzer.py
+
+# Streaming analyzer for serial logs captured from AnttiGateway modules.
+# The file is memory-mapped and read one line at a time, so multi-gigabyte captures are never
+# loaded as a whole. The analyzer rebuilds the chunk sequences printed by processReceivedChunk()
+# ("cn:.. tc:.. data:.."), attributes them to slaves through the SlaveID of the completed data set,
+# and counts the error and notice lines of the library and the example sketches per time window.
+#
+# Timestamps are taken from the line prefix written by the capture tool when there is one
+# ("12:34:56.789 -> " from the Arduino IDE serial monitor, "[123.456] " or an ISO date and time).
+# Without timestamps, time is measured in lines. Latency percentiles come from a bounded sample
+# per window and per slave (analysis_common.LatencySample), so memory does not grow with the capture.
+# Run: python serial_log_analyzer.py capture.log --csv windows.csv --json summary.json
+
+import argparse
+import csv
+import json
+import re
+from collections import Counter, defaultdict
+from datetime import datetime
+from analysis_common import iter_lines, round_or_none, LatencySample
+
+_CHUNK_LINE = re.compile(rb"cn:(-?\d+) tc:(-?\d+) data:(.*)")
+_LASKURI = re.compile(rb"_laskuri: (\d+)(?: currentSize: (\d+))?")
+_SLAVE_ID = re.compile(rb'"SlaveID":(\d+)')
+
+_CLOCK_PREFIX = re.compile(rb"(\d{2}):(\d{2}):(\d{2})\.(\d{3}) -> ")
+_SECONDS_PREFIX = re.compile(rb"\[\s*(\d+(?:\.\d+)?)\] ?")
+_ISO_PREFIX = re.compile(rb"(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?)Z? ")
+
+WINDOW_SAMPLE_SIZE = 1024  # Latencies kept per window (per slave: analysis_common.LATENCY_SAMPLE_SIZE)
+
+WINDOW_COUNTERS = [
+    "chunks", "datasets", "abandoned_sequences", "non_consecutive", "overflows", "invalid_json",
+    "master_ring_full", "slave_ring_full", "slave_readings", "slave_requests", "slave_empty_requests",
+    "slave_chunks_written", "forwarded", "forward_failed", "json_failed", "wifi_down"
+]
+
+
+class TimestampParser:
+    def __init__(self):
+        """Detects the timestamp prefix of the capture from the first line that has one."""
+        self.pattern = None
+        self.kind = None
+        self.day_offset = 0.0
+        self.last_clock = None
+        self.last_hms = None  # "HH:MM:SS" of the previous line and its value in seconds
+        self.last_hms_seconds = 0
+
+    def split(self, line):
+        """
+        :return: (timestamp in seconds or None, line without the prefix).
+        """
+        if self.pattern is None:
+            for pattern, kind in ((_CLOCK_PREFIX, "clock"), (_SECONDS_PREFIX, "seconds"), (_ISO_PREFIX, "iso")):
+                if pattern.match(line):
+                    self.pattern, self.kind = pattern, kind
+                    break
+            else:
+                return None, line
+        if self.kind == "clock":
+            # Fixed-width "HH:MM:SS.mmm -> " prefix, sliced directly (this runs for every line)
+            if line[12:16] != b" -> " or line[2:3] != b":":
+                return None, line
+            try:
+                hms = line[0:8]
+                if hms != self.last_hms:  # Consecutive lines mostly share the second
+                    self.last_hms_seconds = int(line[0:2]) * 3600 + int(line[3:5]) * 60 + int(line[6:8])
+                    self.last_hms = hms
+                clock = self.last_hms_seconds + int(line[9:12]) / 1000
+            except ValueError:
+                self.last_hms = None
+                return None, line
+            if self.last_clock is not None and clock < self.last_clock - 43200:
+                self.day_offset += 86400  # The serial monitor only prints the time of day
+            self.last_clock = clock
+            return clock + self.day_offset, line[16:]
+        match = self.pattern.match(line)
+        if not match:
+            return None, line
+        rest = line[match.end():]
+        if self.kind == "seconds":
+            return float(match.group(1)), rest
+        text = match.group(1).decode().replace(",", ".").replace(" ", "T")
+        return datetime.fromisoformat(text).timestamp(), rest
+
+
+class SerialLogAnalyzer:
+    def __init__(self, window=3600.0, window_lines=100000):
+        """
+        :param window: Window length in seconds for captures with timestamps.
+        :param window_lines: Window length in lines for captures without timestamps.
+        """
+        self.window = window
+        self.window_lines = window_lines
+        self.window_size = window_lines
+        self.timestamps = TimestampParser()
+        self.time_unit = None
+        self.first_time = None
+        self.last_time = 0
+        self.line_number = 0
+
+        self.totals = Counter()
+        self.windows = defaultdict(Counter)
+        self.window_latencies = defaultdict(lambda: LatencySample(WINDOW_SAMPLE_SIZE))
+        self.slaves = defaultdict(lambda: {"datasets": 0, "chunks": 0, "bytes": 0, "non_consecutive": 0,
+                                           "overflows": 0, "latencies": LatencySample()})
+
+        # Reassembly state of the master (shared by all slaves, like processReceivedChunk())
+        self.sequence = None
+        self.awaiting_dataset = None
+        self.expect_dataset = False
+        self.last_add = None  # "master" or "slave": which side printed the last ring buffer add
+        self.last_laskuri = None
+
+    def feed(self, raw_line):
+        """Process one line of the capture."""
+        self.line_number += 1
+        t, line = self.timestamps.split(raw_line)
+        line = line.strip()
+        if not line:
+            return
+        if self.time_unit is None:
+            # The first non-empty line decides whether the capture is timed
+            self.time_unit = "s" if t is not None else "line"
+            self.window_size = self.window if self.time_unit == "s" else self.window_lines
+        if self.time_unit == "line":
+            t = self.line_number
+        elif t is None:
+            t = self.last_time  # Continuation line without its own prefix
+        self.last_time = t
+        if self.first_time is None:
+            self.first_time = t
+
+        if self.expect_dataset:
+            self.expect_dataset = False
+            if line[:1] == b"{":
+                self._dataset(line, t)
+                return
+
+        if line[:3] == b"cn:":
+            self._chunk(line, t)
+        elif b"_laskuri:" in line:
+            self._laskuri(line, t)
+        elif line.startswith(b"Complete Data Set Received:"):
+            self.expect_dataset = True
+        elif line.startswith(b"Error: Non-consecutive chunk received"):
+            self._count("non_consecutive", t)
+            self._sequence_error("non_consecutive")
+        elif line.startswith(b"Error: completeData buffer overflow"):
+            self._count("overflows", t)
+            self._sequence_error("overflows")
+        elif line.startswith(b"addCompleteDataToRingBuffer():"):
+            self.last_add = "master"
+        elif line.startswith(b"AnttiGateway::addToRingBuffer"):
+            self.last_add = "slave"
+            self._count("slave_readings", t)
+        elif line.startswith(b"Notice: Ring buffer is full"):
+            self._count("slave_ring_full" if self.last_add == "slave" else "master_ring_full", t)
+        elif line.startswith(b"Error: Invalid JSON format"):
+            self._count("invalid_json", t)
+        elif line.startswith(b"I2C call from Master -> Write chunk"):
+            self._count("slave_chunks_written", t)
+        elif line == b"Data forwarded successfully.":
+            self._count("forwarded", t)
+        elif line == b"Connection to endpoint failed.":
+            self._count("forward_failed", t)
+        elif line == b"JSON deserialization failed.":
+            self._count("json_failed", t)
+        elif line == b"WiFi not connected.":
+            self._count("wifi_down", t)
+
+    def _window_of(self, t):
+        return int((t - self.first_time) // self.window_size)
+
+    def _count(self, key, t, amount=1):
+        self.totals[key] += amount
+        self.windows[self._window_of(t)][key] += amount
+
+    def _chunk(self, line, t):
+        match = _CHUNK_LINE.match(line)
+        if not match:
+            return
+        chunk_number, total_chunks, data = int(match.group(1)), int(match.group(2)), match.group(3)
+        self._count("chunks", t)
+        if self.awaiting_dataset is not None:
+            self._finish(None)  # Completed sequence whose data set line is missing
+        if chunk_number == 0 and self.sequence is not None:
+            # A new reading started before the previous one completed: the previous one is lost
+            self._count("abandoned_sequences", t)
+            self.sequence = None
+        if self.sequence is None:
+            self.sequence = {"start": t, "chunks": 0, "bytes": 0, "non_consecutive": 0, "overflows": 0}
+        self.sequence["chunks"] += 1
+        self.sequence["bytes"] += len(data)
+        if chunk_number == total_chunks:  # Completion test of processReceivedChunk()
+            self.sequence["end"] = t
+            self.awaiting_dataset = self.sequence
+            self.sequence = None
+
+    def _sequence_error(self, key):
+        sequence = self.sequence or self.awaiting_dataset
+        if sequence is not None:
+            sequence[key] += 1
+
+    def _dataset(self, line, t):
+        match = _SLAVE_ID.search(line)
+        self._finish(int(match.group(1)) if match else None)
+
+    def _finish(self, slave_id):
+        sequence, self.awaiting_dataset = self.awaiting_dataset, None
+        if sequence is None:
+            return
+        t = sequence["end"]
+        latency = t - sequence["start"]
+        self._count("datasets", t)
+        self.window_latencies[self._window_of(t)].add(latency)
+        slave = self.slaves["unknown" if slave_id is None else slave_id]
+        slave["datasets"] += 1
+        slave["latencies"].add(latency)
+        for key in ("chunks", "bytes", "non_consecutive", "overflows"):
+            slave[key] += sequence[key]
+
+    def _laskuri(self, line, t):
+        match = _LASKURI.search(line)
+        if not match:
+            return
+        self._count("slave_requests", t)
+        counter = int(match.group(1))
+        if self.last_laskuri is not None and counter != (self.last_laskuri + 1) & 0xFF:
+            self.totals["laskuri_jumps"] += 1  # Lost log lines or a slave restart (uint8_t counter)
+        self.last_laskuri = counter
+        if match.group(2) == b"0":
+            self._count("slave_empty_requests", t)
+
+    def finish(self):
+        """Attribute a completed sequence still waiting for its data set line."""
+        if self.awaiting_dataset is not None:
+            self._finish(None)
+
+    def window_rows(self):
+        """Per-window counters and rates, in time order."""
+        size = self.window if self.time_unit == "s" else self.window_lines
+        rows = []
+        for index in sorted(self.windows):
+            counts = self.windows[index]
+            latencies = self.window_latencies.get(index) or LatencySample(0)
+            sequences = counts["datasets"] + counts["abandoned_sequences"]
+            row = {"window_start": round(self.first_time + index * size, 3)}
+            row.update({key: counts[key] for key in WINDOW_COUNTERS})
+            row["loss_rate"] = round(counts["abandoned_sequences"] / sequences, 4) if sequences else 0.0
+            row["overflow_rate"] = round(counts["overflows"] / sequences, 4) if sequences else 0.0
+            row["non_consecutive_rate"] = round(counts["non_consecutive"] / counts["chunks"], 4) if counts["chunks"] else 0.0
+            row["latency_p50"] = round_or_none(latencies.percentile(0.5))
+            row["latency_p95"] = round_or_none(latencies.percentile(0.95))
+            rows.append(row)
+        return rows
+
+    def summary(self):
+        """Totals, per-slave statistics and per-window rows."""
+        sequences = self.totals["datasets"] + self.totals["abandoned_sequences"]
+        slaves = {}
+        for slave_id, stats in sorted(self.slaves.items(), key=lambda item: str(item[0])):
+            latencies = stats["latencies"]
+            slaves[str(slave_id)] = {
+                "datasets": stats["datasets"],
+                "chunks": stats["chunks"],
+                "bytes": stats["bytes"],
+                "chunks_per_dataset": round(stats["chunks"] / stats["datasets"], 2) if stats["datasets"] else 0.0,
+                "non_consecutive": stats["non_consecutive"],
+                "overflows": stats["overflows"],
+                "latency_p50": round_or_none(latencies.percentile(0.5)),
+                "latency_p95": round_or_none(latencies.percentile(0.95)),
+                "latency_max": round_or_none(latencies.max)
+            }
+        totals = dict(self.totals)
+        totals["loss_rate"] = round(self.totals["abandoned_sequences"] / sequences, 4) if sequences else 0.0
+        totals["overflow_rate"] = round(self.totals["overflows"] / sequences, 4) if sequences else 0.0
+        return {
+            "lines": self.line_number,
+            "time_unit": self.time_unit or "line",
+            "window": self.window if self.time_unit == "s" else self.window_lines,
+            "totals": totals,
+            "slaves": slaves,
+            "windows": self.window_rows()
+        }
+
+
+def analyze(path, window=3600.0, window_lines=100000):
+    """Stream a capture through SerialLogAnalyzer and return its summary."""
+    analyzer = SerialLogAnalyzer(window, window_lines)
+    for line in iter_lines(path):
+        analyzer.feed(line)
+    analyzer.finish()
+    return analyzer.summary()
+
+
+def write_csv(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) if rows else ["window_start"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze AnttiGateway serial log captures.")
+    parser.add_argument("log", help="Captured serial log, or - for standard input.")
+    parser.add_argument("--window", type=float, default=3600.0, help="Window length in seconds.")
+    parser.add_argument("--window-lines", type=int, default=100000,
+                        help="Window length in lines when the capture has no timestamps.")
+    parser.add_argument("--csv", help="Write per-window rows to this CSV file.")
+    parser.add_argument("--json", help="Write the full summary to this JSON file.")
+    args = parser.parse_args()
+
+    summary = analyze(args.log, args.window, args.window_lines)
+    if args.csv:
+        write_csv(summary["windows"], args.csv)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=4)
+    print(json.dumps({key: summary[key] for key in ("lines", "time_unit", "totals", "slaves")}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
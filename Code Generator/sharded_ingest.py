@@ -0,0 +1,501 @@
+# sharded_ingest.py
+
+# Multi-process front end for ingest_server.py. One IngestServer parses, validates and writes every
+# reading on a single core; here --workers processes share the listening port:
+# - with SO_REUSEPORT (Linux, BSD) every worker binds its own socket and the kernel spreads the
+#   connections over them; elsewhere the coordinator binds once and all workers accept on that socket,
+# - a worker parses and validates the POSTs of its connections and routes every reading by
+#   (gateway, SlaveID) to the shard that owns the sensor (shard_for(), crc32 so all processes agree).
+#   Readings it owns stay with it, the others go to the owner's inbox (a multiprocessing.Queue), so all
+#   readings of a sensor reach one writer,
+# - readings are stamped with received_at by the worker that took the POST, so those forwarded by a
+#   peer can reach the owner after younger ones it took itself. The owner holds every reading for
+#   REORDER_DELAY and hands them to its writer in received_at order, so each shard is committed in
+#   received_at order across batches; a reading forwarded later than that is still written, counted
+#   as "late" in the metrics, and may be committed after younger readings of its sensor,
+# - every worker writes its own shard of the store (readings.shard0.db, ... or timeseries/shard0, ...),
+# - the coordinator collects the workers' metrics every second, merges them and shares the result:
+#   GET /metrics on any worker returns the merged numbers with its own under "worker".
+# Run: python sharded_ingest.py serve --sensor ruuvitag --port 8080 --workers 4
+#      python sharded_ingest.py serve --sensor ruuvitag --timeseries timeseries --workers 4
+#      python sharded_ingest.py bench --sensor ruuvitag --workers 1,2,4 --clients 8 --seconds 10
+
+import argparse
+import asyncio
+import heapq
+import http.client
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+import zlib
+from operator import itemgetter
+from format_compiler import normalise_schema, sample_readings
+from ingest_server import (IngestServer, ReadingValidator, SQLiteStore, load_data_formats, DEFAULT_DB,
+                           QUEUE_CAPACITY, BATCH_SIZE, BATCH_WAIT)
+
+METRICS_INTERVAL = 1.0  # Seconds between the metric reports of a worker
+DEPTH_INTERVAL = 0.05  # Seconds between queue depth updates (backpressure for forwarded readings)
+STOP_TIMEOUT = 30.0  # Seconds a stopping worker waits for the readings its peers still forward
+REORDER_DELAY = 0.5  # Seconds readings are held so those forwarded by peers are committed in received_at order
+METRICS_BYTES = 1 << 16  # Shared buffer for the merged metrics JSON
+SUM_KEYS = ("requests", "received", "accepted", "rejected", "refused_backpressure", "written", "batches",
+            "ingest_rate_10s", "ingest_rate_avg", "queue_depth", "queue_capacity", "forwarded_out", "forwarded_in",
+            "late", "write_failures", "dead_lettered", "lost")
+SHARD_KEYS = ("shard", "pid", "written", "ingest_rate_10s", "queue_depth", "forwarded_out", "forwarded_in")
+
+
+def shard_for(gateway, slave_id, shards):
+    """Shard that owns a sensor; crc32 instead of hash() so every process gets the same answer."""
+    if shards == 1:
+        return 0
+    return zlib.crc32(f"{gateway}|{slave_id}".encode("utf-8")) % shards
+
+
+def shard_path(path, index, directory=False):
+    """Store path of a shard: readings.db -> readings.shard0.db, or timeseries -> timeseries/shard0."""
+    if directory:
+        return os.path.join(path, f"shard{index}")
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{index}{ext}"
+
+
+def listen_socket(host, port, reuse_port=False, listen=True):
+    """TCP socket bound to host:port, with SO_REUSEPORT so several processes can bind the same port."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    if listen:
+        sock.listen(1024)
+        sock.setblocking(False)
+    return sock
+
+
+def merge_snapshots(snapshots):
+    """Cluster metrics from the latest snapshot of every worker (counters and rates are summed)."""
+    merged = {key: sum(snapshot.get(key, 0) for snapshot in snapshots) for key in SUM_KEYS}
+    for key in ("ingest_rate_10s", "ingest_rate_avg"):
+        merged[key] = round(merged[key], 1)
+    batches = merged["batches"]
+    merged.update(
+        workers=len(snapshots),
+        uptime_s=max((snapshot["uptime_s"] for snapshot in snapshots), default=0),
+        readings_per_request=round(merged["received"] / merged["requests"], 2) if merged["requests"] else 0,
+        avg_batch_size=round(merged["written"] / batches, 1) if batches else 0,
+        avg_commit_ms=round(sum(snapshot["avg_commit_ms"] * snapshot["batches"] for snapshot in snapshots)
+                            / batches, 2) if batches else 0,
+        backpressure=any(snapshot["backpressure"] for snapshot in snapshots),
+        shards=[{key: snapshot.get(key) for key in SHARD_KEYS}
+                for snapshot in sorted(snapshots, key=itemgetter("shard"))])
+    return merged
+
+
+def read_shared_metrics(buffer):
+    """Merged metrics the coordinator last wrote into the shared buffer (None before the first merge)."""
+    with buffer.get_lock():
+        data = buffer.value
+    return json.loads(data) if data else None
+
+
+class ShardedIngestServer(IngestServer):
+    def __init__(self, store, validator, index, inboxes, depths, queue_capacity=QUEUE_CAPACITY,
+                 batch_size=BATCH_SIZE, batch_wait=BATCH_WAIT, log=None):
+        """
+        IngestServer of one worker: writes shard index and forwards the readings of other shards.
+        :param store: Store of this shard.
+        :param inboxes: One multiprocessing.Queue per shard; readings for shard n go to inboxes[n].
+        :param depths: Shared array with the writer queue depth of every shard.
+        """
+        super().__init__(store, validator, queue_capacity=queue_capacity, batch_size=batch_size,
+                         batch_wait=batch_wait, log=log)
+        self.index = index
+        self.inboxes = inboxes
+        self.shards = len(inboxes)
+        self.depths = depths
+        self.forwarded_out = 0
+        self.forwarded_in = 0
+        self.held = []  # Heap of (received_at, arrival number, row) waiting for REORDER_DELAY
+        self.arrivals = itertools.count()
+        self.released_until = 0.0  # received_at of the last reading handed to the writer
+        self.late = 0
+        self.closing = False
+        self.shared_metrics = None
+
+    def ingest(self, readings, gateway=None):
+        """
+        Validate readings, then queue each one on the shard that owns its sensor.
+        :return: (status code, response dictionary)
+        """
+        self.metrics.received += len(readings)
+        if self.closing:
+            self.metrics.refused_backpressure += len(readings)
+            return 503, {"error": "Ingest worker is stopping, retry later."}
+
+        now = time.time()
+        valid, errors = self.validator.validate_many(readings)
+        by_shard = {}
+        for reading in valid:
+            slave_id = reading.get("SlaveID")
+            by_shard.setdefault(shard_for(gateway, slave_id, self.shards), []).append(
+                (now, gateway, slave_id, json.dumps(reading, separators=(",", ":"))))
+        for shard, rows in by_shard.items():
+            depth = self.depth() if shard == self.index else self.depths[shard]
+            if depth + len(rows) > self.queue_capacity:
+                self.metrics.refused_backpressure += len(readings)
+                return 503, {"error": "Ingest queue full, retry later.", "queue_depth": depth}
+
+        for shard, rows in by_shard.items():
+            if shard == self.index:
+                self._hold(rows)
+            else:
+                self.inboxes[shard].put(rows)
+                self.forwarded_out += len(rows)
+        accepted = len(valid)
+        self.metrics.accepted += accepted
+        self.metrics.rejected += len(errors)
+        status = 202 if accepted or not errors else 400
+        return status, {"accepted": accepted, "rejected": len(errors), "errors": [error for _, error in errors[:5]]}
+
+    def route(self, method, target, headers, body):
+        if method == "GET" and target.partition("?")[0] == "/metrics":
+            cluster = read_shared_metrics(self.shared_metrics) if self.shared_metrics is not None else None
+            return 200, dict(cluster or {}, worker=self.snapshot()), {}
+        return super().route(method, target, headers, body)
+
+    def snapshot(self):
+        snapshot = self.metrics.snapshot(self.depth(), self.queue_capacity)
+        snapshot.update(shard=self.index, pid=os.getpid(), forwarded_out=self.forwarded_out,
+                        forwarded_in=self.forwarded_in, late=self.late)
+        return snapshot
+
+    def depth(self):
+        """Readings of this shard not written yet (held for reordering or queued for the writer)."""
+        return self.queue.qsize() + len(self.held)
+
+    def _hold(self, rows):
+        if self.shards == 1:
+            put = self.queue.put_nowait  # Nothing is forwarded, so the queue is already in order
+            for row in rows:
+                put(row)
+            return
+        for row in rows:
+            if row[0] < self.released_until:
+                self.late += 1
+            heapq.heappush(self.held, (row[0], next(self.arrivals), row))
+
+    def _release(self, everything=False):
+        """Hand the readings held for REORDER_DELAY (or all of them) to the writer, oldest first."""
+        cutoff = float("inf") if everything else time.time() - REORDER_DELAY
+        held, put = self.held, self.queue.put_nowait
+        while held and held[0][0] <= cutoff:
+            received_at, _, row = heapq.heappop(held)
+            self.released_until = max(self.released_until, received_at)
+            put(row)
+
+    def _enqueue(self, rows):
+        self._hold(rows)
+        self.forwarded_in += len(rows)
+
+    def _receive(self, loop, peers_done):
+        """Inbox thread: hand forwarded readings to the event loop until every peer has said it is done."""
+        inbox = self.inboxes[self.index]
+        done = 0
+        while done < self.shards - 1:
+            rows = inbox.get()
+            if rows is None:
+                done += 1
+                continue
+            loop.call_soon_threadsafe(self._enqueue, rows)
+        loop.call_soon_threadsafe(peers_done.set)
+
+    async def serve(self, sock, stopping, metrics_queue, shared_metrics):
+        """
+        Run the worker until stopping is set, then flush: stop accepting, tell the peers that nothing
+        more is coming, take in what they still forward and write the rest.
+        """
+        loop = asyncio.get_running_loop()
+        self.shared_metrics = shared_metrics
+        await self.start(sock=sock)
+        peers_done = asyncio.Event()
+        if self.shards > 1:
+            threading.Thread(target=self._receive, args=(loop, peers_done), daemon=True).start()
+        else:
+            peers_done.set()
+
+        next_report = 0.0
+        while not stopping.is_set():
+            self._release()
+            self.depths[self.index] = self.depth()
+            if loop.time() >= next_report:
+                metrics_queue.put((self.index, self.snapshot()))
+                next_report = loop.time() + METRICS_INTERVAL
+            await asyncio.sleep(DEPTH_INTERVAL)
+
+        self.closing = True
+        self.server.close()
+        for shard, inbox in enumerate(self.inboxes):
+            if shard != self.index:
+                inbox.put(None)
+        try:
+            await asyncio.wait_for(peers_done.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.log.warning(f"Shard {self.index}: not every peer finished forwarding.")
+        self._release(everything=True)
+        await self.stop()
+        metrics_queue.put((self.index, self.snapshot()))
+
+
+def open_shard_store(index, db=DEFAULT_DB, timeseries=None):
+    if timeseries:
+        from timeseries_store import TimeSeriesStore
+        return TimeSeriesStore(shard_path(timeseries, index, directory=True))
+    return SQLiteStore(shard_path(db, index))
+
+
+def _worker(index, options, sock, inboxes, depths, stopping, metrics_queue, shared_metrics):
+    """Process entry of one worker."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the coordinator, which stops the workers
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] [%(levelname)s] %(message)s")
+    log = logging.getLogger(f"IngestWorker{index}")
+    if sock is None:
+        sock = listen_socket(options["host"], options["port"], reuse_port=True)
+    store = open_shard_store(index, options["db"], options["timeseries"])
+    server = ShardedIngestServer(store, ReadingValidator(options["formats"]), index, inboxes, depths,
+                                 queue_capacity=options["queue_capacity"], batch_size=options["batch_size"], log=log)
+    try:
+        asyncio.run(server.serve(sock, stopping, metrics_queue, shared_metrics))
+    finally:
+        server.store.close()
+
+
+class IngestCluster:
+    def __init__(self, workers, data_formats, host="0.0.0.0", port=8080, db=DEFAULT_DB, timeseries=None,
+                 queue_capacity=QUEUE_CAPACITY, batch_size=BATCH_SIZE, log=None):
+        """
+        Coordinator of the worker processes.
+        :param workers: Worker processes, one shard each.
+        :param data_formats: Data formats accepted (see ingest_server.load_data_formats()).
+        :param port: Listening port; 0 picks a free one (see self.port after start()).
+        :param queue_capacity: Readings that may wait for the writer of one shard.
+        """
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.log = log or logging.getLogger("IngestCluster")
+        self.options = {"host": host, "port": port, "db": db, "timeseries": timeseries, "formats": data_formats,
+                        "queue_capacity": queue_capacity, "batch_size": batch_size}
+        self.reuse_port = hasattr(socket, "SO_REUSEPORT")
+        self.processes = []
+        self.latest = {}
+
+    def start(self, timeout=30.0):
+        """Start the workers and wait until all of them are listening."""
+        self.inboxes = [multiprocessing.Queue() for _ in range(self.workers)]
+        self.depths = multiprocessing.Array("i", self.workers, lock=False)
+        self.stopping = multiprocessing.Event()
+        self.metrics_queue = multiprocessing.Queue()
+        self.shared_metrics = multiprocessing.Array("c", METRICS_BYTES)
+
+        shared_sock = reserved = None
+        if self.reuse_port:
+            # Hold the port (bound, not listening) so workers started with port 0 agree on one port
+            reserved = listen_socket(self.host, self.port, reuse_port=True, listen=False)
+            self.port = self.options["port"] = reserved.getsockname()[1]
+        else:
+            shared_sock = listen_socket(self.host, self.port)
+            self.port = shared_sock.getsockname()[1]
+
+        for index in range(self.workers):
+            process = multiprocessing.Process(
+                target=_worker, name=f"ingest-worker-{index}",
+                args=(index, self.options, shared_sock, self.inboxes, self.depths, self.stopping,
+                      self.metrics_queue, self.shared_metrics))
+            process.start()
+            self.processes.append(process)
+        try:
+            deadline = time.monotonic() + timeout
+            while len(self.latest) < self.workers:
+                if time.monotonic() > deadline or not all(process.is_alive() for process in self.processes):
+                    self.stop()
+                    raise RuntimeError("Ingest workers did not start.")
+                self.collect(0.1)
+        finally:
+            for sock in (reserved, shared_sock):
+                if sock is not None:
+                    sock.close()
+        mode = "SO_REUSEPORT" if self.reuse_port else "shared socket"
+        self.log.info(f"{self.workers} ingest workers listening on http://{self.host}:{self.port} ({mode})")
+
+    def collect(self, seconds):
+        """Take in worker metrics for up to seconds and publish the merged snapshot. :return: Merged metrics."""
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                index, snapshot = self.metrics_queue.get(timeout=max(remaining, 0.001))
+                self.latest[index] = snapshot
+            except queue.Empty:
+                pass
+            if remaining <= 0:
+                break
+        merged = self.snapshot()
+        data = json.dumps(merged).encode("utf-8")
+        if len(data) < METRICS_BYTES:
+            with self.shared_metrics.get_lock():
+                self.shared_metrics.value = data
+        return merged
+
+    def snapshot(self):
+        return merge_snapshots(list(self.latest.values()))
+
+    def stop(self, timeout=STOP_TIMEOUT + 10):
+        """Stop the workers; each one flushes its shard first. :return: Final merged metrics."""
+        self.stopping.set()
+        deadline = time.monotonic() + timeout
+        while any(process.is_alive() for process in self.processes) and time.monotonic() < deadline:
+            self.collect(0.1)
+        for process in self.processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                self.log.warning(f"{process.name} did not stop; terminating it.")
+                process.terminate()
+        self.collect(0.1)
+        return self.snapshot()
+
+
+def _bench_client(port, gateway, body, readings_per_body, seconds, results):
+    """Load client process: POSTs one NDJSON body over a keep-alive connection until the time is up."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    headers = {"Content-Type": "application/x-ndjson", "X-Gateway-Id": gateway}
+    accepted = refused = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        connection.request("POST", "/", body=body, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+        if response.status == 202:
+            accepted += json.loads(data)["accepted"]
+        else:
+            refused += readings_per_body
+            time.sleep(0.01)
+    connection.close()
+    results.put((accepted, refused))
+
+
+def bench_body(data_formats, slaves, batch):
+    """NDJSON body of batch readings spread over slaves SlaveIDs."""
+    typical = sample_readings(normalise_schema(data_formats[0]))[0] if data_formats else {"temperature": 21.5}
+    lines = [json.dumps(dict(typical, SlaveID=8 + index % slaves), separators=(",", ":")) for index in range(batch)]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def run_benchmark(data_formats, worker_counts, clients=8, seconds=10.0, batch=50, slaves=32, timeseries=False,
+                  log=print):
+    """
+    Ingest throughput for each worker count: clients processes POST NDJSON batches as fast as the
+    cluster answers, then the time until every accepted reading is written is added.
+    :return: List of result dictionaries.
+    """
+    body = bench_body(data_formats, slaves, batch)
+    results = []
+    for workers in worker_counts:
+        directory = tempfile.mkdtemp(prefix="sharded_ingest_")
+        try:
+            cluster = IngestCluster(workers, data_formats, host="127.0.0.1", port=0,
+                                    db=os.path.join(directory, "readings.db"),
+                                    timeseries=os.path.join(directory, "timeseries") if timeseries else None)
+            cluster.start()
+            counts = multiprocessing.Queue()
+            start = time.perf_counter()
+            loaders = [multiprocessing.Process(target=_bench_client,
+                                               args=(cluster.port, f"gw-{index}", body, batch, seconds, counts))
+                       for index in range(clients)]
+            for loader in loaders:
+                loader.start()
+            accepted = refused = 0
+            for _ in loaders:
+                done, skipped = counts.get()
+                accepted += done
+                refused += skipped
+            for loader in loaders:
+                loader.join()
+            while cluster.collect(0.1)["written"] < accepted and time.perf_counter() - start < seconds + 60:
+                pass
+            elapsed = time.perf_counter() - start
+            final = cluster.stop()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        result = {"workers": workers, "accepted": accepted, "refused": refused, "written": final["written"],
+                  "elapsed_s": round(elapsed, 2), "readings_per_s": round(final["written"] / elapsed, 1),
+                  "forwarded": final["forwarded_out"]}
+        results.append(result)
+        log(json.dumps(result))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process ingestion endpoint with SlaveID-affine shards.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, text in (("serve", "Run the ingest workers."), ("bench", "Measure throughput per worker count.")):
+        command = sub.add_parser(name, help=text)
+        command.add_argument("--sensor", action="append", help="Accept the data_format of this sensors.json entry.")
+        command.add_argument("--data-format", help="JSON file with the data_format to accept.")
+        command.add_argument("--timeseries", action="store_true" if name == "bench" else "store",
+                             help="Store in the columnar time-series store (serve: its directory).")
+
+    serve = sub.choices["serve"]
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (shards).")
+    serve.add_argument("--db", default=DEFAULT_DB, help="SQLite database file; shard n is written to <name>.shard<n>.db.")
+    serve.add_argument("--queue-capacity", type=int, default=QUEUE_CAPACITY, help="Queue capacity per shard.")
+    serve.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    serve.add_argument("--report-interval", type=float, default=10.0, help="Seconds between metric log lines.")
+
+    bench = sub.choices["bench"]
+    bench.add_argument("--workers", default="1,2,4", help="Comma separated worker counts to compare.")
+    bench.add_argument("--clients", type=int, default=8, help="Load client processes (one gateway each).")
+    bench.add_argument("--seconds", type=float, default=10.0, help="Load duration per worker count.")
+    bench.add_argument("--batch", type=int, default=50, help="Readings per POST.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] [%(levelname)s] %(message)s")
+    data_formats = load_data_formats(args.sensor, args.data_format)
+
+    if args.command == "bench":
+        results = run_benchmark(data_formats, [int(count) for count in args.workers.split(",")],
+                                clients=args.clients, seconds=args.seconds, batch=args.batch,
+                                timeseries=args.timeseries)
+        base = results[0]["readings_per_s"] or 1
+        print(f"{'workers':>8}{'readings/s':>14}{'speedup':>10}{'forwarded':>12}")
+        for result in results:
+            print(f"{result['workers']:>8}{result['readings_per_s']:>14}{result['readings_per_s'] / base:>10.2f}"
+                  f"{result['forwarded']:>12}")
+        print(f"({os.cpu_count()} CPUs; the load clients share them with the workers.)")
+        return
+
+    cluster = IngestCluster(args.workers, data_formats, host=args.host, port=args.port, db=args.db,
+                            timeseries=args.timeseries, queue_capacity=args.queue_capacity,
+                            batch_size=args.batch_size)
+    cluster.start()
+    try:
+        while True:
+            cluster.log.info(json.dumps(cluster.collect(args.report_interval)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cluster.log.info(json.dumps(cluster.stop()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# test_chunk_codec.py
+
+# Tests of the host-side chunk protocol reference (chunk_codec.py): readings split by encode_chunks()
+# and reassembled by MasterReassembler, including the firmware quirks kept on purpose (lost chunks
+# are only counted, oversize datasets are cut, exact multiples of 64 bytes merge with the next one).
+# Run: python -m unittest test_chunk_codec   (or python -m pytest test_chunk_codec.py)
+
+import json
+import unittest
+from chunk_codec import (MasterReassembler, SlaveEndpoint, add_slave_id, encode_chunks, i2c_transaction,
+                         MAX_CHUNK_SIZE_SLAVE, RING_BUFFER_SIZE)
+
+READING = {"sensor_id": "ruuvi-1", "temperature": 21.5, "humidity": 45.2, "pressure": 1013.2,
+           "battery_level": 87, "note": "line\nbreak \"quoted\" ä"}
+
+
+def reassemble(master, chunks):
+    """Feed chunks to the master one I2C read each; returns the completed datasets."""
+    completed = []
+    for chunk in chunks:
+        for line in chunk.split(b"\n")[:-1]:
+            dataset = master.process_chunk(line)
+            if dataset is not None:
+                completed.append(dataset)
+    return completed
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_encode_and_reassemble(self):
+        data = add_slave_id(READING, 8)
+        chunks = encode_chunks(data)
+        self.assertEqual(len(chunks), len(data) // MAX_CHUNK_SIZE_SLAVE + 1)
+        self.assertTrue(all(chunk.endswith(b"\n") and chunk.count(b"\n") == 1 for chunk in chunks))
+        master = MasterReassembler()
+        self.assertEqual(reassemble(master, chunks), [data])
+        self.assertEqual(json.loads(master.get_from_ring_buffer()), dict(READING, SlaveID=8))
+        self.assertEqual(master.stats["non_consecutive"], 0)
+        self.assertEqual(master.stats["datasets"], 1)
+
+    def test_over_the_bus(self):
+        slave, master = SlaveEndpoint(8), MasterReassembler()
+        for index in range(3):
+            slave.add_reading(dict(READING, index=index))
+        for _ in range(20):
+            i2c_transaction(slave, master)
+        indexes = []
+        while not master.ring_buffer.is_empty():
+            indexes.append(json.loads(master.get_from_ring_buffer())["index"])
+        self.assertEqual(indexes, [0, 1, 2])
+        self.assertEqual(master.stats["datasets"], 3)
+
+    def test_exact_multiple_merges_with_next_dataset(self):
+        data = b"{" + b"x" * (MAX_CHUNK_SIZE_SLAVE * 2 - 2) + b"}"
+        master = MasterReassembler()
+        self.assertEqual(reassemble(master, encode_chunks(data)), [])
+        self.assertEqual(reassemble(master, encode_chunks(b'{"a":1}')), [data + b'{"a":1}'])
+        self.assertEqual(master.stats["invalid_json"], 0)  # Starts with { and ends with }
+
+
+class LostChunkTest(unittest.TestCase):
+    def test_non_consecutive_chunk_is_counted(self):
+        data = add_slave_id(READING, 8)
+        chunks = encode_chunks(data)
+        master = MasterReassembler()
+        completed = reassemble(master, chunks[:1] + chunks[2:])
+        self.assertEqual(master.stats["non_consecutive"], 1)
+        # The firmware keeps assembling, so the dataset is stored without the lost chunk
+        self.assertEqual(completed, [data[:MAX_CHUNK_SIZE_SLAVE] + data[MAX_CHUNK_SIZE_SLAVE * 2:]])
+        self.assertEqual(master.stats["datasets"], 1)
+
+    def test_next_dataset_after_lost_chunk(self):
+        first, second = add_slave_id(READING, 8), add_slave_id({"value": 1}, 9)
+        master = MasterReassembler()
+        reassemble(master, encode_chunks(first)[1:])
+        self.assertEqual(master.stats["non_consecutive"], 1)
+        self.assertEqual(reassemble(master, encode_chunks(second)), [second])
+        self.assertEqual(master.get_from_ring_buffer(), second)
+
+    def test_invalid_chunk_ends_an_empty_dataset(self):
+        master = MasterReassembler()
+        self.assertEqual(master.process_chunk(b'{"cn":0,"tc":0,"data":'), b"")  # cn == tc == -1
+        self.assertEqual(master.stats["non_consecutive"], 1)
+        self.assertEqual(master.stats["invalid_json"], 1)
+        self.assertEqual(master.stats["datasets"], 0)
+
+
+class OverflowTest(unittest.TestCase):
+    def test_data_beyond_max_data_size_is_dropped(self):
+        data = add_slave_id(READING, 8)
+        master = MasterReassembler(max_data_size=MAX_CHUNK_SIZE_SLAVE + 1)
+        completed = reassemble(master, encode_chunks(data))
+        self.assertEqual(master.stats["overflows"], len(encode_chunks(data)) - 1)
+        self.assertEqual(completed, [data[:MAX_CHUNK_SIZE_SLAVE]])
+        self.assertEqual(master.stats["invalid_json"], 1)  # Cut before the closing brace
+        self.assertEqual(master.stats["datasets"], 0)
+
+    def test_full_ring_buffer_overwrites_oldest(self):
+        master = MasterReassembler()
+        for index in range(RING_BUFFER_SIZE):
+            reassemble(master, encode_chunks(add_slave_id({"index": index}, 8)))
+        self.assertEqual(master.stats["ring_overwrites"], 1)
+        self.assertEqual(json.loads(master.get_from_ring_buffer())["index"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
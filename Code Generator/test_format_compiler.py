@@ -0,0 +1,99 @@
+# test_format_compiler.py
+
+# Tests of the compact wire format (format_compiler.py): key dictionaries compiled from the catalog
+# formats in sensors.json, and readings encoded to the compact format and decoded back by the host
+# reference helpers and by the generated Python helpers.
+# Run: python -m unittest test_format_compiler   (or python -m pytest test_format_compiler.py)
+
+import json
+import os
+import unittest
+from format_compiler import (compile_format, decode_reading, emit_python, encode_reading, is_compiled,
+                             normalise_schema, parse_format_text, short_keys, size_report)
+
+SENSORS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sensors.json")
+
+with open(SENSORS, "r") as f:
+    CATALOG = {key: sensor["data_format"] for key, sensor in json.load(f)["sensors"].items()}
+
+READING = {"sensor_id": "ruuvi-1", "temperature": -12.34, "humidity": 45.2, "pressure": 1013.2,
+           "battery_level": 87, "SlaveID": 8}
+
+
+class CompileTest(unittest.TestCase):
+    def test_catalog_key_dictionary(self):
+        compiled = compile_format(CATALOG["ruuvitag"])
+        self.assertTrue(is_compiled(compiled))
+        self.assertEqual(list(compiled), ["s", "t", "h", "p", "b"])
+        self.assertEqual(compiled["t"], {"field": "temperature", "source_type": "float", "wire": "int", "scale": 100})
+        self.assertEqual(compiled["h"]["scale"], 10)
+        self.assertEqual(compiled["b"], {"field": "battery_level", "source_type": "int", "wire": "int", "scale": 1})
+        self.assertEqual(compiled["s"]["wire"], "string")
+        self.assertEqual(normalise_schema(compiled), CATALOG["ruuvitag"])
+
+    def test_precision_override(self):
+        compiled = compile_format(CATALOG["ruuvitag"], precision={"temperature": 1})
+        self.assertEqual(compiled["t"]["scale"], 10)
+
+    def test_short_keys_do_not_collide(self):
+        keys = short_keys(["temperature", "temp_max", "time", "t", "SlaveID_copy"])
+        self.assertEqual(len(set(keys.values())), 5)
+        self.assertNotIn("SlaveID", keys.values())
+        self.assertEqual(keys["temperature"], "t")
+        self.assertEqual(keys["temp_max"], "tm")
+
+    def test_proposed_format_variants(self):
+        text = '```json\n{"temperature": 21.5, "count": {"type": "integer"}, "door_open": true, "SlaveID": 8}\n```'
+        self.assertEqual(normalise_schema(parse_format_text(text)),
+                         {"temperature": "float", "count": "int", "door_open": "bool"})
+
+
+class RoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.compiled = compile_format(CATALOG["ruuvitag"])
+
+    def test_encode_and_decode(self):
+        compact = encode_reading(self.compiled, READING)
+        self.assertEqual(compact, {"s": "ruuvi-1", "t": -1234, "h": 452, "p": 10132, "b": 87, "SlaveID": 8})
+        self.assertEqual(decode_reading(self.compiled, compact), READING)
+        self.assertLess(len(json.dumps(compact)), len(json.dumps(READING)))
+
+    def test_values_rounded_to_precision(self):
+        decoded = decode_reading(self.compiled, encode_reading(self.compiled, dict(READING, temperature=21.456)))
+        self.assertEqual(decoded["temperature"], 21.46)
+        self.assertIsInstance(decoded["battery_level"], int)
+
+    def test_unavailable_values_stay_missing(self):
+        reading = {"temperature": float("nan"), "humidity": None, "pressure": 1000.0}
+        compact = encode_reading(self.compiled, reading)
+        self.assertEqual(compact, {"p": 10000})
+        self.assertEqual(decode_reading(self.compiled, compact), {"pressure": 1000.0})
+
+    def test_bool_fields(self):
+        compiled = compile_format({"door_open": "bool"})
+        compact = encode_reading(compiled, {"door_open": True})
+        self.assertEqual(compact, {"d": 1})
+        self.assertIs(decode_reading(compiled, compact)["door_open"], True)
+
+    def test_generated_python_matches_reference(self):
+        namespace = {}
+        exec(compile(emit_python(self.compiled), "<generated>", "exec"), namespace)
+        self.assertEqual(namespace["KEY_DICTIONARY"], self.compiled)
+        for reading in (READING, {"temperature": 21.456, "humidity": None}, {"SlaveID": 9}):
+            compact = namespace["encode_reading"](reading)
+            self.assertEqual(compact, encode_reading(self.compiled, reading))
+            self.assertEqual(namespace["decode_reading"](compact), decode_reading(self.compiled, compact))
+
+
+class SizeReportTest(unittest.TestCase):
+    def test_compact_is_smaller_for_every_catalog_format(self):
+        for sensor, data_format in CATALOG.items():
+            report = size_report(compile_format(data_format))
+            for name in ("typical", "worst_case"):
+                self.assertLess(report[name]["compact"]["reading_bytes"], report[name]["original"]["reading_bytes"],
+                                f"{sensor} {name}")
+                self.assertLessEqual(report[name]["compact"]["chunks"], report[name]["original"]["chunks"])
+
+
+if __name__ == "__main__":
+    unittest.main()
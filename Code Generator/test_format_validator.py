@@ -0,0 +1,105 @@
+# test_format_validator.py
+
+# Regression tests of the compiled data_format validators (format_validator.py) against the catalog
+# formats in sensors.json, both as written and as compact key dictionaries from format_compiler.py.
+# Run: python -m unittest test_format_validator   (or python -m pytest test_format_validator.py)
+
+import json
+import os
+import unittest
+from format_compiler import compile_format, encode_reading
+from format_validator import compile_validator, validate_many, validate_stream
+
+SENSORS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sensors.json")
+
+with open(SENSORS, "r") as f:
+    CATALOG = {key: sensor["data_format"] for key, sensor in json.load(f)["sensors"].items()}
+
+READING = {"sensor_id": "ruuvi-1", "temperature": 21.5, "humidity": 45.2, "pressure": 1013.2,
+           "battery_level": 87, "SlaveID": 8}
+
+
+class CatalogFormatTest(unittest.TestCase):
+    def setUp(self):
+        self.validate = compile_validator(CATALOG["ruuvitag"])
+
+    def test_valid_reading(self):
+        self.assertIsNone(self.validate(READING))
+
+    def test_int_accepted_for_float(self):
+        self.assertIsNone(self.validate(dict(READING, temperature=21, pressure=1013)))
+
+    def test_float_rejected_for_int(self):
+        self.assertEqual(self.validate(dict(READING, battery_level=87.0)), "Field 'battery_level' should be int.")
+
+    def test_missing_fields_allowed(self):
+        self.assertIsNone(self.validate({"temperature": 21.5, "SlaveID": 8}))
+        self.assertIsNone(self.validate({"SlaveID": 8}))
+
+    def test_missing_slave_id(self):
+        reading = dict(READING)
+        del reading["SlaveID"]
+        self.assertEqual(self.validate(reading), "Missing SlaveID.")
+        self.assertIsNone(compile_validator(CATALOG["ruuvitag"], require_slave_id=False)(reading))
+
+    def test_unavailable_values_must_be_omitted(self):
+        self.assertEqual(self.validate(dict(READING, humidity=None)),
+                         "Field 'humidity' is null; omit unavailable values.")
+        self.assertEqual(self.validate(dict(READING, humidity=float("nan"))), "Field 'humidity' should be float.")
+
+    def test_wrong_types(self):
+        self.assertEqual(self.validate(dict(READING, temperature=True)), "Field 'temperature' should be float.")
+        self.assertEqual(self.validate(dict(READING, temperature="21.5")), "Field 'temperature' should be float.")
+        self.assertEqual(self.validate(dict(READING, sensor_id=1)), "Field 'sensor_id' should be string.")
+        self.assertEqual(self.validate(dict(READING, SlaveID="8")), "Field 'SlaveID' should be int.")
+
+    def test_unknown_field_and_non_object(self):
+        self.assertEqual(self.validate(dict(READING, rssi=-70)), "Unknown field 'rssi'.")
+        self.assertEqual(self.validate([READING]), "Reading is not a JSON object.")
+
+
+class CompiledFormatTest(unittest.TestCase):
+    def setUp(self):
+        self.compiled = compile_format(CATALOG["ruuvitag"])
+        self.validate = compile_validator(self.compiled)
+
+    def test_encoded_reading_is_valid(self):
+        compact = encode_reading(self.compiled, READING)
+        self.assertIsNone(self.validate(compact))
+        self.assertEqual(self.validate(READING), "Unknown field 'sensor_id'.")  # Full names are not wire keys
+
+    def test_wire_types(self):
+        compact = encode_reading(self.compiled, READING)
+        self.assertEqual(self.validate(dict(compact, t=21.5)), "Field 't' should be int.")
+        del compact["h"]
+        self.assertIsNone(self.validate(compact))
+
+
+class MultipleFormatsTest(unittest.TestCase):
+    def test_any_format_matches(self):
+        validate = compile_validator([CATALOG["xiaomi_mi_sensor"], CATALOG["ruuvitag"]])
+        xiaomi = {"sensor_id": "mi-1", "temperature": 20.0, "humidity": 50.0, "SlaveID": 9}
+        valid, errors = validate_many(validate, [xiaomi, READING, dict(READING, pressure="high")])
+        self.assertEqual(valid, [xiaomi, READING])
+        self.assertEqual(errors, [(2, "Field 'pressure' should be float.")])
+
+    def test_no_formats_accepts_any_object(self):
+        validate = compile_validator([])
+        self.assertIsNone(validate({"anything": 1, "SlaveID": 8}))
+        self.assertEqual(validate({"anything": 1}), "Missing SlaveID.")
+
+
+class StreamTest(unittest.TestCase):
+    def test_serial_log(self):
+        validate = compile_validator(CATALOG["ruuvitag"], require_slave_id=False)
+        lines = [b"Booting", b"Sent data via I2C: " + json.dumps({"temperature": 21.5}).encode(),
+                 b"Sent data via I2C: {\"temperature\": null}", b"Sent data via I2C: {broken}"]
+        summary = validate_stream(validate, lines, serial=True)
+        self.assertEqual((summary["readings"], summary["valid"], summary["invalid"]), (3, 1, 2))
+        self.assertEqual(summary["errors"][0], {"line": 3, "error": "Field 'temperature' is null; omit unavailable values."})
+        self.assertEqual(summary["errors"][1]["line"], 4)
+        self.assertTrue(summary["errors"][1]["error"].startswith("Invalid JSON"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+# test_job_queue.py
+
+# Tests of the durable job store (job_queue.py): idempotency keys and the recovery of jobs left running
+# by a previous process. Each test uses its own jobs.db in a temporary directory and reopens it the way
+# a restarted application would.
+# Run: python -m unittest test_job_queue   (or python -m pytest test_job_queue.py)
+
+import os
+import tempfile
+import unittest
+from generation_engine import RefineRequest
+from job_queue import JobRunner, JobStore, request_key
+
+
+class StoreTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "jobs.db")
+        self.store = JobStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+
+    def reopen(self):
+        self.store.close()
+        self.store = JobStore(self.path)
+
+
+class IdempotencyTest(StoreTestCase):
+    def test_same_request_returns_existing_job(self):
+        first, queued = self.store.enqueue(RefineRequest("Add a watchdog."))
+        self.assertTrue(queued)
+        # A new request id with the same content has the same default key
+        second, queued = self.store.enqueue(RefineRequest("Add a watchdog."))
+        self.assertFalse(queued)
+        self.assertEqual(second["id"], first["id"])
+        self.assertEqual(self.store.counts(), {"queued": 1})
+        _, queued = self.store.enqueue(RefineRequest("Add a watchdog.", board="ESP32"))
+        self.assertTrue(queued)
+
+    def test_explicit_key(self):
+        request = RefineRequest("Add a watchdog.")
+        self.assertEqual(request_key(request), request_key(RefineRequest("Add a watchdog.")))
+        self.assertNotEqual(request_key(request, "gpt-4o"), request_key(request, "gpt-4o-mini"))
+        first, _ = self.store.enqueue(request, "key-1")
+        second, queued = self.store.enqueue(RefineRequest("Something else."), "key-1")
+        self.assertFalse(queued)
+        self.assertEqual(second["id"], first["id"])
+
+    def test_done_job_is_reused(self):
+        job, _ = self.store.enqueue(RefineRequest("Add a watchdog."), "key-1")
+        self.store.claim()
+        self.store.complete(job["id"], {"code": "void loop() {}"})
+        again, queued = self.store.enqueue(RefineRequest("Add a watchdog."), "key-1")
+        self.assertFalse(queued)
+        self.assertEqual(again["result"], {"code": "void loop() {}"})
+        # reuse_done=False starts a new job and the old one keeps its result
+        fresh, queued = self.store.enqueue(RefineRequest("Add a watchdog."), "key-1", reuse_done=False)
+        self.assertTrue(queued)
+        self.assertNotEqual(fresh["id"], job["id"])
+        self.assertEqual(self.store.get(job["id"])["result"], {"code": "void loop() {}"})
+        self.assertIsNone(self.store.get(job["id"])["idempotency_key"])
+
+    def test_failed_job_is_queued_again_with_fresh_attempts(self):
+        job, _ = self.store.enqueue(RefineRequest("Add a watchdog."), "key-1", max_attempts=1)
+        self.store.claim()
+        self.assertEqual(self.store.fail(job["id"], "timeout"), "error")
+        again, queued = self.store.enqueue(RefineRequest("Add a watchdog."), "key-1")
+        self.assertTrue(queued)
+        self.assertEqual(again["id"], job["id"])
+        self.assertEqual((again["state"], again["attempts"]), ("queued", 0))
+        self.assertIsNone(again["error"])
+
+
+class RecoverTest(StoreTestCase):
+    def test_running_jobs_are_queued_again(self):
+        job, _ = self.store.enqueue(RefineRequest("Add a watchdog."))
+        self.store.enqueue(RefineRequest("Add a display."))
+        self.assertEqual(self.store.claim()["id"], job["id"])
+        self.store.checkpoint(job["id"]).put("call:0", {"code": "partial"})
+        self.reopen()  # The process stopped while the job was running
+
+        self.assertEqual(self.store.recover(), 1)
+        recovered = self.store.get(job["id"])
+        self.assertEqual(recovered["state"], "queued")
+        self.assertEqual(recovered["attempts"], 0)  # The interruption is not a failed attempt
+        self.assertEqual(self.store.counts(), {"queued": 2})
+        self.assertEqual(self.store.checkpoint(job["id"]).items("call:"), {"0": {"code": "partial"}})
+        self.assertEqual(self.store.claim()["id"], job["id"])  # Still first in line
+        self.assertEqual(self.store.recover(), 1)
+
+    def test_other_states_are_left_alone(self):
+        done, _ = self.store.enqueue(RefineRequest("Add a watchdog."))
+        self.store.claim()
+        self.store.complete(done["id"], {"code": ""})
+        cancelled, _ = self.store.enqueue(RefineRequest("Add a display."))
+        self.store.cancel(cancelled["id"])
+        self.assertEqual(self.store.recover(), 0)
+        self.assertEqual(self.store.counts(), {"done": 1, "cancelled": 1})
+
+    def test_runner_resumes_recovered_job(self):
+        job, _ = self.store.enqueue(RefineRequest("Add a watchdog."))
+        self.store.claim()
+        self.reopen()
+        seen = []
+
+        def execute(request, checkpoint):
+            seen.append((request.request_id, request.modification_request))
+            return {"code": "void loop() {}"}
+
+        JobRunner(self.store, None, execute=execute, log=lambda message, level="INFO": None).run_pending()
+        self.assertEqual(seen, [(job["id"], "Add a watchdog.")])
+        finished = self.store.get(job["id"])
+        self.assertEqual((finished["state"], finished["attempts"]), ("done", 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
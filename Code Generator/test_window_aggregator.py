@@ -0,0 +1,174 @@
+# test_window_aggregator.py
+
+# Tests of the windowed aggregation reference (window_aggregator.py). test_data/window_aggregator_capture.log
+# is a serial capture in the format of a Module A sketch built with AGG_DEBUG = true and a window of
+# "5,10s": one window closed by the reading count, one by checkWindow() and one by the next reading
+# after the time ran out, with the last reading left in the open window.
+# Run: python -m unittest test_window_aggregator   (or python -m pytest test_window_aggregator.py)
+
+import os
+import struct
+import tempfile
+import unittest
+from window_aggregator import (WindowAggregator, MAX_AGG_FIELDS, COUNT_KEY, aggregated_format, check_log,
+                               parse_window_spec, serialize_like_sketch)
+
+CAPTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data", "window_aggregator_capture.log")
+
+
+def f32(value):
+    return struct.unpack("<f", struct.pack("<f", value))[0]
+
+
+class CountWindowTest(unittest.TestCase):
+    def test_closes_after_window_readings(self):
+        aggregator = WindowAggregator(window_readings=3)
+        self.assertEqual(aggregator.add({"temperature": 20.5, "SlaveID": 8, "mac": "a"}, 0), [])
+        self.assertEqual(aggregator.add({"temperature": 21.5, "mac": "b"}, 10), [])
+        summaries = aggregator.add({"temperature": 22.0, "mac": "c"}, 20)
+        self.assertEqual(len(summaries), 1)
+        summary = summaries[0]
+        self.assertEqual(summary[COUNT_KEY], 3)
+        self.assertEqual(summary["mac"], "c")  # Text fields keep the latest value
+        self.assertNotIn("SlaveID", summary)
+        self.assertEqual(summary["temperature_min"], 20.5)
+        self.assertEqual(summary["temperature_max"], 22.0)
+        self.assertEqual(summary["temperature_last"], 22.0)
+        self.assertEqual(summary["temperature"], f32(64.0 / 3))
+        self.assertEqual(aggregator.count, 0)
+
+    def test_sums_in_float32(self):
+        aggregator = WindowAggregator(window_readings=3)
+        for now in range(3):
+            summaries = aggregator.add({"value": 0.1}, now)
+        total = f32(f32(f32(0.1) + f32(0.1)) + f32(0.1))
+        self.assertEqual(summaries[0]["value"], f32(total / 3))
+
+    def test_drops_invalid_readings(self):
+        aggregator = WindowAggregator(window_readings=2)
+        self.assertEqual(aggregator.add("not json", 0), [])
+        self.assertEqual(aggregator.add("[1, 2]", 0), [])
+        self.assertEqual(aggregator.count, 0)
+        aggregator.add('{"value": 1}', 0)
+        self.assertEqual(aggregator.add('{"value": 3}', 1)[0]["value"], 2.0)
+
+
+class TimeWindowTest(unittest.TestCase):
+    def test_next_reading_closes_expired_window(self):
+        aggregator = WindowAggregator(window_ms=1000)
+        self.assertEqual(aggregator.add({"value": 1}, 0), [])
+        self.assertEqual(aggregator.add({"value": 2}, 999), [])
+        summaries = aggregator.add({"value": 10}, 1000)
+        self.assertEqual([summary[COUNT_KEY] for summary in summaries], [2])
+        self.assertEqual(summaries[0]["value"], 1.5)
+        # The reading that closed the window opens the next one
+        self.assertEqual(aggregator.count, 1)
+        self.assertEqual(aggregator.start_ms, 1000)
+
+    def test_count_or_time_whichever_first(self):
+        aggregator = WindowAggregator(window_readings=3, window_ms=1000)
+        closed = [aggregator.add({"value": value}, now) for value, now in ((1, 0), (2, 10), (3, 20))]
+        self.assertEqual([len(summaries) for summaries in closed], [0, 0, 1])
+        self.assertEqual(aggregator.add({"value": 4}, 100), [])
+        summaries = aggregator.add({"value": 5}, 1100)
+        self.assertEqual([summary[COUNT_KEY] for summary in summaries], [1])
+        self.assertEqual(summaries[0]["value"], 4.0)
+
+    def test_check_window(self):
+        aggregator = WindowAggregator(window_ms=1000)
+        self.assertIsNone(aggregator.check(5000))  # Empty window
+        aggregator.add({"value": 4}, 100)
+        self.assertIsNone(aggregator.check(1099))
+        summary = aggregator.check(1100)
+        self.assertEqual(summary[COUNT_KEY], 1)
+        self.assertEqual(summary["value"], 4.0)
+        self.assertIsNone(aggregator.check(5000))
+        self.assertIsNone(aggregator.flush())
+
+    def test_needs_a_window(self):
+        with self.assertRaises(ValueError):
+            WindowAggregator(0, 0)
+        self.assertEqual(parse_window_spec("10,60s"), (10, 60000))
+        self.assertEqual(parse_window_spec("none"), (0, 0))
+        with self.assertRaises(ValueError):
+            parse_window_spec("10x")
+
+
+class FieldLimitTest(unittest.TestCase):
+    def test_fields_beyond_max_agg_fields_are_dropped(self):
+        aggregator = WindowAggregator(window_readings=1)
+        reading = {f"f{index}": index for index in range(MAX_AGG_FIELDS + 2)}
+        summary = aggregator.add(reading, 0)[0]
+        self.assertIn(f"f{MAX_AGG_FIELDS - 1}", summary)
+        self.assertNotIn(f"f{MAX_AGG_FIELDS}", summary)
+        self.assertNotIn(f"f{MAX_AGG_FIELDS + 1}_min", summary)
+
+    def test_later_fields_do_not_replace_tracked_ones(self):
+        aggregator = WindowAggregator(window_readings=2, max_fields=1)
+        aggregator.add({"a": 1}, 0)
+        summary = aggregator.add({"b": 5, "a": 3}, 1)[0]
+        self.assertEqual(summary["a"], 2.0)
+        self.assertNotIn("b", summary)
+
+    def test_aggregated_format_has_the_same_limit(self):
+        data_format = {f"f{index}": "float" for index in range(MAX_AGG_FIELDS + 1)}
+        data_format["sensor_id"] = "string"
+        expected = aggregated_format(data_format)
+        self.assertIn(f"f{MAX_AGG_FIELDS - 1}_last", expected)
+        self.assertNotIn(f"f{MAX_AGG_FIELDS}", expected)
+        self.assertEqual(expected["sensor_id"], "string")
+        self.assertEqual(expected[COUNT_KEY], "int")
+
+
+class RoundMeansTest(unittest.TestCase):
+    def test_means_rounded_like_lroundf(self):
+        aggregator = WindowAggregator(window_readings=2, round_means=True)
+        aggregator.add({"up": 1, "down": -1, "even": 2}, 0)
+        summary = aggregator.add({"up": 2, "down": -2, "even": 2}, 1)[0]
+        self.assertEqual(summary["up"], 2)  # 1.5: halfway cases away from zero
+        self.assertEqual(summary["down"], -2)
+        self.assertEqual(summary["even"], 2)
+        self.assertIsInstance(summary["up"], int)
+        self.assertEqual(summary["up_min"], 1.0)  # Only the mean is rounded
+        self.assertEqual(aggregated_format({"up": "int"}, round_means=True)["up"], "int")
+
+
+class CheckLogTest(unittest.TestCase):
+    def test_capture_matches_reference(self):
+        window_readings, window_ms = parse_window_spec("5,10s")
+        result = check_log(CAPTURE, WindowAggregator(window_readings, window_ms), tolerance=1e-7)
+        self.assertEqual(result["problems"], [])
+        self.assertEqual(result["readings"], 10)
+        self.assertEqual(result["summaries"], 3)
+        self.assertEqual(result["matched"], 3)
+        self.assertEqual(result["unsent"], 0)
+        self.assertEqual(result["open_window"], 1)
+
+    def test_capture_with_wrong_window_fails(self):
+        result = check_log(CAPTURE, WindowAggregator(5))
+        self.assertEqual(len(result["problems"]), 2)  # The windows closed by time
+        self.assertIn("before the window was full", result["problems"][0])
+
+    def test_reports_mismatches(self):
+        aggregator = WindowAggregator(window_readings=2)
+        expected = {"mac": "a", COUNT_KEY: 2, "value": 1.5, "value_min": 1.0, "value_max": 2.0, "value_last": 2.0}
+        wrong = dict(expected, value=1.75)
+        del wrong["mac"]
+        lines = ['AGG_IN 0 {"mac":"a","value":1}', 'AGG_IN 5 {"mac":"a","value":2}',
+                 "AGG_OUT " + serialize_like_sketch(wrong), "AGG_OUT not json", "AGG_IN x {}"]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "capture.log")
+            with open(path, "w") as f:
+                f.write("\n".join(lines) + "\n")
+            result = check_log(path, aggregator)
+        self.assertEqual(result["matched"], 0)
+        self.assertEqual(result["summaries"], 2)
+        self.assertEqual(len(result["problems"]), 3)
+        self.assertIn("missing mac", result["problems"][0])
+        self.assertIn("value: expected 1.5, got 1.75", result["problems"][0])
+        self.assertIn("AGG_OUT is not JSON", result["problems"][1])
+        self.assertIn("AGG_IN without millis()", result["problems"][2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+# text_updater.py
+
+# Minimal-diff updates for Tk text widgets. Replacing a whole sketch with delete("1.0", "end") and
+# insert() re-lays out every line, flickers and throws away the scroll position and selection. A
+# TextUpdater keeps the text the widget should show, and once per frame applies only the lines that
+# differ from what the widget shows now:
+#
+#     updater = TextUpdater(module_a_code_box)
+#     updater.set_text(code, state="disabled")      # any number of calls per frame, one redraw
+#     updater.append(log_entry, tag="INFO")         # appends keep the view at the end if it was there
+#
+# Tk moves the insert cursor, marks and the "sel" tag with the text around them, so unchanged lines keep
+# their selection; the first visible line is kept by shifting it past the edits above it.
+# Run: python text_updater.py old.ino new.ino      (prints the line edits that turn one file into the other)
+
+import argparse
+import difflib
+
+FRAME_MS = 16  # Coalesce writes to about one redraw per 60 Hz frame
+
+
+def line_edits(old_text, new_text):
+    """
+    Line ranges to replace to turn old_text into new_text.
+    :return: List of (first old line, end old line, new lines) with 0-based, end-exclusive old line
+             numbers, in ascending order. Apply them from the last to the first so the numbers stay valid.
+    """
+    if old_text == new_text:
+        return []
+    old_lines, new_lines = old_text.split("\n"), new_text.split("\n")
+
+    # Common prefix and suffix first: streaming and most refinements only touch a few lines
+    prefix = 0
+    limit = min(len(old_lines), len(new_lines))
+    while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < limit - prefix
+           and old_lines[len(old_lines) - 1 - suffix] == new_lines[len(new_lines) - 1 - suffix]):
+        suffix += 1
+    old_middle = old_lines[prefix:len(old_lines) - suffix]
+    new_middle = new_lines[prefix:len(new_lines) - suffix]
+    if not old_middle or not new_middle:
+        return [(prefix, prefix + len(old_middle), new_middle)]
+
+    matcher = difflib.SequenceMatcher(None, old_middle, new_middle, autojunk=False)
+    return [(prefix + i1, prefix + i2, new_middle[j1:j2])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+
+def apply_line_edit(widget, old_line_count, start, end, lines):
+    """
+    Replace old lines start..end (0-based, end-exclusive) of a text widget with lines.
+    :param old_line_count: Lines in the widget before the edit ("a\\nb" has 2).
+    """
+    if start < end and lines:
+        widget.delete(f"{start + 1}.0", f"{end}.end")
+        widget.insert(f"{start + 1}.0", "\n".join(lines))
+    elif lines:  # Pure insertion
+        if start < old_line_count:
+            widget.insert(f"{start + 1}.0", "\n".join(lines) + "\n")
+        else:
+            widget.insert(f"{start}.end", "\n" + "\n".join(lines))
+    elif start < end:  # Pure deletion
+        if end < old_line_count:
+            widget.delete(f"{start + 1}.0", f"{end + 1}.0")
+        elif start > 0:
+            widget.delete(f"{start}.end", f"{end}.end")
+        else:
+            widget.delete("1.0", "end-1c")
+
+
+class TextUpdater:
+    def __init__(self, widget, frame_ms=FRAME_MS):
+        """
+        :param widget: Tk text widget; only touched from the Tk thread.
+        :param frame_ms: Writes within this many milliseconds are applied together.
+        """
+        self.widget = widget
+        self.frame_ms = frame_ms
+        self._text = None  # Text the widget should show; None if only appends are pending
+        self._appends = []  # (text, tag) to add after _text
+        self._state = None
+        self._scheduled = False
+
+    def set_text(self, text, state=None):
+        """
+        Show text in the widget from the next frame on.
+        :param state: Widget state to leave it in ("disabled" for read-only boxes); None keeps it.
+        """
+        self._text = text
+        self._appends = []
+        if state is not None:
+            self._state = state
+        self._schedule()
+
+    def append(self, text, tag=None):
+        """Add text (with an optional tag) at the end of the widget from the next frame on."""
+        self._appends.append((text, tag))
+        self._schedule()
+
+    def flush(self):
+        """Apply the pending writes now."""
+        self._scheduled = False
+        text, appends, state = self._text, self._appends, self._state
+        self._text, self._appends, self._state = None, [], None
+        if text is None and not appends:
+            return
+
+        widget = self.widget
+        previous_state = widget.cget("state")
+        at_end = widget.yview()[1] >= 1.0
+        top_line = int(widget.index("@0,0").split(".")[0])
+        widget.config(state="normal")
+
+        if text is not None:
+            old_text = widget.get("1.0", "end-1c")
+            old_line_count = old_text.count("\n") + 1
+            shift = 0
+            edits = line_edits(old_text, text)
+            for start, end, lines in reversed(edits):
+                apply_line_edit(widget, old_line_count, start, end, lines)
+                if end < top_line:  # Edits above the first visible line move it
+                    shift += len(lines) - (end - start)
+            top_line = max(1, top_line + shift)
+
+        # Consecutive appends with the same tag go in with one insert
+        runs = []
+        for chunk, tag in appends:
+            if runs and runs[-1][1] == tag:
+                runs[-1][0].append(chunk)
+            else:
+                runs.append(([chunk], tag))
+        for chunks, tag in runs:
+            if tag is None:
+                widget.insert("end-1c", "".join(chunks))
+            else:
+                widget.insert("end-1c", "".join(chunks), tag)
+
+        if at_end and appends:
+            widget.see("end")
+        else:
+            widget.yview(f"{top_line}.0")
+        widget.config(state=state or previous_state)
+
+    def _schedule(self):
+        if not self._scheduled:
+            self._scheduled = True
+            self.widget.after(self.frame_ms, self.flush)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the line edits TextUpdater applies between two texts.")
+    parser.add_argument("old", help="Text shown now.")
+    parser.add_argument("new", help="Text to show.")
+    args = parser.parse_args()
+
+    with open(args.old, "r", encoding="utf-8") as f:
+        old_text = f.read()
+    with open(args.new, "r", encoding="utf-8") as f:
+        new_text = f.read()
+    edits = line_edits(old_text, new_text)
+    for start, end, lines in edits:
+        print(f"lines {start + 1}-{end} -> {len(lines)} line(s)")
+        for line in lines:
+            print(f"  + {line}")
+    print(f"{len(edits)} edit(s), {sum(len(lines) for _, _, lines in edits)} of "
+          f"{new_text.count(chr(10)) + 1} lines rewritten.")
+
+
+if __name__ == "__main__":
+    main()
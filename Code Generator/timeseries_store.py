@@ -0,0 +1,673 @@
+# timeseries_store.py
+
+# Columnar time-series store for gateway readings. Every numeric field of a reading goes into its own
+# typed column file mapped with np.memmap. Files are partitioned by SlaveID and by time (PARTITION_SECONDS
+# per partition), so a query maps only the partitions it needs and gets NumPy views of the files instead
+# of copies. Per slave, rollups (reading count and per field min, max, sum and valid count) are kept at
+# several resolutions and updated as readings are appended: a dashboard over a year of per-minute
+# readings from hundreds of sensors reads a few hundred rollup rows per sensor.
+#
+# Layout (root/):
+#   store.json                        partition length and rollup resolutions
+#   slave_7/raw_000010/               readings of SlaveID 7 with 10 * PARTITION_SECONDS <= t < 11 * ...
+#       meta.json                     committed row count, capacity, column dtypes, whether t is in order
+#       t.f8  temperature.f4  ...     one file per column, grown in steps
+#   slave_7/rollup_3600/              hourly buckets: t.i8 count.u4 temperature.min.f4 ... .sum.f8 .n.u4
+# Rows are written before meta.json (replaced atomically) counts them, so a crash loses at most the batch
+# being written; "rebuild" recomputes the rollups from the raw columns. Strings (e.g. sensor_id) are not
+# stored; nested objects are stored as "<key>.<subkey>" fields.
+# Run: python timeseries_store.py import readings.db --root timeseries      (ingest_server.py database)
+#      python timeseries_store.py import load.ndjson --root timeseries      (load_generator.py raw output)
+#      python timeseries_store.py dashboard --root timeseries --days 365 --field temperature
+#      python timeseries_store.py bench --sensors 200 --days 365            (synthetic per-minute data)
+#      python ingest_server.py --timeseries timeseries --sensor ruuvitag     (ingest straight into the store)
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import numpy as np
+
+DEFAULT_ROOT = "timeseries"
+PARTITION_SECONDS = 30 * 86400
+RESOLUTIONS = (300, 3600, 86400)  # Rollup bucket lengths in seconds
+FIELD_DTYPE = "f4"  # Column type of reading fields; missing values are NaN
+TIME_DTYPE = "f8"
+GROW_ROWS = 16384  # Rows of a new column file; files double from there, at most MAX_GROW_ROWS at a time
+MAX_GROW_ROWS = 1 << 20
+NAME = re.compile(r"^[A-Za-z0-9_\-.]+$")  # Field names and SlaveIDs usable as file names
+SKIP_FIELDS = ("SlaveID",)
+
+
+def _fill_value(dtype):
+    return np.nan if np.dtype(dtype).kind == "f" else 0
+
+
+def _slave_key(slave_id):
+    if slave_id is None:
+        return "none"
+    key = str(slave_id)
+    if not NAME.match(key):
+        raise ValueError(f"Invalid SlaveID {slave_id!r}.")
+    return key
+
+
+def numeric_fields(reading, prefix=""):
+    """(field name, float) for every number or boolean of a reading; nested objects give "<key>.<subkey>"."""
+    for key, value in reading.items():
+        if key in SKIP_FIELDS and not prefix:
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from numeric_fields(value, f"{name}.")
+        elif isinstance(value, (int, float)) and NAME.match(name):
+            yield name, float(value)
+
+
+class ColumnSet:
+    def __init__(self, path, readonly=False):
+        """
+        Typed columns of one partition or rollup: a file per column, mapped with np.memmap.
+        meta.json holds the committed row count; rows past it (from an interrupted write) are ignored.
+        :param readonly: Map the files read-only and pick up rows committed by another process.
+        """
+        self.path = path
+        self.readonly = readonly
+        self.meta_path = os.path.join(path, "meta.json")
+        self.meta = {"count": 0, "capacity": 0, "sorted": True, "columns": {}}
+        self._meta_mtime = None
+        self._maps = {}
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+        self.refresh()
+
+    @property
+    def count(self):
+        return self.meta["count"]
+
+    @property
+    def columns(self):
+        return self.meta["columns"]
+
+    def refresh(self):
+        """Reload meta.json if it changed since it was read."""
+        try:
+            mtime = os.stat(self.meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._meta_mtime:
+            with open(self.meta_path, "r") as f:
+                self.meta = json.load(f)
+            self._meta_mtime = mtime
+
+    def _file(self, name):
+        return os.path.join(self.path, f"{name}.{self.columns[name]}")
+
+    def _map(self, name):
+        mapped = self._maps.get(name)
+        if mapped is None or len(mapped) < self.count:
+            mapped = np.memmap(self._file(name), dtype=self.columns[name], mode="r" if self.readonly else "r+")
+            self._maps[name] = mapped
+        return mapped
+
+    def view(self, name, start=0, end=None):
+        """Committed rows of a column as a view of the mapped file (writable unless read-only)."""
+        return self._map(name)[start:self.count if end is None else end]
+
+    def add_column(self, name, dtype):
+        """New column; rows already committed get NaN (float columns) or 0."""
+        if not self.meta["capacity"]:
+            self.meta["capacity"] = GROW_ROWS
+        self.columns[name] = dtype
+        with open(self._file(name), "wb") as f:
+            f.truncate(self.meta["capacity"] * np.dtype(dtype).itemsize)
+        if self.count:
+            self._map(name)[:self.count] = _fill_value(dtype)
+
+    def _grow(self, rows):
+        capacity = self.meta["capacity"] or GROW_ROWS
+        while capacity < rows:
+            capacity += min(capacity, MAX_GROW_ROWS)
+        if capacity == self.meta["capacity"]:
+            return
+        for name, dtype in self.columns.items():
+            mapped = self._maps.pop(name, None)
+            if mapped is not None:
+                mapped.flush()
+            os.truncate(self._file(name), capacity * np.dtype(dtype).itemsize)
+        self.meta["capacity"] = capacity
+
+    def append(self, values, rows):
+        """
+        Append rows; commit() makes them visible.
+        :param values: Dictionary of column name -> array of the rows (missing columns get NaN or 0).
+        """
+        start, rows = self.count, int(rows)
+        self._grow(start + rows)
+        for name, dtype in self.columns.items():
+            self._map(name)[start:start + rows] = values[name] if name in values else _fill_value(dtype)
+        self.meta["count"] = start + rows
+
+    def commit(self, sync=True):
+        """Write the rows to disk (when sync) and then record them in meta.json."""
+        if sync:
+            for mapped in self._maps.values():
+                mapped.flush()
+        temporary = self.meta_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(temporary, self.meta_path)
+        self._meta_mtime = os.stat(self.meta_path).st_mtime_ns
+
+    def close(self):
+        if not self.readonly:
+            for mapped in self._maps.values():
+                mapped.flush()
+        self._maps.clear()
+
+
+class TimeSeriesStore:
+    def __init__(self, root=DEFAULT_ROOT, resolutions=RESOLUTIONS, partition_seconds=PARTITION_SECONDS,
+                 field_dtypes=None, readonly=False, sync=True):
+        """
+        :param root: Store directory; partition length and resolutions of an existing store are kept.
+        :param resolutions: Rollup bucket lengths in seconds.
+        :param field_dtypes: Column type per field name (FIELD_DTYPE by default), e.g. {"counter": "f8"}.
+        :param readonly: Only query (maps files read-only; safe next to a writing process).
+        :param sync: Flush the mapped files to disk before every commit.
+        """
+        self.root = root
+        self.readonly = readonly
+        self.sync = sync
+        self.field_dtypes = field_dtypes or {}
+        self.lock = threading.Lock()
+        self._sets = {}
+        settings_path = os.path.join(root, "store.json")
+        if os.path.exists(settings_path):
+            with open(settings_path, "r") as f:
+                settings = json.load(f)
+        elif readonly:
+            raise FileNotFoundError(f"No time-series store in '{root}'.")
+        else:
+            settings = {"partition_seconds": partition_seconds, "resolutions": sorted(resolutions)}
+            os.makedirs(root, exist_ok=True)
+            with open(settings_path, "w") as f:
+                json.dump(settings, f, indent=4)
+        self.partition_seconds = settings["partition_seconds"]
+        self.resolutions = settings["resolutions"]
+
+    # ------------------------------------------------ layout ------------------------------------------------
+
+    def _column_set(self, path):
+        column_set = self._sets.get(path)
+        if column_set is None:
+            column_set = self._sets[path] = ColumnSet(path, readonly=self.readonly)
+        elif self.readonly:
+            column_set.refresh()
+        return column_set
+
+    def _raw_path(self, slave_id, partition):
+        return os.path.join(self.root, f"slave_{_slave_key(slave_id)}", f"raw_{partition:06d}")
+
+    def _rollup_path(self, slave_id, resolution):
+        return os.path.join(self.root, f"slave_{_slave_key(slave_id)}", f"rollup_{resolution}")
+
+    def slaves(self):
+        """SlaveIDs in the store (ints where they are numeric)."""
+        keys = [name[len("slave_"):] for name in os.listdir(self.root) if name.startswith("slave_")]
+        return sorted((int(key) if key.isdigit() else key for key in keys), key=str)
+
+    def partitions(self, slave_id):
+        """Partition numbers of a slave; partition p holds p * partition_seconds <= t < (p + 1) * ..."""
+        directory = os.path.join(self.root, f"slave_{_slave_key(slave_id)}")
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(name[len("raw_"):]) for name in os.listdir(directory) if name.startswith("raw_"))
+
+    # ------------------------------------------------ writing ------------------------------------------------
+
+    def write_batch(self, rows):
+        """
+        Store interface of ingest_server.IngestServer.
+        :param rows: List of (received_at, gateway, slave_id, payload JSON) tuples.
+        """
+        by_slave = {}
+        for received_at, _, slave_id, payload in rows:
+            timestamps, readings = by_slave.setdefault(slave_id, ([], []))
+            timestamps.append(received_at)
+            readings.append(json.loads(payload) if isinstance(payload, str) else payload)
+        for slave_id, (timestamps, readings) in by_slave.items():
+            self.append_readings(slave_id, timestamps, readings)
+
+    def append_readings(self, slave_id, timestamps, readings):
+        """Append reading dictionaries of one slave; fields a reading lacks are stored as NaN."""
+        columns = {}
+        for row, reading in enumerate(readings):
+            for name, value in numeric_fields(reading):
+                column = columns.get(name)
+                if column is None:
+                    column = columns[name] = np.full(len(readings), np.nan)
+                column[row] = value
+        return self.append_columns(slave_id, timestamps, columns)
+
+    def append_columns(self, slave_id, timestamps, fields):
+        """
+        Append readings of one slave given as columns.
+        :param timestamps: Reading times (Unix seconds), in any order.
+        :param fields: Dictionary of field name -> values (NaN where a reading has no value).
+        :return: Number of readings appended.
+        """
+        if self.readonly:
+            raise PermissionError("The store is open read-only.")
+        t = np.asarray(timestamps, dtype=np.float64)
+        if not len(t):
+            return 0
+        fields = {name: np.asarray(values, dtype=np.float64) for name, values in fields.items()}
+        for name in fields:
+            if not NAME.match(name):
+                raise ValueError(f"Invalid field name '{name}'.")
+        if np.any(t[1:] < t[:-1]):
+            order = np.argsort(t, kind="stable")
+            t = t[order]
+            fields = {name: values[order] for name, values in fields.items()}
+
+        with self.lock:
+            keys = np.floor(t / self.partition_seconds).astype(np.int64)
+            bounds = np.flatnonzero(np.diff(keys)) + 1
+            for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(t)]):
+                part = self._column_set(self._raw_path(slave_id, int(keys[start])))
+                if "t" not in part.columns:
+                    part.add_column("t", TIME_DTYPE)
+                for name in fields:
+                    if name not in part.columns:
+                        part.add_column(name, self.field_dtypes.get(name, FIELD_DTYPE))
+                if part.count and part.view("t")[-1] > t[start]:
+                    part.meta["sorted"] = False  # Late readings; compact() puts them back in order
+                part.append({"t": t[start:end], **{name: values[start:end] for name, values in fields.items()}},
+                            end - start)
+                part.commit(self.sync)
+
+            for resolution in self.resolutions:
+                if not self._update_rollup(slave_id, resolution, t, fields):
+                    self._rebuild_rollup(slave_id, resolution)
+        return len(t)
+
+    def _update_rollup(self, slave_id, resolution, t, fields):
+        """
+        Merge time-ordered readings into a rollup.
+        :return: False if they fall into buckets before the last one that do not exist yet (rebuild needed).
+        """
+        buckets = (np.floor(t / resolution) * resolution).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        columns = {"t": buckets[starts], "count": np.diff(np.r_[starts, len(t)])}
+        for name, values in fields.items():
+            valid = ~np.isnan(values)
+            columns[f"{name}.min"] = np.fmin.reduceat(values, starts)
+            columns[f"{name}.max"] = np.fmax.reduceat(values, starts)
+            columns[f"{name}.sum"] = np.add.reduceat(np.where(valid, values, 0.0), starts)
+            columns[f"{name}.n"] = np.add.reduceat(valid.astype(np.int64), starts)
+
+        rollup = self._column_set(self._rollup_path(slave_id, resolution))
+        for name, dtype in (("t", "i8"), ("count", "u4")):
+            if name not in rollup.columns:
+                rollup.add_column(name, dtype)
+        for name in fields:
+            if f"{name}.n" not in rollup.columns:
+                field_dtype = self.field_dtypes.get(name, FIELD_DTYPE)
+                for suffix, dtype in ((".min", field_dtype), (".max", field_dtype), (".sum", "f8"), (".n", "u4")):
+                    rollup.add_column(name + suffix, dtype)
+
+        existing = rollup.view("t")
+        if len(existing) and columns["t"][0] <= existing[-1]:
+            old = columns["t"] <= existing[-1]
+            rows = np.searchsorted(existing, columns["t"][old])
+            if np.any(existing[np.minimum(rows, len(existing) - 1)] != columns["t"][old]):
+                return False
+            for name, values in columns.items():
+                if name == "t":
+                    continue
+                column = rollup.view(name)
+                if name.endswith(".min"):
+                    column[rows] = np.fmin(column[rows], values[old])
+                elif name.endswith(".max"):
+                    column[rows] = np.fmax(column[rows], values[old])
+                else:
+                    column[rows] += values[old].astype(column.dtype)
+            columns = {name: values[~old] for name, values in columns.items()}
+        if len(columns["t"]):
+            rollup.append(columns, len(columns["t"]))
+        rollup.commit(self.sync)
+        return True
+
+    def _rebuild_rollup(self, slave_id, resolution):
+        rollup = self._column_set(self._rollup_path(slave_id, resolution))
+        rollup.meta["count"] = 0
+        for partition in self.partitions(slave_id):
+            part = self._column_set(self._raw_path(slave_id, partition))
+            t = part.view("t")
+            order = None if part.meta["sorted"] else np.argsort(t, kind="stable")
+            fields = {name: (part.view(name) if order is None else part.view(name)[order]).astype(np.float64)
+                      for name in part.columns if name != "t"}
+            if len(t):
+                self._update_rollup(slave_id, resolution, t if order is None else t[order], fields)
+        rollup.commit(self.sync)
+
+    def rebuild(self, slave_ids=None):
+        """Recompute every rollup from the raw columns (after an interrupted write or new resolutions)."""
+        with self.lock:
+            for slave_id in slave_ids or self.slaves():
+                for resolution in self.resolutions:
+                    self._rebuild_rollup(slave_id, resolution)
+
+    def compact(self):
+        """Sort partitions that received late readings, so their queries are views again."""
+        sorted_partitions = 0
+        with self.lock:
+            for slave_id in self.slaves():
+                for partition in self.partitions(slave_id):
+                    part = self._column_set(self._raw_path(slave_id, partition))
+                    if part.meta["sorted"]:
+                        continue
+                    order = np.argsort(part.view("t"), kind="stable")
+                    for name in part.columns:
+                        column = part.view(name)
+                        column[:] = column[order]
+                    part.meta["sorted"] = True
+                    part.commit(self.sync)
+                    sorted_partitions += 1
+        return sorted_partitions
+
+    # ------------------------------------------------ queries ------------------------------------------------
+
+    def query_parts(self, slave_id, start=None, end=None, fields=None):
+        """
+        Raw readings of a slave with start <= t < end, one dictionary ("t" and the fields) per partition.
+        Columns are views of the mapped files, except in partitions with late readings (see compact()).
+        """
+        span = self.partition_seconds
+        for partition in self.partitions(slave_id):
+            if (start is not None and (partition + 1) * span <= start) or (end is not None and partition * span >= end):
+                continue
+            part = self._column_set(self._raw_path(slave_id, partition))
+            t = part.view("t")
+            names = fields or [name for name in part.columns if name != "t"]
+            if part.meta["sorted"]:
+                rows = slice(0 if start is None else int(np.searchsorted(t, start)),
+                             len(t) if end is None else int(np.searchsorted(t, end)))
+            else:
+                rows = np.ones(len(t), dtype=bool)
+                if start is not None:
+                    rows &= t >= start
+                if end is not None:
+                    rows &= t < end
+                rows = np.flatnonzero(rows)[np.argsort(t[rows], kind="stable")]
+            selected = t[rows]
+            result = {"t": selected}
+            for name in names:
+                result[name] = part.view(name)[rows] if name in part.columns else np.full(len(selected), np.nan,
+                                                                                          dtype=FIELD_DTYPE)
+            yield result
+
+    def query(self, slave_id, start=None, end=None, fields=None):
+        """
+        Raw readings of a slave with start <= t < end as a dictionary of "t" and field arrays.
+        Views of the mapped files when the range lies in one partition; one copy otherwise.
+        """
+        parts = list(self.query_parts(slave_id, start, end, fields))
+        if len(parts) == 1:
+            return parts[0]
+        names = fields or sorted({name for part in parts for name in part if name != "t"})
+        result = {"t": np.concatenate([part["t"] for part in parts]) if parts else np.empty(0)}
+        for name in names:
+            result[name] = np.concatenate([part[name] if name in part else np.full(len(part["t"]), np.nan,
+                                                                                    dtype=FIELD_DTYPE)
+                                           for part in parts]) if parts else np.empty(0, dtype=FIELD_DTYPE)
+        return result
+
+    def rollup(self, slave_id, resolution, start=None, end=None, fields=None):
+        """
+        Rollup buckets of a slave overlapping start..end.
+        :return: Dictionary of "t" (bucket start), "count" and per field "<field>.min", "<field>.max" and
+                 "<field>.mean". t, count, min and max are views of the mapped files; mean is computed.
+        """
+        if resolution not in self.resolutions:
+            raise ValueError(f"No {resolution} s rollup; the store keeps {self.resolutions}.")
+        path = self._rollup_path(slave_id, resolution)
+        if not os.path.isdir(path):
+            return {"t": np.empty(0, dtype=np.int64), "count": np.empty(0, dtype=np.uint32)}
+        rollup = self._column_set(path)
+        t = rollup.view("t")
+        lo = 0 if start is None else int(np.searchsorted(t, math.floor(start / resolution) * resolution))
+        hi = len(t) if end is None else int(np.searchsorted(t, end))
+        result = {"t": t[lo:hi], "count": rollup.view("count", lo, hi)}
+        names = fields or sorted(name[:-len(".n")] for name in rollup.columns if name.endswith(".n"))
+        for name in names:
+            if f"{name}.n" not in rollup.columns:
+                for suffix in (".min", ".max", ".mean"):
+                    result[name + suffix] = np.full(hi - lo, np.nan, dtype=FIELD_DTYPE)
+                continue
+            result[f"{name}.min"] = rollup.view(f"{name}.min", lo, hi)
+            result[f"{name}.max"] = rollup.view(f"{name}.max", lo, hi)
+            valid = rollup.view(f"{name}.n", lo, hi)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result[f"{name}.mean"] = np.where(valid > 0, rollup.view(f"{name}.sum", lo, hi) / valid, np.nan)
+        return result
+
+    def pick_resolution(self, start, end, max_points=1000):
+        """Finest rollup resolution that gives at most max_points buckets for start..end."""
+        for resolution in self.resolutions:
+            if (end - start) / resolution <= max_points:
+                return resolution
+        return self.resolutions[-1]
+
+    def dashboard(self, start, end, fields=None, max_points=1000, slave_ids=None):
+        """
+        Rollups of every slave (or slave_ids) for a time range at the resolution pick_resolution() gives.
+        :return: (resolution, dictionary of SlaveID -> rollup dictionary)
+        """
+        resolution = self.pick_resolution(start, end, max_points)
+        return resolution, {slave_id: self.rollup(slave_id, resolution, start, end, fields)
+                            for slave_id in (slave_ids or self.slaves())}
+
+    def info(self):
+        """Slaves, readings, partitions, late partitions and bytes on disk."""
+        readings = partitions = unsorted = size = 0
+        slaves = self.slaves()
+        for slave_id in slaves:
+            for partition in self.partitions(slave_id):
+                part = self._column_set(self._raw_path(slave_id, partition))
+                readings += part.count
+                partitions += 1
+                unsorted += not part.meta["sorted"]
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                stat = os.stat(os.path.join(directory, name))
+                # Column files are sparse past the committed rows where the file system allows it
+                size += stat.st_blocks * 512 if hasattr(stat, "st_blocks") else stat.st_size
+        return {"slaves": len(slaves), "readings": readings, "partitions": partitions,
+                "unsorted_partitions": unsorted, "resolutions": self.resolutions, "bytes": size}
+
+    def close(self):
+        for column_set in self._sets.values():
+            column_set.close()
+        self._sets.clear()
+
+
+# ------------------------------------------------ import and benchmark ------------------------------------------------
+
+def import_sqlite(store, path, batch_size=50000):
+    """Copy the readings table of an ingest_server.py database into the store."""
+    connection = sqlite3.connect(path)
+    last_id = imported = 0
+    try:
+        while True:
+            rows = connection.execute("SELECT id, received_at, gateway, slave_id, payload FROM readings "
+                                      "WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)).fetchall()
+            if not rows:
+                return imported
+            last_id = rows[-1][0]
+            store.write_batch([row[1:] for row in rows])
+            imported += len(rows)
+    finally:
+        connection.close()
+
+
+def import_ndjson(store, path, batch_size=50000):
+    """
+    Copy an NDJSON capture into the store: load_generator.py raw output ({"t", "slave", "body"}) or
+    uplink captures ({"t", "body"} with a SlaveID in the body).
+    """
+    imported = 0
+    rows = []
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            body = record.get("body")
+            if not isinstance(body, dict) or "t" not in record:
+                continue
+            rows.append((float(record["t"]), None, record.get("slave", body.get("SlaveID")), body))
+            if len(rows) >= batch_size:
+                store.write_batch(rows)
+                imported += len(rows)
+                rows = []
+    if rows:
+        store.write_batch(rows)
+        imported += len(rows)
+    return imported
+
+
+def run_benchmark(root, sensors, days, interval=60.0, seed=1):
+    """
+    Fill a store with synthetic per-interval readings and time the dashboard queries.
+    :return: Result dictionary.
+    """
+    fields = ("temperature", "humidity", "pressure", "battery_level")
+    rng = np.random.default_rng(seed)
+    end = math.floor(time.time() / 86400) * 86400
+    start = end - days * 86400
+    store = TimeSeriesStore(root, sync=False)
+    write_start = time.perf_counter()
+    readings = 0
+    for slave_id in range(sensors):
+        for chunk_start in range(start, end, PARTITION_SECONDS):
+            t = np.arange(chunk_start, min(chunk_start + PARTITION_SECONDS, end), interval, dtype=np.float64)
+            t += rng.uniform(0, interval / 10, len(t))
+            walk = np.cumsum(rng.normal(0, 0.05, len(t)))
+            store.append_columns(slave_id, t, {"temperature": 20 + walk, "humidity": 45 + walk * 2,
+                                               "pressure": 101325 + walk * 10, "battery_level": np.full(len(t), 87.0)})
+            readings += len(t)
+    write_seconds = time.perf_counter() - write_start
+    store.close()
+
+    reader = TimeSeriesStore(root, readonly=True)
+    timings = {}
+    for label in ("cold", "warm"):
+        query_start = time.perf_counter()
+        resolution, rollups = reader.dashboard(start, end, fields=list(fields))
+        timings[label] = round((time.perf_counter() - query_start) * 1000, 2)
+    day_start = time.perf_counter()
+    day = reader.query(0, end - 86400, end)
+    raw_ms = round((time.perf_counter() - day_start) * 1000, 3)
+    return {"sensors": sensors, "days": days, "readings": readings,
+            "write_readings_per_s": round(readings / write_seconds), "dashboard_resolution_s": resolution,
+            "dashboard_points": sum(len(rollup["t"]) for rollup in rollups.values()),
+            "dashboard_ms_cold": timings["cold"], "dashboard_ms_warm": timings["warm"],
+            "raw_day_rows": len(day["t"]), "raw_day_ms": raw_ms, "is_view": isinstance(day["t"], np.memmap),
+            "bytes": reader.info()["bytes"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar time-series store for gateway readings.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Import an ingest database (.db) or NDJSON capture.")
+    import_parser.add_argument("source")
+    query_parser = subparsers.add_parser("query", help="Print raw readings or rollup buckets of a slave.")
+    query_parser.add_argument("--slave", required=True)
+    query_parser.add_argument("--resolution", type=int, help="Rollup resolution in seconds (raw readings if omitted).")
+    query_parser.add_argument("--days", type=float, default=1.0, help="Range ending now, in days.")
+    query_parser.add_argument("--limit", type=int, default=20, help="Rows to print.")
+    dashboard_parser = subparsers.add_parser("dashboard", help="Time the rollups of every slave over a range.")
+    dashboard_parser.add_argument("--days", type=float, default=365.0, help="Range ending now, in days.")
+    dashboard_parser.add_argument("--max-points", type=int, default=1000, help="Buckets per slave at most.")
+    subparsers.add_parser("info", help="Print store statistics.")
+    subparsers.add_parser("compact", help="Sort partitions that received late readings.")
+    subparsers.add_parser("rebuild", help="Recompute the rollups from the raw readings.")
+    bench_parser = subparsers.add_parser("bench", help="Fill a fresh store with synthetic data and time queries.")
+    bench_parser.add_argument("--sensors", type=int, default=20)
+    bench_parser.add_argument("--days", type=int, default=365)
+    bench_parser.add_argument("--interval", type=float, default=60.0, help="Seconds between readings.")
+    for sub in (query_parser, dashboard_parser):
+        sub.add_argument("--field", action="append", help="Field to return (repeatable; all by default).")
+    parser.add_argument("--root", default=DEFAULT_ROOT, help="Store directory.")
+    for sub in subparsers.choices.values():
+        # Also accepted after the command; SUPPRESS keeps a --root given before it
+        sub.add_argument("--root", default=argparse.SUPPRESS, help="Store directory.")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        if os.path.exists(args.root):
+            parser.error(f"'{args.root}' exists; bench needs a fresh store directory.")
+        try:
+            print(json.dumps(run_benchmark(args.root, args.sensors, args.days, args.interval), indent=4))
+        finally:
+            shutil.rmtree(args.root, ignore_errors=True)
+        return
+
+    if args.command == "import":
+        store = TimeSeriesStore(args.root)
+        start = time.perf_counter()
+        if args.source.endswith(".db"):
+            imported = import_sqlite(store, args.source)
+        else:
+            imported = import_ndjson(store, args.source)
+        store.close()
+        print(f"Imported {imported} readings in {time.perf_counter() - start:.1f} s.")
+        return
+    if args.command in ("compact", "rebuild"):
+        store = TimeSeriesStore(args.root)
+        if args.command == "compact":
+            print(f"Sorted {store.compact()} partitions.")
+        else:
+            store.rebuild()
+            print("Rollups rebuilt.")
+        store.close()
+        return
+
+    try:
+        store = TimeSeriesStore(args.root, readonly=True)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    if args.command == "info":
+        print(json.dumps(store.info(), indent=4))
+        return
+    end = time.time()
+    start = end - args.days * 86400
+    if args.command == "dashboard":
+        query_start = time.perf_counter()
+        resolution, rollups = store.dashboard(start, end, fields=args.field, max_points=args.max_points)
+        elapsed = (time.perf_counter() - query_start) * 1000
+        points = sum(len(rollup["t"]) for rollup in rollups.values())
+        print(f"{len(rollups)} slaves, {points} buckets of {resolution} s in {elapsed:.1f} ms.")
+        return
+
+    slave_id = int(args.slave) if args.slave.isdigit() else args.slave
+    if args.resolution:
+        result = store.rollup(slave_id, args.resolution, start, end, args.field)
+    else:
+        result = store.query(slave_id, start, end, args.field)
+    names = list(result)
+    print("\t".join(names))
+    for row in range(min(args.limit, len(result["t"]))):
+        print("\t".join(f"{result[name][row]:.6g}" for name in names))
+    print(f"{len(result['t'])} rows.")
+
+
+if __name__ == "__main__":
+    main()
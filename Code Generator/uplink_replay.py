@@ -0,0 +1,218 @@
+# uplink_replay.py
+
+# Replays captured Module B traffic against an HTTP endpoint twice: once like the shipped
+# sketch (one "Connection: close" POST per reading) and once with the batched keep-alive uplink
+# (UplinkBatcher, the Python reference of ADDITIONAL_INFO_BATCHED_UPLINK), and compares
+# requests, connections and bytes per reading.
+#
+# Captured traffic is NDJSON: either one reading per line, or {"t": seconds, "body": reading}
+# lines with the time each reading left the ring buffer.
+# Run: python uplink_replay.py capture.ndjson                 (starts a local ingest_server)
+#      python uplink_replay.py capture.ndjson --url http://host:8080/readings
+
+import argparse
+import asyncio
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlparse
+
+BATCH_MAX_READINGS = 20
+BATCH_MAX_BYTES = 4096
+BATCH_FLUSH_INTERVAL = 10.0  # seconds
+
+
+class UplinkBatcher:
+    def __init__(self, max_readings=BATCH_MAX_READINGS, max_bytes=BATCH_MAX_BYTES,
+                 flush_interval=BATCH_FLUSH_INTERVAL):
+        """
+        Size/time flush policy of the batched uplink, identical to queueReadingForUplink() and
+        forwardData() in the C++ template (delivery failures are not modelled).
+        """
+        self.max_readings = max_readings
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.lines = []
+        self.size = 0
+        self.started = None
+
+    def add(self, reading, now):
+        """Queue one reading. :return: List of NDJSON bodies to send now (possibly empty)."""
+        out = []
+        if self.lines and self.size + len(reading) + 1 > self.max_bytes:
+            out.append(self.flush())
+        if not self.lines:
+            self.started = now
+        self.lines.append(reading)
+        self.size += len(reading) + 1
+        if len(self.lines) >= self.max_readings:
+            out.append(self.flush())
+        return out
+
+    def poll(self, now):
+        """Time-based flush at the end of forwardData(). :return: List of bodies to send now."""
+        if self.lines and now - self.started >= self.flush_interval:
+            return [self.flush()]
+        return []
+
+    def flush(self):
+        body = "".join(line + "\n" for line in self.lines)
+        self.lines = []
+        self.size = 0
+        return body
+
+
+def load_capture(path, interval=2.0):
+    """
+    Read captured readings.
+    :param interval: Seconds between readings when the capture has no timestamps.
+    :return: List of (time, reading as compact JSON string).
+    """
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for index, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, dict) and "body" in record:
+                t, body = float(record.get("t", index * interval)), record["body"]
+            else:
+                t, body = index * interval, record
+            if not isinstance(body, str):
+                body = json.dumps(body, separators=(",", ":"))
+            events.append((t, body))
+    return events
+
+
+class TrafficCounter:
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.header_bytes = 0
+        self.body_bytes = 0
+        self.failed = 0
+
+    def send(self, connection, path, body, content_type, keep_alive, host):
+        data = body.encode("utf-8")
+        headers = {"Host": host, "Content-Type": content_type, "Content-Length": str(len(data)),
+                   "Connection": "keep-alive" if keep_alive else "close"}
+        # Request line plus headers, as the sketch writes them
+        self.header_bytes += len(f"POST {path} HTTP/1.1\r\n") + sum(len(f"{k}: {v}\r\n") for k, v in headers.items()) + 2
+        self.body_bytes += len(data)
+        self.requests += 1
+        connection.request("POST", path, body=data, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        if response.status >= 300:
+            self.failed += 1
+
+
+def replay_per_reading(events, url):
+    """One new TCP connection and one POST per reading, like B_Master_AnttiGateway_REST.ino."""
+    target = urlparse(url)
+    counter = TrafficCounter()
+    for _, reading in events:
+        connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=10)
+        counter.connections += 1
+        counter.send(connection, target.path or "/", reading, "application/json", False, target.netloc)
+        connection.close()
+    return counter
+
+
+def replay_batched(events, url, batcher):
+    """NDJSON batches over one keep-alive connection, reconnecting only when it drops."""
+    target = urlparse(url)
+    counter = TrafficCounter()
+    connection = None
+
+    def send(body):
+        nonlocal connection
+        for _ in range(2):
+            if connection is None:
+                connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=10)
+                counter.connections += 1
+            try:
+                counter.send(connection, target.path or "/", body, "application/x-ndjson", True, target.netloc)
+                return
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                connection = None
+        counter.failed += 1
+
+    last_time = 0.0
+    for t, reading in events:
+        for body in batcher.poll(t):
+            send(body)
+        for body in batcher.add(reading, t):
+            send(body)
+        last_time = t
+    for body in batcher.poll(last_time + batcher.flush_interval):
+        send(body)
+    if connection is not None:
+        connection.close()
+    return counter
+
+
+def summarise(name, counter, readings, elapsed):
+    return {
+        "mode": name,
+        "readings": readings,
+        "requests": counter.requests,
+        "connections": counter.connections,
+        "requests_per_reading": round(counter.requests / readings, 3) if readings else 0,
+        "connections_per_reading": round(counter.connections / readings, 3) if readings else 0,
+        "header_bytes_per_reading": round(counter.header_bytes / readings, 1) if readings else 0,
+        "body_bytes_per_reading": round(counter.body_bytes / readings, 1) if readings else 0,
+        "failed_requests": counter.failed,
+        "elapsed_s": round(elapsed, 3)
+    }
+
+
+def start_local_server(port):
+    """Run ingest_server in a background thread with an in-memory store. Returns its URL."""
+    from ingest_server import IngestServer, SQLiteStore, ReadingValidator
+
+    ready = threading.Event()
+
+    def run():
+        async def serve():
+            server = IngestServer(SQLiteStore(":memory:"), ReadingValidator([]))
+            await server.start("127.0.0.1", port)
+            ready.set()
+            await asyncio.Event().wait()
+        asyncio.run(serve())
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait(5)
+    return f"http://127.0.0.1:{port}/readings"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-reading and batched Module B uplinks.")
+    parser.add_argument("capture", help="NDJSON capture of the readings Module B forwarded.")
+    parser.add_argument("--url", help="Endpoint URL; a local ingest_server is started if omitted.")
+    parser.add_argument("--port", type=int, default=18080, help="Port of the local ingest_server.")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between untimed readings.")
+    parser.add_argument("--max-readings", type=int, default=BATCH_MAX_READINGS)
+    parser.add_argument("--max-bytes", type=int, default=BATCH_MAX_BYTES)
+    parser.add_argument("--flush-interval", type=float, default=BATCH_FLUSH_INTERVAL)
+    args = parser.parse_args()
+
+    events = load_capture(args.capture, args.interval)
+    url = args.url or start_local_server(args.port)
+
+    start = time.perf_counter()
+    per_reading = replay_per_reading(events, url)
+    per_reading_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = replay_batched(events, url, UplinkBatcher(args.max_readings, args.max_bytes, args.flush_interval))
+    batched_elapsed = time.perf_counter() - start
+
+    print(json.dumps([summarise("per_reading", per_reading, len(events), per_reading_elapsed),
+                      summarise("batched", batched, len(events), batched_elapsed)], indent=4))
+
+
+if __name__ == "__main__":
+    main()
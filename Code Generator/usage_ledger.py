@@ -0,0 +1,141 @@
+# usage_ledger.py
+
+import json
+import os
+import datetime
+import threading
+
+USAGE_LEDGER_FILE = "usage_ledger.jsonl"
+BATCH_DISCOUNT = 0.5  # Batch endpoint requests are billed at half price
+
+
+def _empty_totals():
+    return {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cost_usd": 0.0}
+
+
+def _add(totals, entry):
+    totals["requests"] += 1
+    totals["prompt_tokens"] += entry["prompt_tokens"]
+    totals["completion_tokens"] += entry["completion_tokens"]
+    totals["cached_tokens"] += entry["cached_tokens"]
+    totals["cost_usd"] += entry["cost_usd"]
+
+
+class UsageLedger:
+    def __init__(self, path=USAGE_LEDGER_FILE, pricing=None, budgets=None):
+        """
+        Persistent token usage and cost ledger with budget enforcement.
+        Every request is appended to a JSONL file, totals are kept per session, module, sensor and model.
+        :param path: Ledger file.
+        :param pricing: The "pricing" section of config.json: USD per million tokens per model,
+                        with "input", "cached_input" and "output" prices.
+        :param budgets: The "budgets" section of config.json: "session_usd" and "total_usd" limits
+                        (null or missing disables a limit).
+        """
+        self.path = path
+        self.pricing = pricing or {}
+        self.budgets = budgets or {}
+        self.session_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.lock = threading.Lock()
+        self.session = _empty_totals()
+        self.total = _empty_totals()
+        self.by_module = {}
+        self.by_sensor = {}
+        self.by_model = {}
+        self._load()
+
+    def _load(self):
+        """Rebuild the all-time totals from the ledger file."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._aggregate(entry, session=False)
+
+    def _aggregate(self, entry, session):
+        _add(self.total, entry)
+        if session:
+            _add(self.session, entry)
+        _add(self.by_module.setdefault(entry.get("module") or "unknown", _empty_totals()), entry)
+        _add(self.by_sensor.setdefault(entry.get("sensor") or "unknown", _empty_totals()), entry)
+        _add(self.by_model.setdefault(entry.get("model") or "unknown", _empty_totals()), entry)
+
+    def cost(self, model, prompt_tokens, completion_tokens, cached_tokens, batch=False):
+        """Estimated cost in USD. Unknown models cost 0 so they never block work."""
+        prices = self.pricing.get(model)
+        if not prices:
+            return 0.0
+        uncached = max(0, prompt_tokens - cached_tokens)
+        cost = (uncached * prices.get("input", 0)
+                + cached_tokens * prices.get("cached_input", prices.get("input", 0))
+                + completion_tokens * prices.get("output", 0)) / 1_000_000
+        return cost * BATCH_DISCOUNT if batch else cost
+
+    def record(self, usage, module, sensor="", batch=False):
+        """
+        Record the usage of one request.
+        :param usage: The "usage" dictionary of a ChatGPTAPI result.
+        :param module: 'module_a', 'module_b', 'data_format' or 'refine'.
+        :param sensor: Sensor type or catalog key the request was for.
+        :param batch: True if the request went through the batch endpoint.
+        :return: The ledger entry, or None if there was no usage information.
+        """
+        if not usage:
+            return None
+        entry = {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "session": self.session_id,
+            "model": usage.get("model"),
+            "module": module,
+            "sensor": sensor,
+            "batch": batch,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "cached_tokens": usage.get("cached_tokens", 0)
+        }
+        entry["cost_usd"] = self.cost(entry["model"], entry["prompt_tokens"], entry["completion_tokens"],
+                                      entry["cached_tokens"], batch)
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._aggregate(entry, session=True)
+        return entry
+
+    def budget_exceeded(self, pending_usd=0.0):
+        """
+        Return a message describing the exceeded budget, or None if spending may continue.
+        :param pending_usd: Estimated cost of work that is about to be (or was) submitted but is not billed yet.
+        """
+        pending = f" + ${pending_usd:.2f} pending" if pending_usd else ""
+        with self.lock:
+            session_limit = self.budgets.get("session_usd")
+            if session_limit is not None and self.session["cost_usd"] + pending_usd >= session_limit:
+                return (f"Session budget of ${session_limit:.2f} reached "
+                        f"(${self.session['cost_usd']:.2f} spent{pending}).")
+            total_limit = self.budgets.get("total_usd")
+            if total_limit is not None and self.total["cost_usd"] + pending_usd >= total_limit:
+                return f"Total budget of ${total_limit:.2f} reached (${self.total['cost_usd']:.2f} spent{pending})."
+        return None
+
+    def summary(self):
+        """One line summary of the session and all-time totals for the UI."""
+        with self.lock:
+            session_tokens = self.session["prompt_tokens"] + self.session["completion_tokens"]
+            return (f"Session: {self.session['requests']} requests, {session_tokens} tokens, "
+                    f"${self.session['cost_usd']:.4f} | Total: ${self.total['cost_usd']:.4f}")
+
+    def format_report(self):
+        """Breakdown of all-time usage per module, sensor and model."""
+        lines = [self.summary()]
+        with self.lock:
+            for title, table in (("Module", self.by_module), ("Sensor", self.by_sensor), ("Model", self.by_model)):
+                lines.append(f"\n{title}:")
+                for name, totals in sorted(table.items(), key=lambda item: -item[1]["cost_usd"]):
+                    lines.append(f"- {name}: {totals['requests']} requests, {totals['prompt_tokens']} prompt / "
+                                 f"{totals['completion_tokens']} completion / {totals['cached_tokens']} cached tokens, "
+                                 f"${totals['cost_usd']:.4f}")
+        return "\n".join(lines)
@@ -0,0 +1,404 @@
+# window_aggregator.py
+
+# Host reference of the windowed aggregation that the generator adds to Module A
+# (ADDITIONAL_INFO_WINDOWED_AGGREGATION): readings are folded into windows of WINDOW_READINGS readings
+# and/or WINDOW_MS milliseconds, and one summary per window goes to the ring buffer:
+#     {"Count": 10, "temperature": 23.41, "temperature_min": 23.2, "temperature_max": 23.6,
+#      "temperature_last": 23.5, "mac": "c6:f3:..."}
+# Numeric fields are summed in float32 like the sketch, so the reference reproduces its output; text
+# and bool fields keep the value of the latest reading. With a window of N readings the ring buffer
+# slots and I2C transfers per hour drop by N; a summary is larger than a reading, so `report` shows
+# the chunks and wire bytes that are actually saved (computed with chunk_codec).
+#
+# `check` is the equivalence test for a sketch: build it with AGG_DEBUG = true, capture its serial
+# output, and the reference replays every AGG_IN reading at its millis() time and compares each
+# AGG_OUT summary with its own. Summaries are not in the data format, so validate them (ingest_server
+# --data-format, format_validator) against the output of `format`.
+# Run: python window_aggregator.py format --sensor ruuvitag [--round-means]
+#      python window_aggregator.py check serial.log --window 10,60s [--round-means] [--tolerance 1e-5]
+#      python window_aggregator.py report --sensor ruuvitag --window 60s --interval 5
+
+import argparse
+import json
+import math
+import re
+import struct
+from chunk_codec import add_slave_id, encode_chunks, RING_BUFFER_SIZE
+from format_compiler import is_compiled, normalise_schema, sample_readings
+from analysis_common import iter_lines
+
+MAX_AGG_FIELDS = 10  # Numeric fields tracked per window, as in the sketch
+SKIPPED_KEYS = ("SlaveID", "Backlog")  # Set by the library and the weighted polling policy
+COUNT_KEY = "Count"
+STAT_SUFFIXES = ("_min", "_max", "_last")
+REPORT_SLAVE_ID = 0x7F
+
+_SPEC_PART = re.compile(r"^(\d+)\s*(ms|s|m|h)?$")
+_UNIT_MS = {"ms": 1, "s": 1000, "m": 60000, "h": 3600000}
+
+
+def parse_window_spec(spec):
+    """
+    Parse the aggregation option: "none", a reading count ("10"), a duration ("60s", "5m", "500ms")
+    or both, comma separated ("10,60s": whichever is reached first).
+    :return: (window_readings, window_ms); (0, 0) turns aggregation off.
+    """
+    spec = (spec or "").strip().lower()
+    if spec in ("", "none", "off", "0"):
+        return 0, 0
+    readings, window_ms = 0, 0
+    for part in spec.split(","):
+        match = _SPEC_PART.match(part.strip())
+        if not match:
+            raise ValueError(f"Invalid aggregation window '{part.strip()}' (use e.g. 10, 60s or 10,60s).")
+        value, unit = int(match.group(1)), match.group(2)
+        if unit:
+            window_ms = value * _UNIT_MS[unit]
+        else:
+            readings = value
+    if readings > 0xFFFF:
+        raise ValueError("At most 65535 readings per window (the sketch counts them in a uint16_t).")
+    return readings, window_ms
+
+
+def describe_window(window_readings, window_ms):
+    """Short human description of a window, e.g. '10 readings or 60 s'."""
+    parts = []
+    if window_readings:
+        parts.append(f"{window_readings} readings")
+    if window_ms:
+        parts.append(f"{window_ms / 1000:g} s")
+    return " or ".join(parts) if parts else "off"
+
+
+def _f32(value):
+    """Round to the nearest float32, like assigning to a float in the sketch."""
+    return struct.unpack("<f", struct.pack("<f", value))[0]
+
+
+def _lroundf(value):
+    """C lroundf(): halfway cases away from zero."""
+    return int(math.copysign(math.floor(abs(value) + 0.5), value))
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class FieldWindow:
+    def __init__(self):
+        self.count = 0
+        self.min_value = 0.0
+        self.max_value = 0.0
+        self.sum = 0.0
+        self.last = 0.0
+
+    def add(self, value):
+        value = _f32(value)
+        if self.count == 0 or value < self.min_value:
+            self.min_value = value
+        if self.count == 0 or value > self.max_value:
+            self.max_value = value
+        self.sum = _f32(self.sum + value)
+        self.last = value
+        self.count += 1
+
+
+class WindowAggregator:
+    def __init__(self, window_readings=0, window_ms=0, round_means=False, max_fields=MAX_AGG_FIELDS):
+        """
+        Mirror of aggregateReading()/checkWindow()/flushWindow() in the generated Module A code.
+        :param window_readings: Close a window after this many readings (0: no limit).
+        :param window_ms: Close a window this long after its first reading (0: no limit).
+        :param round_means: Send means as integers (compiled compact formats send scaled integers).
+        """
+        if window_readings <= 0 and window_ms <= 0:
+            raise ValueError("A window needs a reading count, a duration or both.")
+        self.window_readings = window_readings
+        self.window_ms = window_ms
+        self.round_means = round_means
+        self.max_fields = max_fields
+        self.count = 0
+        self.start_ms = 0
+        self.fields = {}
+        self.last_reading = {}
+
+    def add(self, reading, now_ms):
+        """
+        Add one reading.
+        :param reading: Reading as a dictionary or JSON text; anything else is dropped like in the sketch.
+        :param now_ms: millis() when the reading was added.
+        :return: List of the summaries closed by this reading (0, 1 or 2).
+        """
+        summaries = []
+        if self.count > 0 and self.window_ms > 0 and now_ms - self.start_ms >= self.window_ms:
+            summaries.append(self.flush())
+        if not isinstance(reading, dict):
+            try:
+                reading = json.loads(reading)
+            except (ValueError, TypeError):
+                return summaries
+            if not isinstance(reading, dict):
+                return summaries
+        if self.count == 0:
+            self.start_ms = now_ms
+        self.count += 1
+        self.last_reading = {}
+        for key, value in reading.items():
+            if key in SKIPPED_KEYS:
+                continue
+            if _is_number(value):
+                field = self.fields.get(key)
+                if field is None:
+                    if len(self.fields) == self.max_fields:
+                        continue
+                    field = self.fields[key] = FieldWindow()
+                field.add(value)
+            else:
+                self.last_reading[key] = value
+        if self.window_readings > 0 and self.count >= self.window_readings:
+            summaries.append(self.flush())
+        return summaries
+
+    def check(self, now_ms):
+        """checkWindow(): the summary if the time window has run out, else None."""
+        if self.count > 0 and self.window_ms > 0 and now_ms - self.start_ms >= self.window_ms:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Close the current window. :return: Summary dictionary, or None if the window is empty."""
+        if self.count == 0:
+            return None
+        summary = dict(self.last_reading)
+        summary[COUNT_KEY] = self.count
+        for name, field in self.fields.items():
+            mean = _f32(field.sum / field.count)
+            summary[name] = _lroundf(mean) if self.round_means else mean
+            summary[name + "_min"] = field.min_value
+            summary[name + "_max"] = field.max_value
+            summary[name + "_last"] = field.last
+        self.count = 0
+        self.fields = {}
+        self.last_reading = {}
+        return summary
+
+
+def aggregated_format(data_format, round_means=False):
+    """
+    Data format of the summaries for a reading format, for format_validator and the ingest side.
+    :param data_format: data_format dictionary or compiled key dictionary (the keys on the wire).
+    :return: {key: type} with the numeric fields expanded into mean/_min/_max/_last and "Count".
+    """
+    if is_compiled(data_format):
+        wire = {key: entry["wire"] for key, entry in data_format.items()}
+    else:
+        wire = normalise_schema(data_format)
+    out = {}
+    numeric = 0
+    for key, kind in wire.items():
+        if kind in ("int", "float") and numeric < MAX_AGG_FIELDS:
+            numeric += 1
+            out[key] = "int" if round_means else "float"
+            for suffix in STAT_SUFFIXES:
+                out[key + suffix] = kind
+        elif kind not in ("int", "float"):
+            out[key] = kind
+    out[COUNT_KEY] = "int"
+    return out
+
+
+def _close(expected, actual, tolerance):
+    if _is_number(expected) and _is_number(actual):
+        return math.isclose(expected, actual, rel_tol=tolerance, abs_tol=tolerance)
+    return expected == actual
+
+
+def compare_summary(expected, actual, tolerance=1e-5):
+    """Differences between a reference and a sketch summary. :return: List of messages (empty: equal)."""
+    problems = []
+    for key in expected:
+        if key not in actual:
+            problems.append(f"missing {key}")
+        elif not _close(expected[key], actual[key], tolerance):
+            problems.append(f"{key}: expected {expected[key]!r}, got {actual[key]!r}")
+    problems.extend(f"unexpected {key}" for key in actual if key not in expected and key not in SKIPPED_KEYS)
+    return problems
+
+
+def check_log(path, aggregator, tolerance=1e-5, max_errors=20):
+    """
+    Replay the AGG_IN lines of a serial capture through the reference and compare every AGG_OUT summary.
+    :return: Result dictionary with counts and the first max_errors problems.
+    """
+    result = {"readings": 0, "summaries": 0, "matched": 0, "problems": []}
+    pending = []
+
+    def problem(message):
+        if len(result["problems"]) < max_errors:
+            result["problems"].append(message)
+
+    for number, raw in enumerate(iter_lines(path), 1):
+        line = raw.decode("utf-8", errors="replace")
+        if "AGG_IN " in line:
+            rest = line[line.index("AGG_IN ") + 7:].strip()
+            stamp, _, reading = rest.partition(" ")
+            if not stamp.isdigit():
+                problem(f"line {number}: AGG_IN without millis()")
+                continue
+            result["readings"] += 1
+            pending.extend(aggregator.add(reading, int(stamp)))
+        elif "AGG_OUT " in line:
+            result["summaries"] += 1
+            try:
+                actual = json.loads(line[line.index("AGG_OUT ") + 8:])
+            except ValueError:
+                problem(f"line {number}: AGG_OUT is not JSON")
+                continue
+            if not pending:
+                # Closed by checkWindow(); the reference closes the same window now
+                if aggregator.window_ms <= 0:
+                    problem(f"line {number}: summary before the window was full (no time window to close it)")
+                summary = aggregator.flush()
+                if summary is None:
+                    problem(f"line {number}: summary without readings")
+                    continue
+                pending.append(summary)
+            differences = compare_summary(pending.pop(0), actual, tolerance)
+            if differences:
+                problem(f"line {number}: " + "; ".join(differences))
+            else:
+                result["matched"] += 1
+    result["unsent"] = len(pending)
+    result["open_window"] = aggregator.count
+    return result
+
+
+def serialize_like_sketch(reading):
+    """JSON text as serializeJson() writes it: floats widened from float32 with 9 significant digits."""
+    parts = []
+    for key, value in reading.items():
+        if isinstance(value, float):
+            text = "%.9g" % _f32(value)
+            if "e" not in text and "." in text:
+                text = text.rstrip("0").rstrip(".")
+        else:
+            text = json.dumps(value, ensure_ascii=False)
+        parts.append(json.dumps(key, ensure_ascii=False) + ":" + text)
+    return "{" + ",".join(parts) + "}"
+
+
+def _wire(reading):
+    dataset = add_slave_id(serialize_like_sketch(reading), REPORT_SLAVE_ID)
+    chunks = encode_chunks(dataset)
+    return len(chunks), sum(len(chunk) for chunk in chunks)
+
+
+def traffic_report(data_format, window_readings, window_ms, interval_s, hours=1.0):
+    """
+    Readings, ring buffer slots, I2C chunks and wire bytes per hour without and with aggregation,
+    for sample readings of the format arriving every interval_s seconds.
+    """
+    schema = normalise_schema(data_format)
+    typical, candidates = sample_readings(schema)
+    aggregator = WindowAggregator(window_readings, window_ms)
+    raw = {"readings": 0, "chunks": 0, "wire_bytes": 0}
+    summaries = {"readings": 0, "chunks": 0, "wire_bytes": 0}
+    total = int(hours * 3600 / interval_s)
+    for index in range(total):
+        reading = {field: values[index % len(values)] for field, values in candidates.items()}
+        chunks, wire_bytes = _wire(reading)
+        raw["readings"] += 1
+        raw["chunks"] += chunks
+        raw["wire_bytes"] += wire_bytes
+        closed = aggregator.add(reading, int(index * interval_s * 1000))
+        if index == total - 1:
+            closed.append(aggregator.flush())
+        for summary in closed:
+            if summary is None:
+                continue
+            chunks, wire_bytes = _wire(summary)
+            summaries["readings"] += 1
+            summaries["chunks"] += chunks
+            summaries["wire_bytes"] += wire_bytes
+    per_summary = summaries["readings"] and total / summaries["readings"]
+    return {
+        "interval_s": interval_s,
+        "hours": hours,
+        "raw": raw,
+        "aggregated": summaries,
+        "readings_per_summary": per_summary,
+        "reduction_chunks": raw["chunks"] / summaries["chunks"] if summaries["chunks"] else None,
+        "reduction_wire_bytes": raw["wire_bytes"] / summaries["wire_bytes"] if summaries["wire_bytes"] else None,
+        # How long the ring buffer lasts when the master stops polling
+        "ring_buffer_s_raw": RING_BUFFER_SIZE * interval_s,
+        "ring_buffer_s_aggregated": RING_BUFFER_SIZE * interval_s * per_summary
+    }
+
+
+def _load_format(args):
+    if args.sensor:
+        with open(args.sensors_file, "r") as f:
+            return json.load(f)["sensors"][args.sensor]["data_format"]
+    if args.format:
+        with open(args.format, "r") as f:
+            return json.load(f)
+    raise SystemExit("Give --sensor or --format.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reference and checks for Module A windowed aggregation.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name, text in (("format", "Print the data format of the summaries."),
+                       ("report", "Compare the I2C traffic per hour without and with aggregation.")):
+        command = sub.add_parser(name, help=text)
+        command.add_argument("--sensor", help="Sensor key in the catalog.")
+        command.add_argument("--sensors-file", default="sensors.json", help="Sensor catalog.")
+        command.add_argument("--format", help="data_format JSON file (instead of --sensor).")
+    sub.choices["format"].add_argument("--round-means", action="store_true",
+                                       help="Means sent as integers (compiled compact formats).")
+    sub.choices["report"].add_argument("--window", default="10", help="Window, e.g. 10, 60s or 10,60s.")
+    sub.choices["report"].add_argument("--interval", type=float, default=5.0, help="Seconds between readings.")
+
+    check = sub.add_parser("check", help="Compare the AGG_OUT summaries of a serial capture with the reference.")
+    check.add_argument("log", help="Serial capture of a sketch built with AGG_DEBUG = true ('-': stdin).")
+    check.add_argument("--window", default="10", help="The sketch's window, e.g. 10, 60s or 10,60s.")
+    check.add_argument("--round-means", action="store_true", help="The sketch has ROUND_MEANS = true.")
+    check.add_argument("--tolerance", type=float, default=1e-5, help="Relative/absolute tolerance for numbers.")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        window_readings, window_ms = parse_window_spec(args.window)
+        aggregator = WindowAggregator(window_readings, window_ms, round_means=args.round_means)
+        result = check_log(args.log, aggregator, tolerance=args.tolerance)
+        for message in result["problems"]:
+            print(message)
+        print(f"{result['readings']} readings, {result['summaries']} summaries, {result['matched']} matched "
+              f"the reference ({describe_window(window_readings, window_ms)}); "
+              f"{result['unsent']} expected but not seen, {result['open_window']} readings in the open window.")
+        if result["problems"] or result["matched"] != result["summaries"]:
+            raise SystemExit(1)
+        return
+
+    data_format = _load_format(args)
+    if args.command == "format":
+        print(json.dumps(aggregated_format(data_format, round_means=args.round_means), indent=4))
+        return
+
+    window_readings, window_ms = parse_window_spec(args.window)
+    report = traffic_report(data_format, window_readings, window_ms, args.interval)
+    print(f"Window: {describe_window(window_readings, window_ms)}, one reading every {args.interval:g} s")
+    print(f"{'per hour':<12}{'readings':>10}{'chunks':>10}{'wire bytes':>12}")
+    for label in ("raw", "aggregated"):
+        row = report[label]
+        print(f"{label:<12}{row['readings']:>10}{row['chunks']:>10}{row['wire_bytes']:>12}")
+    if report["reduction_chunks"]:
+        print(f"{report['readings_per_summary']:.1f} readings per summary: "
+              f"{report['reduction_chunks']:.1f}x fewer chunks, {report['reduction_wire_bytes']:.1f}x fewer wire bytes.")
+    print(f"Ring buffer ({RING_BUFFER_SIZE} slots) lasts {report['ring_buffer_s_raw']:g} s without polling, "
+          f"{report['ring_buffer_s_aggregated']:g} s with aggregation.")
+
+
+if __name__ == "__main__":
+    main()